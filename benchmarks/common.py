@@ -0,0 +1,191 @@
+"""
+Shared helpers for the benchmark suite: report format, percentiles and
+fixtures (a fake ptp4l management socket, synthetic PTP frames / pcaps).
+"""
+import json
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(os.path.dirname(HERE), "source")
+FIXTURES = os.path.join(HERE, "fixtures")
+sys.path.insert(0, SOURCE_DIR)
+
+import pmc_client as pc  # noqa: E402
+
+
+# --- Reports ---
+def percentile(sorted_vals, q):
+    if not sorted_vals: return None
+    i = min(len(sorted_vals) - 1, max(0, int(round(q / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+
+def summarize(latencies_s, elapsed_s, errors=0):
+    """Per-operation summary in microseconds; the same shape for micro and load results."""
+    vals = sorted(latencies_s)
+    us = lambda v: round(v * 1e6, 2) if v is not None else None
+    return {
+        "count": len(vals), "errors": errors,
+        "ops_per_sec": round(len(vals) / elapsed_s, 1) if elapsed_s > 0 else None,
+        "p50_us": us(percentile(vals, 50)), "p90_us": us(percentile(vals, 90)),
+        "p99_us": us(percentile(vals, 99)), "max_us": us(vals[-1] if vals else None),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "-C", HERE, "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception: return None
+
+
+def write_report(path, kind, results, params):
+    report = {
+        "kind": kind, "time": time.time(), "revision": git_revision(),
+        "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+        "params": params, "results": results,
+    }
+    if path:
+        with open(path, "w") as f: json.dump(report, f, indent=2)
+    return report
+
+
+def print_results(results):
+    print(f"{'operation':32} {'count':>8} {'ops/s':>11} {'p50 us':>10} {'p99 us':>10} {'max us':>10} {'err':>5}")
+    for name, r in results.items():
+        print(f"{name:32} {r['count']:>8} {r['ops_per_sec'] or 0:>11} {r['p50_us'] or 0:>10} {r['p99_us'] or 0:>10} {r['max_us'] or 0:>10} {r['errors']:>5}")
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f: return f.read()
+
+
+# --- Fake ptp4l management socket ---
+CLOCK_ID = bytes.fromhex("001122fffe334455")
+GM_ID = bytes.fromhex("aabbccfffe000001")
+
+
+def dataset_payload(name, port=1):
+    if name == "DEFAULT_DATA_SET":
+        return struct.pack(">BBHBBBHB8sBB", 1, 0, 2, 128, 248, 0xfe, 0xffff, 128, CLOCK_ID, 0, 0)
+    if name == "CURRENT_DATA_SET":
+        return struct.pack(">Hqq", 1, int(-12 * 65536), int(812 * 65536))
+    if name == "PARENT_DATA_SET":
+        return struct.pack(">8sHBBHiBBBHB8s", GM_ID, 1, 0, 0, 0xffff, 0x7fffffff, 128, 6, 0x21, 0x4e5d, 128, GM_ID)
+    if name == "TIME_PROPERTIES_DATA_SET":
+        return struct.pack(">hBB", 37, 0x3c, 0x20)
+    if name == "PORT_DATA_SET":
+        return struct.pack(">8sHBbqbBbBbB", CLOCK_ID, port, 9 if port == 1 else 6, 0, 0, 1, 3, 0, 1, 0, 2)
+    if name == "TIME_STATUS_NP":
+        return struct.pack(">qqiiHHQHi8s", -12, 0, 0, 0, 0, 0, 0, 0, 1, GM_ID)
+    if name == "GRANDMASTER_SETTINGS_NP":
+        return struct.pack(">BBHhBB", 248, 0xfe, 0xffff, 37, 0, 0xa0)
+    if name in ("PRIORITY1", "PRIORITY2"):
+        return bytes([128, 0])
+    return None
+
+
+def response_frames(seq, name, action=pc.ACTION_GET, nports=2, overrides=None, port_state=None):
+    """Management replies ptp4l would send for one request (one per port for port-scoped datasets)."""
+    mid = pc.MANAGEMENT_IDS[name]
+    out = []
+    for port in (range(1, nports + 1) if name in pc.PORT_SCOPED else [0]):
+        data = (overrides or {}).get(name) or dataset_payload(name, port or 1)
+        if name == "PORT_DATA_SET" and port_state is not None:
+            data = data[:10] + bytes([port_state]) + data[11:]
+        resp_action = pc.ACTION_RESPONSE if action == pc.ACTION_GET else pc.ACTION_ACKNOWLEDGE
+        if data is None:
+            msg = bytearray(pc.pack_management(seq, pc.TLV_MANAGEMENT_ERROR_STATUS, resp_action, struct.pack(">H", mid) + b"\0" * 4))
+            struct.pack_into(">H", msg, pc.TLV_OFFSET, pc.TLV_MANAGEMENT_ERROR_STATUS)
+        else:
+            msg = bytearray(pc.pack_management(seq, mid, resp_action, data))
+        struct.pack_into(">8sH", msg, 20, CLOCK_ID, port)
+        out.append(bytes(msg))
+    return out
+
+
+class FakePtp4l:
+    """Answers management requests on an AF_UNIX datagram socket like ptp4l's uds_address."""
+    def __init__(self, path, nports=2):
+        self.path = path
+        self.nports = nports
+        self.overrides = {}      # name -> data field stored by SET
+        self.port_state = None   # PORT_STATES code forced on every port (None = SLAVE / MASTER fixture)
+        try: os.unlink(path)
+        except OSError: pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(path)
+        self.sock.settimeout(0.2)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._serve, name="fake-ptp4l", daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while not self.stop_event.is_set():
+            try: buf, addr = self.sock.recvfrom(4096)
+            except socket.timeout: continue
+            except OSError: break
+            seq = pc.HEADER.unpack_from(buf)[10]
+            _, _, mid = pc.TLV.unpack_from(buf, pc.TLV_OFFSET)
+            action = buf[pc.MGMT_OFFSET + 12] & 0x0F
+            name = pc.MANAGEMENT_NAMES.get(mid)
+            if name is None: continue
+            if action == pc.ACTION_SET: self.overrides[name] = bytes(buf[pc.TLV_OFFSET + pc.TLV.size:])
+            for frame in response_frames(seq, name, action, self.nports, self.overrides, self.port_state):
+                try: self.sock.sendto(frame, addr)
+                except OSError: pass
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join(1)
+        self.sock.close()
+        try: os.unlink(self.path)
+        except OSError: pass
+
+
+# --- Synthetic PTP traffic ---
+def _checksum(data):
+    if len(data) % 2: data += b"\0"
+    s = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    s = (s >> 16) + (s & 0xFFFF); s += s >> 16
+    return ~s & 0xFFFF
+
+
+def ptp_udp_frame(src_ip, src_mac, msg_type, seq, domain=0, clock_id=None, dst_ip="224.0.1.129", announce=None):
+    """
+    Ethernet + IPv4 + UDP + PTPv2 event/general message (44-byte body, like Sync/Delay_Req).
+    Announce messages carry a full body from `announce` = (priority1, clockClass, priority2, stepsRemoved).
+    """
+    clock_id = clock_id or (src_mac[:3] + b"\xff\xfe" + src_mac[3:])
+    body = bytes(10)
+    if msg_type == 0xB:
+        p1, cls, p2, steps = announce or (128, 248, 128, 0)
+        body = struct.pack(">10shxBBBHB8sHB", bytes(10), 37, p1, cls, 0xFE, 0xFFFF, p2, clock_id, steps, 0xA0)
+    ptp = struct.pack(">BBHBBHqI8sHHBb", msg_type & 0x0F, 2, 34 + len(body), domain, 0, 0, 0, 0, clock_id, 1, seq & 0xFFFF,
+                      0 if msg_type == 0 else 1, 0) + body
+    port = 319 if msg_type < 8 else 320
+    udp = struct.pack(">HHHH", port, port, 8 + len(ptp), 0) + ptp
+    src = socket.inet_aton(src_ip); dst = socket.inet_aton(dst_ip)
+    ip = struct.pack(">BBHHHBBH4s4s", 0x45, 0, 20 + len(udp), 0, 0x4000, 1, 17, 0, src, dst)
+    ip = ip[:10] + struct.pack(">H", _checksum(ip)) + ip[12:]
+    eth = b"\x01\x00\x5e\x00\x01\x81" + src_mac + b"\x08\x00"
+    return eth + ip + udp
+
+
+def synthetic_traffic(clients=200, per_client=20, start=1700000000.0):
+    """[(ts, frame)] of Delay_Req (event) and Announce (general) from `clients` endpoints at 8 msgs/s each."""
+    frames = []
+    for k in range(per_client):
+        for c in range(1, clients + 1):
+            ip = f"10.{(c >> 16) & 0xFF}.{(c >> 8) & 0xFF}.{c & 0xFF}"
+            mac = bytes([0x02, 0, 0, (c >> 16) & 0xFF, (c >> 8) & 0xFF, c & 0xFF])
+            # Every 50th endpoint announces as a (competing) grandmaster candidate
+            announce = (128 - c % 3, 6 if c % 50 == 1 else 248, 128, 0)
+            frames.append((start + k * 0.125 + c * 1e-5, ptp_udp_frame(ip, mac, 1 if k % 8 else 0xB, k, announce=announce)))
+    return frames
@@ -0,0 +1,51 @@
+"""
+Compare two benchmark reports (micro.py / load.py --output).
+
+    python3 benchmarks/compare.py before.json after.json [--threshold 10] [--metric p99_us]
+
+Exits 1 when any operation's latency got worse by more than --threshold
+percent, so it can gate a change in CI or a pre-merge check.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_us", "p90_us", "p99_us")
+
+
+def load(path):
+    with open(path) as f: return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two ptp-web benchmark reports")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown in percent")
+    parser.add_argument("--metric", choices=METRICS, default="p50_us", help="latency used for the regression check")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    if base.get("kind") != new.get("kind"): print(f"warning: comparing a {base.get('kind')} report with a {new.get('kind')} report")
+    if base.get("params") != new.get("params"): print("warning: reports were produced with different parameters")
+
+    regressions = []
+    print(f"{'operation':32} {'base ' + args.metric:>16} {'new ' + args.metric:>16} {'change':>9}")
+    for name in sorted(set(base["results"]) | set(new["results"])):
+        b = base["results"].get(name, {}).get(args.metric); n = new["results"].get(name, {}).get(args.metric)
+        if not b or n is None:
+            print(f"{name:32} {b or '--':>16} {n if n is not None else '--':>16} {'':>9}")
+            continue
+        change = (n - b) / b * 100
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"; regressions.append(name)
+        print(f"{name:32} {b:>16} {n:>16} {change:>+8.1f}%{flag}")
+        if new["results"][name].get("errors"): print(f"{'':32} {new['results'][name]['errors']} errors in new run")
+
+    print(f"\n{base.get('revision')} -> {new.get('revision')}: {len(regressions)} regression(s) above {args.threshold:g}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
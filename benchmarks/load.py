@@ -0,0 +1,200 @@
+"""
+Load test of the polled JSON API under many concurrent dashboard tabs.
+
+Starts the app in a subprocess against fixtures only:
+  - fake ptp4l management sockets (uds_address in a temporary config dir),
+  - fake `pgrep` / `pmc` / `journalctl` binaries first on PATH,
+  - a synthetic pcap replayed through the client radar instead of a raw socket,
+then drives N keep-alive clients over /api/status, /api/clients and /api/bmca
+and reports per-endpoint throughput and latency percentiles.
+
+    python3 benchmarks/load.py --tabs 20 --duration 10 --output load.json
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import common
+
+ENDPOINTS = ["/api/status", "/api/clients?sort=-rate&limit=50", "/api/bmca"]
+
+FAKE_PGREP = """#!/bin/sh
+# Every configured instance is "running"
+echo "1001 /usr/sbin/phc2sys -a -r"
+for f in {conf_dir}/ptp4l*.conf; do echo "1000 /usr/sbin/ptp4l -f $f"; done
+"""
+
+FAKE_PMC = """#!/bin/sh
+# Recorded `pmc -u` output (only reached when the in-process client is unavailable)
+case "$*" in
+  *TIME_PROPERTIES_DATA_SET*) cat {fixtures}/pmc_bmca.txt ;;
+  *) cat {fixtures}/pmc_status.txt ;;
+esac
+"""
+
+FAKE_JOURNALCTL = """#!{python}
+import json, sys, time
+for i, line in enumerate(open({journal!r})):
+    unit = "phc2sys-custom.service" if line.startswith("phc2sys") else "ptp4l.service"
+    print(json.dumps({{"__CURSOR": "s=bench;i=%x" % i, "__REALTIME_TIMESTAMP": str(int(time.time() * 1e6)), "_SYSTEMD_UNIT": unit,
+                      "PRIORITY": "6", "SYSLOG_IDENTIFIER": unit.split(".")[0], "MESSAGE": line.rstrip()}}), flush=True)
+time.sleep(1e9)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_script(path, content):
+    with open(path, "w") as f: f.write(content)
+    os.chmod(path, 0o755)
+
+
+def prepare(tmp, instances, clients):
+    """Config dir, fake binaries and pcap under tmp; returns (env, fake ptp4l servers)."""
+    conf_dir = os.path.join(tmp, "linuxptp"); os.makedirs(conf_dir)
+    bin_dir = os.path.join(tmp, "bin"); os.makedirs(bin_dir)
+    fakes = []
+    for i in range(instances):
+        name = "default" if i == 0 else f"bench{i}"
+        uds = os.path.join(tmp, f"ptp4l-{name}")
+        fakes.append(common.FakePtp4l(uds))
+        conf = "ptp4l.conf" if i == 0 else f"ptp4l-{name}.conf"
+        with open(os.path.join(conf_dir, conf), "w") as f:
+            f.write(f"[global]\ndomainNumber {i}\nuds_address {uds}\n[eth{i}]\n")
+    write_script(os.path.join(bin_dir, "pgrep"), FAKE_PGREP.format(conf_dir=conf_dir))
+    write_script(os.path.join(bin_dir, "pmc"), FAKE_PMC.format(fixtures=common.FIXTURES))
+    write_script(os.path.join(bin_dir, "journalctl"), FAKE_JOURNALCTL.format(python=sys.executable, journal=os.path.join(common.FIXTURES, "journal.txt")))
+    pcap = os.path.join(tmp, "radar.pcap")
+    import capture
+    capture.write_pcap(pcap, common.synthetic_traffic(clients, 40, start=time.time() - 5))
+    env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""), PTP_WEB_CONFIG_DIR=conf_dir,
+               PTP_WEB_FLEET_PEERS="", BENCH_PCAP=pcap)
+    return env, fakes
+
+
+def serve(port):
+    """Child process: the real app, with the radar reading the fixture pcap."""
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    make_server("127.0.0.1", port, wsgi_app(), threaded=True).serve_forever()
+
+
+def start_server(env, port, use_gunicorn):
+    if use_gunicorn and shutil.which("gunicorn"):
+        # Same shape as the installed service: one worker, many threads
+        cmd = [shutil.which("gunicorn"), "--workers", "1", "--threads", "64", "--bind", f"127.0.0.1:{port}",
+               "--chdir", common.HERE, "--log-level", "warning", "load:wsgi_app()"]
+    else:
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve", str(port)]
+    proc = subprocess.Popen(cmd, env=env)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/api/status"); conn.getresponse().read(); conn.close()
+            return proc
+        except OSError:
+            if proc.poll() is not None: break
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def wsgi_app():
+    # Also the gunicorn entry point ("load:wsgi_app()")
+    import capture
+    import app
+    pcap = os.environ["BENCH_PCAP"]
+    app.open_capture = lambda iface: capture.PcapCapture(pcap, iface)
+    app.MONITOR.configure("realtime", ["eth0"])
+    return app.app
+
+
+def tab(port, stop, interval, results, lock):
+    """One dashboard tab: keep-alive connection, polls every endpoint each `interval` (0 = closed loop)."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    local = {path: ([], 0) for path in ENDPOINTS}
+    while not stop.is_set():
+        start_round = time.perf_counter()
+        for path in ENDPOINTS:
+            lat, errors = local[path]
+            t0 = time.perf_counter()
+            try:
+                conn.request("GET", path)
+                resp = conn.getresponse()
+                body = resp.read()
+                if resp.status != 200: raise ValueError(resp.status)
+                json.loads(body)
+                lat.append(time.perf_counter() - t0)
+            except Exception:
+                local[path] = (lat, errors + 1)
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        if interval:
+            stop.wait(max(0.0, interval - (time.perf_counter() - start_round)))
+    conn.close()
+    with lock:
+        for path, (lat, errors) in local.items():
+            agg = results.setdefault(path, [[], 0])
+            agg[0].extend(lat); agg[1] += errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ptp-web API load test")
+    parser.add_argument("--tabs", type=int, default=20, help="concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=0.0, help="poll period per tab (0 = as fast as possible)")
+    parser.add_argument("--instances", type=int, default=1, help="fake ptp4l instances")
+    parser.add_argument("--clients", type=int, default=200, help="synthetic PTP endpoints in the radar")
+    parser.add_argument("--gunicorn", action="store_true", help="serve with gunicorn like the installed service")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve: return serve(args.serve)
+
+    tmp = tempfile.mkdtemp(prefix="ptp-load-")
+    env, fakes = prepare(tmp, args.instances, args.clients)
+    port = free_port()
+    proc = start_server(env, port, args.gunicorn)
+    try:
+        time.sleep(2)   # first sampling cycle and pcap replay
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        conn.request("GET", "/api/clients?limit=1")
+        radar_clients = json.loads(conn.getresponse().read()).get("total"); conn.close()
+        stop = threading.Event(); lock = threading.Lock(); results = {}
+        threads = [threading.Thread(target=tab, args=(port, stop, args.interval, results, lock), daemon=True) for _ in range(args.tabs)]
+        start = time.perf_counter()
+        for t in threads: t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads: t.join(10)
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        try: proc.wait(5)
+        except subprocess.TimeoutExpired: proc.kill()
+        for fake in fakes: fake.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    summary = {path.split("?")[0]: common.summarize(lat, elapsed, errors) for path, (lat, errors) in results.items()}
+    common.print_results(summary)
+    params = {k: v for k, v in vars(args).items() if k != "serve"}
+    params["radar_clients"] = radar_clients
+    common.write_report(args.output, "load", summary, params)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
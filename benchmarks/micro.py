@@ -0,0 +1,190 @@
+"""
+Micro-benchmarks of the controller's hot paths.
+
+Every operation runs against fixtures (a fake ptp4l management socket,
+recorded pmc / journal text, synthetic PTP traffic), so results do not depend
+on PTP hardware and are comparable between runs on the same machine:
+
+    python3 benchmarks/micro.py --output before.json
+    ... change code ...
+    python3 benchmarks/micro.py --output after.json
+    python3 benchmarks/compare.py before.json after.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import common
+
+# Keep the app's background sampler idle while importing it
+os.environ.setdefault("PTP_WEB_SAMPLE_INTERVAL", "3600")
+os.environ.setdefault("PTP_WEB_FLEET_PEERS", "")
+
+import archive  # noqa: E402
+import capture  # noqa: E402
+import client_stats  # noqa: E402
+import foreign_masters  # noqa: E402
+import history  # noqa: E402
+import journal  # noqa: E402
+import pmc_client as pc  # noqa: E402
+
+
+def timed(fn, duration, batch=1):
+    """Run fn() in batches for about `duration` seconds; one sample per batch, divided by batch."""
+    lat = []; errors = 0
+    fn()   # warm up caches / lazy imports
+    start = time.perf_counter(); end = start + duration
+    while True:
+        t0 = time.perf_counter()
+        try:
+            for _ in range(batch): fn()
+        except Exception:
+            errors += 1
+        t1 = time.perf_counter()
+        lat.append((t1 - t0) / batch)
+        if t1 >= end: break
+    return common.summarize(lat, (time.perf_counter() - start) / batch, errors)
+
+
+def bench_pmc_unpack():
+    frames = [f for name in ("DEFAULT_DATA_SET", "CURRENT_DATA_SET", "PORT_DATA_SET", "TIME_STATUS_NP", "PARENT_DATA_SET")
+              for f in common.response_frames(1, name)]
+    return lambda: [pc.unpack_management(f) for f in frames]
+
+
+def bench_decode_frame(traffic):
+    frames = traffic[:1000]
+    return lambda: [capture.decode_frame(f, ts, "eth0") for ts, f in frames]
+
+
+def bench_client_observe(traffic):
+    msgs = [m for m in (capture.decode_frame(f, ts, "eth0") for ts, f in traffic) if m is not None]
+    table = client_stats.ClientTable(4096)
+    table.observe(msgs, "eth0", "10.255.255.254", msgs[-1].ts)   # steady state: every client known
+    state = {"i": 0}
+    def run():
+        i = state["i"]; chunk = msgs[i:i + 256] or msgs[:256]
+        state["i"] = (i + 256) % len(msgs)
+        table.observe(chunk, "eth0", "10.255.255.254", chunk[-1].ts)
+    return run, table
+
+
+def bench_foreign_observe(traffic):
+    msgs = [m for m in (capture.decode_frame(f, ts, "eth0") for ts, f in traffic) if m is not None and m.msg_type == 0xB]
+    table = foreign_masters.ForeignMasterTable(4096, ttl=1e9)
+    table.observe(msgs, "eth0", None, msgs[-1].ts)   # steady state: every announcer ranked
+    state = {"i": 0}
+    def run():
+        i = state["i"]; chunk = msgs[i:i + 256] or msgs[:256]
+        state["i"] = (i + 256) % len(msgs)
+        table.observe(chunk, "eth0", None, chunk[-1].ts)
+    return run, table
+
+
+def bench_archive_observe(traffic, directory):
+    msgs = [m for m in (capture.decode_frame(f, ts, "eth0") for ts, f in traffic) if m is not None]
+    store = archive.PacketArchive(directory, max_bytes=64 << 20)
+    state = {"i": 0}
+    def run():
+        i = state["i"]; chunk = msgs[i:i + 256] or msgs[:256]
+        state["i"] = (i + 256) % len(msgs)
+        store.observe(chunk, "eth0", None, chunk[-1].ts)
+    run()
+    return run, store, msgs[len(msgs) // 2].clock_id
+
+
+def bench_query_clients(table):
+    rows = table.export(time.time())
+    return lambda: client_stats.query_clients(rows, sort="-rate", limit=50)
+
+
+def bench_parse_servo():
+    lines = common.read_fixture("journal.txt").splitlines()
+    return lambda: [journal.parse_servo(line, 0.0) for line in lines]
+
+
+def bench_history_query(hours):
+    samples = int(hours * 3600)
+    h = history.MetricHistory(samples, {"offset": "d"})
+    t0 = time.time() - samples
+    for i in range(samples): h.record(t0 + i, {"offset": float((i * 37) % 201 - 100)})
+    return lambda: h.query("offset", t0, t0 + samples, 600)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ptp-web micro-benchmarks")
+    parser.add_argument("--duration", type=float, default=1.0, help="seconds per operation")
+    parser.add_argument("--clients", type=int, default=200, help="synthetic PTP endpoints")
+    parser.add_argument("--instances", type=int, default=4, help="fake ptp4l instances for the sampling cycle")
+    parser.add_argument("--only", help="comma separated operation names")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ptp-bench-")
+    fakes = []
+    uds = os.path.join(tmp, "ptp4l")
+    fakes.append(common.FakePtp4l(uds))
+    # Named instances for the full sampling cycle: ptp4l-<name>.conf with their own uds_address
+    conf_dir = os.path.join(tmp, "linuxptp"); os.makedirs(conf_dir)
+    for i in range(args.instances):
+        name = "default" if i == 0 else f"bench{i}"
+        path = uds if i == 0 else os.path.join(tmp, f"ptp4l-{name}")
+        if i: fakes.append(common.FakePtp4l(path))
+        conf = "ptp4l.conf" if i == 0 else f"ptp4l-{name}.conf"
+        with open(os.path.join(conf_dir, conf), "w") as f:
+            f.write(f"[global]\ndomainNumber {i}\nuds_address {path}\n[eth{i}]\n")
+    os.environ["PTP_WEB_CONFIG_DIR"] = conf_dir
+    os.environ["PTP_WEB_DATA_DIR"] = os.path.join(tmp, "data")
+
+    import app
+    pmc_text = common.read_fixture("pmc_status.txt")
+    bmca_text = common.read_fixture("pmc_bmca.txt")
+    traffic = common.synthetic_traffic(args.clients, 40)
+    client = pc.PmcClient(uds)
+    inst = app.INSTANCES.primary
+    procs = [["/usr/sbin/ptp4l", "-f", os.path.join(conf_dir, c)] for c in sorted(os.listdir(conf_dir))]
+    app.list_ptp_processes = lambda: procs
+
+    observe, table = bench_client_observe(traffic)
+    announces, foreign = bench_foreign_observe(traffic)
+    archived, packets, clock = bench_archive_observe(traffic, os.path.join(tmp, "archive"))
+    ops = {
+        "pmc.unpack_management": (bench_pmc_unpack(), 100),
+        "pmc.get_roundtrip": (lambda: client.get("DEFAULT_DATA_SET", "CURRENT_DATA_SET", "PORT_DATA_SET", "TIME_STATUS_NP", "PARENT_DATA_SET"), 1),
+        "pmc_cli.status_parse": (lambda: app.pmc_query_cli(inst, *app.STATUS_DATASETS), 100),
+        "pmc_cli.bmca_parse": (lambda: app.bmca_sources(app.pmc_query_cli(inst, *app.BMCA_DATASETS)), 100),
+        "capture.decode_frame_x1000": (bench_decode_frame(traffic), 1),
+        "clients.observe_x256": (observe, 10),
+        "clients.query_sorted": (bench_query_clients(table), 1),
+        "foreign.observe_announce_x256": (announces, 10),
+        "foreign.query_ranked": (lambda: foreign.query(traffic[-1][0]), 1),
+        "archive.observe_x256": (archived, 10),
+        "archive.query_clock": (lambda: packets.query(0, time.time() + 3600, clock_id=clock, types=["Sync", "Announce"]), 1),
+        "journal.parse_servo": (bench_parse_servo(), 100),
+        f"history.query_{app.HISTORY_HOURS:g}h": (bench_history_query(app.HISTORY_HOURS), 1),
+        "app.bmca_info": (lambda: app.get_bmca_info(inst), 1),
+        "app.sample_cycle": (app.collect_instances, 1),
+    }
+    only = set(args.only.split(",")) if args.only else None
+
+    # The CLI fallbacks parse recorded `pmc -u` output instead of forking pmc
+    real_run = app.run_cmd_safe
+    app.run_cmd_safe = lambda cmd: bmca_text if "GET TIME_PROPERTIES_DATA_SET" in cmd else pmc_text
+    results = {}
+    try:
+        for name, (fn, batch) in ops.items():
+            if only and name not in only: continue
+            results[name] = timed(fn, args.duration, batch)
+    finally:
+        app.run_cmd_safe = real_run
+        client.close()
+        for fake in fakes: fake.stop()
+
+    common.print_results(results)
+    common.write_report(args.output, "micro", results, vars(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
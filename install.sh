@@ -115,9 +115,10 @@ echo "[3/8] 生成 PTP 注入工具..."
 cat << 'EOF' > /usr/local/bin/ptp-inject
 #!/bin/bash
 # PTP4L 状态强制注入工具 (v6.2 Robust)
-# Usage: ptp-inject <domain_number>
+# Usage: ptp-inject <domain_number> [uds_address]
 
 DOMAIN=${1:-0}
+UDS=${2:-/var/run/ptp4l}
 LOG_TAG="ptp-inject"
 
 # 构造指令：包含 clockClass 13 (Master) 以及 ST 2110 必需的 Traceable 标志
@@ -131,7 +132,7 @@ SUCCESS_COUNT=0
 
 for i in {1..20}; do
     # 运行 PMC 命令
-    OUT=$(pmc -u -b 0 -d "$DOMAIN" "$CMD" 2>&1)
+    OUT=$(pmc -u -b 0 -s "$UDS" -d "$DOMAIN" "$CMD" 2>&1)
     
     # 检查结果：必须包含 RESPONSE 且不能包含 ERROR
     if echo "$OUT" | grep -q "RESPONSE" && ! echo "$OUT" | grep -q "ERROR"; then
@@ -180,36 +181,116 @@ import re
 import json
 import socket
 import shutil
-import threading
 import time
 import atexit
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, g
+from pmc_client import PmcError, PmcUnavailable, PORT_STATES, GrandmasterSettingsNP
+from pmc_text import parse_datasets
+from telemetry import TelemetrySampler
+from stream import Broadcaster, sse_format, diff_fields, diff_clients
+from history import MetricHistory, downsample
+from metric_store import MetricStore
+from archive import PacketArchive, TYPE_CODES
+from capture import RawCapture
+from client_stats import ClientTable, query_clients
+from foreign_masters import ForeignMasterTable
+from monitor import MonitorSupervisor
+from journal import JournalFollower
+from fleet import FleetAggregator
+from metrics import Registry, CONTENT_TYPE
+from phc import PhcManager
+from hostinfo import HostInfo
+from apply import ApplyQueue, wait_until
+from executor import Executor
+from servo_stats import ServoStats
+from config_diff import RUNTIME_OPTIONS, diff_config, needs_restart, runtime_values
+from instances import InstanceRegistry, DEFAULT_INSTANCE, NAME_RE, config_path, default_uds_path, unit_name, parse_ptp4l_config
 
 app = Flask(__name__)
 
 # --- Configuration ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CONFIG_FILE = "/etc/linuxptp/ptp4l.conf"
 PHC2SYS_SERVICE_FILE = "/etc/systemd/system/phc2sys-custom.service"
 SAFE_WRAPPER_SCRIPT = "/usr/local/bin/ptp-safe-wrapper.sh"
 INJECT_SCRIPT = "/usr/local/bin/ptp-inject"
 USER_PROFILES_FILE = os.path.join(BASE_DIR, "user_profiles.json")
+# linuxptp config directory (ptp4l.conf + ptp4l-<name>.conf); overridable for test rigs / benchmarks
+PTP_CONFIG_DIR = os.environ.get("PTP_WEB_CONFIG_DIR", "/etc/linuxptp")
+# Seconds between background telemetry cycles (status / BMCA / clients)
+SAMPLE_INTERVAL = float(os.environ.get("PTP_WEB_SAMPLE_INTERVAL", "1.0"))
+# Concurrent /api/stream connections (each holds one gunicorn thread)
+STREAM_MAX_CLIENTS = int(os.environ.get("PTP_WEB_STREAM_CLIENTS", "48"))
+# Upper bound of tracked radar endpoints (least recently seen are evicted first)
+MAX_CLIENTS = int(os.environ.get("PTP_WEB_MAX_CLIENTS", "4096"))
+# Delay_Req -> Delay_Resp turnaround p99 above which a master is flagged as overloaded
+TURNAROUND_LIMIT_MS = float(os.environ.get("PTP_WEB_TURNAROUND_LIMIT_MS", "10"))
+CLIENT_TTL = 120
+# In-memory metric history depth (hours at SAMPLE_INTERVAL resolution)
+HISTORY_HOURS = float(os.environ.get("PTP_WEB_HISTORY_HOURS", "24"))
+# On-disk metric store (one mmap file per day): directory, retention in days and total size cap
+DATA_DIR = os.environ.get("PTP_WEB_DATA_DIR", "/var/lib/ptp-web")
+STORE_DAYS = int(os.environ.get("PTP_WEB_STORE_DAYS", "30"))
+STORE_MAX_MB = int(os.environ.get("PTP_WEB_STORE_MAX_MB", "512"))
+# Rolling archive of captured PTP message headers (MB on disk, 0 = off)
+ARCHIVE_MB = int(os.environ.get("PTP_WEB_ARCHIVE_MB", "0"))
+# Fleet aggregator peers: comma-separated host[:port] list, or a JSON list in fleet_peers.json
+FLEET_PEERS = os.environ.get("PTP_WEB_FLEET_PEERS", "")
+FLEET_PEERS_FILE = os.path.join(BASE_DIR, "fleet_peers.json")
+LOG_UNITS = ["ptp4l", "ptp4l@*", "phc2sys-custom"]
+LOG_TAIL = 30
+SERVO_MAX_AGE = 5.0 # seconds a parsed "master offset" line stays current
+# Offset limit for lock detection and the servo verdict (ST 2059-2: +/-1 us) and the rolling stats window (samples)
+OFFSET_LIMIT_NS = int(os.environ.get("PTP_WEB_OFFSET_LIMIT_NS", "1000"))
+SERVO_WINDOW = int(os.environ.get("PTP_WEB_SERVO_WINDOW", "60"))
+# Helper processes (pgrep / pmc / systemctl) alive at once
+MAX_PROCS = int(os.environ.get("PTP_WEB_MAX_PROCS", "8"))
+SYSTEMCTL_TIMEOUT = 30.0
 
-# Global Cache
-STATUS_CACHE = { "time": 0, "data": None }
+# --- Self Metrics (served by /metrics together with the sampled values) ---
+METRICS = Registry()
+CMD_SECONDS = METRICS.histogram("ptpweb_subprocess_seconds", "Latency of helper process calls", ["cmd"])
+CMD_RESULTS = METRICS.counter("ptpweb_subprocess_total", "Helper process calls by result (ok, exit, timeout, error, coalesced)", ["cmd", "result"])
+PMC_SECONDS = METRICS.histogram("ptpweb_pmc_seconds", "Latency of batched management requests to ptp4l", ["instance"])
+HTTP_SECONDS = METRICS.histogram("ptpweb_http_request_seconds", "HTTP request latency per route", ["route"])
+SAMPLE_SECONDS = METRICS.histogram("ptpweb_sample_cycle_seconds", "Duration of one telemetry sampling cycle")
+OFFSET_ABS_NS = METRICS.histogram("ptp_offset_abs_ns", "Absolute offset from master per sample", ["instance"],
+                                  buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 100000, 1000000))
+JOURNAL_RECORDS = METRICS.counter("ptpweb_journal_records_total", "Journal records received by the follower", ["unit"])
 
-# --- Client Monitoring Globals ---
-MONITOR_CONFIG = { "mode": "disabled", "interfaces": [] }
-CLIENTS = {} # { ip: { mac: str, last_seen: float } }
-CLIENTS_LOCK = threading.Lock()
+# NICs / addresses from rtnetlink and config directory changes from inotify, re-read only when the kernel reports a change
+HOST = HostInfo().start()
+atexit.register(HOST.close)
+# ptp4l instances (ptp4l.service + ptp4l@<name>.service), each with a persistent management connection
+INSTANCES = InstanceRegistry(PTP_CONFIG_DIR)
+atexit.register(INSTANCES.close)
+# Open /dev/ptpN per interface: PHC reads are a clock_gettime() instead of ethtool + phc_ctl
+PHC = PhcManager(ifindex=HOST.ifindex)
+atexit.register(PHC.close)
+
+def on_config_change(name):
+    # name is None when the watch itself ended: go back to checking mtimes every cycle
+    if name is None: INSTANCES.watched = False
+    INSTANCES.invalidate()
+
+def on_link_change(names):
+    # Driver reload / interface re-creation: reopen the PHC on next use
+    for name in names: PHC.invalidate(name)
 
-# --- Cleanup on Exit ---
-def cleanup_subprocesses():
-    # 退出时强制清理 tcpdump，防止僵尸进程
-    os.system("pkill -f 'tcpdump -i .* dst port 319'")
+INSTANCES.watched = HOST.watch_dir(PTP_CONFIG_DIR, on_config_change)
+if HOST.watching_links: PHC.revalidate = None
+HOST.link_listeners.append(on_link_change)
+# Instances are sampled in parallel, so one cycle costs the slowest instance rather than the sum
+SAMPLE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ptp-sample")
 
-atexit.register(cleanup_subprocesses)
+# --- Client Monitoring Globals ---
+CLIENTS = ClientTable(MAX_CLIENTS, TURNAROUND_LIMIT_MS / 1000) # ip (or mac for L2 PTP) -> ClientStats
+# Every announcing port seen by the radar, ranked per (iface, domain) as Announce messages arrive
+FOREIGN = ForeignMasterTable(MAX_CLIENTS, CLIENT_TTL)
+# Capture factory: RawCapture(iface) in production, capture.PcapCapture to replay recorded traffic
+open_capture = RawCapture
 
 # --- Built-in Profiles ---
 BUILTIN_PROFILES = {
@@ -218,244 +299,148 @@ BUILTIN_PROFILES = {
     "st2059": { "name": "SMPTE ST 2059-2 (Broadcast)", "timeStamping": "hardware", "domain": 127, "priority1": 128, "priority2": 128, "logAnnounceInterval": -2, "logSyncInterval": -3, "logMinDelayReqInterval": -2, "announceReceiptTimeout": 3, "syncMode": "slave", "logLevel": 6 }
 }
 
-def run_cmd_safe(cmd_list):
-    try:
-        env = os.environ.copy()
-        env['LANG'] = 'C'
-        # Reduced timeout to prevent long blocking
-        result = subprocess.check_output(cmd_list, stderr=subprocess.STDOUT, timeout=1.5, env=env)
-        return result.decode('utf-8', errors='ignore')
-    except:
-        return ""
+def observe_cmd(result, coalesced):
+    name = os.path.basename(result.argv[0])
+    if coalesced: CMD_RESULTS.labels(name, "coalesced").inc(); return
+    CMD_SECONDS.labels(name).observe(result.duration)
+    CMD_RESULTS.labels(name, result.status).inc()
 
-def validate_interface(iface):
-    if not iface: return False
-    try:
-        valid_nics = os.listdir('/sys/class/net/')
-        return iface in valid_nics
-    except:
-        return False
+EXECUTOR = Executor(max_procs=MAX_PROCS, on_result=observe_cmd)
+atexit.register(EXECUTOR.close)
 
-# --- Monitor Logic (Multi-Interface) ---
-def get_ip_address(iface):
-    try:
-        out = subprocess.check_output(["ip", "-4", "addr", "show", iface], text=True)
-        m = re.search(r'inet\s+(\d+\.\d+\.\d+\.\d+)', out)
-        return m.group(1) if m else None
-    except: return None
-
-def monitor_worker(iface):
-    global CLIENTS
-    proc = None
-    my_ip = get_ip_address(iface)
-    
-    while True:
-        # Check global config (simple polling)
-        if MONITOR_CONFIG["mode"] == "disabled" or iface not in MONITOR_CONFIG["interfaces"]:
-            if proc:
-                try: proc.terminate(); proc.wait()
-                except: pass
-                proc = None
-            time.sleep(1)
-            # If interface was removed from config, exit this worker
-            if iface not in MONITOR_CONFIG["interfaces"]: return
-            continue
+def run_cmd_safe(cmd_list):
+    # Output of a successful call, "" otherwise (callers needing the reason use EXECUTOR.run)
+    result = EXECUTOR.run(cmd_list)
+    return result.output if result.ok else ""
 
-        if not proc or proc.poll() is not None:
-            # Capture both Sync/FollowUp and DelayReq to see EVERYONE (GM + Clients)
-            cmd = ["tcpdump", "-i", iface, "-nn", "-l", "-e", "dst port 319"]
-            try:
-                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
-            except:
-                time.sleep(5)
-                continue
+def systemctl(*args):
+    return EXECUTOR.run(["systemctl", *args], timeout=SYSTEMCTL_TIMEOUT)
 
-        try:
-            line = proc.stdout.readline()
-            if not line:
-                time.sleep(0.1)
-                continue
-            
-            # Simple interaction update
-            current_time = time.time()
-            # Regex: SourceMAC > ... SourceIP.319 >
-            # Note: tcpdump format varies slightly by version, but usually:
-            # HH:MM:SS.us MAC1 > MAC2, ethertype IPv4 (0x0800), length 76: 192.168.1.55.319 > 224.0.1.129.319: UDP, length 44
-            # We want source IP.
-            m = re.search(r'([0-9a-fA-F:]{17}) > .*? (\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\.319 >', line)
-            
-            # If standard regex failed, try alternative format (sometimes source port is not 319)
-            # e.g. 192.168.1.55.56789 > 224.0.1.129.319
-            if not m:
-                m = re.search(r'([0-9a-fA-F:]{17}) > .*? (\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\.(\d+) > .*?\.319', line)
-
-            if m:
-                mac = m.group(1)
-                ip = m.group(2)
-                # Filter out our own MAC/IP if possible? (Hard without netifaces)
-                # But seeing "Self" in radar is sometimes useful debugging.
-                is_self = (ip == my_ip)
-                with CLIENTS_LOCK:
-                    # Append interface name to info for UI
-                    CLIENTS[ip] = { "mac": mac, "last_seen": current_time, "iface": iface, "is_self": is_self }       
-        except:
-            time.sleep(1)
-
-def monitor_manager_thread():
-    # Spawns workers for interfaces in MONITOR_CONFIG
-    active_workers = {} # iface -> thread
-    while True:
-        target_ifaces = MONITOR_CONFIG.get("interfaces", [])
-        mode = MONITOR_CONFIG.get("mode", "disabled")
-        
-        if mode == "disabled":
-             target_ifaces = []
-
-        # Start new workers
-        for iface in target_ifaces:
-                if iface not in active_workers or not active_workers[iface].is_alive():
-                    # Refresh IP in case it changed
-                    t = threading.Thread(target=monitor_worker, args=(iface,), daemon=True)
-                    t.start()
-                    active_workers[iface] = t
-        
-        # Prune old workers (logic handled inside worker loop checking config)
-        time.sleep(2)
+def validate_interface(iface):
+    return bool(iface) and HOST.has_link(iface)
 
-# Start Manager
-threading.Thread(target=monitor_manager_thread, daemon=True).start()
+# Start Supervisor (one selector loop over every capture; config changes wake it immediately)
+# Local IPs come from the netlink-maintained table, so is_self follows DHCP changes
+MONITOR = MonitorSupervisor(CLIENTS, lambda iface: open_capture(iface), HOST.ipv4, CLIENT_TTL)
+MONITOR.observers.append(FOREIGN.observe)
+ARCHIVE = PacketArchive(os.path.join(DATA_DIR, "archive"), ARCHIVE_MB << 20) if ARCHIVE_MB > 0 else None
+if ARCHIVE:
+    MONITOR.observers.append(ARCHIVE.observe)
+    atexit.register(ARCHIVE.close)
+MONITOR.start()
 
-def cleanup_thread():
-    while True:
-        time.sleep(5)
-        now = time.time()
-        with CLIENTS_LOCK:
-            to_remove = [ip for ip, d in CLIENTS.items() if now - d['last_seen'] > 120]
-            for ip in to_remove:
-                del CLIENTS[ip]
+def get_ptp_time(interface):
+    if not interface: return None
+    ns = PHC.gettime_ns(interface)
+    if ns is None: return None
+    return datetime.fromtimestamp(ns // 1000000000).strftime('%Y-%m-%d %H:%M:%S')
 
+def pmc_query(inst, *names):
+    start = time.perf_counter()
+    try: return INSTANCES.client(inst).get(*names)
+    finally: PMC_SECONDS.labels(inst.name).observe(time.perf_counter() - start)
 
-threading.Thread(target=cleanup_thread, daemon=True).start()
+def list_ptp_processes():
+    """argv lists of the running ptp4l / phc2sys processes, None when pgrep itself failed."""
+    # One fork per cycle for every instance; match on the process name so `journalctl -u ptp4l` never counts
+    result = EXECUTOR.run(["pgrep", "-a", "^(ptp4l|phc2sys)$"])
+    if result.failed or result.returncode not in (0, 1): return None     # 1 = nothing matched
+    procs = []
+    for line in result.output.splitlines():
+        parts = line.split()
+        if len(parts) >= 2: procs.append(parts[1:])
+    return procs
 
-def get_current_interface():
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                for line in f:
-                    m = re.match(r'^\[([^\]]+)\]', line.strip())
-                    if m and m.group(1) != 'global':
-                        return m.group(1)
-    except: pass
-    return None
+def instance_running(inst, procs):
+    for argv in procs or ():
+        if os.path.basename(argv[0]) != "ptp4l": continue
+        if inst.config_file in argv: return True
+        if inst.name == DEFAULT_INSTANCE and "-f" not in argv: return True
+    return False
 
-def get_ptp_time(interface):
-    if not interface: return None
-    try:
-        ethtool_out = run_cmd_safe(["ethtool", "-T", interface])
-        m = re.search(r'(?:PTP Hardware Clock|Hardware timestamp provider index):\s+(\d+)', ethtool_out)
-        if not m: return None
-        ptp_dev = f"/dev/ptp{m.group(1)}"
-        out = run_cmd_safe(["phc_ctl", ptp_dev, "get"])
-        m_ts = re.search(r'clock time is (\d+)\.', out)
-        if m_ts:
-            ts = int(m_ts.group(1))
-            return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-    except: pass
-    return None
+def summarize_port_states(states):
+    if 'SLAVE' in states: return 'SLAVE'
+    if all(s == 'MASTER' for s in states): return 'MASTER'
+    if 'UNCALIBRATED' in states: return 'UNCALIBRATED'
+    return states[0]
 
-def get_pmc_dict():
-    cmd = ["pmc", "-u", "-b", "0", 
-           "GET CURRENT_DATA_SET", 
-           "GET PORT_DATA_SET", 
-           "GET TIME_STATUS_NP", 
-           "GET PARENT_DATA_SET"]
-    output = run_cmd_safe(cmd)
-    data = { "port_state": "UNKNOWN", "offset": 0, "path_delay": 0, "steps_removed": -1, "gm_id": "Unknown", "gm_present": False, "clock_id": "", "phc2sys_state": "STOPPED" }
-
-    m_delay = re.search(r'meanPathDelay\s+([\d\.\-eE]+)', output)
-    if m_delay: 
-        try: data['path_delay'] = float(m_delay.group(1))
-        except: pass
+STATUS_DATASETS = ("DEFAULT_DATA_SET", "CURRENT_DATA_SET", "PORT_DATA_SET", "TIME_STATUS_NP", "PARENT_DATA_SET")
+BMCA_DATASETS = ("DEFAULT_DATA_SET", "PARENT_DATA_SET", "TIME_PROPERTIES_DATA_SET")
 
-    m_steps = re.search(r'stepsRemoved\s+(\d+)', output)
-    if m_steps: 
-        try: data['steps_removed'] = int(m_steps.group(1))
-        except: pass
+def pmc_query_cli(inst, *names):
+    # Same {name: dataset} shape as the native client, parsed in one pass from the pmc binary's output
+    cmd = ["pmc", "-u", "-b", "0", "-s", inst.uds_path, "-d", str(inst.domain)] + [f"GET {n}" for n in names]
+    return parse_datasets(run_cmd_safe(cmd))
 
-    m_off = re.search(r'offsetFromMaster\s+([\d\.\-eE]+)', output)
-    if m_off: 
-        try: data['offset'] = float(m_off.group(1))
-        except: pass
+def pmc_datasets(inst, *names):
+    try: return pmc_query(inst, *names)
+    except PmcUnavailable:
+        # Socket exists but is not usable in-process - fall back to the pmc binary
+        return pmc_query_cli(inst, *names) if os.path.exists(inst.uds_path) else {}
 
-    m_gm = re.search(r'grandmasterIdentity\s+([0-9a-fA-F\.]+)', output)
-    if m_gm: data['gm_id'] = m_gm.group(1)
-        
-    m_clk = re.search(r'clockIdentity\s+([0-9a-fA-F\.]+)', output)
-    if not m_clk: m_clk = re.search(r'^([0-9a-fA-F\.]+).*RESPONSE', output, re.MULTILINE)
-    if m_clk: data['clock_id'] = m_clk.group(1)
-
-    states = re.findall(r'portState\s+(\w+)', output)
-    if states:
-        if 'SLAVE' in states: data['port_state'] = 'SLAVE'
-        elif all(s == 'MASTER' for s in states): data['port_state'] = 'MASTER'
-        elif 'UNCALIBRATED' in states: data['port_state'] = 'UNCALIBRATED'
-        else: data['port_state'] = states[0]
-
-    if run_cmd_safe(["pgrep", "-f", "phc2sys"]): data["phc2sys_state"] = "RUNNING"
+def get_pmc_dict(inst):
+    data = { "port_state": "UNKNOWN", "ports": [], "offset": 0, "path_delay": 0, "freq": 0, "steps_removed": -1, "gm_id": "Unknown", "gm_present": False, "clock_id": "", "parent": "" }
+    try: ds = pmc_datasets(inst, *STATUS_DATASETS)
+    except PmcError: return data
+    cur = ds.get("CURRENT_DATA_SET")
+    if cur and cur.offset_from_master is not None:
+        data['path_delay'] = cur.mean_path_delay
+        data['steps_removed'] = cur.steps_removed
+        data['offset'] = cur.offset_from_master
+    if "PARENT_DATA_SET" in ds:
+        data['gm_id'] = ds["PARENT_DATA_SET"].gm_identity
+        data['parent'] = ds["PARENT_DATA_SET"].parent_port_identity
+    ts = ds.get("TIME_STATUS_NP")
+    if ts and ts.cumulative_scaled_rate_offset is not None:
+        data['gm_present'] = bool(ts.gm_present)
+        # cumulativeScaledRateOffset = (rateRatio - 1) * 2^41 -> ppb
+        data['freq'] = ts.cumulative_scaled_rate_offset / 2**41 * 1e9
+    if "DEFAULT_DATA_SET" in ds: data['clock_id'] = ds["DEFAULT_DATA_SET"].clock_identity
+    # One entry per port so boundary clocks show every port, the summary keeps the old single state
+    data['ports'] = [{ "id": p.port_identity, "state": p.port_state } for p in ds.get("PORT_DATA_SET", []) if p.port_state]
+    if data['ports']: data['port_state'] = summarize_port_states([p["state"] for p in data['ports']])
     return data
 
-def get_bmca_info():
-    # Helper to parse hex/int
-    def p_val(txt, key, type_func=lambda x: int(x, 0)):
-        # Match "key value"
-        m = re.search(f'{key}\\s+([\\w\\d\\.\\-]+)', txt)
-        if not m: return None
-        try: return type_func(m.group(1))
-        except: return None
-
-    # 1. Get ALL Data in one go (More efficient)
-    cmd = ["pmc", "-u", "-b", "0", "GET DEFAULT_DATA_SET", "GET PARENT_DATA_SET", "GET TIME_PROPERTIES_DATA_SET"]
-    out_all = run_cmd_safe(cmd)
-    
-    # Check if we got valid output
-    if "RESPONSE" not in out_all:
-        return { "local": {}, "gm": {}, "flags": {}, "decision": [], "winner": "unknown", "error": "No PTP response" }
-
+def bmca_sources(ds):
+    if not ds: return None
+    d = ds.get("DEFAULT_DATA_SET"); p = ds.get("PARENT_DATA_SET"); t = ds.get("TIME_PROPERTIES_DATA_SET")
     local = {
-        "priority1": p_val(out_all, "priority1"),
-        "class": p_val(out_all, "clockClass"),
-        "accuracy": p_val(out_all, "clockAccuracy"), 
-        "variance": p_val(out_all, "offsetScaledLogVariance"),
-        "priority2": p_val(out_all, "priority2"),
-        "id": "", 
+        "priority1": d.priority1 if d else None,
+        "class": d.clock_class if d else None,
+        "accuracy": d.clock_accuracy if d else None,
+        "variance": d.offset_scaled_log_variance if d else None,
+        "priority2": d.priority2 if d else None,
+        "id": (d.clock_identity or "") if d else "",
     }
-    # Local ID usually appears under generic clockIdentity or PTP port identity
-    # In bundled output, we need to be careful. GET DEFAULT_DATA_SET response usually has clockIdentity.
-    # We'll look for the first clockIdentity which is usually local.
-    m_id = re.search(r'clockIdentity\s+([0-9a-fA-F\.]+)', out_all)
-    if m_id: local["id"] = m_id.group(1)
-
     gm = {
-        "priority1": p_val(out_all, "grandmasterPriority1"),
-        "class": p_val(out_all, "grandmasterClockQuality.clockClass"),
-        "accuracy": p_val(out_all, "grandmasterClockQuality.clockAccuracy"),
-        "variance": p_val(out_all, "grandmasterClockQuality.offsetScaledLogVariance"),
-        "priority2": p_val(out_all, "grandmasterPriority2"),
-        "id": ""
+        "priority1": p.gm_priority1 if p else None,
+        "class": p.gm_clock_class if p else None,
+        "accuracy": p.gm_clock_accuracy if p else None,
+        "variance": p.gm_offset_scaled_log_variance if p else None,
+        "priority2": p.gm_priority2 if p else None,
+        "id": (p.gm_identity or "") if p else "",
     }
-    m_gmid = re.search(r'grandmasterIdentity\s+([0-9a-fA-F\.]+)', out_all)
-    if m_gmid: gm["id"] = m_gmid.group(1)
-
     flags = {
-        "currentUtcOffset": p_val(out_all, "currentUtcOffset"),
-        "leap61": p_val(out_all, "leap61"),
-        "leap59": p_val(out_all, "leap59"),
-        "currentUtcOffsetValid": p_val(out_all, "currentUtcOffsetValid"),
-        "ptpTimescale": p_val(out_all, "ptpTimescale"),
-        "timeTraceable": p_val(out_all, "timeTraceable"),
-        "frequencyTraceable": p_val(out_all, "frequencyTraceable"),
-        "timeSource": p_val(out_all, "timeSource")
+        "currentUtcOffset": t.current_utc_offset if t else None,
+        "leap61": t.leap61 if t else None,
+        "leap59": t.leap59 if t else None,
+        "currentUtcOffsetValid": t.current_utc_offset_valid if t else None,
+        "ptpTimescale": t.ptp_timescale if t else None,
+        "timeTraceable": t.time_traceable if t else None,
+        "frequencyTraceable": t.frequency_traceable if t else None,
+        "timeSource": t.time_source if t else None,
     }
+    return local, gm, flags
+
+def get_bmca_info(inst):
+    # 1. Get ALL Data in one go (single batched management request, or one pmc run)
+    try: sources = bmca_sources(pmc_datasets(inst, *BMCA_DATASETS))
+    except PmcError: sources = None
+
+    # Check if we got valid output
+    if not sources:
+        return { "local": {}, "gm": {}, "flags": {}, "decision": [], "winner": "unknown", "error": "No PTP response" }
+    local, gm, flags = sources
 
     # 4. Analyze Winner
     decision = []
@@ -532,6 +517,18 @@ def save_user_profiles(profiles):
     with open(tmp_file, 'w') as f: json.dump(profiles, f, indent=4)
     os.rename(tmp_file, USER_PROFILES_FILE)
 
+def write_if_changed(path, content, mode=None):
+    """Atomically replace `path` unless it already holds `content`. Returns True when written."""
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content: return False
+    except OSError: pass
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f: f.write(content)
+    if mode is not None: os.chmod(tmp, mode)
+    os.rename(tmp, path)
+    return True
+
 def create_safe_wrapper_script(sync_mode, log_level):
     script_dir = os.path.dirname(SAFE_WRAPPER_SCRIPT)
     if not os.path.exists(script_dir):
@@ -549,7 +546,9 @@ exec /usr/sbin/phc2sys -s CLOCK_REALTIME -c $INTERFACE -O 0 -l {log_level}
 """
     else:
         content += f"""
-PTP_DEV_ID=$(ethtool -T $INTERFACE 2>/dev/null | grep -E "(Clock|index):" | sed 's/.*: //')
+# sysfs link first (no process spawn); ethtool only for drivers without it
+PTP_DEV_ID=$(ls /sys/class/net/$INTERFACE/device/ptp 2>/dev/null | sed -n 's/^ptp//p' | head -n 1)
+if [ -z "$PTP_DEV_ID" ]; then PTP_DEV_ID=$(ethtool -T $INTERFACE 2>/dev/null | grep -E "(Clock|index):" | sed 's/.*: //'); fi
 if [ -z "$PTP_DEV_ID" ]; then exit 1; fi
 PTP_DEV="/dev/ptp$PTP_DEV_ID"
 PTP_SECONDS=$(phc_ctl $PTP_DEV get 2>/dev/null | sed -n 's/.*clock time is \\([0-9]\\+\\)\\..*/\\1/p')
@@ -560,17 +559,17 @@ fi
 echo "✅ PTP time valid. Syncing System..."
 exec /usr/sbin/phc2sys -s $INTERFACE -c CLOCK_REALTIME -w -O 0 -l {log_level}
 """
-    try:
-        with open(SAFE_WRAPPER_SCRIPT, 'w') as f: f.write(content)
-        os.chmod(SAFE_WRAPPER_SCRIPT, 0o755)
+    try: return write_if_changed(SAFE_WRAPPER_SCRIPT, content, 0o755)
     except Exception as e: print(f"Error writing wrapper script: {e}")
+    return False
 
-def create_phc2sys_service(interface, sync_mode, log_level):
-    create_safe_wrapper_script(sync_mode, log_level)
+def create_phc2sys_service(interface, sync_mode, log_level, unit="ptp4l"):
+    """Returns True when the wrapper or the unit file changed (phc2sys needs a restart)."""
+    changed = create_safe_wrapper_script(sync_mode, log_level)
     service_content = f"""[Unit]
 Description=Safe System Clock Sync (phc2sys)
-After=ptp4l.service
-Requires=ptp4l.service
+After={unit}.service
+Requires={unit}.service
 [Service]
 Type=simple
 ExecStart={SAFE_WRAPPER_SCRIPT} {interface}
@@ -581,45 +580,482 @@ StandardError=journal
 [Install]
 WantedBy=multi-user.target
 """
-    tmp_svc = PHC2SYS_SERVICE_FILE + ".tmp"
-    with open(tmp_svc, 'w') as f: f.write(service_content)
-    os.rename(tmp_svc, PHC2SYS_SERVICE_FILE)
-    subprocess.run(["systemctl", "daemon-reload"], check=False)
-
-def restart_services_async(enable_phc2sys, master_mode=False, domain=0):
-    def _restart():
-        time.sleep(0.5)
-        subprocess.run(["systemctl", "restart", "ptp4l"], check=False)
-        time.sleep(2) 
-        if enable_phc2sys:
-            subprocess.run(["systemctl", "enable", "--now", "phc2sys-custom"], check=False)
-            subprocess.run(["systemctl", "restart", "phc2sys-custom"], check=False)
-        else:
-            subprocess.run(["systemctl", "stop", "phc2sys-custom"], check=False)
-            subprocess.run(["systemctl", "disable", "phc2sys-custom"], check=False)
-        
-        if master_mode:
-            print(f"Fire-and-forget injection for Domain {domain}")
-            subprocess.Popen([INJECT_SCRIPT, str(domain)], 
-                             stdout=subprocess.DEVNULL, 
-                             stderr=subprocess.DEVNULL)
-            
-    threading.Thread(target=_restart).start()
+    if write_if_changed(PHC2SYS_SERVICE_FILE, service_content):
+        systemctl("daemon-reload")
+        changed = True
+    return changed
+
+def phc2sys_owner():
+    """ptp4l unit phc2sys-custom is bound to (its Requires=), None when the service is not installed."""
+    try:
+        with open(PHC2SYS_SERVICE_FILE) as f:
+            for line in f:
+                if line.startswith("Requires="): return os.path.splitext(line.split("=", 1)[1].strip())[0]
+    except OSError: pass
+    return None
+
+def owns_phc2sys(inst):
+    # A single phc2sys-custom drives the system clock: only the instance it is bound to may rewrite or stop it
+    owner = phc2sys_owner()
+    return owner is None or owner == inst.unit or not any(i.unit == owner for i in INSTANCES.all())
+
+# --- Apply jobs ---
+READY_TIMEOUT = 10.0    # ptp4l answering on its management socket after a restart
+STATE_TIMEOUT = 60.0    # port reaching MASTER / SLAVE (announceReceiptTimeout x announce interval + BMCA)
+LOCK_TIMEOUT = 60.0     # servo reaching s2 after the port became SLAVE
+# Grandmaster identity advertised in master mode (clockClass 13 + the traceable flags ST 2110 requires)
+GM_SETTINGS = GrandmasterSettingsNP(clock_class=13, clock_accuracy=0x27, offset_scaled_log_variance=0xFFFF,
+                                    current_utc_offset=37, leap61=0, leap59=0, current_utc_offset_valid=1,
+                                    ptp_timescale=1, time_traceable=1, frequency_traceable=1, time_source=0x50)
+# ptp4l's own defaults for the GRANDMASTER_SETTINGS_NP fields a config does not set
+GM_DEFAULTS = { "clockClass": "248", "clockAccuracy": "0xFE", "offsetScaledLogVariance": "0xFFFF", "utc_offset": "37", "timeSource": "0xA0" }
+
+def configured_gm_settings(options):
+    """GRANDMASTER_SETTINGS_NP as ptp4l builds it at start from its config (no traceability flags)."""
+    v = lambda key: int(options.get(key) or GM_DEFAULTS[key], 0)
+    return GrandmasterSettingsNP(clock_class=v("clockClass"), clock_accuracy=v("clockAccuracy"), offset_scaled_log_variance=v("offsetScaledLogVariance"),
+                                 current_utc_offset=v("utc_offset"), leap61=0, leap59=0, current_utc_offset_valid=0,
+                                 ptp_timescale=0 if options.get("utc_timescale") == "1" else 1, time_traceable=0, frequency_traceable=0,
+                                 time_source=v("timeSource"))
+
+APPLY = ApplyQueue().start()
+
+def port_states(inst):
+    try: return [p.port_state for p in INSTANCES.client(inst).get("PORT_DATA_SET", timeout=0.2).get("PORT_DATA_SET", [])]
+    except PmcError: return None
+
+def inject_gm_settings(job, inst):
+    try:
+        INSTANCES.client(inst).set("GRANDMASTER_SETTINGS_NP", GM_SETTINGS)
+        job.step("grandmaster settings set")
+    except PmcUnavailable:
+        # Socket not usable in-process: hand over to the pmc based injector
+        subprocess.Popen([INJECT_SCRIPT, str(inst.domain), inst.uds_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        job.step("grandmaster settings handed to ptp-inject")
+    except PmcError as e:
+        job.step("grandmaster settings failed", str(e))
+
+def wait_ready(job, inst, master_mode, restarted_at):
+    """Follow the restarted instance: management socket -> port state -> GM settings / servo lock."""
+    states = wait_until(lambda: port_states(inst), READY_TIMEOUT, cancel=APPLY.has_pending)
+    if states is None: raise RuntimeError(f"ptp4l did not answer on {inst.uds_path}")
+    job.step("management socket ready", states)
+    job.result["time_to_ready"] = job.elapsed()
+
+    target = ("MASTER", "GRAND_MASTER") if master_mode else ("SLAVE",)
+    def reached():
+        st = port_states(inst)
+        return st if st and any(x in target for x in st) else None
+    states = wait_until(reached, STATE_TIMEOUT, cancel=APPLY.has_pending)
+    if states is None:
+        job.step("port did not reach " + "/".join(target), port_states(inst)); return
+    job.step("port " + summarize_port_states(states), states)
+    job.result["time_to_state"] = job.elapsed()
+    if master_mode:
+        inject_gm_settings(job, inst); return
+
+    # Locked = ptp4l's servo reports s2 in a log line newer than the restart
+    key = inst.unit + ".service"
+    def locked():
+        servo = JOURNAL.servo.get(key)
+        return servo if servo and servo.ts >= restarted_at and servo.state == 2 else None
+    servo = wait_until(locked, LOCK_TIMEOUT, interval=0.1, cancel=APPLY.has_pending)
+    if servo is None: job.step("servo not locked yet"); return
+    job.step("servo locked", { "offset": servo.offset, "freq": servo.freq })
+    job.result["time_to_lock"] = job.elapsed()
+
+def set_runtime_options(job, inst, values, master_mode):
+    """Change priorities / GM settings in place with management SETs. False when ptp4l refused (restart instead)."""
+    pmc = INSTANCES.client(inst)
+    try:
+        for key in ("priority1", "priority2"):
+            if key in values:
+                pmc.set(RUNTIME_OPTIONS[key], int(values[key], 0))
+                job.step(f"{key} set", int(values[key], 0))
+        if "clockClass" in values or "timeSource" in values:
+            # Built from the config, not read back: flags injected earlier (master mode) must not survive
+            gm = GM_SETTINGS if master_mode else configured_gm_settings(parse_ptp4l_config(inst.config_file)[0])
+            pmc.set("GRANDMASTER_SETTINGS_NP", gm)
+            job.step("grandmaster settings set", { "clockClass": gm.clock_class, "timeSource": gm.time_source })
+    except (PmcError, ValueError) as e:
+        job.step("runtime change refused", str(e))
+        return False
+    return True
+
+def write_config(config_file, text):
+    tmp_conf = config_file + ".tmp"
+    with open(tmp_conf, 'w') as f: f.write(text)
+    os.rename(tmp_conf, config_file)
+
+def run_apply(job, instance, config_file, cfg, phc_args, master_mode):
+    try:
+        with open(config_file, 'r') as f: old_cfg = f.read()
+    except OSError: old_cfg = None
+    changes = diff_config(old_cfg, cfg)
+    job.result["changes"] = [c._asdict() for c in changes]
+    written = cfg != old_cfg
+    if written:
+        if old_cfg is not None: shutil.copy(config_file, config_file + ".bak")
+        write_config(config_file, cfg)
+        job.step("config written", config_file)
+    try: apply_changes(job, instance, config_file, changes, phc_args, master_mode)
+    except Exception:
+        # The file on disk must stay what ptp4l runs with, or an identical retry would report "no changes"
+        if written:
+            if old_cfg is None: os.unlink(config_file)
+            else: write_config(config_file, old_cfg)
+            INSTANCES.refresh()
+            job.step("config restored", config_file)
+        raise
+    finally:
+        # Screens see the outcome now rather than at the next scheduled sample
+        SAMPLER.refresh()
+
+def apply_changes(job, instance, config_file, changes, phc_args, master_mode):
+    INSTANCES.refresh()
+    inst = INSTANCES.get(instance)
+    if inst is None: raise RuntimeError(f"{config_file} is outside {PTP_CONFIG_DIR}")
+
+    # Only what really changed is applied: runtime options by SET, log options at the next restart
+    procs = list_ptp_processes()
+    if procs is None: job.step("process check failed, restarting to be safe")
+    restart = needs_restart(changes) or not instance_running(inst, procs)
+    if not restart and runtime_values(changes):
+        restart = not set_runtime_options(job, inst, runtime_values(changes), master_mode)
+    deferred = [c.key for c in changes if c.kind == "deferred"]
+    if deferred and not restart: job.step("applied on next restart", deferred)
+    phc_running = any(os.path.basename(argv[0]) == "phc2sys" for argv in procs or ())
+    if not owns_phc2sys(inst):
+        job.step("phc2sys left alone", f"phc2sys-custom belongs to {phc2sys_owner()}")
+        phc_args = phc_running = None
+    phc_changed = create_phc2sys_service(*phc_args) if phc_args else False
+    job.result["restarted"] = restart
+
+    if restart:
+        # Template instances (ptp4l@<name>) are enabled on first apply so they survive a reboot
+        if inst.unit != "ptp4l":
+            r = systemctl("enable", inst.unit)
+            if not r.ok: job.step("enable failed", r.describe())
+        restarted_at = time.time()
+        r = systemctl("restart", inst.unit)
+        if not r.ok: raise RuntimeError(f"restart of {inst.unit} failed: {r.describe()}")
+        job.step("ptp4l restarted", inst.unit)
+    # phc2sys -w waits for ptp4l itself, no need to hold it back
+    if phc_args and (restart or phc_changed or not phc_running):
+        enabled, r = EXECUTOR.run_all([["systemctl", "enable", "phc2sys-custom"], ["systemctl", "restart", "phc2sys-custom"]], SYSTEMCTL_TIMEOUT)
+        if not enabled.ok: job.step("enable failed", enabled.describe())
+        job.step("phc2sys restarted" if r.ok else "phc2sys restart failed", None if r.ok else r.describe())
+    elif not phc_args and phc_running:
+        r = systemctl("disable", "--now", "phc2sys-custom")
+        job.step("phc2sys stopped" if r.ok else "phc2sys stop failed", None if r.ok else r.describe())
+    if restart: wait_ready(job, inst, master_mode, restarted_at)
+    elif not job.steps: job.step("no changes")
+
+def run_stop(job, instance):
+    units = [unit_name(instance)]
+    if phc2sys_owner() == units[0]: units.append("phc2sys-custom")
+    # Independent units stop concurrently
+    for unit, r in zip(units, EXECUTOR.run_all([["systemctl", "stop", unit] for unit in units], SYSTEMCTL_TIMEOUT)):
+        if r.ok: job.step("stopped", unit)
+        else: job.step("stop failed", { "unit": unit, "error": r.describe() })
+    SAMPLER.refresh()
 
 def safe_int(val, default=0):
     try: return int(val)
     except: return default
 
+# --- Telemetry Sampler ---
+def collect_status(inst, procs):
+    data = { "instance": inst.name, "ptp4l": "STOPPED", "phc2sys": "STOPPED", "port": "Offline", "ports": [], "offset": 0, "path_delay": 0, "freq": 0, "servo_freq": None, "steps_removed": -1, "gm": "Scanning...", "gm_id": "", "clock_id": "", "parent": "", "ptp_time": "--", "phc_offset": None, "is_self": False }
+    iface = inst.interface
+    if iface:
+        t = get_ptp_time(iface)
+        if t: data["ptp_time"] = t
+        # PHC - CLOCK_REALTIME (best of 5 PTP_SYS_OFFSET readings); ~0 when phc2sys runs with -O 0
+        off = PHC.sys_offset(iface)
+        if off: data["phc_offset"] = off[0]
+    if procs is None:
+        # pgrep failed: say so instead of reporting a running ptp4l as stopped
+        data["ptp4l"] = data["phc2sys"] = "UNKNOWN"
+        return data
+    if any(os.path.basename(argv[0]) == "phc2sys" for argv in procs): data["phc2sys"] = "RUNNING"
+    if instance_running(inst, procs): data["ptp4l"] = "RUNNING"
+    if data["ptp4l"] == "RUNNING":
+        pmc = get_pmc_dict(inst)
+        if 'port_state' in pmc: data["port"] = pmc['port_state']
+        data["ports"] = pmc.get('ports', [])
+        if 'offset' in pmc: data["offset"] = pmc['offset']
+        if 'path_delay' in pmc: data["path_delay"] = pmc['path_delay']
+        if 'freq' in pmc: data["freq"] = pmc['freq']
+        if 'steps_removed' in pmc: data["steps_removed"] = pmc['steps_removed']
+        # Raw identities let a fleet aggregator rebuild the GM -> BC -> slave tree
+        for k in ("gm_id", "clock_id", "parent"): data[k] = pmc.get(k, "")
+        if 'gm_id' in pmc:
+            data["gm"] = pmc['gm_id']
+            if 'clock_id' in pmc and pmc['gm_id'] == pmc['clock_id']:
+                data["is_self"] = True
+                data["gm"] += " (Self)"
+        # Servo frequency adjustment comes from ptp4l's own log lines, pmc does not expose it
+        servo = JOURNAL.servo.get(inst.unit + ".service")
+        if servo and time.time() - servo.ts <= SERVO_MAX_AGE: data["servo_freq"] = servo.freq
+        if data["port"] in ["MASTER", "GRAND_MASTER"]:
+            data["offset"] = 0; data["path_delay"] = 0; data["steps_removed"] = 0; data["is_self"] = True
+    return data
+
+def sample_instance(inst, procs):
+    return { "status": collect_status(inst, procs), "bmca": get_bmca_info(inst) }
+
+# linuxptp defaults for intervals a config does not set
+DEFAULT_LOG_INTERVALS = { "logSyncInterval": 0, "logAnnounceInterval": 1, "logMinDelayReqInterval": 0 }
+_intervals_key = [None]
+
+def update_expected_intervals(insts):
+    """Configured Sync / Announce / Delay_Req intervals per domain, for the radar's cadence checks."""
+    key = tuple((i.name, i.mtime) for i in insts)
+    if key == _intervals_key[0]: return
+    _intervals_key[0] = key
+    expected = {}
+    for inst in insts:
+        if inst.mtime is None: continue
+        options = parse_ptp4l_config(inst.config_file)[0]
+        logs = {}
+        for name, default in DEFAULT_LOG_INTERVALS.items():
+            try: logs[name] = int(options.get(name, default))
+            except ValueError: logs[name] = default
+        expected.setdefault(inst.domain, { 0x0: 2.0 ** logs["logSyncInterval"], 0xB: 2.0 ** logs["logAnnounceInterval"],
+                                           0x1: 2.0 ** logs["logMinDelayReqInterval"] })
+    CLIENTS.expected = expected
+
+def collect_instances():
+    insts = INSTANCES.current()
+    update_expected_intervals(insts)
+    procs = list_ptp_processes()
+    futures = [(inst.name, SAMPLE_POOL.submit(sample_instance, inst, procs)) for inst in insts]
+    return {name: f.result() for name, f in futures}
+
+def instance_rows(data):
+    return {name: instance_row(name, sample) for name, sample in (data.get("instances") or {}).items()}
+
+def primary_instance(data):
+    return (data.get("instances") or {}).get(DEFAULT_INSTANCE) or {}
+
+def instance_row(name, sample):
+    # Compact per-instance summary pushed to dashboards
+    st = sample.get("status", {})
+    return { "ptp4l": st.get("ptp4l"), "port": st.get("port"), "offset": st.get("offset"), "gm": st.get("gm") }
+
+def collect_clients():
+    return CLIENTS.export(time.time())
+
+def radar_row(c):
+    # Compact projection pushed to dashboards (identity only, so it changes rarely); full stats stay behind /api/clients
+    return { "ip": c["ip"], "mac": c["mac"], "iface": c["iface"], "is_self": c["is_self"], "clock_id": c["clock_id"], "domain": c["domain"] }
+
+def radar_counters(c):
+    # The part of a radar row that moves every cycle
+    return { "last_seen": int(c["last_seen"]), "rate": round(c["rate"], 1), "lost": c["lost"], "flags": c["flags"] }
+
+def radar_full(c):
+    return { **radar_row(c), **radar_counters(c) }
+
+SAMPLER = TelemetrySampler({
+    "instances": collect_instances,
+    "clients": collect_clients,
+}, interval=SAMPLE_INTERVAL, derived={
+    # Top-level status / bmca keep describing the default instance
+    "status": lambda data: primary_instance(data).get("status", {}),
+    "bmca": lambda data: primary_instance(data).get("bmca", {}),
+})
+
+# --- Metric History ---
+HISTORY_METRICS = { "offset": "d", "path_delay": "d", "freq": "d", "servo_freq": "d", "phc_offset": "d", "port_state": "b" }
+HISTORY = MetricHistory(max(1, int(HISTORY_HOURS * 3600 / SAMPLE_INTERVAL)), HISTORY_METRICS)
+PORT_STATE_CODES = {name: code for code, name in PORT_STATES.items()}
+
+def record_history(prev, snap):
+    st = snap.data.get("status")
+    if not st: return
+    values = { "port_state": PORT_STATE_CODES.get(st.get("port"), 0), "phc_offset": st.get("phc_offset") }
+    if st.get("ptp4l") == "RUNNING" and st.get("port") in PORT_STATE_CODES:
+        values.update({ "offset": st["offset"], "path_delay": st["path_delay"], "freq": st["freq"], "servo_freq": st.get("servo_freq") })
+    values["gm_id"] = st.get("gm_id")
+    HISTORY.record(snap.time, values)
+    if STORE: STORE.append(snap.time, values, running=st.get("ptp4l") == "RUNNING")
+
+def open_store():
+    """(MetricStore, None) with the in-memory history refilled from it, (None, reason) when the data dir is unusable."""
+    try: store = MetricStore(os.path.join(DATA_DIR, "metrics"), SAMPLE_INTERVAL, STORE_DAYS, STORE_MAX_MB << 20)
+    except OSError as e:
+        traceback.print_exc()
+        return None, str(e)
+    now = time.time()
+    for t, off, delay, freq, sfreq, phc, _, port, flags, _ in store.records(now - HISTORY_HOURS * 3600, now):
+        values = { "offset": off, "path_delay": delay, "freq": freq, "servo_freq": sfreq, "phc_offset": phc, "port_state": port }
+        HISTORY.record(t, {k: v for k, v in values.items() if v == v})
+    return store, None
+
+STORE, STORE_ERROR = open_store()
+if STORE: atexit.register(STORE.close)
+
+# --- Live Stream (single producer, fan-out to every open dashboard) ---
+STREAM = Broadcaster(max_subscribers=STREAM_MAX_CLIENTS)
+
+CLIENT_COUNTERS_INTERVAL = 5.0     # seconds between radar counter updates on the stream
+_counters_sent = [0.0, {}]         # time and content of the last counter update
+
+def publish_snapshot_delta(prev, snap):
+    if not STREAM.subscriber_count: return
+    prev_data = prev.data if prev else {}
+    changed = diff_fields(prev_data.get("status"), snap.data.get("status"))
+    if changed: STREAM.publish("status", changed)
+    changed = diff_fields(prev_data.get("bmca"), snap.data.get("bmca"))
+    if changed: STREAM.publish("bmca", changed)
+    prev_rows, rows = instance_rows(prev_data), instance_rows(snap.data)
+    changed = diff_fields(prev_rows, rows)
+    changed.update({name: None for name in prev_rows if name not in rows})
+    if changed: STREAM.publish("instances", changed)
+    rows = snap.data.get("clients") or []
+    upsert, expire = diff_clients([radar_row(c) for c in prev_data.get("clients") or []], [radar_row(c) for c in rows])
+    counters = {c["ip"]: radar_counters(c) for c in rows}
+    # New or changed endpoints go out complete; counters of the others follow at most every CLIENT_COUNTERS_INTERVAL
+    for row in upsert: row.update(counters[row["ip"]])
+    if upsert or expire: STREAM.publish("clients", {"upsert": upsert, "expire": expire})
+    if snap.time - _counters_sent[0] >= CLIENT_COUNTERS_INTERVAL:
+        changed = diff_fields(_counters_sent[1], counters)
+        _counters_sent[:] = [snap.time, counters]
+        if changed: STREAM.publish("client_counters", changed)
+    # Servo statistics move every cycle: pushed once per cycle instead of polled by every tab
+    STREAM.publish("servo", servo_rows(snap.data))
+    STREAM.publish("foreign", foreign_masters(snap.data))
+
+# --- Journal (one long-lived journalctl -f, no per-request forks) ---
+JOURNAL = JournalFollower(LOG_UNITS, backlog=LOG_TAIL)
+
+def publish_log_records(records):
+    if STREAM.subscriber_count: STREAM.publish("logs", {"lines": [r.message for r in records], "cursor": records[-1].cursor})
+
+def log_entry(r):
+    return { "cursor": r.cursor, "ts": r.ts, "unit": r.unit, "priority": r.priority, "ident": r.ident, "message": r.message }
+
+def count_log_records(records):
+    for r in records: JOURNAL_RECORDS.labels(r.unit).inc()
+
+JOURNAL.listeners.append(publish_log_records)
+JOURNAL.listeners.append(count_log_records)
+JOURNAL.start()
+atexit.register(JOURNAL.stop)
+
+def record_metrics(prev, snap):
+    SAMPLE_SECONDS.observe(snap.duration)
+    for name, sample in (snap.data.get("instances") or {}).items():
+        st = sample.get("status") or {}
+        if st.get("ptp4l") == "RUNNING" and st.get("port") == "SLAVE": OFFSET_ABS_NS.labels(name).observe(abs(st.get("offset") or 0))
+
+def snapshot_metrics():
+    # Rendered from the latest snapshot at scrape time: a scrape never starts new sampling work
+    snap = SAMPLER.snapshot(timeout=0)
+    data = snap.data if snap else {}
+    per = [(name, s.get("status") or {}) for name, s in (data.get("instances") or {}).items()]
+    up = [(name, st) for name, st in per if st.get("ptp4l") == "RUNNING"]
+    yield ("ptp4l_up", "gauge", "ptp4l process running", ("instance",), [((n,), st.get("ptp4l") == "RUNNING") for n, st in per])
+    yield ("phc2sys_up", "gauge", "phc2sys process running", (), [((), (data.get("status") or {}).get("phc2sys") == "RUNNING")])
+    yield ("ptp_port_state", "gauge", "Port state code (IEEE 1588 portState)", ("instance",), [((n,), PORT_STATE_CODES.get(st.get("port"), 0)) for n, st in per])
+    yield ("ptp_offset_ns", "gauge", "Offset from master", ("instance",), [((n,), st.get("offset")) for n, st in up])
+    yield ("ptp_path_delay_ns", "gauge", "Mean path delay", ("instance",), [((n,), st.get("path_delay")) for n, st in up])
+    yield ("ptp_rate_offset_ppb", "gauge", "Cumulative scaled rate offset", ("instance",), [((n,), st.get("freq")) for n, st in up])
+    yield ("ptp_servo_freq_ppb", "gauge", "Servo frequency adjustment from ptp4l log", ("instance",), [((n,), st["servo_freq"]) for n, st in up if st.get("servo_freq") is not None])
+    yield ("ptp_steps_removed", "gauge", "Steps removed from the grandmaster", ("instance",), [((n,), st.get("steps_removed")) for n, st in up])
+    yield ("ptp_phc_sys_offset_ns", "gauge", "PHC minus system clock", ("instance",), [((n,), st["phc_offset"]) for n, st in per if st.get("phc_offset") is not None])
+    yield ("ptp_grandmaster_info", "gauge", "Current grandmaster identity", ("instance", "gm_identity", "clock_identity"), [((n, st.get("gm_id"), st.get("clock_id")), 1) for n, st in up])
+
+    by_iface = {}
+    for c in data.get("clients") or []:
+        agg = by_iface.setdefault(c["iface"], [0, 0.0, 0])
+        agg[0] += 1; agg[1] += c["rate"]; agg[2] += c["lost"]
+    yield ("ptp_clients", "gauge", "PTP endpoints seen by the client radar", ("iface",), [((i,), a[0]) for i, a in by_iface.items()])
+    yield ("ptp_client_messages_per_second", "gauge", "PTP message rate of all radar endpoints", ("iface",), [((i,), round(a[1], 3)) for i, a in by_iface.items()])
+    yield ("ptp_client_lost_messages", "gauge", "Sequence gaps of the currently tracked endpoints", ("iface",), [((i,), a[2]) for i, a in by_iface.items()])
+
+    caps = MONITOR.capture_stats()
+    yield ("ptpweb_capture_frames_total", "counter", "Frames read by the radar capture", ("iface",), [((i,), v[0]) for i, v in caps.items()])
+    yield ("ptpweb_capture_decoded_total", "counter", "Frames decoded as PTP by the radar capture", ("iface",), [((i,), v[1]) for i, v in caps.items()])
+    yield ("ptpweb_capture_kernel_packets_total", "counter", "Packets accepted by the capture socket filter", ("iface",), [((i,), v[2]) for i, v in caps.items()])
+    yield ("ptpweb_capture_kernel_drops_total", "counter", "Packets dropped by the kernel before the capture read them", ("iface",), [((i,), v[3]) for i, v in caps.items()])
+    yield ("ptpweb_clients_evicted_total", "counter", "Radar endpoints evicted by the table size cap", (), [((), CLIENTS.evicted)])
+    yield ("ptpweb_snapshot_age_seconds", "gauge", "Age of the served telemetry snapshot", (), [((), round(time.time() - snap.time, 3) if snap else None)])
+    yield ("ptpweb_metric_store_up", "gauge", "On-disk metric store open (0: history is memory-only)", (), [((), STORE is not None)])
+    yield ("ptpweb_stream_subscribers", "gauge", "Open /api/stream connections", (), [((), STREAM.subscriber_count)])
+
+# --- Servo Statistics (incremental, one analyzer per instance) ---
+SERVO = ServoStats(SAMPLE_INTERVAL, SERVO_WINDOW, OFFSET_LIMIT_NS)
+
+def record_servo(prev, snap):
+    instances = snap.data.get("instances") or {}
+    for name, sample in instances.items():
+        st = sample.get("status") or {}
+        port = st.get("port") if st.get("ptp4l") == "RUNNING" else "Offline"
+        gm = st.get("gm_id") if st.get("gm_id") not in ("", "Unknown") else None
+        SERVO.add(name, snap.time, st.get("offset") or 0, st.get("freq"), port, gm)
+    SERVO.retain(instances)
+
+def servo_rows(data):
+    return {name: SERVO.snapshot(name) for name in data.get("instances") or {}}
+
+def record_servo_state(unit, servo):
+    if servo.state is None: return      # summary line, not a state transition
+    # ptp4l.service -> default, ptp4l@<name>.service -> <name>
+    for inst in INSTANCES.all():
+        if inst.unit + ".service" == unit: return SERVO.servo_event(inst.name, servo.ts, servo.state)
+
+JOURNAL.servo_listeners.append(record_servo_state)
+
+METRICS.add_collector(snapshot_metrics)
+SAMPLER.add_listener(record_servo)
+SAMPLER.add_listener(record_history)
+SAMPLER.add_listener(record_metrics)
+SAMPLER.add_listener(publish_snapshot_delta)
+SAMPLER.start()
+
+# --- Fleet Aggregator (only runs when peers are configured) ---
+def load_fleet_peers():
+    if FLEET_PEERS: return [p for p in FLEET_PEERS.split(",") if p.strip()]
+    if os.path.exists(FLEET_PEERS_FILE):
+        try:
+            with open(FLEET_PEERS_FILE, 'r') as f: return json.load(f)
+        except: pass
+    return []
+
+FLEET = FleetAggregator(load_fleet_peers(), interval=SAMPLE_INTERVAL).start()
+
 # --- Routes ---
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    start = g.get('request_start')
+    # Label by route pattern, not raw path, so cardinality stays bounded
+    if start is not None: HTTP_SECONDS.labels(request.url_rule.rule if request.url_rule else "unmatched").observe(time.perf_counter() - start)
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
 
 @app.route('/')
 def index():
-    nics = []
-    try:
-        nics = [n for n in os.listdir('/sys/class/net/') if not n.startswith('lo')]
-        nics.sort()
-    except: pass
-    return render_template('index.html', nics=nics, hostname=socket.gethostname())
+    return render_template('index.html', nics=HOST.nics(), hostname=socket.gethostname())
+
+@app.route('/fleet')
+def fleet_page():
+    return render_template('fleet.html', hostname=socket.gethostname(), enabled=bool(FLEET.nodes))
+
+@app.route('/api/fleet')
+def get_fleet():
+    if not FLEET.nodes: return jsonify({"status": "error", "message": "Fleet mode disabled (set PTP_WEB_FLEET_PEERS)"}), 404
+    return jsonify(FLEET.view)
 
 @app.route('/api/profiles', methods=['GET', 'POST'])
 def handle_profiles():
@@ -649,6 +1085,11 @@ def delete_profile(pid):
 @app.route('/api/apply', methods=['POST'])
 def apply_config():
     req = request.json
+    instance = req.get('instance') or DEFAULT_INSTANCE
+    if not NAME_RE.match(instance): return jsonify({"status":"error", "message":"Invalid instance name"}), 400
+    config_file = config_path(instance, PTP_CONFIG_DIR)
+    unit = unit_name(instance)
+    uds_path = default_uds_path(instance)
     target_if = req.get('interface')
     mode = req.get('clockMode', 'OC')
     if mode == 'BC':
@@ -658,12 +1099,11 @@ def apply_config():
         if not validate_interface(target_if): return jsonify({"status":"error", "message":"Invalid Interface"}), 400
 
     monitor_mode = req.get('monitorMode', 'disabled')
-    MONITOR_CONFIG["mode"] = monitor_mode
     # Populate interfaces list based on mode
     if mode == 'BC':
-        MONITOR_CONFIG["interfaces"] = [x for x in [req.get('bcSlaveIf'), req.get('bcMasterIf')] if x]
+        MONITOR.configure(monitor_mode, [req.get('bcSlaveIf'), req.get('bcMasterIf')])
     else:
-        MONITOR_CONFIG["interfaces"] = [target_if] if target_if else []
+        MONITOR.configure(monitor_mode, [target_if])
     
     ts_mode = req.get('timeStamping', 'hardware')
     sync_mode = req.get('syncMode')
@@ -672,14 +1112,14 @@ def apply_config():
     log_level = safe_int(req.get('logLevel'), 6)
     if ts_mode not in ['hardware', 'software', 'legacy', 'onestep']: ts_mode = 'hardware'
     
-    if os.path.exists(CONFIG_FILE): shutil.copy(CONFIG_FILE, CONFIG_FILE + ".bak")
-    
     is_master_mode = (sync_mode == 'master')
     clock_class = 13 if is_master_mode else 248
     time_source = "0x40" if is_master_mode else "0xA0"
 
     try:
         cfg = f"[global]\nnetwork_transport UDPv4\ntime_stamping {ts_mode}\ndelay_mechanism E2E\ndomainNumber {safe_int(req.get('domain'))}\npriority1 {safe_int(req.get('priority1'), 128)}\npriority2 {safe_int(req.get('priority2'), 128)}\nclockClass {clock_class}\ntimeSource {time_source}\nlogAnnounceInterval {safe_int(req.get('logAnnounceInterval'), 1)}\nlogSyncInterval {safe_int(req.get('logSyncInterval'))}\nlogMinDelayReqInterval {safe_int(req.get('logMinDelayReqInterval'))}\nannounceReceiptTimeout {safe_int(req.get('announceReceiptTimeout'), 3)}\nlogging_level {log_level}\nuse_syslog 1\nverbose 1\n"
+        # Every extra instance needs its own management socket next to the default one
+        if instance != DEFAULT_INSTANCE: cfg += f"uds_address {uds_path}\n"
         final_target_if = ""
         if mode == 'BC':
             cfg += "boundary_clock_jbod 1\n\n"
@@ -689,337 +1129,4990 @@ def apply_config():
         else:
             cfg += "\n"; target_if = req.get('interface'); cfg += f"[{target_if}]\n"; final_target_if = target_if
 
-        tmp_conf = CONFIG_FILE + ".tmp"
-        with open(tmp_conf, 'w') as f: f.write(cfg)
-        os.rename(tmp_conf, CONFIG_FILE)
-
         should_enable_phc = (sync_mode != 'none' and final_target_if)
-        if should_enable_phc: create_phc2sys_service(final_target_if, sync_mode, log_level)
-
-        domain_val = safe_int(req.get('domain'), 0)
-        restart_services_async(should_enable_phc, is_master_mode, domain_val)
-        return jsonify({"status": "success"})
+        phc_args = (final_target_if, sync_mode, log_level, unit) if should_enable_phc else None
+        # Writing the config and restarting run in the apply queue, one job at a time
+        job = APPLY.submit("apply", instance, lambda job: run_apply(job, instance, config_file, cfg, phc_args, is_master_mode))
+        return jsonify({"status": "success", "job": job.id})
     except Exception as e: return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/apply/<job_id>')
+def get_apply_job(job_id):
+    job = APPLY.get(job_id)
+    if job is None: return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+def instance_sample(key):
+    # ?instance=<name> selects one ptp4l instance; without it the default instance is returned
+    name = request.args.get('instance')
+    if not name: return jsonify(SAMPLER.get(key, {}))
+    sample = (SAMPLER.get("instances") or {}).get(name)
+    if sample is None: return jsonify({"status": "error", "message": "Unknown instance"}), 404
+    return jsonify(sample.get(key, {}))
+
 @app.route('/api/status')
 def get_status():
-    global STATUS_CACHE
-    now = time.time()
-    if STATUS_CACHE['data'] and (now - STATUS_CACHE['time'] < 1.0): return jsonify(STATUS_CACHE['data'])
+    return instance_sample("status")
 
-    data = { "ptp4l": "STOPPED", "phc2sys": "STOPPED", "port": "Offline", "offset": 0, "path_delay": 0, "steps_removed": -1, "gm": "Scanning...", "ptp_time": "--", "is_self": False }
-    iface = get_current_interface()
-    if iface:
-        t = get_ptp_time(iface)
-        if t: data["ptp_time"] = t
-    if run_cmd_safe(["pgrep", "-x", "ptp4l"]): data["ptp4l"] = "RUNNING"
-    if data["ptp4l"] == "RUNNING":
-        pmc = get_pmc_dict()
-        if 'port_state' in pmc: data["port"] = pmc['port_state']
-        if 'offset' in pmc: data["offset"] = pmc['offset']
-        if 'path_delay' in pmc: data["path_delay"] = pmc['path_delay']
-        if 'steps_removed' in pmc: data["steps_removed"] = pmc['steps_removed']
-        if 'phc2sys_state' in pmc: data["phc2sys"] = pmc['phc2sys_state']
-        if 'gm_id' in pmc:
-            data["gm"] = pmc['gm_id']
-            if 'clock_id' in pmc and pmc['gm_id'] == pmc['clock_id']:
-                data["is_self"] = True
-                data["gm"] += " (Self)"
-        if data["port"] in ["MASTER", "GRAND_MASTER"]:
-            data["offset"] = 0; data["path_delay"] = 0; data["steps_removed"] = 0; data["is_self"] = True
-            
-    STATUS_CACHE = { "time": now, "data": data }
-    return jsonify(data)
+@app.route('/api/instances')
+def get_instances():
+    samples = SAMPLER.get("instances") or {}
+    return jsonify([{ **inst.to_dict(), **instance_row(inst.name, samples.get(inst.name, {})) } for inst in INSTANCES.all()])
 
 @app.route('/api/clients')
 def get_clients():
-    with CLIENTS_LOCK:
-        clients_list = []
-        for ip, info in CLIENTS.items():
-            clients_list.append({ "ip": ip, "mac": info["mac"], "last_seen": info["last_seen"], "iface": info.get("iface", "?"), "is_self": info.get("is_self", False) })
-        return jsonify(clients_list)
+    # Sorting / filtering / paging run on the sampled snapshot, never under the capture lock
+    total, page = query_clients(SAMPLER.get("clients", []),
+                                sort=request.args.get('sort', 'ip'),
+                                iface=request.args.get('iface'),
+                                domain=request.args.get('domain', type=int),
+                                msg_type=request.args.get('type'),
+                                search=request.args.get('q'),
+                                offset=request.args.get('offset', 0, type=int),
+                                limit=request.args.get('limit', type=int))
+    return jsonify({ "total": total, "offset": request.args.get('offset', 0, type=int), "clients": page })
 
 @app.route('/api/logs')
 def get_logs():
-    return jsonify({"logs": run_cmd_safe(["journalctl", "-u", "ptp4l", "-u", "phc2sys-custom", "-n", "30", "--no-pager", "--output", "cat"])})
+    # ?after=<cursor> returns only newer entries; without it the last LOG_TAIL lines (old behaviour)
+    after = request.args.get('after')
+    units = [u for u in request.args.get('unit', '').split(',') if u]
+    limit = min(max(request.args.get('limit', 500 if after else LOG_TAIL, type=int), 1), 2000)
+    records, cursor, reset, truncated = JOURNAL.since(after, units=units, max_priority=request.args.get('priority', type=int), limit=limit)
+    return jsonify({ "cursor": cursor, "reset": reset, "truncated": truncated, "entries": [log_entry(r) for r in records], "logs": "\n".join(r.message for r in records) })
+
+@app.route('/api/history')
+def get_history():
+    now = time.time()
+    t_to = request.args.get('to', type=float) or now
+    t_from = request.args.get('from', type=float) or (t_to - 3600)
+    points = min(max(request.args.get('points', 500, type=int), 1), 5000)
+    metrics = [m for m in request.args.get('metric', 'offset').split(',') if m]
+    unknown = [m for m in metrics if m not in HISTORY_METRICS]
+    if unknown: return jsonify({"status": "error", "message": f"Unknown metric: {', '.join(unknown)}"}), 400
+    if t_from >= t_to: return jsonify({"status": "error", "message": "Invalid time range"}), 400
+    # Ranges older than the in-memory window are read from the on-disk store
+    source = "store" if STORE and t_from < now - HISTORY_HOURS * 3600 else "memory"
+    if source == "store": series = {m: downsample(*STORE.series(m, t_from, t_to), t_from, t_to, points) for m in metrics}
+    else: series = {m: HISTORY.query(m, t_from, t_to, points) for m in metrics}
+    return jsonify({ "from": t_from, "to": t_to, "points": points, "source": source, "columns": ["t", "min", "max", "mean", "count"], "series": series,
+                     "store": { "enabled": STORE is not None, "error": STORE_ERROR } })
+
+@app.route('/api/history/export')
+def export_history():
+    if not STORE: return jsonify({"status": "error", "message": f"Metric store not available: {STORE_ERROR}"}), 503
+    t_to = request.args.get('to', type=float) or time.time()
+    t_from = request.args.get('from', type=float) or (t_to - 3600)
+    if t_from >= t_to: return jsonify({"status": "error", "message": "Invalid time range"}), 400
+    name = f"ptp-metrics-{datetime.fromtimestamp(t_from):%Y%m%d-%H%M%S}-{datetime.fromtimestamp(t_to):%Y%m%d-%H%M%S}.csv"
+    return Response(STORE.csv(t_from, t_to, PORT_STATES), mimetype='text/csv', headers={'Content-Disposition': f'attachment; filename={name}'})
+
+@app.route('/api/stream')
+def stream_events():
+    q = STREAM.subscribe()
+    if q is None: return jsonify({"status": "error", "message": "Too many stream clients"}), 503
+    snap = SAMPLER.snapshot()
+    data = snap.data if snap else {}
+    tail = JOURNAL.tail(LOG_TAIL)
+    initial = [sse_format("snapshot", { "status": data.get("status", {}), "bmca": data.get("bmca", {}), "clients": [radar_full(c) for c in data.get("clients", [])], "instances": instance_rows(data), "servo": servo_rows(data), "foreign": foreign_masters(data), "logs": [r.message for r in tail], "log_cursor": tail[-1].cursor if tail else None })]
+    return Response(STREAM.events(q, initial), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/stop', methods=['POST'])
 def stop_service():
-    subprocess.run(["systemctl", "stop", "ptp4l"], check=False)
-    subprocess.run(["systemctl", "stop", "phc2sys-custom"], check=False)
-    return jsonify({"status": "success"})
+    instance = (request.get_json(silent=True) or {}).get('instance') or DEFAULT_INSTANCE
+    if not NAME_RE.match(instance): return jsonify({"status":"error", "message":"Invalid instance name"}), 400
+    job = APPLY.submit("stop", instance, lambda job: run_stop(job, instance))
+    return jsonify({"status": "success", "job": job.id})
 
 @app.route('/api/bmca')
 def get_bmca_api():
-    return jsonify(get_bmca_info())
+    return instance_sample("bmca")
+
+def foreign_masters(data, iface=None, domain=None):
+    # The GM each running instance follows, so a better or competing announcer stands out
+    selected = {}
+    for sample in (data.get("instances") or {}).values():
+        st = sample.get("status") or {}
+        inst = INSTANCES.get(st.get("instance"))
+        if inst and st.get("ptp4l") == "RUNNING" and st.get("gm_id"): selected.setdefault(inst.domain, st["gm_id"])
+    groups = FOREIGN.query(time.time(), iface=iface, domain=domain)
+    for grp in groups:
+        grp["selected_gm"] = selected.get(grp["domain"])
+        for row in grp["masters"]: row["selected"] = row["gm_identity"] == grp["selected_gm"]
+    return { "total": len(FOREIGN), "groups": groups }
+
+@app.route('/api/foreign_masters')
+def get_foreign_masters():
+    snap = SAMPLER.snapshot()
+    return jsonify(foreign_masters(snap.data if snap else {}, request.args.get('iface'), request.args.get('domain', type=int)))
+
+@app.route('/api/clients/timing')
+def get_client_timing():
+    # Worst masters / flagged clients from the sampled rows, merged turnaround per domain from the live sketches
+    rows = SAMPLER.get("clients", [])
+    masters = sorted((c for c in rows if "served_us" in c["timing"]), key=lambda c: -c["timing"]["served_us"]["p99"])
+    return jsonify({ "turnaround_limit_ms": TURNAROUND_LIMIT_MS, "domains": CLIENTS.turnaround(time.time()),
+                     "masters": [{ "ip": c["ip"], "iface": c["iface"], "domain": c["domain"], "clock_id": c["clock_id"],
+                                   "served_us": c["timing"]["served_us"], "flags": c["flags"] } for c in masters],
+                     "flagged": [{ "ip": c["ip"], "iface": c["iface"], "domain": c["domain"], "flags": c["flags"], "timing": c["timing"] }
+                                 for c in rows if c["flags"]] })
+
+@app.route('/api/archive')
+def get_archive():
+    if not ARCHIVE: return jsonify({"status": "error", "message": "Packet archive disabled (PTP_WEB_ARCHIVE_MB)"}), 503
+    t_to = request.args.get('to', type=float) or time.time()
+    t_from = request.args.get('from', type=float) or (t_to - 600)
+    types = [t for t in request.args.get('type', '').split(',') if t]
+    unknown = [t for t in types if t not in TYPE_CODES]
+    if unknown: return jsonify({"status": "error", "message": f"Unknown message type: {', '.join(unknown)}"}), 400
+    if t_from >= t_to: return jsonify({"status": "error", "message": "Invalid time range"}), 400
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 10000)
+    result = ARCHIVE.query(t_from, t_to, clock_id=request.args.get('clock') or None, ip=request.args.get('ip') or None, types=types, limit=limit)
+    return jsonify({ "from": t_from, "to": t_to, **result, "archive": ARCHIVE.stats() })
+
+@app.route('/api/servo')
+def get_servo_stats():
+    name = request.args.get('instance') or DEFAULT_INSTANCE
+    stats = SERVO.snapshot(name)
+    if stats is None: return jsonify({"status": "error", "message": "Unknown instance"}), 404
+    return jsonify({ "instance": name, **stats })
 
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8080)
 EOF
 
-# --- 7. 前端 UI (保持 Client Monitor 功能) ---
-echo "[5/8] 写入前端UI..."
+cat << 'EOF' > "$INSTALL_DIR/apply.py"
+"""
+Serialized config-apply jobs.
 
-cat << 'EOF' > "$INSTALL_DIR/templates/index.html"
-<!DOCTYPE html>
-<html lang="zh">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>PTP Controller</title>
-    <title>PTP Controller</title>
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <style>
-        .status-box { padding: 15px; border-radius: 8px; color: white; height: 100%; display: flex; flex-direction: column; justify-content: center; transition: background-color 0.3s; }
-        .bg-running { background-color: #198754; } 
-        .bg-stopped { background-color: #dc3545; }
-        .bg-slave { background-color: #0d6efd; }
-        .bg-master { background-color: #6610f2; }
-        .bg-syncing { background-color: #fd7e14; }
-        .bg-passive { background-color: #6c757d; }
-        #logWindow { background-color: #212529; color: #0f0; height: 350px; overflow-y: auto; padding: 10px; font-family: monospace; font-size: 0.8rem; }
-        .metric-label { font-size: 0.75rem; text-transform: uppercase; color: #6c757d; font-weight: bold; }
-        .metric-value { font-size: 1.5rem; font-weight: bold; }
-        .chart-container { position: relative; height: 250px; width: 100%; }
-        .ptp-time-display { background: rgba(0,0,0,0.2); padding: 5px; border-radius: 4px; margin-top: 10px; font-family: monospace; font-size: 0.9rem; text-align: center;}
-    </style>
-</head>
-<body class="bg-light">
-<div class="container-fluid p-4">
-    <div class="d-flex justify-content-between align-items-center mb-3">
-        <h3 class="mb-0">⏱️ PTP4L Controller by Vega Sun <small class="text-muted fs-6">v4.0 Stable</small></h3>
-        <span class="badge bg-secondary">{{ hostname }}</span>
-    </div>
-    
-    <div class="row g-3 mb-3">
-        <div class="col-md-4">
-            <div id="ptpCard" class="status-box bg-stopped shadow-sm">
-                <div class="d-flex justify-content-between">
-                    <small>PTP4L State</small>
-                    <span id="phcBadge" class="badge bg-dark border border-secondary" style="opacity: 0.3">SYNC OFF</span>
-                </div>
-                <div id="ptpState" class="h3 mb-0">STOPPED</div>
-                <small id="serviceStateDetail" class="opacity-75">Service Inactive</small>
-                <div class="ptp-time-display"><small class="d-block text-white-50" style="font-size:0.7rem">PTP HARDWARE TIME</small><span id="ptpTimeVal">--</span></div>
-            </div>
-        </div>
-        <div class="col-md-4">
-            <div class="card h-100 p-3 shadow-sm">
-                <div class="d-flex h-100 align-items-center">
-                    <div class="w-50 text-center border-end">
-                        <div class="metric-label">Offset</div><div id="offsetVal" class="metric-value text-primary">--</div><small class="text-muted">ns</small>
-                    </div>
-                    <div class="w-50 text-center">
-                        <div class="metric-label">Path Delay</div><div id="pathDelayVal" class="metric-value text-info">--</div><small class="text-muted">ns</small>
-                    </div>
-                </div>
-            </div>
-        </div>
-        <div class="col-md-4">
-            <div class="card h-100 p-3 shadow-sm justify-content-center">
-                <div class="d-flex justify-content-between align-items-center mb-2"><small class="text-muted fw-bold">Grandmaster ID</small><span id="stepsBadge" class="badge bg-secondary">Hops: --</span></div>
-                <div id="gmId" class="h6 mb-0 text-break font-monospace text-center bg-light p-2 rounded">Scanning...</div>
-            </div>
-        </div>
-    </div>
+One worker thread runs apply / stop jobs in submission order, so two
+requests never interleave on a config file or a service restart. Every job
+gets an id and a list of timestamped steps, and the last MAX_JOBS jobs stay
+queryable (/api/apply/<job>).
 
-    <div class="row g-3 mb-3">
-        <!-- BMCA Visualizer -->
-        <div class="col-12">
-            <div class="card shadow-sm">
-                <div class="card-header bg-white d-flex justify-content-between align-items-center" style="cursor: pointer;" data-bs-toggle="collapse" data-bs-target="#bmcaBody">
-                    <span class="fw-bold small text-muted">🕸️ BMCA Decision Analyzer</span>
-                    <span class="badge bg-light text-dark border" id="bmcaSummary">Loading...</span>
-                </div>
-                <div id="bmcaBody" class="collapse show">
-                    <div class="card-body">
-                        <div class="row">
-                            <div class="col-md-8">
-                                <div class="table-responsive">
-                                    <table class="table table-sm table-bordered text-center align-middle" style="font-size: 0.85rem;">
-                                        <thead class="table-light">
-                                            <tr>
-                                                <th style="width:20%">Check</th>
-                                                <th style="width:30%" class="text-primary">Local (Me)</th>
-                                                <th style="width:10%">Vs</th>
-                                                <th style="width:30%" class="text-danger">Current GM</th>
-                                                <th style="width:10%">Result</th>
-                                            </tr>
-                                        </thead>
-                                        <tbody id="bmcaTable"></tbody>
-                                    </table>
-                                </div>
-                            </div>
-                            <div class="col-md-4">
-                                <div class="p-2 border rounded bg-light h-100">
-                                    <h6 class="small fw-bold text-muted mb-2">ST 2059-2 Flags</h6>
-                                    <div id="ptpFlags" class="d-flex flex-wrap gap-2"></div>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </div>
+Readiness is observed instead of slept for: wait_until() polls a probe (the
+management socket answering, the port reaching MASTER / SLAVE, the servo
+locking) at a short interval until it succeeds, times out, or a newer job is
+waiting in the queue.
+"""
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
 
-    <div class="row g-3 mb-3">
-        <div class="col-lg-8">
-            <div class="card shadow-sm h-100">
-                <div class="card-header d-flex justify-content-between py-1 bg-white align-items-center">
-                    <span class="fw-bold small text-muted">📈 Offset Stability</span>
-                    <span class="badge bg-light text-dark border">RMS: <span id="rmsVal">--</span></span>
-                </div>
-                <div class="card-body p-2"><div class="chart-container"><canvas id="offsetChart"></canvas></div></div>
-            </div>
-        </div>
-        <div class="col-lg-4">
-            <div class="card shadow-sm h-100">
-                <div class="card-header fw-bold small text-muted d-flex justify-content-between align-items-center">
-                    <span>📡 PTP Client Radar</span>
-                    <span class="badge bg-primary" id="clientCount">0</span>
-                </div>
-                <div class="card-body p-0">
-                    <div style="height: 250px; overflow-y: auto;">
-                        <table class="table table-sm table-striped mb-0" style="font-size: 0.8rem;">
-                            <thead class="table-light sticky-top"><tr><th>IP Address</th><th>MAC</th><th>Iface</th><th>Last Seen</th></tr></thead>
-                            <tbody id="clientTableBody"><tr><td colspan="4" class="text-center text-muted">Waiting for data...</td></tr></tbody>
-                        </table>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </div>
+MAX_JOBS = 50
+POLL_INTERVAL = 0.05
 
-    <div class="row g-3">
-        <div class="col-lg-4">
-            <div class="card shadow-sm">
-                <div class="card-header fw-bold">⚙️ Configuration</div>
-                <div class="card-body">
-                    <form id="configForm">
-                        <div class="row g-2 mb-3">
-                            <div class="col-8">
-                                <label class="form-label fw-bold small text-uppercase text-secondary">Clock Mode</label>
-                                <select class="form-select" id="clockMode" onchange="toggleMode()">
-                                    <option value="OC" selected>Ordinary Clock (OC)</option>
-                                    <option value="BC">Boundary Clock (BC)</option>
-                                </select>
-                            </div>
-                            <div class="col-4">
-                                <label class="form-label fw-bold small text-uppercase text-secondary">Monitor</label>
-                                <select class="form-select" id="monitorMode">
-                                    <option value="disabled">OFF</option>
-                                    <option value="periodic" selected>Scan</option>
-                                    <option value="realtime">Real-Time</option>
-                                </select>
-                            </div>
-                        </div>
 
-                        <div id="ocPanel" class="mb-3">
-                            <label class="small text-muted">Network Interface</label>
-                            <select class="form-select" id="interface"><option value="" disabled selected>-- Select --</option>{% for nic in nics %}<option value="{{ nic }}">{{ nic }}</option>{% endfor %}</select>
-                        </div>
-                        <div id="bcPanel" class="mb-3 border p-2 rounded bg-white" style="display:none;">
-                            <label class="small fw-bold text-primary mb-2 d-block">Boundary Clock Topology</label>
-                            <div class="mb-2"><label class="small text-muted">⬇️ Upstream (Slave)</label><select class="form-select form-select-sm" id="bcSlaveIf"><option value="" disabled selected>-- Select --</option>{% for nic in nics %}<option value="{{ nic }}">{{ nic }}</option>{% endfor %}</select></div>
-                            <div class="mb-2"><label class="small text-muted">⬆️ Downstream (Master)</label><select class="form-select form-select-sm" id="bcMasterIf"><option value="" disabled selected>-- Select --</option>{% for nic in nics %}<option value="{{ nic }}">{{ nic }}</option>{% endfor %}</select></div>
-                        </div>
-                        
-                        <div class="row g-2 mb-3 bg-light p-2 rounded border mx-0">
-                            <div class="col-6">
-                                <label class="small fw-bold text-muted">Clock Sync</label>
-                                <select class="form-select form-select-sm" id="syncMode">
-                                    <option value="none">Disabled</option>
-                                    <option value="slave" selected>Slave (PHC➔SYS)</option>
-                                    <option value="master">Master (SYS➔PHC)</option>
-                                </select>
-                            </div>
-                            <div class="col-6">
-                                <label class="small fw-bold text-muted">Timestamping</label>
-                                <select class="form-select form-select-sm" id="timeStamping"><option value="hardware">Hardware</option><option value="software">Software</option></select>
-                            </div>
-                        </div>
+def wait_until(probe, timeout, interval=POLL_INTERVAL, cancel=None):
+    """Call probe() until it returns something truthy (returned), or None on timeout / cancel()."""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = probe()
+        if result: return result
+        if time.monotonic() >= deadline or (cancel is not None and cancel()): return None
+        time.sleep(interval)
 
-                        <hr>
-                        <div class="mb-2">
-                            <label class="small text-muted">Profile Manager</label>
-                            <div class="input-group input-group-sm">
-                                <select class="form-select" id="profileSelect" onchange="onUserSelectProfile()"></select>
-                                <button type="button" class="btn btn-outline-success" onclick="saveProfile()" title="Save">💾</button>
-                                <button type="button" class="btn btn-outline-warning" id="btnRename" onclick="renameProfile()" disabled title="Rename">✏️</button>
-                                <button type="button" class="btn btn-outline-danger" id="btnDelete" onclick="deleteProfile()" disabled title="Delete">🗑️</button>
-                            </div>
-                        </div>
 
-                        <div class="row g-2 mb-2">
-                            <div class="col-4"><label class="small text-muted">Domain</label><input type="number" class="form-control form-control-sm" id="domain"></div>
-                            <div class="col-4"><label class="small text-muted">Prio 1</label><input type="number" class="form-control form-control-sm" id="priority1"></div>
-                            <div class="col-4"><label class="small text-muted">Prio 2</label><input type="number" class="form-control form-control-sm" id="priority2"></div>
-                        </div>
-                        <div class="row g-2 mb-2">
-                            <div class="col-6"><label class="small text-muted">Sync Int</label><input type="number" class="form-control form-control-sm" id="logSyncInterval"></div>
-                            <div class="col-6"><label class="small text-muted">Announce Int</label><input type="number" class="form-control form-control-sm" id="logAnnounceInterval"></div>
-                        </div>
-                        <div class="row g-2 mb-3">
-                            <div class="col-6"><label class="small text-muted">Delay Req</label><input type="number" class="form-control form-control-sm" id="logMinDelayReqInterval"></div>
-                            <div class="col-6"><label class="small text-muted">Receipt T/O</label><input type="number" class="form-control form-control-sm" id="announceReceiptTimeout"></div>
-                        </div>
-                        
-                        <div class="row g-2 mb-3">
-                            <div class="col-12">
-                                <label class="small text-muted">Log Verbosity</label>
-                                <select class="form-select form-select-sm" id="logLevel">
-                                    <option value="3">Error Only (3)</option>
-                                    <option value="4">Warning (4)</option>
-                                    <option value="5">Notice (5)</option>
-                                    <option value="6" selected>Info (6) - Default</option>
-                                    <option value="7">Debug (7) - High Load</option>
-                                </select>
-                            </div>
-                        </div>
+class ApplyJob:
+    def __init__(self, kind, instance, fn):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.instance = instance
+        self.fn = fn            # fn(job)
+        self.state = "queued"   # queued -> running -> done | failed
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.steps = []
+        self.result = {}
+        self.error = None
 
-                        <div class="d-grid gap-2"><button type="button" onclick="applyConfig()" class="btn btn-primary btn-sm fw-bold">Apply & Restart</button><button type="button" onclick="stopService()" class="btn btn-danger btn-sm">Stop</button></div>
-                    </form>
-                </div>
-            </div>
-        </div>
-        <div class="col-lg-8">
-            <div class="card shadow-sm h-100">
-                <div class="card-header d-flex justify-content-between py-2"><span class="fw-bold small">PTP4L Logs</span><span class="badge bg-secondary" id="logTime">--:--:--</span></div>
-                <div class="card-body p-0"><div id="logWindow">Connecting...</div></div>
-            </div>
-        </div>
+    def elapsed(self):
+        return round(time.time() - self.started, 3) if self.started else 0.0
+
+    def step(self, name, detail=None):
+        self.steps.append({ "t": self.elapsed(), "step": name, "detail": detail })
+
+    def to_dict(self):
+        return { "id": self.id, "kind": self.kind, "instance": self.instance, "state": self.state,
+                 "created": self.created, "started": self.started, "finished": self.finished,
+                 "duration": round(self.finished - self.started, 3) if self.finished and self.started else None,
+                 "steps": list(self.steps), "result": dict(self.result), "error": self.error }
+
+
+class ApplyQueue:
+    def __init__(self, max_jobs=MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()   # id -> ApplyJob, oldest first
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="apply-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, kind, instance, fn):
+        job = ApplyJob(kind, instance, fn)
+        with self.cond:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                old_id, old = next(iter(self.jobs.items()))
+                if old.state in ("queued", "running"): break
+                del self.jobs[old_id]
+            self.pending.append(job)
+            self.cond.notify()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def has_pending(self):
+        # Long readiness waits give way as soon as another apply is queued
+        return bool(self.pending)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending: self.cond.wait()
+                job = self.pending.popleft()
+            job.state = "running"; job.started = time.time()
+            try:
+                job.fn(job)
+                job.state = "done"
+            except Exception as e:
+                traceback.print_exc()
+                job.state = "failed"; job.error = str(e)
+            job.finished = time.time()
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/archive.py"
+"""
+Rolling on-disk archive of captured PTP message headers.
+
+Every batch the capture loop decodes is packed into fixed 64-byte records
+(capture time, sourcePortIdentity, sequenceId, message type, domain, flags,
+logMessageInterval, IPs, source MAC, interface) and appended to the current
+segment file with one write() per batch. A segment is closed at
+segment_bytes and the oldest segments are deleted once the archive exceeds
+max_bytes.
+
+Each segment is indexed in blocks of BLOCK_RECORDS records: file offset,
+time range, a bit mask of message types and the set of clock identities and
+IP addresses in the block. A query only reads (pread) the blocks whose time
+range, type mask and key set can match, so "Announce from clock X between T1
+and T2" costs a few blocks, not the whole archive. The index of a closed
+segment is stored next to it (.idx, JSON); a segment without one (the
+process stopped while writing it) is re-indexed by a single scan on start.
+"""
+import json
+import os
+import socket
+import struct
+import threading
+import traceback
+
+from capture import MESSAGE_TYPES
+
+RECORD = struct.Struct("<d8s4s4s6sHHHBBBb16s8x")   # 64 bytes
+BLOCK_RECORDS = 1024
+TYPE_CODES = {name: code for code, name in MESSAGE_TYPES.items()}
+
+
+def _ip_bytes(ip):
+    try: return socket.inet_aton(ip) if ip else bytes(4)
+    except OSError: return bytes(4)
+
+
+def _ip_text(raw):
+    return socket.inet_ntoa(raw) if any(raw) else None
+
+
+def _clock_text(raw):
+    h = raw.hex()
+    return f"{h[0:6]}.{h[6:10]}.{h[10:16]}"
+
+
+def pack_message(msg, iface, now):
+    return RECORD.pack(msg.ts or now, bytes.fromhex(msg.clock_id.replace(".", "")), _ip_bytes(msg.src_ip), _ip_bytes(msg.dst_ip),
+                       bytes.fromhex(msg.src_mac.replace(":", "")) if msg.src_mac else bytes(6),
+                       msg.port_number, msg.seq, msg.flags, msg.msg_type, msg.version, msg.domain, msg.log_interval,
+                       iface.encode()[:16])
+
+
+def unpack_record(rec):
+    ts, cid, src_ip, dst_ip, mac, port, seq, flags, mtype, version, domain, log_interval, iface = rec
+    return { "ts": ts, "iface": iface.rstrip(b"\0").decode(errors="replace"), "type": MESSAGE_TYPES.get(mtype, hex(mtype)),
+             "clock_id": _clock_text(cid), "port_number": port, "seq": seq, "domain": domain, "version": version,
+             "flags": flags, "log_interval": log_interval, "src_ip": _ip_text(src_ip), "dst_ip": _ip_text(dst_ip),
+             "src_mac": ":".join(f"{b:02x}" for b in mac) }
+
+
+class Block:
+    __slots__ = ("offset", "count", "t_min", "t_max", "types", "keys")
+
+    def __init__(self, offset, count=0, t_min=None, t_max=None, types=0, keys=()):
+        self.offset = offset; self.count = count
+        self.t_min = t_min; self.t_max = t_max
+        self.types = types; self.keys = set(keys)
+
+    def add(self, ts, msg_type, keys):
+        self.count += 1
+        if self.t_min is None or ts < self.t_min: self.t_min = ts
+        if self.t_max is None or ts > self.t_max: self.t_max = ts
+        self.types |= 1 << msg_type
+        self.keys.update(keys)
+
+    def matches(self, t_from, t_to, type_mask, key):
+        if not self.count or self.t_max < t_from or self.t_min > t_to: return False
+        if type_mask and not (self.types & type_mask): return False
+        return key is None or key in self.keys
+
+    def to_json(self):
+        return [self.offset, self.count, self.t_min, self.t_max, self.types, sorted(self.keys)]
+
+
+class Segment:
+    def __init__(self, path, blocks=None):
+        self.path = path
+        self.blocks = blocks if blocks is not None else []
+        self.size = self.blocks[-1].offset + self.blocks[-1].count * RECORD.size if self.blocks else 0
+
+    @property
+    def t_min(self):
+        return min((b.t_min for b in self.blocks if b.count), default=None)
+
+    @property
+    def t_max(self):
+        return max((b.t_max for b in self.blocks if b.count), default=None)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path + ".idx") as f: blocks = [Block(*b) for b in json.load(f)["blocks"]]
+            return cls(path, blocks)
+        except (OSError, ValueError, TypeError): pass
+        # No (valid) index: rebuild it from the records, dropping a torn tail
+        seg = cls(path)
+        with open(path, "rb") as f: data = f.read()
+        n = len(data) // RECORD.size
+        for rec in RECORD.iter_unpack(memoryview(data)[:n * RECORD.size]):
+            seg._index(rec[0], rec[8], (_clock_text(rec[1]), _ip_text(rec[2]), _ip_text(rec[3])))
+        if len(data) != n * RECORD.size: os.truncate(path, n * RECORD.size)
+        seg.save_index()
+        return seg
+
+    def _index(self, ts, msg_type, keys):
+        if not self.blocks or self.blocks[-1].count >= BLOCK_RECORDS:
+            self.blocks.append(Block(self.size))
+        self.blocks[-1].add(ts, msg_type, [k for k in keys if k])
+        self.size += RECORD.size
+
+    def save_index(self):
+        tmp = self.path + ".idx.tmp"
+        with open(tmp, "w") as f: json.dump({ "record_size": RECORD.size, "blocks": [b.to_json() for b in self.blocks] }, f)
+        os.replace(tmp, self.path + ".idx")
+
+    def read(self, block):
+        with open(self.path, "rb") as f:
+            return os.pread(f.fileno(), block.count * RECORD.size, block.offset)
+
+
+class PacketArchive:
+    def __init__(self, directory, max_bytes=256 << 20, segment_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes or max(1 << 20, max_bytes // 16)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".seg"): continue
+            seg = Segment.load(os.path.join(directory, name))
+            if seg.size: self.segments.append(seg)
+            else: self._unlink(seg)
+        self.fd = None
+        self._roll()
+
+    def _roll(self):
+        """Close the current segment (index written next to it) and start a new one."""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.segments[-1].save_index()
+        seq = int(os.path.basename(self.segments[-1].path)[:-4]) + 1 if self.segments else 1
+        path = os.path.join(self.directory, f"{seq:010d}.seg")
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.segments.append(Segment(path))
+        # Room for the new segment to fill up keeps the whole archive under max_bytes
+        total = sum(s.size for s in self.segments) + self.segment_bytes
+        while total > self.max_bytes and len(self.segments) > 1:
+            old = self.segments.pop(0)
+            total -= old.size
+            self._unlink(old)
+
+    @staticmethod
+    def _unlink(seg):
+        for p in (seg.path, seg.path + ".idx"):
+            try: os.unlink(p)
+            except FileNotFoundError: pass
+
+    def observe(self, msgs, iface, my_ip, now):
+        """Same signature as ClientTable.observe: the whole batch is one write."""
+        try:
+            records = [pack_message(m, iface, now) for m in msgs]
+            with self.lock:
+                os.write(self.fd, b"".join(records))
+                seg = self.segments[-1]
+                for m in msgs: seg._index(m.ts or now, m.msg_type, (m.clock_id, m.src_ip, m.dst_ip))
+                self.written += len(records)
+                if seg.size >= self.segment_bytes: self._roll()
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+
+    def query(self, t_from, t_to, clock_id=None, ip=None, types=None, limit=1000):
+        """Archived messages in [t_from, t_to] (oldest first), optionally from one clock / IP and of some types."""
+        type_mask = 0
+        for name in types or ():
+            type_mask |= 1 << TYPE_CODES[name]
+        key = clock_id or ip
+        with self.lock:
+            # Block counts are taken under the lock: records appended later are not read half-written
+            candidates = [(seg, b, b.count) for seg in self.segments for b in seg.blocks if b.matches(t_from, t_to, type_mask, key)]
+        out, blocks = [], 0
+        for seg, block, count in candidates:
+            if len(out) > limit: break
+            try: data = seg.read(block)
+            except OSError: continue    # segment deleted by retention meanwhile
+            blocks += 1
+            for rec in RECORD.iter_unpack(data[:count * RECORD.size]):
+                if not (t_from <= rec[0] <= t_to): continue
+                if type_mask and not (type_mask >> rec[8]) & 1: continue
+                if clock_id and _clock_text(rec[1]) != clock_id: continue
+                if ip and ip not in (_ip_text(rec[2]), _ip_text(rec[3])): continue
+                out.append(rec)
+        # Blocks are in write order, so the first `limit` hits are the oldest ones up to capture jitter
+        out.sort(key=lambda r: r[0])
+        truncated = len(out) > limit
+        return { "count": min(len(out), limit), "truncated": truncated, "blocks_read": blocks,
+                 "messages": [unpack_record(r) for r in out[:limit]] }
+
+    def stats(self):
+        with self.lock:
+            return { "segments": len(self.segments), "bytes": sum(s.size for s in self.segments), "max_bytes": self.max_bytes,
+                     "written": self.written, "errors": self.errors,
+                     "oldest": self.segments[0].t_min if self.segments else None }
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd); self.fd = None
+                self.segments[-1].save_index()
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/capture.py"
+"""
+PTP packet capture without tcpdump.
+
+RawCapture opens an AF_PACKET socket with a classic BPF filter for PTP
+(UDP 319/320 over IPv4 and ethertype 0x88F7), reads frames in batches from
+a TPACKET_V3 mmap ring (falling back to a non-blocking recv drain) and
+decode_frame() turns each frame into a PtpMessage (decode_announce() adds the
+Announce body for the foreign master table, decode_delay_resp() the requesting
+port of a Delay_Resp). Frames carry kernel receive timestamps: the ring's
+tp_sec / tp_nsec, SO_TIMESTAMPNS on the recv path. PcapCapture offers the
+same read() interface over a pcap file so the pipeline can be replayed
+offline.
+"""
+import ctypes
+import mmap
+import os
+import select
+import socket
+import struct
+import time
+from collections import namedtuple
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_1588 = 0x88F7
+VLAN_TPIDS = (0x8100, 0x88A8)
+PTP_EVENT_PORT = 319
+PTP_GENERAL_PORT = 320
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+SO_ATTACH_FILTER = 26
+SO_TIMESTAMPNS = 35
+
+MESSAGE_TYPES = {
+    0x0: "Sync", 0x1: "Delay_Req", 0x2: "Pdelay_Req", 0x3: "Pdelay_Resp",
+    0x8: "Follow_Up", 0x9: "Delay_Resp", 0xA: "Pdelay_Resp_Follow_Up",
+    0xB: "Announce", 0xC: "Signaling", 0xD: "Management",
+}
+
+PTP_HEADER = struct.Struct(">BBHBBHqI8sHHBb")   # 34 bytes
+PTP_HEADER_LEN = PTP_HEADER.size
+
+# One decoded PTP message. `payload` is the PTP message itself (header + body).
+PtpMessage = namedtuple("PtpMessage", [
+    "ts", "iface", "src_mac", "dst_mac", "src_ip", "dst_ip", "transport",
+    "msg_type", "version", "domain", "flags", "seq", "clock_id", "port_number",
+    "log_interval", "payload"])
+
+# Classic BPF: "ether proto 0x88f7 or (ip and udp and not ip fragment and (port 319 or port 320))"
+BPF_ACCEPT = 0x40000
+_BPF = [
+    (0x28, 0, 0, 12),            # 0: ldh [12]               ethertype
+    (0x15, 12, 0, ETH_P_1588),   # 1: jeq 0x88f7 -> accept
+    (0x15, 0, 12, ETH_P_IP),     # 2: jeq 0x0800 else reject
+    (0x30, 0, 0, 23),            # 3: ldb [23]               ip proto
+    (0x15, 0, 10, 17),           # 4: jeq udp else reject
+    (0x28, 0, 0, 20),            # 5: ldh [20]               frag offset
+    (0x45, 8, 0, 0x1FFF),        # 6: jset 0x1fff -> reject
+    (0xB1, 0, 0, 14),            # 7: ldxb 4*([14]&0xf)
+    (0x48, 0, 0, 14),            # 8: ldh [x+14]             src port
+    (0x15, 4, 0, PTP_EVENT_PORT),    # 9
+    (0x15, 3, 0, PTP_GENERAL_PORT),  # 10
+    (0x48, 0, 0, 16),            # 11: ldh [x+16]            dst port
+    (0x15, 1, 0, PTP_EVENT_PORT),    # 12
+    (0x15, 0, 1, PTP_GENERAL_PORT),  # 13
+    (0x06, 0, 0, BPF_ACCEPT),    # 14: accept
+    (0x06, 0, 0, 0),             # 15: reject
+]
+
+
+# Announce body after the header: originTimestamp, currentUtcOffset, reserved, grandmasterPriority1,
+# grandmasterClockQuality (class, accuracy, offsetScaledLogVariance), grandmasterPriority2,
+# grandmasterIdentity, stepsRemoved, timeSource
+ANNOUNCE_BODY = struct.Struct(">10shxBBBHB8sHB")   # 30 bytes
+Announce = namedtuple("Announce", [
+    "utc_offset", "priority1", "clock_class", "clock_accuracy", "variance", "priority2",
+    "gm_identity", "steps_removed", "time_source"])
+# Delay_Resp body: receiveTimestamp, requestingPortIdentity (clockIdentity, portNumber)
+DELAY_RESP_BODY = struct.Struct(">10s8sH")   # 20 bytes
+
+
+def _format_mac(b):
+    return ":".join(f"{x:02x}" for x in b)
+
+
+def _format_clock_id(b):
+    h = b.hex()
+    return f"{h[0:6]}.{h[6:10]}.{h[10:16]}"
+
+
+def decode_ptp(ptp, ts=0.0, iface="", src_mac="", dst_mac="", src_ip=None, dst_ip=None, transport="L2"):
+    if len(ptp) < PTP_HEADER_LEN: return None
+    (b0, b1, _length, domain, _, flags, _corr, _, cid, port, seq, _ctl,
+     log_interval) = PTP_HEADER.unpack_from(ptp)
+    return PtpMessage(ts, iface, src_mac, dst_mac, src_ip, dst_ip, transport, b0 & 0x0F, b1 & 0x0F,
+                      domain, flags, seq, _format_clock_id(cid), port, log_interval, bytes(ptp))
+
+
+def decode_announce(msg):
+    """Announce dataset of a decoded Announce PtpMessage, or None when truncated."""
+    if msg.msg_type != 0xB or len(msg.payload) < PTP_HEADER_LEN + ANNOUNCE_BODY.size: return None
+    _, utc, p1, cls, acc, var, p2, gm, steps, src = ANNOUNCE_BODY.unpack_from(msg.payload, PTP_HEADER_LEN)
+    return Announce(utc, p1, cls, acc, var, p2, _format_clock_id(gm), steps, src)
+
+
+def decode_delay_resp(msg):
+    """(clock_id, port_number) of the port whose Delay_Req a Delay_Resp answers, or None."""
+    if msg.msg_type != 0x9 or len(msg.payload) < PTP_HEADER_LEN + DELAY_RESP_BODY.size: return None
+    _, cid, port = DELAY_RESP_BODY.unpack_from(msg.payload, PTP_HEADER_LEN)
+    return _format_clock_id(cid), port
+
+
+def decode_frame(frame, ts=0.0, iface=""):
+    """Decode one Ethernet frame into a PtpMessage, or None if it is not PTP."""
+    if len(frame) < 14: return None
+    off = 12
+    ethertype = (frame[off] << 8) | frame[off + 1]
+    while ethertype in VLAN_TPIDS and len(frame) >= off + 6:
+        off += 4
+        ethertype = (frame[off] << 8) | frame[off + 1]
+    off += 2
+    dst_mac = _format_mac(frame[0:6]); src_mac = _format_mac(frame[6:12])
+    if ethertype == ETH_P_1588:
+        return decode_ptp(memoryview(frame)[off:], ts, iface, src_mac, dst_mac)
+    if ethertype != ETH_P_IP or len(frame) < off + 28: return None
+    ihl = (frame[off] & 0x0F) * 4
+    if frame[off + 9] != 17 or (((frame[off + 6] << 8) | frame[off + 7]) & 0x1FFF): return None
+    udp = off + ihl
+    if len(frame) < udp + 8: return None
+    sport = (frame[udp] << 8) | frame[udp + 1]
+    dport = (frame[udp + 2] << 8) | frame[udp + 3]
+    if sport not in (PTP_EVENT_PORT, PTP_GENERAL_PORT) and dport not in (PTP_EVENT_PORT, PTP_GENERAL_PORT):
+        return None
+    src_ip = socket.inet_ntoa(frame[off + 12:off + 16])
+    dst_ip = socket.inet_ntoa(frame[off + 16:off + 20])
+    return decode_ptp(memoryview(frame)[udp + 8:], ts, iface, src_mac, dst_mac, src_ip, dst_ip, "UDPv4")
+
+
+class RawCapture:
+    """AF_PACKET capture of PTP frames on one interface (requires CAP_NET_RAW)."""
+    BLOCK_SIZE = 1 << 18
+    BLOCK_NR = 8
+    FRAME_SIZE = 1 << 11
+    BLOCK_TIMEOUT_MS = 50
+
+    def __init__(self, iface, use_ring=True):
+        self.iface = iface
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        self.packets = 0
+        self.drops = 0
+        self.frames = 0      # frames read from the socket / file
+        self.decoded = 0     # of which decoded as PTP
+        self.ring = None
+        try:
+            self._attach_filter()
+            # Kernel receive timestamps for the recv() fallback (the mmap ring always carries them)
+            try: self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            except OSError: pass
+            self.sock.bind((iface, ETH_P_ALL))
+            if use_ring:
+                try: self._setup_ring()
+                except OSError: self.ring = None
+            self.sock.setblocking(False)
+        except Exception:
+            self.close()
+            raise
+        self._block = 0
+
+    def _attach_filter(self):
+        # The kernel copies the program during setsockopt, so a temporary buffer is enough
+        buf = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *ins) for ins in _BPF))
+        fprog = struct.pack("HL", len(_BPF), ctypes.addressof(buf))
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    def _setup_ring(self):
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        frame_nr = self.BLOCK_SIZE * self.BLOCK_NR // self.FRAME_SIZE
+        req = struct.pack("7I", self.BLOCK_SIZE, self.BLOCK_NR, self.FRAME_SIZE, frame_nr,
+                          self.BLOCK_TIMEOUT_MS, 0, 0)
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        self.ring = mmap.mmap(self.sock.fileno(), self.BLOCK_SIZE * self.BLOCK_NR,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        if self.ring is not None:
+            try: self.ring.close()
+            except Exception: pass
+            self.ring = None
+        try: self.sock.close()
+        except Exception: pass
+
+    def stats(self):
+        # Kernel counters reset on every read, so accumulate them here
+        try:
+            raw = self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12)
+            packets, drops = struct.unpack_from("II", raw)
+            self.packets += packets
+            self.drops += drops
+        except OSError: pass
+        return self.packets, self.drops
+
+    def read_frames(self, timeout=None):
+        """Wait up to `timeout` seconds, then return every pending (ts, frame) in one batch."""
+        if timeout is not None and not self._ready():
+            r, _, _ = select.select([self.sock], [], [], timeout)
+            if not r: return []
+        return self._drain_ring() if self.ring is not None else self._drain_socket()
+
+    def read(self, timeout=None):
+        out = []
+        frames = self.read_frames(timeout)
+        for ts, frame in frames:
+            msg = decode_frame(frame, ts, self.iface)
+            if msg is not None: out.append(msg)
+        self.frames += len(frames)
+        self.decoded += len(out)
+        return out
+
+    def _ready(self):
+        if self.ring is None: return False
+        status = struct.unpack_from("I", self.ring, self._block * self.BLOCK_SIZE + 8)[0]
+        return bool(status & TP_STATUS_USER)
+
+    def _drain_ring(self):
+        frames = []
+        ring = self.ring
+        for _ in range(self.BLOCK_NR):
+            base = self._block * self.BLOCK_SIZE
+            status, num_pkts, first = struct.unpack_from("III", ring, base + 8)
+            if not status & TP_STATUS_USER: break
+            off = base + first
+            for _ in range(num_pkts):
+                next_off, sec, nsec, snaplen, _len, _st, mac = struct.unpack_from("IIIIIIH", ring, off)
+                frames.append((sec + nsec * 1e-9, ring[off + mac:off + mac + snaplen]))
+                off += next_off
+            # Hand the block back to the kernel
+            struct.pack_into("I", ring, base + 8, TP_STATUS_KERNEL)
+            self._block = (self._block + 1) % self.BLOCK_NR
+        return frames
+
+    def _drain_socket(self):
+        frames = []
+        now = time.time()
+        while True:
+            try:
+                data, anc, _, _ = self.sock.recvmsg(65535, socket.CMSG_SPACE(16))
+            except (BlockingIOError, InterruptedError):
+                return frames
+            ts = now
+            for level, kind, raw in anc:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(raw) >= 16:
+                    sec, nsec = struct.unpack_from("qq", raw)
+                    ts = sec + nsec * 1e-9
+            frames.append((ts, data))
+
+
+class PcapCapture:
+    """Replays a classic pcap file (Ethernet link type) through the same read() interface."""
+    LINKTYPE_ETHERNET = 1
+
+    def __init__(self, path, iface="pcap"):
+        self.iface = iface
+        self.f = open(path, "rb")
+        magic = self.f.read(4)
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"): self.endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"): self.endian = ">"
+        else: raise ValueError(f"{path}: not a pcap file")
+        self.nano = magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d")
+        self.linktype = struct.unpack(self.endian + "HHiIII", self.f.read(20))[5]
+        if self.linktype != self.LINKTYPE_ETHERNET: raise ValueError(f"{path}: unsupported link type {self.linktype}")
+        self.rec = struct.Struct(self.endian + "IIII")
+        self.packets = 0
+        self.drops = 0
+        self.frames = 0      # frames read from the socket / file
+        self.decoded = 0     # of which decoded as PTP
+        # Regular files cannot sit in epoll; expose a pipe that stays readable until EOF instead
+        self._ready_r, self._ready_w = os.pipe()
+        os.write(self._ready_w, b"\0")
+        self._eof = False
+
+    def records(self):
+        while True:
+            hdr = self.f.read(16)
+            if len(hdr) < 16: return self._set_eof()
+            sec, frac, incl, _orig = self.rec.unpack(hdr)
+            data = self.f.read(incl)
+            if len(data) < incl: return self._set_eof()
+            self.packets += 1
+            yield sec + frac * (1e-9 if self.nano else 1e-6), data
+
+    def _set_eof(self):
+        if not self._eof:
+            self._eof = True
+            os.read(self._ready_r, 1)
+
+    def read_frames(self, timeout=None, batch=4096):
+        out = []
+        for item in self.records():
+            out.append(item)
+            if len(out) >= batch: break
+        # At end of file behave like an idle link instead of spinning
+        if not out and timeout: time.sleep(timeout)
+        return out
+
+    def read(self, timeout=None, batch=4096):
+        out = []
+        frames = self.read_frames(timeout, batch)
+        for ts, frame in frames:
+            msg = decode_frame(frame, ts, self.iface)
+            if msg is not None: out.append(msg)
+        self.frames += len(frames)
+        self.decoded += len(out)
+        return out
+
+    def stats(self):
+        return self.packets, self.drops
+
+    def fileno(self):
+        return self._ready_r
+
+    def close(self):
+        self.f.close()
+        for fd in (self._ready_r, self._ready_w):
+            try: os.close(fd)
+            except OSError: pass
+
+
+def write_pcap(path, frames):
+    """Write [(ts, frame)] as a microsecond pcap file (fixtures / exporting captures)."""
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, PcapCapture.LINKTYPE_ETHERNET))
+        for ts, frame in frames:
+            sec = int(ts); usec = int(round((ts - sec) * 1e6))
+            f.write(struct.pack("<IIII", sec, usec, len(frame), len(frame)))
+            f.write(frame)
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/client_stats.py"
+"""
+Per-client PTP traffic statistics for the client radar.
+
+Every endpoint gets one ClientStats with fixed-size arrays indexed by PTP
+messageType (counters, decaying rate estimators, sequenceId gap tracking
+and inter-arrival jitter), so memory per client is constant and the whole
+table is capped at `max_clients` with least-recently-seen eviction.
+
+Timing quality comes from the capture timestamps (kernel receive time, or
+the pcap time when replaying), kept in mergeable quantile sketches:
+
+  - Delay_Req -> Delay_Resp turnaround, matched on requestingPortIdentity +
+    sequenceId, for the requesting client and for the master answering it,
+  - Sync / Announce cadence (multicast only) and Delay_Req cadence, compared
+    with the intervals of the applied profile for the domain (`expected`),
+    else with the interval the sender advertises.
+
+A master whose turnaround p99 exceeds `turnaround_limit` is flagged as
+overloaded, a client sending Delay_Req much faster than
+logMinDelayReqInterval allows as a spammer.
+"""
+import math
+import threading
+from array import array
+from collections import OrderedDict
+
+from capture import MESSAGE_TYPES, decode_delay_resp
+from sketch import LogSketch, WindowedSketch
+
+N_TYPES = 16
+RATE_TAU = 10.0          # seconds, time constant of the rate estimator
+JITTER_GAIN = 1 / 16.0   # RFC 3550 style smoothing
+MAX_SEQ_GAP = 1000       # larger jumps are treated as a sender restart, not loss
+# Message types whose sequenceId is a per-sender monotonic counter
+SEQUENCED_TYPES = (0x0, 0x1, 0x2, 0x8, 0xB)
+# Message types whose inter-arrival time is compared with the configured interval
+CADENCE_TYPES = { 0x0: "Sync", 0xB: "Announce", 0x1: "Delay_Req" }
+SKETCH_WINDOW = 30.0     # seconds per quantile sketch window
+PENDING_TIMEOUT = 2.0    # a Delay_Req without Delay_Resp after this long counts as unanswered
+MAX_PENDING = 16384
+CADENCE_TOLERANCE = 0.3  # IEEE 1588: mean message interval within +/-30 % of the configured one
+MIN_SAMPLES = 8
+
+
+def log_interval_seconds(log_interval):
+    # logMessageInterval 0x7F means "not specified"
+    return 2.0 ** log_interval if -8 <= log_interval <= 8 else None
+
+
+def is_multicast(ip):
+    return ip is None or 224 <= int(ip.split(".", 1)[0]) <= 239
+
+
+class ClientStats:
+    __slots__ = ("ip", "mac", "iface", "is_self", "clock_id", "domain", "transport", "first_seen",
+                 "last_seen", "counts", "lost", "rate", "last_ts", "last_seq", "interval", "jitter",
+                 "advertised", "sketches", "unanswered", "min_delay_req")
+
+    def __init__(self, ip, mac, iface, now):
+        self.ip = ip; self.mac = mac; self.iface = iface
+        self.is_self = False
+        self.clock_id = ""; self.domain = -1; self.transport = ""
+        self.first_seen = now; self.last_seen = now
+        self.counts = array("I", bytes(4 * N_TYPES))
+        self.lost = array("I", bytes(4 * N_TYPES))
+        self.rate = array("d", bytes(8 * N_TYPES))       # decaying rate estimate, msgs/s
+        self.last_ts = array("d", bytes(8 * N_TYPES))    # arrival time of the previous message
+        self.last_seq = array("i", [-1]) * N_TYPES
+        self.interval = array("d", bytes(8 * N_TYPES))   # smoothed inter-arrival time, s
+        self.jitter = array("d", bytes(8 * N_TYPES))     # smoothed |interval deviation|, s
+        self.advertised = array("b", [0x7F]) * N_TYPES    # logMessageInterval of the last message
+        self.sketches = {}          # name -> WindowedSketch, created on first use
+        self.unanswered = 0         # Delay_Req never answered
+        self.min_delay_req = None   # logMinDelayReqInterval the master announced in Delay_Resp, s
+
+    def sketch(self, name, scale):
+        sk = self.sketches.get(name)
+        if sk is None: sk = self.sketches[name] = WindowedSketch(SKETCH_WINDOW, scale)
+        return sk
+
+    def observe(self, msg, now):
+        t = msg.msg_type
+        ts = msg.ts or now
+        self.last_seen = now
+        self.clock_id = msg.clock_id; self.domain = msg.domain; self.transport = msg.transport
+        self.counts[t] += 1
+
+        prev = self.last_ts[t]
+        if prev:
+            dt = ts - prev
+            if dt > 0:
+                self.rate[t] = self.rate[t] * math.exp(-dt / RATE_TAU) + 1.0 / RATE_TAU
+                if self.interval[t]:
+                    self.jitter[t] += (abs(dt - self.interval[t]) - self.jitter[t]) * JITTER_GAIN
+                    self.interval[t] += (dt - self.interval[t]) * JITTER_GAIN
+                else:
+                    self.interval[t] = dt
+                # Unicast Sync / Announce to many slaves would look like one fast sender
+                if t in CADENCE_TYPES and (t == 0x1 or is_multicast(msg.dst_ip)):
+                    self.sketch(CADENCE_TYPES[t], 1e3).add(dt, ts)
+        else:
+            self.rate[t] = 1.0 / RATE_TAU
+        self.last_ts[t] = ts
+        self.advertised[t] = msg.log_interval
+
+        if t in SEQUENCED_TYPES:
+            last = self.last_seq[t]
+            if last >= 0:
+                gap = (msg.seq - last - 1) & 0xFFFF
+                # gap >= 0x8000 means duplicate / reordered, not loss
+                if 0 < gap < MAX_SEQ_GAP: self.lost[t] += gap
+                if gap < 0x8000: self.last_seq[t] = msg.seq
+            else:
+                self.last_seq[t] = msg.seq
+
+    def current_rate(self, t, now):
+        ts = self.last_ts[t]
+        if not ts: return 0.0
+        return self.rate[t] * math.exp(-max(0.0, now - ts) / RATE_TAU)
+
+    def timing(self, now, expected=None, turnaround_limit=None):
+        """({turnaround_us, served_us, unanswered, cadence}, [flags]) from the last completed sketch windows."""
+        timing = { "unanswered": self.unanswered }
+        flags = []
+        for name, field in (("turnaround", "turnaround_us"), ("served", "served_us")):
+            sk = self.sketches.get(name)
+            summary = sk.summary(now) if sk else None
+            if summary: timing[field] = summary
+        served = timing.get("served_us")
+        if served and turnaround_limit and served["p99"] > turnaround_limit * 1e6: flags.append("overloaded_master")
+        cadence = {}
+        for t, name in CADENCE_TYPES.items():
+            sk = self.sketches.get(name)
+            summary = sk.summary(now) if sk else None
+            if not summary: continue
+            if t == 0x1: want = self.min_delay_req or (expected or {}).get(t)
+            else: want = (expected or {}).get(t) or log_interval_seconds(self.advertised[t])
+            cadence[name] = dict(summary, expected_ms=round(want * 1e3, 1) if want else None)
+            if not want or summary["count"] < MIN_SAMPLES: continue
+            ratio = summary["p50"] / (want * 1e3)
+            if t == 0x1:
+                # Delay_Req intervals are randomized up to 2x the minimum, so only a far shorter median is spam
+                if ratio < 0.5: flags.append("delay_req_spam")
+            elif abs(ratio - 1) > CADENCE_TOLERANCE: flags.append(name.lower() + "_cadence")
+        if cadence: timing["cadence"] = cadence
+        return timing, flags
+
+    def to_dict(self, now, key, expected=None, turnaround_limit=None):
+        counts = {}; rates = {}; lost = {}; jitter = {}
+        for t in range(N_TYPES):
+            n = self.counts[t]
+            if not n: continue
+            name = MESSAGE_TYPES.get(t, str(t))
+            counts[name] = n
+            rates[name] = round(self.current_rate(t, now), 3)
+            if self.lost[t]: lost[name] = self.lost[t]
+            if self.interval[t]: jitter[name] = round(self.jitter[t] * 1e6, 1)
+        total = sum(counts.values())
+        timing, flags = self.timing(now, expected, turnaround_limit)
+        return {
+            "ip": key, "mac": self.mac, "iface": self.iface, "is_self": self.is_self,
+            "clock_id": self.clock_id, "domain": self.domain, "transport": self.transport,
+            "first_seen": self.first_seen, "last_seen": self.last_seen,
+            "total": total, "rate": round(sum(rates.values()), 3), "lost": sum(lost.values()),
+            "loss_pct": round(100.0 * sum(lost.values()) / (total + sum(lost.values())), 3) if total else 0.0,
+            "counts": counts, "rates": rates, "lost_by_type": lost, "jitter_us": jitter,
+            "timing": timing, "flags": flags,
+        }
+
+
+class ClientTable:
+    def __init__(self, max_clients=4096, turnaround_limit=0.01):
+        self.max_clients = max_clients
+        self.turnaround_limit = turnaround_limit   # s, served turnaround p99 above this = overloaded master
+        self.clients = OrderedDict()   # key -> ClientStats, least recently seen first
+        self.pending = OrderedDict()   # (domain, clock_id, port, seq) of a Delay_Req -> (ts, client key)
+        self.expected = {}             # domain -> {message type: configured interval, s} of the applied profile
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def observe(self, msgs, iface, my_ip, now):
+        with self.lock:
+            for msg in msgs:
+                # L2 (ethertype 0x88F7) PTP has no IP, key those endpoints by MAC
+                key = msg.src_ip or msg.src_mac
+                c = self.clients.get(key)
+                if c is None:
+                    if len(self.clients) >= self.max_clients:
+                        self.clients.popitem(last=False)
+                        self.evicted += 1
+                    c = self.clients[key] = ClientStats(msg.src_ip, msg.src_mac, iface, now)
+                else:
+                    self.clients.move_to_end(key)
+                c.mac = msg.src_mac; c.iface = iface
+                # Seeing "Self" in radar is sometimes useful debugging.
+                c.is_self = (msg.src_ip is not None and msg.src_ip == my_ip)
+                c.observe(msg, now)
+                if msg.msg_type == 0x1: self._delay_req(msg, key, msg.ts or now)
+                elif msg.msg_type == 0x9: self._delay_resp(msg, c, msg.ts or now)
+
+    def _delay_req(self, msg, key, ts):
+        # Oldest requests sit at the front; anything older than PENDING_TIMEOUT was never answered
+        while self.pending:
+            (_, (req_ts, req_key)) = next(iter(self.pending.items()))
+            if ts - req_ts <= PENDING_TIMEOUT and len(self.pending) < MAX_PENDING: break
+            self.pending.popitem(last=False)
+            requester = self.clients.get(req_key)
+            if requester is not None: requester.unanswered += 1
+        self.pending[(msg.domain, msg.clock_id, msg.port_number, msg.seq)] = (ts, key)
+
+    def _delay_resp(self, msg, master, ts):
+        req = decode_delay_resp(msg)
+        if req is None: return
+        item = self.pending.pop((msg.domain, req[0], req[1], msg.seq), None)
+        if item is None: return
+        dt = ts - item[0]
+        if dt < 0: return
+        master.sketch("served", 1e6).add(dt, ts)
+        requester = self.clients.get(item[1])
+        if requester is not None:
+            requester.sketch("turnaround", 1e6).add(dt, ts)
+            requester.min_delay_req = log_interval_seconds(msg.log_interval)
+
+    def expire(self, max_age, now):
+        # Oldest entries sit at the front of the LRU order, so stop at the first live one
+        removed = []
+        with self.lock:
+            while self.clients:
+                key, c = next(iter(self.clients.items()))
+                if now - c.last_seen <= max_age: break
+                self.clients.popitem(last=False)
+                removed.append(key)
+        return removed
+
+    def next_expiry(self, max_age):
+        # The LRU order doubles as an expiry queue: the front entry always expires first
+        with self.lock:
+            if not self.clients: return None
+            return next(iter(self.clients.values())).last_seen + max_age
+
+    def export(self, now):
+        with self.lock:
+            items = list(self.clients.items())
+        return [c.to_dict(now, key, self.expected.get(c.domain), self.turnaround_limit) for key, c in items]
+
+    def turnaround(self, now):
+        """[{iface, domain, clients, turnaround_us}]: every requester's last window merged per (interface, domain)."""
+        groups = {}
+        with self.lock:
+            for c in self.clients.values():
+                sk = c.sketches.get("turnaround")
+                done = sk.completed(now) if sk else None
+                if done is not None: groups.setdefault((c.iface, c.domain), []).append(done)
+        out = []
+        for (iface, domain), sketches in sorted(groups.items()):
+            merged = LogSketch()
+            for sk in sketches: merged.merge(sk)
+            out.append({ "iface": iface, "domain": domain, "clients": len(sketches), "turnaround_us": merged.summary(1e6) })
+        return out
+
+
+# --- Query helpers for /api/clients ---
+SORT_FIELDS = ("ip", "mac", "iface", "clock_id", "domain", "first_seen", "last_seen", "total", "rate", "lost", "loss_pct")
+
+
+def _ip_sort_key(v):
+    parts = str(v).split(".")
+    if len(parts) == 4 and all(p.isdigit() for p in parts): return (0, tuple(int(p) for p in parts), "")
+    return (1, (), str(v))
+
+
+def query_clients(clients, sort="ip", iface=None, domain=None, msg_type=None, search=None, offset=0, limit=None):
+    """Filter, sort and page an exported client list. Returns (total_matching, page)."""
+    rows = clients
+    if iface: rows = [c for c in rows if c["iface"] == iface]
+    if domain is not None: rows = [c for c in rows if c["domain"] == domain]
+    if msg_type: rows = [c for c in rows if msg_type in c["counts"]]
+    if search:
+        s = search.lower()
+        rows = [c for c in rows if s in c["ip"].lower() or s in c["mac"].lower() or s in c["clock_id"].lower()]
+    desc = sort.startswith("-")
+    field = sort.lstrip("-")
+    if field not in SORT_FIELDS: field = "ip"
+    key = (lambda c: _ip_sort_key(c["ip"])) if field == "ip" else (lambda c: c[field])
+    rows = sorted(rows, key=key, reverse=desc)
+    total = len(rows)
+    offset = max(0, offset)
+    return total, rows[offset:offset + limit] if limit else rows[offset:]
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/config_diff.py"
+"""
+Classification of ptp4l config changes for /api/apply.
+
+The generated config is compared option by option with the one on disk, and
+every difference is one of:
+
+  - runtime:  ptp4l accepts a management SET for it (PRIORITY1, PRIORITY2,
+              GRANDMASTER_SETTINGS_NP for clockClass / timeSource), so it is
+              applied in place and lock is kept,
+  - deferred: only read at startup but harmless to leave until the next
+              restart (logging), so it is written to the file only,
+  - restart:  everything else (interfaces, transport, timestamping, domain,
+              message intervals ...), which needs ptp4l to be restarted.
+
+Comments, blank lines and option order are not changes.
+"""
+from collections import namedtuple
+
+from instances import parse_sections
+
+ConfigChange = namedtuple("ConfigChange", ["section", "key", "old", "new", "kind"])
+
+# [global] option -> management ID used to change it at runtime
+RUNTIME_OPTIONS = {
+    "priority1": "PRIORITY1",
+    "priority2": "PRIORITY2",
+    "clockClass": "GRANDMASTER_SETTINGS_NP",
+    "timeSource": "GRANDMASTER_SETTINGS_NP",
+}
+# ptp4l has no management ID for its log settings; they take effect on the next restart
+DEFERRED_OPTIONS = ("logging_level", "verbose", "use_syslog")
+
+
+def classify(section, key):
+    if section == "global" and key in RUNTIME_OPTIONS: return "runtime"
+    if key in DEFERRED_OPTIONS: return "deferred"
+    return "restart"
+
+
+def diff_config(old_text, new_text):
+    """[ConfigChange] between two config texts. A port section added / removed has key None."""
+    old, new = parse_sections(old_text or ""), parse_sections(new_text)
+    changes = []
+    for section in list(old) + [s for s in new if s not in old]:
+        a, b = old.get(section), new.get(section)
+        if a is None or b is None:
+            changes.append(ConfigChange(section, None, None if a is None else "present", None if b is None else "present", "restart"))
+            continue
+        for key in list(a) + [k for k in b if k not in a]:
+            if a.get(key) == b.get(key): continue
+            kind = classify(section, key)
+            # An option dropped from / added to the file falls back to ptp4l's default, which only a restart applies
+            if kind == "runtime" and None in (a.get(key), b.get(key)): kind = "restart"
+            changes.append(ConfigChange(section, key, a.get(key), b.get(key), kind))
+    return changes
+
+
+def needs_restart(changes):
+    return any(c.kind == "restart" for c in changes)
+
+
+def runtime_values(changes):
+    """{option: new value} of the runtime-changeable options."""
+    return {c.key: c.new for c in changes if c.kind == "runtime"}
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/executor.py"
+"""
+Helper process execution for the web app (pgrep, pmc, systemctl ...).
+
+Every command goes through one Executor:
+
+  - a semaphore bounds the number of child processes alive at once, so a
+    burst of requests queues instead of forking without limit,
+  - identical read-only commands already running with the same timeout are
+    coalesced (singleflight): the later callers wait for the running one and
+    share its result. Commands that change something (systemctl restart,
+    daemon-reload, pmc SET ...) always run,
+  - submit() / run_all() fan independent commands out on a small thread pool,
+  - the child environment (LANG=C) is built once, not copied per call.
+
+A command returns a CommandResult with exit code, output, duration and
+whether it timed out or could not be started, so a failed check is no
+longer indistinguishable from empty output.
+"""
+import os
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_TIMEOUT = 1.5
+# Helpers that only ever read state; anything not listed here (or below) is never coalesced
+READ_ONLY_COMMANDS = {"pgrep", "pidof", "ps"}
+# systemctl verbs that only read state
+SYSTEMCTL_QUERIES = {"is-active", "is-enabled", "is-failed", "is-system-running", "show", "status", "cat", "list-units", "list-unit-files"}
+PMC_ACTIONS = {"SET", "CMD", "COMMAND"}
+
+
+def is_query(argv):
+    """True when running argv twice at once is the same as running it once (safe to coalesce)."""
+    name = os.path.basename(argv[0])
+    if name == "systemctl":
+        verb = next((a for a in argv[1:] if not a.startswith("-")), None)
+        return verb in SYSTEMCTL_QUERIES
+    if name == "pmc": return not any(a.split(None, 1)[0].upper() in PMC_ACTIONS for a in argv[1:] if a.strip())
+    return name in READ_ONLY_COMMANDS
+
+
+class CommandResult(namedtuple("CommandResult", ["argv", "returncode", "output", "duration", "timed_out", "error"])):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def failed(self):
+        """Timed out or could not be run at all (a non-zero exit is an answer, not a failure)."""
+        return self.timed_out or self.error is not None
+
+    @property
+    def status(self):
+        if self.timed_out: return "timeout"
+        if self.error is not None: return "error"
+        return "ok" if self.returncode == 0 else "exit"
+
+    def describe(self):
+        name = os.path.basename(self.argv[0])
+        if self.timed_out: return f"{name} timed out after {self.duration:.1f}s"
+        if self.error is not None: return f"{name}: {self.error}"
+        if self.returncode: return f"{name} exited with {self.returncode}: {self.output.strip()[-200:]}"
+        return f"{name} ok"
+
+
+class Executor:
+    def __init__(self, max_procs=8, max_workers=8, on_result=None):
+        self.slots = threading.BoundedSemaphore(max_procs)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ptp-exec")
+        self.on_result = on_result      # fn(result, coalesced) after every call, e.g. for metrics
+        self.env = dict(os.environ, LANG="C")
+        self.inflight = {}              # (tuple(argv), timeout) -> Future of the running query
+        self.lock = threading.Lock()
+        self.counts = { "runs": 0, "coalesced": 0, "timeouts": 0, "errors": 0 }
+
+    def _exec(self, argv, timeout):
+        start = time.perf_counter()
+        with self.slots:
+            try:
+                p = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout, env=self.env)
+                return CommandResult(argv, p.returncode, p.stdout.decode("utf-8", errors="ignore"), time.perf_counter() - start, False, None)
+            except subprocess.TimeoutExpired as e:
+                return CommandResult(argv, None, (e.output or b"").decode("utf-8", errors="ignore"), time.perf_counter() - start, True, None)
+            except OSError as e:
+                return CommandResult(argv, None, "", time.perf_counter() - start, False, e.strerror or str(e))
+
+    def run(self, argv, timeout=DEFAULT_TIMEOUT):
+        """Run argv (or join the identical query already running) and return its CommandResult."""
+        if not is_query(argv): return self._finish(self._exec(list(argv), timeout))
+        key = (tuple(argv), timeout)
+        with self.lock:
+            fut = self.inflight.get(key)
+            leader = fut is None
+            if leader: fut = self.inflight[key] = Future()
+        if not leader:
+            result = fut.result()
+            with self.lock: self.counts["coalesced"] += 1
+            if self.on_result: self.on_result(result, True)
+            return result
+        try: result = self._exec(list(argv), timeout)
+        except BaseException as e:
+            with self.lock: del self.inflight[key]
+            fut.set_exception(e)
+            raise
+        with self.lock: del self.inflight[key]
+        fut.set_result(result)
+        return self._finish(result)
+
+    def _finish(self, result):
+        with self.lock:
+            self.counts["runs"] += 1
+            if result.timed_out: self.counts["timeouts"] += 1
+            elif result.error is not None: self.counts["errors"] += 1
+        if self.on_result: self.on_result(result, False)
+        return result
+
+    def submit(self, argv, timeout=DEFAULT_TIMEOUT):
+        return self.pool.submit(self.run, argv, timeout)
+
+    def run_all(self, commands, timeout=DEFAULT_TIMEOUT):
+        """Run independent commands concurrently; results in the order given."""
+        futures = [self.submit(argv, timeout) for argv in commands]
+        return [f.result() for f in futures]
+
+    def stats(self):
+        with self.lock: return { **self.counts, "inflight": len(self.inflight) }
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/fleet.py"
+"""
+Fleet aggregator: one dashboard over many ptp-web nodes.
+
+A single asyncio loop (own thread) keeps one HTTP/1.1 keep-alive connection
+per peer and polls /api/status, /api/bmca and /api/clients of every peer
+concurrently each cycle, with a per-node timeout and exponential backoff for
+unreachable nodes. The merged view (node table + GM -> BC -> slave topology)
+is rebuilt once per cycle, so /api/fleet only returns a cached object.
+
+`python3 fleet.py stub --count 200` starts local stub nodes for testing.
+"""
+import asyncio
+import json
+import threading
+import time
+import traceback
+
+MAX_BACKOFF = 30.0
+MAX_CONCURRENCY = 256     # open sockets at once; 200+ nodes still fit in one wave
+TOP_CLIENTS = 10
+
+
+def parse_peer(spec, default_port=8080):
+    """'host', 'host:port', 'http://host:port' or {"name", "host", "port"} -> (name, host, port)."""
+    if isinstance(spec, dict):
+        host = spec.get("host", "")
+        port = int(spec.get("port", default_port))
+        return spec.get("name") or f"{host}:{port}", host, port
+    spec = spec.strip().split("://", 1)[-1].rstrip("/")
+    host, sep, port = spec.rpartition(":")
+    if not sep: host, port = spec, ""
+    port = int(port) if port else default_port
+    return f"{host}:{port}", host, port
+
+
+class PeerConnection:
+    """Minimal HTTP/1.1 GET client over one persistent asyncio stream."""
+    def __init__(self, host, port):
+        self.host = host; self.port = port
+        self.reader = None; self.writer = None
+
+    async def get_json(self, path):
+        # A kept-alive socket may have been closed by the peer; retry once on a fresh one
+        for attempt in (0, 1):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nAccept: application/json\r\nConnection: keep-alive\r\n\r\n".encode())
+                await self.writer.drain()
+                status, body = await self._read_response()
+                break
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                self.close()
+                if attempt or not reused: raise
+        if status != 200: raise ConnectionError(f"HTTP {status} for {path}")
+        return json.loads(body)
+
+    async def _read_response(self):
+        line = await self.reader.readline()
+        if not line: raise ConnectionError("connection closed")
+        parts = line.split(None, 2)
+        version, status = parts[0], int(parts[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n"): break
+            if not line: raise ConnectionError("connection closed")
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            self.close()
+        if self.writer is not None and (headers.get("connection", "").lower() == "close" or version == b"HTTP/1.0"):
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            try: self.writer.close()
+            except Exception: pass
+        self.reader = None; self.writer = None
+
+
+class FleetNode:
+    def __init__(self, name, host, port):
+        self.name = name
+        self.conn = PeerConnection(host, port)
+        self.ok = False
+        self.error = "pending"
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.last_ok = None
+        self.latency_ms = None
+        self.status = {}; self.bmca = {}
+        self.clients_total = 0; self.top_clients = []
+
+    def to_dict(self):
+        return { "name": self.name, "ok": self.ok, "error": self.error, "last_ok": self.last_ok, "latency_ms": self.latency_ms,
+                 "failures": self.failures, "status": self.status, "bmca": self.bmca,
+                 "clients_total": self.clients_total, "top_clients": self.top_clients }
+
+
+def _clock(identity):
+    # "aabbcc.fffe.000001-1" (port identity) -> clock identity
+    return (identity or "").split("-")[0]
+
+
+def build_topology(nodes):
+    """
+    GM -> BC -> slave graph from each node's clock_id, parent port identity,
+    grandmaster identity and stepsRemoved. Clocks outside the fleet (e.g. a
+    third-party GM) appear as vertices without a node.
+    """
+    vertices = {}
+    for n in nodes:
+        st = n.get("status") or {}
+        cid = st.get("clock_id")
+        if not cid: continue
+        vertices[cid] = { "id": cid, "node": n["name"], "ok": n["ok"], "port": st.get("port"), "steps_removed": st.get("steps_removed"), "gm": st.get("gm_id"), "role": "slave" }
+    edges = []
+    by_gm_steps = {}
+    for v in vertices.values(): by_gm_steps.setdefault((v["gm"], v["steps_removed"]), []).append(v["id"])
+    for n in nodes:
+        st = n.get("status") or {}
+        cid = st.get("clock_id")
+        if cid not in vertices: continue
+        if st.get("is_self") or st.get("gm_id") == cid:
+            vertices[cid]["role"] = "gm"; continue
+        parent = _clock(st.get("parent"))
+        if not parent or parent == cid:
+            # No parent identity (older peer): nearest clock one hop closer to the same GM
+            steps = st.get("steps_removed") or 0
+            cands = by_gm_steps.get((st.get("gm_id"), steps - 1)) or []
+            parent = cands[0] if len(cands) == 1 else st.get("gm_id")
+        if not parent: continue
+        if parent not in vertices:
+            vertices[parent] = { "id": parent, "node": None, "ok": None, "port": None, "steps_removed": None, "gm": st.get("gm_id"), "role": "gm" if parent == st.get("gm_id") else "external" }
+        edges.append({ "from": parent, "to": cid })
+    parents = {e["from"] for e in edges}
+    for v in vertices.values():
+        if v["role"] == "slave" and v["id"] in parents: v["role"] = "bc"
+    return { "vertices": list(vertices.values()), "edges": edges }
+
+
+class FleetAggregator:
+    def __init__(self, peers, interval=1.0, timeout=0.8):
+        self.nodes = [FleetNode(*parse_peer(p)) for p in peers]
+        self.interval = interval
+        self.timeout = timeout
+        self.view = { "time": None, "duration": None, "nodes": [n.to_dict() for n in self.nodes], "topology": { "vertices": [], "edges": [] } }
+        self._thread = None
+
+    def start(self):
+        if self.nodes and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name="fleet-aggregator", daemon=True)
+            self._thread.start()
+        return self
+
+    async def _poll(self, node, sem):
+        async with sem:
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(self._fetch(node), self.timeout)
+            except Exception as e:
+                # State of a timed-out keep-alive stream is unknown, start over next time
+                node.conn.close()
+                node.ok = False
+                node.error = str(e) or type(e).__name__
+                node.failures += 1
+                node.next_attempt = time.monotonic() + min(MAX_BACKOFF, self.interval * 2 ** (node.failures - 1))
+                return
+            node.ok = True; node.error = None; node.failures = 0
+            node.last_ok = time.time()
+            node.latency_ms = round((time.monotonic() - start) * 1000, 1)
+
+    async def _fetch(self, node):
+        status = await node.conn.get_json("/api/status")
+        bmca = await node.conn.get_json("/api/bmca")
+        clients = await node.conn.get_json(f"/api/clients?sort=-rate&limit={TOP_CLIENTS}")
+        node.status = status; node.bmca = bmca
+        node.clients_total = clients.get("total", 0)
+        node.top_clients = clients.get("clients", [])
+
+    async def _main(self):
+        sem = asyncio.Semaphore(MAX_CONCURRENCY)
+        next_due = time.monotonic()
+        while True:
+            try:
+                start = time.monotonic()
+                due = [n for n in self.nodes if n.next_attempt <= start]
+                if due: await asyncio.gather(*(self._poll(n, sem) for n in due))
+                nodes = [n.to_dict() for n in self.nodes]
+                self.view = { "time": time.time(), "duration": round(time.monotonic() - start, 4), "nodes": nodes, "topology": build_topology(nodes) }
+            except Exception:
+                traceback.print_exc()
+            next_due += self.interval
+            now = time.monotonic()
+            if next_due < now: next_due = now + self.interval
+            await asyncio.sleep(next_due - now)
+
+
+# --- Local stub nodes (python3 fleet.py stub --count N) ---
+def stub_payloads(i, fanout=4):
+    """Synthetic node i of a GM (0) -> BCs (1..fanout) -> slaves tree."""
+    cid = f"000000.fffe.{i:06x}"
+    gm = "000000.fffe.000000"
+    if i == 0: parent, steps, port = cid, 0, "MASTER"
+    elif i <= fanout: parent, steps, port = gm, 1, "SLAVE"
+    else: parent, steps, port = f"000000.fffe.{1 + (i % fanout):06x}", 2, "SLAVE"
+    status = { "ptp4l": "RUNNING", "phc2sys": "RUNNING", "port": port, "offset": (i % 7) - 3, "path_delay": 500 + i, "freq": 0,
+               "steps_removed": steps, "gm": gm + (" (Self)" if i == 0 else ""), "gm_id": gm, "clock_id": cid, "parent": f"{parent}-1",
+               "is_self": i == 0, "ptp_time": "--" }
+    bmca = { "local": {"id": cid}, "gm": {"id": gm}, "flags": {}, "decision": [], "winner": "local" if i == 0 else "remote" }
+    clients = { "total": 0, "offset": 0, "clients": [] }
+    return { "/api/status": json.dumps(status).encode(), "/api/bmca": json.dumps(bmca).encode(), "/api/clients": json.dumps(clients).encode() }
+
+
+async def _serve_stub(i, port):
+    payloads = stub_payloads(i)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                path = line.split()[1].decode().split("?")[0]
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""): pass
+                body = payloads.get(path)
+                head = "200 OK" if body is not None else "404 Not Found"
+                body = body or b"{}"
+                writer.write(f"HTTP/1.1 {head}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (ConnectionError, IndexError): pass
+        finally: writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", port)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Start local ptp-web stub nodes")
+    parser.add_argument("mode", choices=["stub"])
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--base-port", type=int, default=18000)
+    args = parser.parse_args()
+
+    async def main():
+        servers = [await _serve_stub(i, args.base_port + i) for i in range(args.count)]
+        print(",".join(f"127.0.0.1:{args.base_port + i}" for i in range(args.count)), flush=True)
+        await asyncio.gather(*(s.serve_forever() for s in servers))
+
+    asyncio.run(main())
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/foreign_masters.py"
+"""
+Network-wide foreign master table built from captured Announce messages.
+
+Every announcing port (interface, domain, sender portIdentity) gets one
+entry with the grandmaster dataset of its latest Announce, its announce rate
+and first / last seen time. Per (interface, domain) the entries are kept in
+a list sorted by the IEEE 1588 dataset comparison (priority1, clockClass,
+clockAccuracy, offsetScaledLogVariance, priority2, grandmasterIdentity,
+stepsRemoved, sender portIdentity). An Announce only moves its entry when
+that key changed (bisect out + insort, most announces repeat the same
+dataset and cost one tuple compare), so a query walks an already ranked list
+instead of sorting hundreds of ports per request.
+
+An entry is stale after STALE_INTERVALS announce intervals without an
+Announce (the announceReceiptTimeout idea) and dropped after `ttl` seconds.
+"""
+import bisect
+import math
+import threading
+from collections import OrderedDict
+
+from capture import decode_announce
+
+RATE_TAU = 10.0         # seconds, time constant of the announce rate estimator
+STALE_INTERVALS = 4     # IEEE 1588 FOREIGN_MASTER_TIME_WINDOW
+
+
+class ForeignMaster:
+    __slots__ = ("key", "iface", "domain", "clock_id", "port_number", "src_ip", "src_mac", "is_self",
+                 "announce", "rank_key", "log_interval", "count", "rate", "first_seen", "last_seen")
+
+    def __init__(self, key, now):
+        self.key = key
+        self.iface, self.domain, self.clock_id, self.port_number = key
+        self.src_ip = self.src_mac = None; self.is_self = False
+        self.announce = None; self.rank_key = None; self.log_interval = 0
+        self.count = 0; self.rate = 0.0
+        self.first_seen = now; self.last_seen = now
+
+    def observe(self, msg, announce, now):
+        dt = now - self.last_seen
+        self.rate = self.rate * math.exp(-dt / RATE_TAU) + 1.0 / RATE_TAU if self.count else 1.0 / RATE_TAU
+        self.count += 1
+        self.last_seen = now
+        self.src_ip = msg.src_ip; self.src_mac = msg.src_mac
+        self.log_interval = msg.log_interval
+        self.announce = announce
+
+    def stale(self, now):
+        # logMessageInterval 0x7F means "not specified": fall back to the 1 s default
+        interval = 2.0 ** self.log_interval if -8 <= self.log_interval <= 8 else 1.0
+        return now - self.last_seen > STALE_INTERVALS * interval
+
+    def to_dict(self, now, rank):
+        a = self.announce
+        return { "rank": rank, "iface": self.iface, "domain": self.domain, "gm_identity": a.gm_identity,
+                 "priority1": a.priority1, "clock_class": a.clock_class, "clock_accuracy": a.clock_accuracy,
+                 "variance": a.variance, "priority2": a.priority2, "steps_removed": a.steps_removed,
+                 "time_source": a.time_source, "utc_offset": a.utc_offset,
+                 "port_identity": f"{self.clock_id}-{self.port_number}", "src_ip": self.src_ip, "src_mac": self.src_mac,
+                 "is_self": self.is_self, "log_interval": self.log_interval, "count": self.count,
+                 "rate": round(self.rate * math.exp(-(now - self.last_seen) / RATE_TAU), 2),
+                 "first_seen": self.first_seen, "last_seen": self.last_seen, "stale": self.stale(now) }
+
+
+def rank_key(entry):
+    a = entry.announce
+    return (a.priority1, a.clock_class, a.clock_accuracy, a.variance, a.priority2, a.gm_identity,
+            a.steps_removed, entry.clock_id, entry.port_number)
+
+
+class ForeignMasterTable:
+    def __init__(self, max_entries=1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()   # (iface, domain, clock_id, port) -> ForeignMaster, least recently seen first
+        self.ranking = {}              # (iface, domain) -> sorted [(rank_key, entry key)]
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _unrank(self, entry):
+        group = self.ranking.get((entry.iface, entry.domain))
+        if group is None or entry.rank_key is None: return
+        i = bisect.bisect_left(group, (entry.rank_key, entry.key))
+        if i < len(group) and group[i][1] == entry.key: del group[i]
+        if not group: del self.ranking[(entry.iface, entry.domain)]
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self._unrank(entry)
+
+    def observe(self, msgs, iface, my_ip, now):
+        """Same signature as ClientTable.observe; everything but Announce is ignored."""
+        with self.lock:
+            for msg in msgs:
+                if msg.msg_type != 0xB: continue
+                announce = decode_announce(msg)
+                if announce is None: continue
+                key = (iface, msg.domain, msg.clock_id, msg.port_number)
+                entry = self.entries.get(key)
+                if entry is None:
+                    if len(self.entries) >= self.max_entries:
+                        self._remove(next(iter(self.entries)))
+                        self.evicted += 1
+                    entry = self.entries[key] = ForeignMaster(key, now)
+                else:
+                    self.entries.move_to_end(key)
+                entry.observe(msg, announce, now)
+                entry.is_self = (msg.src_ip is not None and msg.src_ip == my_ip)
+                new_key = rank_key(entry)
+                if new_key != entry.rank_key:
+                    self._unrank(entry)
+                    entry.rank_key = new_key
+                    bisect.insort(self.ranking.setdefault((iface, msg.domain), []), (new_key, key))
+            self._expire(now)
+
+    def _expire(self, now):
+        # Oldest entries sit at the front of the LRU order, so stop at the first live one
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if now - entry.last_seen <= self.ttl: break
+            self._remove(key)
+
+    def query(self, now, iface=None, domain=None):
+        """[{iface, domain, best, gm_count, competing, masters: [rows in BMCA order]}] per (interface, domain)."""
+        out = []
+        with self.lock:
+            self._expire(now)
+            for (g_iface, g_domain), group in sorted(self.ranking.items()):
+                if iface and g_iface != iface: continue
+                if domain is not None and g_domain != domain: continue
+                rows = [self.entries[key].to_dict(now, rank) for rank, (_, key) in enumerate(group, 1)]
+                live = [r for r in rows if not r["stale"]]
+                gms = {r["gm_identity"] for r in live}
+                out.append({ "iface": g_iface, "domain": g_domain, "best": live[0]["gm_identity"] if live else None,
+                             "gm_count": len(gms), "competing": len(gms) > 1, "masters": rows })
+        return out
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/history.py"
+"""
+Fixed-memory time-series history for sampled PTP metrics.
+
+Each metric is a pair of preallocated `array` rings (timestamps + values),
+so 24 h at 1 Hz costs ~1.4 MB per float metric instead of a list of dicts.
+Queries return min/max/mean buckets (min-max decimation); bucket edges are
+located with bisect and aggregated with C-level min()/max()/sum() over
+array slices, so there is no per-sample Python loop.
+"""
+import bisect
+import threading
+from array import array
+
+
+class MetricRing:
+    def __init__(self, capacity, typecode="d"):
+        self.capacity = capacity
+        self.ts = array("d", bytes(8 * capacity))
+        self.values = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self.head = 0    # next physical write position
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, t, value):
+        with self.lock:
+            self.ts[self.head] = t
+            self.values[self.head] = value
+            self.head = (self.head + 1) % self.capacity
+            if self.count < self.capacity: self.count += 1
+
+    def _segments(self):
+        # Physical [start, end) slices of the live part of the ring, oldest first (one or two)
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity: return [(start, start + self.count)]
+        return [(start, self.capacity), (0, self.head)]
+
+    def range(self, t_from, t_to):
+        """(timestamps, values) arrays for samples with t_from <= t <= t_to, oldest first."""
+        ts = array("d"); vals = array(self.values.typecode)
+        with self.lock:
+            # Bisect each segment in place and copy only the matching samples
+            for start, end in self._segments():
+                lo = bisect.bisect_left(self.ts, t_from, start, end)
+                hi = bisect.bisect_right(self.ts, t_to, lo, end)
+                if hi > lo:
+                    ts += self.ts[lo:hi]; vals += self.values[lo:hi]
+        return ts, vals
+
+    def latest(self):
+        with self.lock:
+            if not self.count: return None
+            i = (self.head - 1) % self.capacity
+            return self.ts[i], self.values[i]
+
+    @property
+    def nbytes(self):
+        return self.capacity * (self.ts.itemsize + self.values.itemsize)
+
+
+def downsample(ts, vals, t_from, t_to, points):
+    """
+    Min-max decimation into `points` equal-time buckets.
+    Returns [[bucket_start, min, max, mean, count], ...], skipping empty buckets.
+    """
+    n = len(ts)
+    if not n or points <= 0: return []
+    if n <= points:
+        return [[t, v, v, v, 1] for t, v in zip(ts, vals)]
+    width = (t_to - t_from) / points
+    if width <= 0: return []
+    out = []
+    lo = 0
+    for i in range(points):
+        edge = t_from + (i + 1) * width
+        hi = n if i == points - 1 else bisect.bisect_right(ts, edge, lo)
+        if hi > lo:
+            chunk = vals[lo:hi]
+            out.append([t_from + i * width, min(chunk), max(chunk), sum(chunk) / (hi - lo), hi - lo])
+        lo = hi
+    return out
+
+
+class MetricHistory:
+    """Named set of MetricRing, one per metric."""
+    def __init__(self, capacity, metrics):
+        # metrics: {name: array typecode}
+        self.rings = {name: MetricRing(capacity, tc) for name, tc in metrics.items()}
+
+    def record(self, t, values):
+        for name, value in values.items():
+            ring = self.rings.get(name)
+            if ring is not None and value is not None: ring.append(t, value)
+
+    def query(self, name, t_from, t_to, points):
+        ts, vals = self.rings[name].range(t_from, t_to)
+        return downsample(ts, vals, t_from, t_to, points)
+
+    @property
+    def nbytes(self):
+        return sum(r.nbytes for r in self.rings.values())
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/hostinfo.py"
+"""
+Cached host metadata: network interfaces and the ptp4l config directory.
+
+The interface table (name, ifindex, MAC, operstate, IPv4 / IPv6 addresses)
+is built from one rtnetlink dump (RTM_GETLINK + RTM_GETADDR) and kept as an
+immutable snapshot, so a read is a dict lookup. It is rebuilt only when the
+kernel reports a change on the RTMGRP_LINK / RTMGRP_IPV4_IFADDR /
+RTMGRP_IPV6_IFADDR multicast groups (link up/down, rename, driver reload,
+DHCP lease), and listeners get the names of the interfaces that changed.
+Config files are watched with inotify on their directory (editors and the
+apply path replace them by rename), so consumers re-parse on a real change
+instead of stat()ing on every request.
+
+Without netlink / inotify (non-Linux, restricted sandbox) the table falls
+back to a sysfs + SIOCGIFADDR scan at most every FALLBACK_INTERVAL seconds.
+"""
+import ctypes
+import errno
+import fcntl
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+SYSFS_NET = "/sys/class/net"
+FALLBACK_INTERVAL = 5.0
+
+# rtnetlink (linux/netlink.h, linux/rtnetlink.h, linux/if_link.h, linux/if_addr.h)
+NETLINK_ROUTE = 0
+RTMGRP_LINK, RTMGRP_IPV4_IFADDR, RTMGRP_IPV6_IFADDR = 0x1, 0x10, 0x100
+NLMSG_ERROR, NLMSG_DONE = 2, 3
+NLM_F_REQUEST, NLM_F_DUMP = 0x1, 0x300
+RTM_NEWLINK, RTM_GETLINK, RTM_NEWADDR, RTM_GETADDR = 16, 18, 20, 22
+IFLA_ADDRESS, IFLA_IFNAME, IFLA_OPERSTATE = 1, 3, 16
+IFA_ADDRESS, IFA_LOCAL = 1, 2
+IFF_UP = 0x1
+OPERSTATES = ["unknown", "notpresent", "down", "lowerlayerdown", "testing", "dormant", "up"]
+NLMSGHDR = struct.Struct("=IHHII")     # len, type, flags, seq, pid
+IFINFOMSG = struct.Struct("=BxHiII")   # family, type, index, flags, change
+IFADDRMSG = struct.Struct("=BBBBI")    # family, prefixlen, flags, scope, index
+RTATTR = struct.Struct("=HH")          # len, type
+
+# inotify (linux/inotify.h)
+IN_ATTRIB, IN_CLOSE_WRITE = 0x4, 0x8
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_DELETE_SELF, IN_IGNORED = 0x400, 0x8000
+IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+CONFIG_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB | IN_DELETE_SELF
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+SIOCGIFADDR = 0x8915
+
+Link = namedtuple("Link", ["name", "index", "mac", "up", "operstate", "ipv4", "ipv6"])
+
+
+def _attrs(buf, off, end):
+    while off + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from(buf, off)
+        if length < RTATTR.size: break
+        yield kind, buf[off + RTATTR.size:off + length]
+        off += (length + 3) & ~3
+
+
+def _messages(buf):
+    off = 0
+    while off + NLMSGHDR.size <= len(buf):
+        length, kind, _, _, _ = NLMSGHDR.unpack_from(buf, off)
+        if length < NLMSGHDR.size: break
+        yield kind, buf, off + NLMSGHDR.size, off + length
+        off += (length + 3) & ~3
+
+
+def parse_link(buf, off, end):
+    """RTM_NEWLINK body -> (index, name, mac, up, operstate)."""
+    _, _, index, flags, _ = IFINFOMSG.unpack_from(buf, off)
+    name = mac = None; oper = 0
+    for kind, value in _attrs(buf, off + IFINFOMSG.size, end):
+        if kind == IFLA_IFNAME: name = value.split(b"\0", 1)[0].decode(errors="replace")
+        elif kind == IFLA_ADDRESS: mac = ":".join(f"{b:02x}" for b in value)
+        elif kind == IFLA_OPERSTATE: oper = value[0]
+    return index, name, mac, bool(flags & IFF_UP), OPERSTATES[oper] if oper < len(OPERSTATES) else "unknown"
+
+
+def parse_addr(buf, off, end):
+    """RTM_NEWADDR body -> (index, family, address)."""
+    family, _, _, _, index = IFADDRMSG.unpack_from(buf, off)
+    addr = local = None
+    for kind, value in _attrs(buf, off + IFADDRMSG.size, end):
+        if kind == IFA_ADDRESS: addr = value
+        elif kind == IFA_LOCAL: local = value
+    # IFA_LOCAL is our address; IFA_ADDRESS is the peer on point-to-point links
+    raw = local or addr
+    return index, family, socket.inet_ntop(family, raw) if raw else None
+
+
+class NetlinkDumper:
+    """One unbound NETLINK_ROUTE socket for dump requests."""
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        self.seq = 0
+
+    def dump(self, kind):
+        self.seq += 1
+        # struct rtgenmsg { unsigned char rtgen_family; } padded to 4 bytes
+        self.sock.send(NLMSGHDR.pack(NLMSGHDR.size + 4, kind, NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0) + b"\0" * 4)
+        out = []
+        while True:
+            buf = self.sock.recv(65536)
+            for mtype, data, off, end in _messages(buf):
+                if mtype == NLMSG_DONE: return out
+                if mtype == NLMSG_ERROR:
+                    code = struct.unpack_from("=i", data, off)[0]
+                    if code: raise OSError(-code, os.strerror(-code))
+                    continue
+                out.append((mtype, data, off, end))
+
+    def links(self):
+        links = {}
+        for mtype, data, off, end in self.dump(RTM_GETLINK):
+            if mtype != RTM_NEWLINK: continue
+            index, name, mac, up, oper = parse_link(data, off, end)
+            if name: links[index] = [name, index, mac, up, oper, [], []]
+        for mtype, data, off, end in self.dump(RTM_GETADDR):
+            if mtype != RTM_NEWADDR: continue
+            index, family, addr = parse_addr(data, off, end)
+            if addr and index in links: links[index][5 if family == socket.AF_INET else 6].append(addr)
+        return {l[0]: Link(l[0], l[1], l[2], l[3], l[4], tuple(l[5]), tuple(l[6])) for l in links.values()}
+
+    def close(self):
+        self.sock.close()
+
+
+def _sysfs_read(iface, attr):
+    try:
+        with open(os.path.join(SYSFS_NET, iface, attr)) as f: return f.read().strip()
+    except OSError: return None
+
+
+def _ipv4_ioctl(iface):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try: return socket.inet_ntoa(fcntl.ioctl(s, SIOCGIFADDR, struct.pack("256s", iface.encode()[:15]))[20:24])
+        except OSError: return None
+
+
+def scan_sysfs():
+    """Fallback interface table from sysfs and SIOCGIFADDR (first IPv4 only)."""
+    links = {}
+    try: names = os.listdir(SYSFS_NET)
+    except OSError: return links
+    for name in names:
+        try: index = int(_sysfs_read(name, "ifindex") or 0)
+        except ValueError: index = 0
+        flags = _sysfs_read(name, "flags") or "0"
+        ip = _ipv4_ioctl(name)
+        links[name] = Link(name, index, _sysfs_read(name, "address"), bool(int(flags, 16) & IFF_UP),
+                           _sysfs_read(name, "operstate") or "unknown", (ip,) if ip else (), ())
+    return links
+
+
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno(); raise OSError(e, os.strerror(e))
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno(); raise OSError(e, os.strerror(e))
+        return wd
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """[(wd, mask, name)] of the queued events."""
+        out = []
+        while True:
+            try: buf = os.read(self.fd, 65536)
+            except BlockingIOError: return out
+            off = 0
+            while off + INOTIFY_EVENT.size <= len(buf):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(buf, off)
+                name = buf[off + INOTIFY_EVENT.size:off + INOTIFY_EVENT.size + length].split(b"\0", 1)[0]
+                out.append((wd, mask, os.fsdecode(name)))
+                off += INOTIFY_EVENT.size + length
+
+    def close(self):
+        os.close(self.fd)
+
+
+class HostInfo:
+    def __init__(self):
+        self.links = {}               # name -> Link (replaced as a whole, never mutated)
+        self.link_listeners = []      # fn(set of changed interface names), on the watcher thread
+        self.watching_links = False
+        self._dirs = {}               # inotify wd -> (directory, fn(filename))
+        self._events = None
+        self._dumper = None
+        self._inotify = None
+        self._sel = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._scanned_at = 0.0
+        self._thread = None
+
+    def start(self):
+        try:
+            self._dumper = NetlinkDumper()
+            self._events = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            self._events.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            self._events.setblocking(False)
+            self._sel.register(self._events, selectors.EVENT_READ, "link")
+            self.watching_links = True
+        except OSError:
+            self._events = None
+        try:
+            self._inotify = Inotify()
+            self._sel.register(self._inotify, selectors.EVENT_READ, "inotify")
+        except (OSError, AttributeError):
+            self._inotify = None
+        self._reload()
+        if (self._events or self._inotify) and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name="host-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def watch_dir(self, path, fn):
+        """
+        Call fn(filename) for every create / write / rename / delete in `path`, and fn(None)
+        once if the directory itself goes away (the watch ends). False when not watchable.
+        """
+        if self._inotify is None: return False
+        try: wd = self._inotify.add_watch(path, CONFIG_MASK)
+        except OSError: return False
+        self._dirs[wd] = (path, fn)
+        return True
+
+    # --- reads (no syscalls unless running on the fallback scan) ---
+    def _table(self):
+        if not self.watching_links and time.monotonic() - self._scanned_at > FALLBACK_INTERVAL: self._reload()
+        return self.links
+
+    def nics(self):
+        return sorted(n for n in self._table() if not n.startswith("lo"))
+
+    def has_link(self, name):
+        return name in self._table()
+
+    def link(self, name):
+        return self._table().get(name)
+
+    def ifindex(self, name):
+        l = self._table().get(name)
+        return l.index if l else None
+
+    def ipv4(self, name):
+        l = self._table().get(name)
+        return l.ipv4[0] if l and l.ipv4 else None
+
+    # --- watcher ---
+    def _reload(self):
+        with self._lock:
+            old = self.links
+            try: links = self._dumper.links() if self._dumper else scan_sysfs()
+            except OSError: links = scan_sysfs()
+            self.links = links
+            self._scanned_at = time.monotonic()
+        return {n for n in set(old) | set(links) if old.get(n) != links.get(n)}
+
+    def _drain_links(self):
+        # Any number of queued events collapses into one re-dump; ENOBUFS (overrun) just means "re-dump"
+        while True:
+            try:
+                if not self._events.recv(65536): break
+            except BlockingIOError: break
+            except OSError as e:
+                if e.errno != errno.ENOBUFS: raise
+        return self._reload()
+
+    def _run(self):
+        while True:
+            try:
+                for key, _ in self._sel.select():
+                    if key.data == "link":
+                        changed = self._drain_links()
+                        if not changed: continue
+                        for fn in self.link_listeners:
+                            try: fn(changed)
+                            except Exception: traceback.print_exc()
+                    else:
+                        for wd, mask, name in self._inotify.read():
+                            path, fn = self._dirs.get(wd, (None, None))
+                            if fn is None: continue
+                            if mask & (IN_DELETE_SELF | IN_IGNORED):
+                                if self._dirs.pop(wd, None) is None: continue
+                                name = None
+                            try: fn(name)
+                            except Exception: traceback.print_exc()
+            except Exception:
+                traceback.print_exc()
+                time.sleep(1)
+
+    def close(self):
+        for closer in (self._events, self._dumper, self._inotify):
+            if closer is not None:
+                try: closer.close()
+                except Exception: pass
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/instances.py"
+"""
+Discovery of the ptp4l instances managed by this controller.
+
+The default instance is `/etc/linuxptp/ptp4l.conf` run by `ptp4l.service`.
+Every additional `/etc/linuxptp/ptp4l-<name>.conf` is one more instance run
+by the `ptp4l@<name>.service` template unit, with its own management socket
+(uds_address) and domain. Each instance keeps one persistent PmcClient.
+"""
+import os
+import re
+import threading
+
+from pmc_client import PmcClient, PTP4L_UDS
+
+CONFIG_DIR = "/etc/linuxptp"
+DEFAULT_INSTANCE = "default"
+NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+CONFIG_RE = re.compile(r"^ptp4l-([A-Za-z0-9_-]{1,32})\.conf$")
+
+
+def parse_sections(text):
+    """Single pass over ptp4l config text. Returns {section: {option: value}} in file order."""
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in "#;": continue
+        m = re.match(r'^\[([^\]]+)\]', line)
+        if m:
+            current = sections.setdefault(m.group(1), {})
+            continue
+        if current is not None:
+            parts = line.split(None, 1)
+            current[parts[0]] = parts[1].strip() if len(parts) > 1 else ""
+    return sections
+
+
+def parse_ptp4l_config(path):
+    """Returns ({global option: value}, [port section names])."""
+    try:
+        with open(path, 'r') as f: sections = parse_sections(f.read())
+    except OSError: return {}, []
+    return sections.get("global", {}), [s for s in sections if s != "global"]
+
+
+class PtpInstance:
+    __slots__ = ("name", "config_file", "unit", "uds_path", "domain", "interfaces", "mtime")
+
+    def __init__(self, name, config_file):
+        self.name = name
+        self.config_file = config_file
+        self.unit = unit_name(name)
+        self.load()
+
+    def load(self):
+        try: self.mtime = os.stat(self.config_file).st_mtime
+        except OSError: self.mtime = None
+        options, self.interfaces = parse_ptp4l_config(self.config_file)
+        self.uds_path = options.get("uds_address") or default_uds_path(self.name)
+        try: self.domain = int(options.get("domainNumber", 0))
+        except ValueError: self.domain = 0
+
+    @property
+    def interface(self):
+        return self.interfaces[0] if self.interfaces else None
+
+    def to_dict(self):
+        return { "name": self.name, "config_file": self.config_file, "unit": self.unit, "uds_path": self.uds_path,
+                 "domain": self.domain, "interfaces": list(self.interfaces), "configured": self.mtime is not None }
+
+
+def unit_name(name):
+    return "ptp4l" if name == DEFAULT_INSTANCE else f"ptp4l@{name}"
+
+
+def default_uds_path(name):
+    return PTP4L_UDS if name == DEFAULT_INSTANCE else f"{PTP4L_UDS}-{name}"
+
+
+def config_path(name, config_dir=CONFIG_DIR):
+    if name == DEFAULT_INSTANCE: return os.path.join(config_dir, "ptp4l.conf")
+    return os.path.join(config_dir, f"ptp4l-{name}.conf")
+
+
+class InstanceRegistry:
+    """
+    Cached instance list. refresh() costs one listdir plus one stat per config
+    and only re-parses files whose mtime changed. While the config directory is
+    watched (inotify), current() skips even that until invalidate() is called.
+    """
+    def __init__(self, config_dir=CONFIG_DIR):
+        self.config_dir = config_dir
+        self.instances = {}    # name -> PtpInstance, default first
+        self.clients = {}      # name -> PmcClient
+        self.lock = threading.Lock()
+        self.watched = False
+        self.stale = True
+        self.refresh()
+
+    def invalidate(self):
+        self.stale = True
+
+    def current(self):
+        return self.refresh() if self.stale or not self.watched else self.all()
+
+    def _discover(self):
+        names = [DEFAULT_INSTANCE]
+        try: names += sorted(m.group(1) for m in map(CONFIG_RE.match, os.listdir(self.config_dir)) if m)
+        except OSError: pass
+        return names
+
+    def refresh(self):
+        with self.lock:
+            # Cleared before the scan, so an event arriving during it is not lost
+            self.stale = False
+            current = {}
+            for name in self._discover():
+                inst = self.instances.get(name)
+                if inst is None: inst = PtpInstance(name, config_path(name, self.config_dir))
+                else:
+                    try: mtime = os.stat(inst.config_file).st_mtime
+                    except OSError: mtime = None
+                    if mtime != inst.mtime: inst.load()
+                current[name] = inst
+            for name in set(self.clients) - set(current):
+                self.clients.pop(name).close()
+            self.instances = current
+            return list(current.values())
+
+    def all(self):
+        with self.lock:
+            return list(self.instances.values())
+
+    def get(self, name):
+        with self.lock:
+            return self.instances.get(name or DEFAULT_INSTANCE)
+
+    @property
+    def primary(self):
+        return self.get(DEFAULT_INSTANCE)
+
+    def client(self, inst):
+        with self.lock:
+            pmc = self.clients.get(inst.name)
+            if pmc is not None and pmc.uds_path != inst.uds_path:
+                pmc.close(); pmc = None
+            if pmc is None: pmc = self.clients[inst.name] = PmcClient(inst.uds_path)
+        # ptp4l drops management messages for a foreign domain, so follow the configured one
+        pmc.domain = inst.domain
+        return pmc
+
+    def close(self):
+        with self.lock:
+            for pmc in self.clients.values(): pmc.close()
+            self.clients = {}
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/journal.py"
+"""
+Long-lived journald follower for the ptp4l / phc2sys units.
+
+One `journalctl -f -o json` process feeds a bounded in-memory ring of
+structured records. Readers fetch incrementally by journald cursor, and
+ptp4l servo lines ("master offset ... freq ... path delay ...") are parsed
+into metrics on the way in.
+"""
+import json
+import re
+import subprocess
+import threading
+import time
+import traceback
+from collections import deque, namedtuple
+
+LogRecord = namedtuple("LogRecord", ["seq", "cursor", "ts", "unit", "priority", "ident", "message"])
+ServoSample = namedtuple("ServoSample", ["ts", "offset", "state", "freq", "path_delay"])
+
+# ptp4l: "master offset        -12 s2 freq   +1234 path delay       567"
+SERVO_RE = re.compile(r"master offset\s+(-?\d+)\s+s(\d)\s+freq\s+([+-]?\d+)\s+path delay\s+(-?\d+)")
+# ptp4l with summary_interval: "rms   12 max   20 freq  +123 +/-   4 delay   567 +/-   1"
+SERVO_RMS_RE = re.compile(r"\brms\s+(\d+)\s+max\s+\d+\s+freq\s+([+-]?\d+)\s+\+/-\s+\d+(?:\s+delay\s+(\d+))?")
+
+RESTART_DELAY = 2.0
+
+
+def parse_servo(message, ts):
+    m = SERVO_RE.search(message)
+    if m: return ServoSample(ts, int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)))
+    # Summary lines are printed in any servo state and carry an unsigned rms: no offset, no state
+    m = SERVO_RMS_RE.search(message)
+    if m: return ServoSample(ts, None, None, int(m.group(2)), int(m.group(3)) if m.group(3) else None)
+    return None
+
+
+def _text(value):
+    # journald exports non-UTF-8 fields as a list of byte values
+    if isinstance(value, list): return bytes(value).decode("utf-8", errors="replace")
+    return value or ""
+
+
+class JournalFollower:
+    def __init__(self, units, maxlen=2000, backlog=200):
+        self.units = list(units)
+        self.backlog = backlog
+        self.records = deque(maxlen=maxlen)
+        self.servo = {}               # unit -> latest ServoSample (one per ptp4l instance)
+        self.listeners = []           # fn(list[LogRecord]) on the follower thread
+        self.servo_listeners = []     # fn(unit, ServoSample)
+        self._seq = 0
+        self._by_cursor = {}
+        self._lock = threading.Lock()
+        self._last_cursor = None
+        self._proc = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="journal-follower", daemon=True)
+            self._thread.start()
+        return self
+
+    def _command(self):
+        cmd = ["journalctl", "-f", "-o", "json", "--no-pager"]
+        for u in self.units: cmd += ["-u", u]
+        # Resume exactly where the previous follower process stopped
+        if self._last_cursor: cmd += ["--after-cursor", self._last_cursor]
+        else: cmd += ["-n", str(self.backlog)]
+        return cmd
+
+    def _run(self):
+        while True:
+            try:
+                self._proc = subprocess.Popen(self._command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                              env={"LANG": "C", "PATH": "/usr/bin:/bin:/usr/sbin:/sbin"})
+                for line in self._proc.stdout:
+                    rec = self._parse(line)
+                    if rec is not None: self._append(rec)
+                self._proc.wait()
+            except FileNotFoundError:
+                pass
+            except Exception:
+                traceback.print_exc()
+            time.sleep(RESTART_DELAY)
+
+    def _parse(self, line):
+        try: entry = json.loads(line)
+        except ValueError: return None
+        try: ts = int(entry.get("__REALTIME_TIMESTAMP", 0)) / 1e6 or time.time()
+        except (TypeError, ValueError): ts = time.time()
+        try: prio = int(entry.get("PRIORITY", 6))
+        except (TypeError, ValueError): prio = 6
+        return (entry.get("__CURSOR", ""), ts, _text(entry.get("_SYSTEMD_UNIT") or entry.get("UNIT")), prio,
+                _text(entry.get("SYSLOG_IDENTIFIER")), _text(entry.get("MESSAGE")))
+
+    def _append(self, fields):
+        with self._lock:
+            self._seq += 1
+            rec = LogRecord(self._seq, *fields)
+            if len(self.records) == self.records.maxlen:
+                self._by_cursor.pop(self.records[0].cursor, None)
+            self.records.append(rec)
+            self._by_cursor[rec.cursor] = rec.seq
+            self._last_cursor = rec.cursor
+        # phc2sys prints look-alike summaries, only ptp4l's servo lines are port metrics
+        servo = parse_servo(rec.message, rec.ts) if rec.unit.startswith("ptp4l") else None
+        if servo is not None:
+            self.servo[rec.unit] = servo
+            for fn in self.servo_listeners:
+                try: fn(rec.unit, servo)
+                except Exception: traceback.print_exc()
+        for fn in self.listeners:
+            try: fn([rec])
+            except Exception: traceback.print_exc()
+
+    def since(self, cursor=None, units=None, max_priority=None, limit=None):
+        """
+        Records after `cursor` (all buffered records when None/unknown), filtered by
+        unit name prefix and maximum syslog priority, at most the newest `limit` of them.
+        Returns (records, next_cursor, reset, truncated): next_cursor is the newest record
+        seen regardless of filters, truncated=True means older matches were left out, and
+        reset=True means the records do not continue from the given cursor (it had already
+        left the ring, or the limit cut a gap after it).
+        """
+        with self._lock:
+            start_seq = self._by_cursor.get(cursor) if cursor else None
+            reset = bool(cursor) and start_seq is None
+            if start_seq is None: items = list(self.records)
+            else:
+                # Records are seq-contiguous, so the cursor position is an index computation
+                items = list(self.records)[start_seq - self.records[0].seq + 1:]
+            next_cursor = self._last_cursor or cursor
+        if units: items = [r for r in items if any(r.unit.startswith(u) for u in units)]
+        if max_priority is not None: items = [r for r in items if r.priority <= max_priority]
+        truncated = bool(limit) and len(items) > limit
+        if truncated: items = items[-limit:]
+        return items, next_cursor, reset or (truncated and bool(cursor)), truncated
+
+    def tail(self, n):
+        with self._lock:
+            return list(self.records)[-n:]
+
+    def stop(self):
+        if self._proc and self._proc.poll() is None:
+            try: self._proc.terminate()
+            except Exception: pass
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/metric_store.py"
+"""
+Durable on-disk store of the sampled metrics (survives restarts and reboots).
+
+One file per UTC day (metrics-YYYYMMDD.dat), memory-mapped:
+
+    [0, 64)        header: magic, version, record size, day start
+    [64, 5824)     time index: uint32 per minute of the day, 1 + number of
+                   the first record in that minute (0 = no record yet)
+    [8192, ...)    fixed 64-byte records, append-only, in time order
+
+A record is t, offset, path delay, freq, servo freq, PHC - system offset
+(NaN = not available), the 8-byte grandmaster identity, port state, flags
+and a CRC32 of the other 60 bytes. Appending writes one record into the map
+and at most one index slot, so a write is O(1). Files are preallocated
+(sparse) and doubled when full. After a crash the record count is recovered
+by binary search over the zero-filled tail, and a torn last record fails
+its CRC and is dropped.
+
+Range queries find their first record through the minute index and return
+memoryview slices of the map (no copy). CSV export streams those records in
+chunks. The directory is bounded by retention_days and max_bytes (oldest
+days deleted first). Finished days are compacted by truncating their unused
+preallocated tail.
+"""
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import traceback
+import zlib
+from array import array
+from datetime import datetime, timezone
+
+MAGIC = b"PTPMET01"
+VERSION = 1
+HEADER = struct.Struct("<8sIId")       # magic, version, record size, day start (epoch s)
+RECORD = struct.Struct("<dddddd8sBB2xI")   # t, offset, path_delay, freq, servo_freq, phc_offset, gm, port_state, flags, crc
+RECORD_SIZE = RECORD.size              # 64
+INDEX_OFFSET = 64
+MINUTES = 1440
+DATA_OFFSET = 8192
+FLAG_RUNNING = 0x1
+NAN = float("nan")
+FIELDS = ("offset", "path_delay", "freq", "servo_freq", "phc_offset")
+FIELD_INDEX = {name: i + 1 for i, name in enumerate(FIELDS)}
+FIELD_INDEX["port_state"] = 7
+CSV_CHUNK = 1000
+
+
+def day_start(t):
+    return float(int(t // 86400) * 86400)
+
+
+def gm_bytes(gm_id):
+    try:
+        raw = bytes.fromhex((gm_id or "").replace(".", ""))
+        return raw if len(raw) == 8 else bytes(8)
+    except ValueError: return bytes(8)
+
+
+def gm_text(raw):
+    if not any(raw): return ""
+    h = raw.hex()
+    return f"{h[0:6]}.{h[6:10]}.{h[10:16]}"
+
+
+def pack_record(t, values, running):
+    def f(name):
+        v = values.get(name)
+        return NAN if v is None else float(v)
+    body = RECORD.pack(t, f("offset"), f("path_delay"), f("freq"), f("servo_freq"), f("phc_offset"),
+                       gm_bytes(values.get("gm_id")), values.get("port_state") or 0, FLAG_RUNNING if running else 0, 0)
+    return body[:-4] + struct.pack("<I", zlib.crc32(body[:-4]))
+
+
+def record_ok(buf, off):
+    return zlib.crc32(buf[off:off + RECORD_SIZE - 4]) == struct.unpack_from("<I", buf, off + RECORD_SIZE - 4)[0]
+
+
+class DayFile:
+    def __init__(self, path, start, writable=False, capacity=0):
+        self.path = path
+        self.start = start
+        self.writable = writable
+        if writable:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(self.fd).st_size < DATA_OFFSET:
+                os.ftruncate(self.fd, DATA_OFFSET + max(capacity, 1) * RECORD_SIZE)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, VERSION, RECORD_SIZE, start), 0)
+        else:
+            self.fd = os.open(path, os.O_RDONLY)
+        try:
+            self._map()
+            magic, version, size, _ = HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC or version != VERSION or size != RECORD_SIZE: raise ValueError(f"{path}: not a metric store file")
+        except (OSError, ValueError, struct.error):
+            if getattr(self, "mm", None) is not None: self.mm.close()
+            os.close(self.fd)
+            raise
+        self.index = memoryview(self.mm)[INDEX_OFFSET:INDEX_OFFSET + 4 * MINUTES].cast("I")
+        self.count = self._recover()
+        self.last_t = struct.unpack_from("<d", self.mm, self._off(self.count - 1))[0] if self.count else 0.0
+
+    def _map(self):
+        size = os.fstat(self.fd).st_size
+        # A grown file gets a new map; the old one stays valid for readers still holding views of it
+        self.mm = mmap.mmap(self.fd, size, access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+        self.capacity = (size - DATA_OFFSET) // RECORD_SIZE
+
+    @staticmethod
+    def _off(i):
+        return DATA_OFFSET + i * RECORD_SIZE
+
+    def _t(self, i):
+        return struct.unpack_from("<d", self.mm, self._off(i))[0]
+
+    def _recover(self):
+        # Records are appended into a zero-filled file: the first t == 0 ends the data
+        lo, hi = 0, self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._t(mid) > 0: lo = mid + 1
+            else: hi = mid
+        count = lo
+        if count and not record_ok(self.mm, self._off(count - 1)):
+            count -= 1      # torn write of the last record
+            if self.writable: self.mm[self._off(count):self._off(count + 1)] = bytes(RECORD_SIZE)
+        if self.writable:
+            # The index slot is written after its record, so rebuild it from the data
+            self.index[:] = array("I", bytes(4 * MINUTES))
+            for i in range(count):
+                m = self._minute(self._t(i))
+                if not self.index[m]: self.index[m] = i + 1
+        return count
+
+    def _minute(self, t):
+        return min(max(int((t - self.start) // 60), 0), MINUTES - 1)
+
+    def append(self, record, t):
+        if self.count >= self.capacity:
+            os.ftruncate(self.fd, self._off(self.capacity * 2))
+            old = self.mm
+            self._map()
+            # The old index goes with the old map: dropped, not released, so a view still in use keeps both alive
+            self.index = memoryview(self.mm)[INDEX_OFFSET:INDEX_OFFSET + 4 * MINUTES].cast("I")
+            self._unmap(old)
+        off = self._off(self.count)
+        self.mm[off:off + RECORD_SIZE] = record
+        m = self._minute(t)
+        if not self.index[m]: self.index[m] = self.count + 1
+        self.count += 1
+        self.last_t = t
+
+    def find(self, t):
+        """Number of the first record with time >= t (minute index, then a short forward scan)."""
+        if t <= self.start: return 0
+        i = None
+        for m in range(self._minute(t), MINUTES):
+            if self.index[m]: i = self.index[m] - 1; break
+        if i is None: return self.count
+        # Minute slots can precede t within the minute; an index slot past count is a record still being written
+        i = min(i, self.count)
+        while i > 0 and self._t(i - 1) >= t: i -= 1
+        while i < self.count and self._t(i) < t: i += 1
+        return i
+
+    def view(self, t_from, t_to):
+        """memoryview over the raw records with t_from <= t <= t_to (no copy). Call with the writer held off."""
+        count = self.count
+        lo = self.find(t_from)
+        hi = self.find(math.nextafter(t_to, math.inf))
+        hi = min(hi, count)
+        return memoryview(self.mm)[self._off(lo):self._off(max(lo, hi))]
+
+    def flush(self):
+        if self.writable: self.mm.flush()
+
+    def compact(self):
+        """Drop the unused preallocated tail (the day is finished)."""
+        if self.writable:
+            self.mm.flush()
+            os.ftruncate(self.fd, self._off(self.count))
+
+    @staticmethod
+    def _unmap(mm):
+        # A reader still holding a view keeps the map alive; it is unmapped when that view goes away
+        try: mm.close()
+        except BufferError: pass
+
+    def close(self):
+        self.index = None
+        self._unmap(self.mm)
+        try: os.close(self.fd)
+        except OSError: pass
+
+
+class MetricStore:
+    def __init__(self, data_dir, sample_interval=1.0, retention_days=30, max_bytes=512 << 20, flush_interval=30.0):
+        self.data_dir = data_dir
+        self.capacity = int(86400 / max(sample_interval, 0.01) * 1.1) + 16
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.current = None
+        self.flushed_at = time.monotonic()
+        self.dropped = 0        # samples older than the last record (backward clock step)
+        self.lock = threading.Lock()
+        os.makedirs(data_dir, exist_ok=True)
+        self.enforce_retention()
+
+    def _path(self, start):
+        return os.path.join(self.data_dir, "metrics-" + datetime.fromtimestamp(start, timezone.utc).strftime("%Y%m%d") + ".dat")
+
+    def _files(self):
+        """[(day start, path)] of the stored days, oldest first."""
+        out = []
+        for name in os.listdir(self.data_dir):
+            if not (name.startswith("metrics-") and name.endswith(".dat")): continue
+            try: d = datetime.strptime(name[8:16], "%Y%m%d").replace(tzinfo=timezone.utc)
+            except ValueError: continue
+            out.append((d.timestamp(), os.path.join(self.data_dir, name)))
+        return sorted(out)
+
+    def _open_day(self, start):
+        path = self._path(start)
+        try: return DayFile(path, start, writable=True, capacity=self.capacity)
+        except ValueError:
+            # Not ours / corrupt header: keep it aside and start the day again
+            os.rename(path, path + ".bad")
+            return DayFile(path, start, writable=True, capacity=self.capacity)
+
+    def append(self, t, values, running=True):
+        with self.lock:
+            start = day_start(t)
+            if self.current is None or self.current.start != start:
+                if self.current is not None and start < self.current.start: self.dropped += 1; return
+                old, self.current = self.current, self._open_day(start)
+                if old is not None:
+                    old.compact(); old.close()
+                    self.enforce_retention()
+            if t <= self.current.last_t: self.dropped += 1; return
+            self.current.append(pack_record(t, values, running), t)
+            if time.monotonic() - self.flushed_at > self.flush_interval:
+                self.current.flush(); self.flushed_at = time.monotonic()
+
+    def enforce_retention(self):
+        files = self._files()
+        today = self.current.start if self.current else day_start(time.time())
+        keep = []
+        for start, path in files:
+            if start < today - (self.retention_days - 1) * 86400: self._unlink(path)
+            else: keep.append((start, path))
+        total = sum(os.path.getsize(p) for _, p in keep)
+        while total > self.max_bytes and len(keep) > 1 and keep[0][0] < today:
+            _, path = keep.pop(0)
+            total -= os.path.getsize(path)
+            self._unlink(path)
+
+    def _unlink(self, path):
+        try: os.unlink(path)
+        except OSError: traceback.print_exc()
+
+    def scan(self, t_from, t_to):
+        """memoryview chunks (one per day) of the raw records in [t_from, t_to], oldest first."""
+        for start, path in self._files():
+            if start + 86400 <= t_from or start > t_to: continue
+            with self.lock:
+                # The index lookup and the view are taken under the lock: append() may grow (remap) or close the day
+                chunk = self.current.view(t_from, t_to) if self.current is not None and self.current.start == start else None
+            if chunk is not None:
+                if len(chunk): yield chunk
+                continue
+            try: day = DayFile(path, start)
+            except (OSError, ValueError): continue
+            chunk = day.view(t_from, t_to)
+            try:
+                if len(chunk): yield chunk
+            finally:
+                # Past days are opened per query: unmap once the caller is done with the chunk
+                try: chunk.release()
+                except BufferError: pass
+                day.close()
+
+    def records(self, t_from, t_to):
+        for chunk in self.scan(t_from, t_to):
+            yield from RECORD.iter_unpack(chunk)
+
+    def series(self, name, t_from, t_to):
+        """(timestamps, values) arrays of one metric, skipping samples where it was not available."""
+        i = FIELD_INDEX[name]
+        ts = array("d"); vals = array("d")
+        for rec in self.records(t_from, t_to):
+            v = rec[i]
+            if v == v: ts.append(rec[0]); vals.append(v)
+        return ts, vals
+
+    def csv(self, t_from, t_to, port_names=None):
+        """Streaming CSV of every stored sample in the range, CSV_CHUNK lines per yielded string."""
+        port_names = port_names or {}
+        yield "time,timestamp,offset_ns,path_delay_ns,freq_ppb,servo_freq_ppb,phc_offset_ns,port_state,gm_identity,ptp4l_running\n"
+        lines = []
+        for t, off, delay, freq, sfreq, phc, gm, port, flags, _ in self.records(t_from, t_to):
+            iso = datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            cols = ["" if v != v else f"{v:g}" for v in (off, delay, freq, sfreq, phc)]
+            lines.append(f"{iso},{t:.3f},{','.join(cols)},{port_names.get(port, port)},{gm_text(gm)},{flags & FLAG_RUNNING}\n")
+            if len(lines) >= CSV_CHUNK:
+                yield "".join(lines); lines = []
+        if lines: yield "".join(lines)
+
+    @property
+    def nbytes(self):
+        return sum(os.path.getsize(p) for _, p in self._files())
+
+    def close(self):
+        with self.lock:
+            if self.current is not None:
+                self.current.flush(); self.current.close()
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/metrics.py"
+"""
+Minimal Prometheus text-format metrics (no client library dependency).
+
+Hot-path cost is one dict lookup per labelled child plus a short lock:
+Counter.inc is an add, Histogram.observe is a bisect over the bucket bounds
+and an add. Values that already live in the telemetry snapshot are not
+copied into metrics at all; they are rendered by collector callbacks at
+scrape time, so a scrape never triggers new sampling work.
+"""
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names: return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def format_value(v):
+    if v is None: return "NaN"
+    if isinstance(v, bool): return "1" if v else "0"
+    if isinstance(v, float) and math.isinf(v): return "+Inf" if v > 0 else "-Inf"
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(format_labels(self.labelnames, values), values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock: self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _new_child = staticmethod(_Value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, labels, values, child):
+        return [f"{self.name}{labels} {format_value(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # per bucket, last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, labels, values, child):
+        with child.lock:
+            counts = list(child.counts); total = child.sum
+        names = self.labelnames + ("le",)
+        lines = []
+        acc = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            acc += n
+            lines.append(f"{self.name}_bucket{format_labels(names, values + (format_value(float(bound)),))} {acc}")
+        lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {acc}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        """
+        fn() -> iterable of (name, kind, help, labelnames, [(label_values, value), ...]),
+        evaluated at scrape time (used to expose snapshot values without copying them).
+        """
+        self.collectors.append(fn)
+
+    def render(self):
+        lines = []
+        for fn in self.collectors:
+            for name, kind, help, labelnames, samples in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for values, value in samples:
+                    lines.append(f"{name}{format_labels(labelnames, values)} {format_value(value)}")
+        for metric in self.metrics: lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/monitor.py"
+"""
+Event-driven supervisor for the client radar captures.
+
+One thread multiplexes every capture socket plus a wake-up socketpair in a
+selector (epoll on Linux). Config changes wake it immediately, captures are
+opened/closed on the spot, and client expiry is scheduled from the oldest
+entry of the LRU-ordered ClientTable, so an idle monitor sleeps in the
+kernel instead of polling.
+"""
+import selectors
+import socket
+import threading
+import time
+import traceback
+
+RETRY_DELAY = 5.0
+
+
+class MonitorSupervisor:
+    def __init__(self, clients, open_capture, resolve_ip, ttl):
+        self.clients = clients
+        self.open_capture = open_capture    # iface -> capture object (fileno/read/close)
+        self.resolve_ip = resolve_ip        # iface -> local IPv4 (for is_self), looked up per batch
+        self.ttl = ttl
+        self.observers = []     # extra fn(msgs, iface, local ip, now) fed with every batch (foreign master table)
+        self.mode = "disabled"
+        self.interfaces = []
+        self.captures = {}      # iface -> capture
+        self.retry_at = {}      # iface -> monotonic time of next open attempt
+        self._lock = threading.Lock()
+        self._sel = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = None
+
+    @property
+    def config(self):
+        return { "mode": self.mode, "interfaces": list(self.interfaces) }
+
+    def configure(self, mode, interfaces):
+        with self._lock:
+            self.mode = mode
+            self.interfaces = [i for i in interfaces if i]
+        self._wake()
+
+    def _wake(self):
+        try: self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError): pass
+
+    def capture_stats(self):
+        """{iface: (frames, decoded, kernel packets, kernel drops)} of the open captures."""
+        out = {}
+        for iface, cap in list(self.captures.items()):
+            packets, drops = cap.stats()
+            out[iface] = (cap.frames, cap.decoded, packets, drops)
+        return out
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="monitor-supervisor", daemon=True)
+            self._thread.start()
+        return self
+
+    # --- capture lifecycle ---
+    def _targets(self):
+        with self._lock:
+            return set() if self.mode == "disabled" else set(self.interfaces)
+
+    def _reconcile(self):
+        targets = self._targets()
+        for iface in list(self.captures):
+            if iface not in targets: self._close(iface)
+        for iface in list(self.retry_at):
+            if iface not in targets: del self.retry_at[iface]
+        now = time.monotonic()
+        for iface in targets:
+            if iface in self.captures or self.retry_at.get(iface, 0) > now: continue
+            try:
+                cap = self.open_capture(iface)
+                self._sel.register(cap, selectors.EVENT_READ, iface)
+            except Exception:
+                self.retry_at[iface] = now + RETRY_DELAY
+                continue
+            self.retry_at.pop(iface, None)
+            self.captures[iface] = cap
+
+    def _close(self, iface):
+        cap = self.captures.pop(iface, None)
+        if cap is None: return
+        try: self._sel.unregister(cap)
+        except Exception: pass
+        try: cap.close()
+        except Exception: pass
+
+    def _fail(self, iface):
+        self._close(iface)
+        self.retry_at[iface] = time.monotonic() + RETRY_DELAY
+
+    # --- main loop ---
+    def _timeout(self):
+        deadlines = []
+        nxt = self.clients.next_expiry(self.ttl)
+        if nxt is not None: deadlines.append(nxt - time.time())
+        if self.retry_at: deadlines.append(min(self.retry_at.values()) - time.monotonic())
+        if not deadlines: return None      # nothing scheduled: block until traffic or a config change
+        return max(0.0, min(deadlines))
+
+    def _run(self):
+        while True:
+            try:
+                self._reconcile()
+                for key, _ in self._sel.select(self._timeout()):
+                    if key.data is None:
+                        try:
+                            while self._wake_r.recv(4096): pass
+                        except (BlockingIOError, InterruptedError): pass
+                        continue
+                    iface = key.data
+                    cap = self.captures.get(iface)
+                    if cap is None: continue
+                    try:
+                        msgs = cap.read()
+                    except Exception:
+                        self._fail(iface)
+                        continue
+                    if msgs:
+                        now = time.time(); my_ip = self.resolve_ip(iface)
+                        self.clients.observe(msgs, iface, my_ip, now)
+                        for fn in self.observers: fn(msgs, iface, my_ip, now)
+                self.clients.expire(self.ttl, time.time())
+            except Exception:
+                traceback.print_exc()
+                time.sleep(1)
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/phc.py"
+"""
+Direct PTP hardware clock (PHC) access.
+
+Interface -> /dev/ptpN is resolved once through sysfs
+(/sys/class/net/<if>/device/ptp/ptpN) or, for drivers without that link, the
+ETHTOOL_GET_TS_INFO ioctl, and cached until the interface's ifindex changes
+(link events, or a periodic check without them) or a read fails. Time is read with clock_gettime() on the dynamic posix clock
+of the open /dev/ptpN fd, and PHC - system offset with the PTP_SYS_OFFSET
+ioctls (best of several samples), so a read is a syscall instead of
+`ethtool -T` + `phc_ctl get`.
+
+The clock backend is injectable (PhcManager(open_clock=...)) so callers can be
+exercised without PTP hardware.
+"""
+import ctypes
+import fcntl
+import os
+import socket
+import struct
+import threading
+import time
+
+SYSFS_NET = "/sys/class/net"
+SIOCETHTOOL = 0x8946
+ETHTOOL_GET_TS_INFO = 0x41
+PTP_MAX_SAMPLES = 25
+CLOCKFD = 3
+REVALIDATE_INTERVAL = 30.0   # seconds between ifindex checks of a cached mapping
+
+
+def _IOW(nr, size):
+    return (1 << 30) | (size << 16) | (ord('=') << 8) | nr
+
+
+def _IOWR(nr, size):
+    return (3 << 30) | (size << 16) | (ord('=') << 8) | nr
+
+
+# struct ptp_sys_offset: n_samples, rsv[3], ptp_clock_time ts[2 * PTP_MAX_SAMPLES + 1]
+PTP_SYS_OFFSET = _IOW(5, 16 + 16 * (2 * PTP_MAX_SAMPLES + 1))
+# struct ptp_sys_offset_extended: n_samples, rsv[3], ptp_clock_time ts[PTP_MAX_SAMPLES][3]
+PTP_SYS_OFFSET_EXTENDED = _IOWR(9, 16 + 16 * 3 * PTP_MAX_SAMPLES)
+
+
+def fd_to_clockid(fd):
+    # FD_TO_CLOCKID() from the kernel's posix-clock ABI
+    return ((~fd) << 3) | CLOCKFD
+
+
+def read_ifindex(iface):
+    try:
+        with open(os.path.join(SYSFS_NET, iface, "ifindex")) as f: return int(f.read())
+    except (OSError, ValueError): return None
+
+
+def phc_index_sysfs(iface):
+    try: entries = os.listdir(os.path.join(SYSFS_NET, iface, "device", "ptp"))
+    except OSError: return None
+    for e in sorted(entries):
+        if e.startswith("ptp") and e[3:].isdigit(): return int(e[3:])
+    return None
+
+
+def phc_index_ethtool(iface):
+    # struct ethtool_ts_info: cmd, so_timestamping, phc_index, tx_types, tx_reserved[3], rx_filters, rx_reserved[3]
+    info = ctypes.create_string_buffer(struct.pack("IIi8I", ETHTOOL_GET_TS_INFO, 0, -1, *([0] * 8)))
+    ifreq = struct.pack("16sP", iface.encode()[:15], ctypes.addressof(info))
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try: fcntl.ioctl(s, SIOCETHTOOL, ifreq)
+        except OSError: return None
+    index = struct.unpack_from("i", info.raw, 8)[0]
+    return index if index >= 0 else None
+
+
+def resolve_phc_index(iface):
+    index = phc_index_sysfs(iface)
+    return index if index is not None else phc_index_ethtool(iface)
+
+
+class PosixPhc:
+    """One open /dev/ptpN."""
+    def __init__(self, index):
+        self.index = index
+        self.path = f"/dev/ptp{index}"
+        try: self.fd = os.open(self.path, os.O_RDWR)
+        except PermissionError: self.fd = os.open(self.path, os.O_RDONLY)
+        self.clockid = fd_to_clockid(self.fd)
+
+    def gettime_ns(self):
+        return time.clock_gettime_ns(self.clockid)
+
+    def sys_offset(self, samples=5):
+        """(PHC - CLOCK_REALTIME in ns, read delay in ns) of the tightest of `samples` readings."""
+        samples = max(1, min(samples, PTP_MAX_SAMPLES))
+        try:
+            buf = bytearray(struct.pack("I", samples) + bytes(12 + 16 * 3 * PTP_MAX_SAMPLES))
+            fcntl.ioctl(self.fd, PTP_SYS_OFFSET_EXTENDED, buf)
+            triples = [[self._ts(buf, 16 + 48 * i + 16 * k) for k in range(3)] for i in range(samples)]
+        except OSError:
+            # Older kernels / drivers: sys, phc, sys, phc, ..., sys
+            buf = bytearray(struct.pack("I", samples) + bytes(12 + 16 * (2 * PTP_MAX_SAMPLES + 1)))
+            fcntl.ioctl(self.fd, PTP_SYS_OFFSET, buf)
+            ts = [self._ts(buf, 16 + 16 * j) for j in range(2 * samples + 1)]
+            triples = [(ts[2 * i], ts[2 * i + 1], ts[2 * i + 2]) for i in range(samples)]
+        before, phc, after = min(triples, key=lambda t: t[2] - t[0])
+        return phc - (before + after) // 2, after - before
+
+    @staticmethod
+    def _ts(buf, off):
+        sec, nsec = struct.unpack_from("qI", buf, off)
+        return sec * 1000000000 + nsec
+
+    def close(self):
+        try: os.close(self.fd)
+        except OSError: pass
+
+
+class PhcManager:
+    """Cached iface -> open PHC, revalidated against the interface ifindex."""
+    def __init__(self, open_clock=PosixPhc, resolve=resolve_phc_index, ifindex=read_ifindex):
+        self.open_clock = open_clock
+        self.resolve = resolve
+        self.ifindex = ifindex
+        self.clocks = {}    # iface -> [clock, ifindex, checked_at]
+        self.revalidate = REVALIDATE_INTERVAL   # None when link events call invalidate() instead
+        self.lock = threading.Lock()
+
+    def _clock(self, iface):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.clocks.get(iface)
+            if entry is not None and self.revalidate and now - entry[2] > self.revalidate:
+                # Driver reload / interface re-creation changes the ifindex
+                if self.ifindex(iface) != entry[1]: self._drop(iface)
+                else: entry[2] = now
+                entry = self.clocks.get(iface)
+            if entry is None:
+                index = self.resolve(iface)
+                if index is None: return None
+                entry = self.clocks[iface] = [self.open_clock(index), self.ifindex(iface), now]
+            return entry[0]
+
+    def _drop(self, iface):
+        entry = self.clocks.pop(iface, None)
+        if entry is not None: entry[0].close()
+
+    def invalidate(self, iface=None):
+        with self.lock:
+            for name in ([iface] if iface else list(self.clocks)): self._drop(name)
+
+    def phc_index(self, iface):
+        try: clock = self._clock(iface)
+        except OSError: return None
+        return clock.index if clock is not None else None
+
+    def gettime_ns(self, iface):
+        return self._call(iface, lambda c: c.gettime_ns())
+
+    def sys_offset(self, iface, samples=5):
+        return self._call(iface, lambda c: c.sys_offset(samples))
+
+    def _call(self, iface, fn):
+        # A failing read means the device went away: drop the mapping and retry once
+        for attempt in (0, 1):
+            try:
+                clock = self._clock(iface)
+                if clock is None: return None
+                return fn(clock)
+            except OSError:
+                self.invalidate(iface)
+        return None
+
+    def close(self):
+        self.invalidate()
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/pmc_client.py"
+"""
+Native PTP management client for ptp4l's UNIX domain socket.
+
+Speaks the same IEEE 1588 management protocol as `pmc -u`, but in-process:
+one persistent datagram socket, all GET requests of a batch are sent
+back-to-back and the responses are decoded into namedtuples. SET is
+supported for the datasets in ENCODERS.
+"""
+import os
+import socket
+import struct
+import threading
+import time
+import itertools
+from collections import namedtuple
+
+PTP4L_UDS = "/var/run/ptp4l"
+
+# --- Protocol constants ---
+MSG_MANAGEMENT = 0x0D
+CTL_MANAGEMENT = 0x04
+TLV_MANAGEMENT = 0x0001
+TLV_MANAGEMENT_ERROR_STATUS = 0x0002
+
+ACTION_GET, ACTION_SET, ACTION_RESPONSE, ACTION_COMMAND, ACTION_ACKNOWLEDGE = range(5)
+
+HEADER = struct.Struct(">BBHBBHqI8sHHBB")   # 34 bytes, common PTP header
+MGMT = struct.Struct(">8sHBBBB")            # 14 bytes, targetPortIdentity .. actionField
+TLV = struct.Struct(">HHH")                 # tlvType, lengthField, managementId
+MGMT_OFFSET = HEADER.size
+TLV_OFFSET = HEADER.size + MGMT.size
+
+WILDCARD_CLOCK = b"\xff" * 8
+WILDCARD_PORT = 0xFFFF
+
+# managementId values (IEEE 1588-2008 table 40 + linuxptp _NP extensions)
+MANAGEMENT_IDS = {
+    "DEFAULT_DATA_SET": 0x2000,
+    "CURRENT_DATA_SET": 0x2001,
+    "PARENT_DATA_SET": 0x2002,
+    "TIME_PROPERTIES_DATA_SET": 0x2003,
+    "PORT_DATA_SET": 0x2004,
+    "PRIORITY1": 0x2005,
+    "PRIORITY2": 0x2006,
+    "DOMAIN": 0x2007,
+    "TIME_STATUS_NP": 0xC000,
+    "GRANDMASTER_SETTINGS_NP": 0xC001,
+    "PORT_DATA_SET_NP": 0xC002,
+}
+MANAGEMENT_NAMES = {v: k for k, v in MANAGEMENT_IDS.items()}
+
+# Datasets answered once per port (the rest are answered once per clock)
+PORT_SCOPED = {"PORT_DATA_SET", "PORT_DATA_SET_NP"}
+
+PORT_STATES = {
+    1: "INITIALIZING", 2: "FAULTY", 3: "DISABLED", 4: "LISTENING", 5: "PRE_MASTER",
+    6: "MASTER", 7: "PASSIVE", 8: "UNCALIBRATED", 9: "SLAVE", 10: "GRAND_MASTER",
+}
+
+MANAGEMENT_ERRORS = {
+    0x0001: "RESPONSE_TOO_BIG", 0x0002: "NO_SUCH_ID", 0x0003: "WRONG_LENGTH",
+    0x0004: "WRONG_VALUE", 0x0005: "NOT_SETABLE", 0x0006: "NOT_SUPPORTED",
+    0xFFFE: "GENERAL_ERROR",
+}
+
+# --- Typed datasets ---
+DefaultDataSet = namedtuple("DefaultDataSet", [
+    "two_step", "slave_only", "number_ports", "priority1", "clock_class", "clock_accuracy",
+    "offset_scaled_log_variance", "priority2", "clock_identity", "domain_number"])
+CurrentDataSet = namedtuple("CurrentDataSet", ["steps_removed", "offset_from_master", "mean_path_delay"])
+ParentDataSet = namedtuple("ParentDataSet", [
+    "parent_port_identity", "parent_stats", "observed_parent_offset_scaled_log_variance",
+    "observed_parent_clock_phase_change_rate", "gm_priority1", "gm_clock_class", "gm_clock_accuracy",
+    "gm_offset_scaled_log_variance", "gm_priority2", "gm_identity"])
+TimePropertiesDataSet = namedtuple("TimePropertiesDataSet", [
+    "current_utc_offset", "leap61", "leap59", "current_utc_offset_valid", "ptp_timescale",
+    "time_traceable", "frequency_traceable", "time_source"])
+PortDataSet = namedtuple("PortDataSet", [
+    "port_identity", "port_state", "log_min_delay_req_interval", "peer_mean_path_delay",
+    "log_announce_interval", "announce_receipt_timeout", "log_sync_interval", "delay_mechanism",
+    "log_min_pdelay_req_interval", "version_number"])
+TimeStatusNP = namedtuple("TimeStatusNP", [
+    "master_offset", "ingress_time", "cumulative_scaled_rate_offset", "scaled_last_gm_phase_change",
+    "gm_time_base_indicator", "last_gm_phase_change", "gm_present", "gm_identity"])
+GrandmasterSettingsNP = namedtuple("GrandmasterSettingsNP", [
+    "clock_class", "clock_accuracy", "offset_scaled_log_variance", "current_utc_offset", "leap61",
+    "leap59", "current_utc_offset_valid", "ptp_timescale", "time_traceable", "frequency_traceable",
+    "time_source"])
+PortDataSetNP = namedtuple("PortDataSetNP", ["neighbor_prop_delay_thresh", "as_capable"])
+Priority = namedtuple("Priority", ["value"])
+Domain = namedtuple("Domain", ["value"])
+
+# One decoded reply. `data` is a dataset namedtuple, or None when `error` is set.
+Response = namedtuple("Response", ["port_identity", "name", "action", "data", "error"])
+
+
+class PmcError(Exception):
+    pass
+
+
+class PmcUnavailable(PmcError):
+    """The ptp4l socket could not be reached at all (not running / wrong path)."""
+
+
+class PmcTimeout(PmcError):
+    pass
+
+
+# --- Field helpers ---
+def format_clock_identity(raw):
+    h = raw.hex()
+    return f"{h[0:6]}.{h[6:10]}.{h[10:16]}"
+
+
+def format_port_identity(raw_clock, port):
+    return f"{format_clock_identity(raw_clock)}-{port}"
+
+
+def scaled_ns(value):
+    # TimeInterval is nanoseconds multiplied by 2^16
+    return value / 65536.0
+
+
+TIME_FLAG_BITS = (("leap61", 0x01), ("leap59", 0x02), ("current_utc_offset_valid", 0x04),
+                  ("ptp_timescale", 0x08), ("time_traceable", 0x10), ("frequency_traceable", 0x20))
+
+
+def _time_flags(flags):
+    return [1 if flags & bit else 0 for _, bit in TIME_FLAG_BITS]
+
+
+# --- Decoders (data field -> namedtuple) ---
+def _dec_default(buf):
+    flags, _, nports, p1, cclass, cacc, var, p2, cid, domain, _ = struct.unpack_from(">BBHBBBHB8sBB", buf)
+    return DefaultDataSet(flags & 1, (flags >> 1) & 1, nports, p1, cclass, cacc, var, p2,
+                          format_clock_identity(cid), domain)
+
+
+def _dec_current(buf):
+    steps, offset, delay = struct.unpack_from(">Hqq", buf)
+    return CurrentDataSet(steps, scaled_ns(offset), scaled_ns(delay))
+
+
+def _dec_parent(buf):
+    (pcid, pport, stats, _, ovar, rate, gp1, gclass, gacc, gvar, gp2,
+     gmid) = struct.unpack_from(">8sHBBHiBBBHB8s", buf)
+    return ParentDataSet(format_port_identity(pcid, pport), stats, ovar, rate, gp1, gclass, gacc, gvar,
+                         gp2, format_clock_identity(gmid))
+
+
+def _dec_time_properties(buf):
+    utc, flags, source = struct.unpack_from(">hBB", buf)
+    return TimePropertiesDataSet(utc, *_time_flags(flags), source)
+
+
+def _dec_port(buf):
+    (cid, port, state, min_dreq, peer_delay, ann, ann_to, sync, mech, min_pdreq,
+     ver) = struct.unpack_from(">8sHBbqbBbBbB", buf)
+    return PortDataSet(format_port_identity(cid, port), PORT_STATES.get(state, str(state)), min_dreq,
+                       scaled_ns(peer_delay), ann, ann_to, sync, mech, min_pdreq, ver & 0x0f)
+
+
+def _dec_time_status(buf):
+    (offset, ingress, csro, slgpc, gtbi, nsmsb, nslsb, fracns, present,
+     gmid) = struct.unpack_from(">qqiiHHQHi8s", buf)
+    last_change = ((nsmsb << 64) | nslsb) + fracns / 65536.0
+    return TimeStatusNP(offset, ingress, csro, slgpc, gtbi, last_change, present, format_clock_identity(gmid))
+
+
+def _dec_gm_settings(buf):
+    cclass, cacc, var, utc, flags, source = struct.unpack_from(">BBHhBB", buf)
+    return GrandmasterSettingsNP(cclass, cacc, var, utc, *_time_flags(flags), source)
+
+
+def _dec_port_np(buf):
+    return PortDataSetNP(*struct.unpack_from(">Ii", buf))
+
+
+DECODERS = {
+    "DEFAULT_DATA_SET": _dec_default,
+    "CURRENT_DATA_SET": _dec_current,
+    "PARENT_DATA_SET": _dec_parent,
+    "TIME_PROPERTIES_DATA_SET": _dec_time_properties,
+    "PORT_DATA_SET": _dec_port,
+    "PRIORITY1": lambda b: Priority(b[0]),
+    "PRIORITY2": lambda b: Priority(b[0]),
+    "DOMAIN": lambda b: Domain(b[0]),
+    "TIME_STATUS_NP": _dec_time_status,
+    "GRANDMASTER_SETTINGS_NP": _dec_gm_settings,
+    "PORT_DATA_SET_NP": _dec_port_np,
+}
+
+
+# --- Encoders (namedtuple / value -> data field, for SET) ---
+def _time_flag_byte(ds):
+    return sum(bit for field, bit in TIME_FLAG_BITS if getattr(ds, field))
+
+
+def _enc_gm_settings(ds):
+    return struct.pack(">BBHhBB", ds.clock_class, ds.clock_accuracy, ds.offset_scaled_log_variance,
+                       ds.current_utc_offset, _time_flag_byte(ds), ds.time_source)
+
+
+ENCODERS = {
+    "GRANDMASTER_SETTINGS_NP": _enc_gm_settings,
+    "PRIORITY1": lambda v: bytes([getattr(v, "value", v) & 0xFF, 0]),
+    "PRIORITY2": lambda v: bytes([getattr(v, "value", v) & 0xFF, 0]),
+    "DOMAIN": lambda v: bytes([getattr(v, "value", v) & 0xFF, 0]),
+}
+
+
+# --- Message framing ---
+def pack_management(seq, mid, action=ACTION_GET, data=b"", domain=0, boundary_hops=0,
+                    source_port=0, target_clock=WILDCARD_CLOCK, target_port=WILDCARD_PORT):
+    if len(data) % 2: data += b"\x00"
+    length = TLV_OFFSET + TLV.size + len(data)
+    return b"".join((
+        HEADER.pack(MSG_MANAGEMENT, 2, length, domain, 0, 0, 0, 0, b"\x00" * 8, source_port & 0xFFFF,
+                    seq, CTL_MANAGEMENT, 0x7F),
+        MGMT.pack(target_clock, target_port, boundary_hops, boundary_hops, action & 0x0F, 0),
+        TLV.pack(TLV_MANAGEMENT, 2 + len(data), mid),
+        data,
+    ))
+
+
+def unpack_management(buf):
+    """Decode one management message. Returns (sequenceId, Response) or None if not a management reply."""
+    if len(buf) < TLV_OFFSET + TLV.size or (buf[0] & 0x0F) != MSG_MANAGEMENT:
+        return None
+    hdr = HEADER.unpack_from(buf)
+    src_clock, src_port, seq = hdr[8], hdr[9], hdr[10]
+    action = buf[MGMT_OFFSET + 12] & 0x0F
+    tlv_type, tlv_len, mid = TLV.unpack_from(buf, TLV_OFFSET)
+    port_identity = format_port_identity(src_clock, src_port)
+    data_start = TLV_OFFSET + TLV.size
+    if tlv_type == TLV_MANAGEMENT_ERROR_STATUS:
+        # managementErrorId comes first, the managementId follows it
+        err_id = mid
+        mid = struct.unpack_from(">H", buf, data_start)[0] if len(buf) >= data_start + 2 else 0
+        name = MANAGEMENT_NAMES.get(mid, hex(mid))
+        return seq, Response(port_identity, name, action, None, MANAGEMENT_ERRORS.get(err_id, hex(err_id)))
+    if tlv_type != TLV_MANAGEMENT:
+        return None
+    name = MANAGEMENT_NAMES.get(mid, hex(mid))
+    payload = buf[data_start:data_start + tlv_len - 2]
+    decoder = DECODERS.get(name)
+    if decoder is None:
+        return seq, Response(port_identity, name, action, bytes(payload), None)
+    try:
+        return seq, Response(port_identity, name, action, decoder(payload), None)
+    except struct.error:
+        return seq, Response(port_identity, name, action, None, "WRONG_LENGTH")
+
+
+class PmcClient:
+    """
+    Persistent management client for one ptp4l instance.
+
+    `uds_path` is ptp4l's `uds_address`; the client binds its own socket next
+    to it (like pmc's /var/run/pmc.<pid>) so replies can be addressed back.
+    Safe to share between threads: requests are serialized on a lock.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, uds_path=PTP4L_UDS, domain=0, boundary_hops=0, timeout=0.5, client_path=None):
+        self.uds_path = uds_path
+        self.domain = domain
+        self.boundary_hops = boundary_hops
+        self.timeout = timeout
+        self.client_path = client_path or os.path.join(
+            os.path.dirname(uds_path) or ".", f"ptp-web.{os.getpid()}.{next(self._ids)}")
+        self.number_ports = None
+        self._sock = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    # --- socket lifecycle ---
+    def _open(self):
+        if self._sock is not None: return self._sock
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            try: os.unlink(self.client_path)
+            except FileNotFoundError: pass
+            sock.bind(self.client_path)
+            sock.connect(self.uds_path)
+        except OSError as e:
+            sock.close()
+            self._unlink()
+            raise PmcUnavailable(f"{self.uds_path}: {e}") from e
+        self._sock = sock
+        return sock
+
+    def _unlink(self):
+        try: os.unlink(self.client_path)
+        except OSError: pass
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+            self._unlink()
+
+    def _next_seq(self):
+        self._seq = (self._seq + 1) & 0xFFFF
+        return self._seq
+
+    def _drain(self, sock):
+        # Drop late replies left over from an earlier timed-out batch
+        sock.setblocking(False)
+        try:
+            while True: sock.recv(4096)
+        except (BlockingIOError, InterruptedError): pass
+        except OSError: pass
+
+    # --- requests ---
+    def request(self, requests, timeout=None):
+        """
+        Send a batch of (name, action, data) management requests back-to-back and
+        collect every reply. Returns a list of Response in arrival order.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            pending = {}   # seq -> [name, expected replies, received]
+            frames = []
+            for name, action, data in requests:
+                seq = self._next_seq()
+                pending[seq] = [name, None if name in PORT_SCOPED else 1, 0]
+                frames.append(pack_management(seq, MANAGEMENT_IDS[name], action, data, self.domain,
+                                              self.boundary_hops, source_port=os.getpid()))
+            sock = self._send_all(frames)
+
+            replies = []
+            deadline = time.monotonic() + timeout
+            while not self._complete(pending):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Port count may have changed (ptp4l restarted with another config)
+                    self.number_ports = None
+                    if replies: break
+                    raise PmcTimeout(f"no response from {self.uds_path} within {timeout}s")
+                sock.settimeout(remaining)
+                try:
+                    buf = sock.recv(4096)
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    self._reset()
+                    raise PmcUnavailable(f"{self.uds_path}: {e}") from e
+                decoded = unpack_management(buf)
+                if decoded is None: continue
+                seq, resp = decoded
+                entry = pending.get(seq)
+                if entry is None or resp.action not in (ACTION_RESPONSE, ACTION_ACKNOWLEDGE): continue
+                entry[2] += 1
+                if resp.name == "DEFAULT_DATA_SET" and resp.data is not None:
+                    self.number_ports = resp.data.number_ports
+                replies.append(resp)
+            return replies
+
+    def _send_all(self, frames):
+        # A persistent socket goes stale when ptp4l restarts; reconnect once before giving up
+        for attempt in (0, 1):
+            reused = self._sock is not None
+            sock = self._open()
+            self._drain(sock)
+            try:
+                for frame in frames: sock.send(frame)
+                return sock
+            except OSError as e:
+                self._reset()
+                if attempt or not reused:
+                    raise PmcUnavailable(f"{self.uds_path}: {e}") from e
+
+    def _complete(self, pending):
+        for name, expected, received in pending.values():
+            if expected is None:
+                # Port-scoped: one reply per port, once we know how many ports there are
+                expected = self.number_ports
+                if expected is None: return False
+            if received < expected: return False
+        return True
+
+    def _reset(self):
+        self.number_ports = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._unlink()
+
+    def query(self, *names, timeout=None):
+        """Batched GET. Port-scoped datasets implicitly fetch DEFAULT_DATA_SET first to learn the port count."""
+        names = list(names)
+        if self.number_ports is None and any(n in PORT_SCOPED for n in names) and "DEFAULT_DATA_SET" not in names:
+            names.insert(0, "DEFAULT_DATA_SET")
+        return self.request([(n, ACTION_GET, b"") for n in names], timeout)
+
+    def set(self, name, value, timeout=None):
+        """SET one dataset (see ENCODERS). Returns the value ptp4l reports back, raises PmcError if refused."""
+        replies = self.request([(name, ACTION_SET, ENCODERS[name](value))], timeout)
+        for resp in replies:
+            if resp.error: raise PmcError(f"SET {name}: {resp.error}")
+            return resp.data
+        raise PmcTimeout(f"no response to SET {name}")
+
+    def get(self, *names, timeout=None):
+        """
+        Batched GET returning {name: dataset}. Port-scoped datasets map to a list
+        (one entry per port); datasets that errored or did not answer are absent.
+        """
+        result = {}
+        for resp in self.query(*names, timeout=timeout):
+            if resp.error or resp.data is None: continue
+            if resp.name in PORT_SCOPED:
+                result.setdefault(resp.name, []).append(resp.data)
+            else:
+                result.setdefault(resp.name, resp.data)
+        return result
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/pmc_text.py"
+"""
+Parser for the text output of the `pmc` binary (`pmc -u -b 0 'GET ...'`).
+
+Used when ptp4l's socket cannot be used in-process. The output is walked
+once, line by line: every "<portIdentity> seq N RESPONSE MANAGEMENT <ID>"
+line opens a block, and each indented "key value" line below it is converted
+straight into its slot of that block's record through a precomputed key
+index. Blocks become the same namedtuples as the native client decodes, so
+callers do not care which path produced a dataset, and a key never matches
+outside its own block (clockIdentity of DEFAULT_DATA_SET vs
+grandmasterIdentity, priority1 vs grandmasterPriority1).
+"""
+from pmc_client import (
+    ACTION_ACKNOWLEDGE, ACTION_RESPONSE, PORT_SCOPED, Response,
+    DefaultDataSet, CurrentDataSet, ParentDataSet, TimePropertiesDataSet, PortDataSet, TimeStatusNP,
+    GrandmasterSettingsNP, PortDataSetNP, Priority, Domain,
+)
+
+ACTIONS = {"RESPONSE": ACTION_RESPONSE, "ACKNOWLEDGE": ACTION_ACKNOWLEDGE}
+
+
+def _int(v):
+    return int(v, 0)
+
+
+def _float(v):
+    return float(v)
+
+
+def _bool(v):
+    return 1 if v in ("true", "1") else 0
+
+
+def _rate(v):
+    # pmc prints cumulativeScaledRateOffset as a ratio; the native decoder keeps the raw 2^41-scaled value
+    return int(round(float(v) * 2**41))
+
+
+def _str(v):
+    return v
+
+
+def _phase(v):
+    # "0x0000'0000000000000000.0000": nanoseconds msb'lsb.fractional, all hex
+    ns, _, frac = v.partition(".")
+    return int(ns.replace("'", ""), 16) + int(frac or "0", 16) / 65536.0
+
+
+# dataset -> (namedtuple, [(pmc keys, converter)] in namedtuple field order)
+FIELDS = {
+    "DEFAULT_DATA_SET": (DefaultDataSet, [
+        (("twoStepFlag",), _int), (("slaveOnly",), _int), (("numberPorts",), _int), (("priority1",), _int),
+        (("clockClass",), _int), (("clockAccuracy",), _int), (("offsetScaledLogVariance",), _int),
+        (("priority2",), _int), (("clockIdentity",), _str), (("domainNumber",), _int)]),
+    "CURRENT_DATA_SET": (CurrentDataSet, [
+        (("stepsRemoved",), _int), (("offsetFromMaster",), _float), (("meanPathDelay",), _float)]),
+    # linuxptp prints "gm.ClockClass", some older builds "grandmasterClockQuality.clockClass"
+    "PARENT_DATA_SET": (ParentDataSet, [
+        (("parentPortIdentity",), _str), (("parentStats",), _int),
+        (("observedParentOffsetScaledLogVariance",), _int), (("observedParentClockPhaseChangeRate",), _int),
+        (("grandmasterPriority1",), _int),
+        (("gm.ClockClass", "grandmasterClockQuality.clockClass"), _int),
+        (("gm.ClockAccuracy", "grandmasterClockQuality.clockAccuracy"), _int),
+        (("gm.OffsetScaledLogVariance", "grandmasterClockQuality.offsetScaledLogVariance"), _int),
+        (("grandmasterPriority2",), _int), (("grandmasterIdentity",), _str)]),
+    "TIME_PROPERTIES_DATA_SET": (TimePropertiesDataSet, [
+        (("currentUtcOffset",), _int), (("leap61",), _int), (("leap59",), _int),
+        (("currentUtcOffsetValid",), _int), (("ptpTimescale",), _int), (("timeTraceable",), _int),
+        (("frequencyTraceable",), _int), (("timeSource",), _int)]),
+    "PORT_DATA_SET": (PortDataSet, [
+        (("portIdentity",), _str), (("portState",), _str), (("logMinDelayReqInterval",), _int),
+        (("peerMeanPathDelay",), _float), (("logAnnounceInterval",), _int), (("announceReceiptTimeout",), _int),
+        (("logSyncInterval",), _int), (("delayMechanism",), _int), (("logMinPdelayReqInterval",), _int),
+        (("versionNumber",), _int)]),
+    "TIME_STATUS_NP": (TimeStatusNP, [
+        (("master_offset",), _int), (("ingress_time",), _int), (("cumulativeScaledRateOffset",), _rate),
+        (("scaledLastGmPhaseChange",), _int), (("gmTimeBaseIndicator",), _int), (("lastGmPhaseChange",), _phase),
+        (("gmPresent",), _bool), (("gmIdentity",), _str)]),
+    "GRANDMASTER_SETTINGS_NP": (GrandmasterSettingsNP, [
+        (("clockClass",), _int), (("clockAccuracy",), _int), (("offsetScaledLogVariance",), _int),
+        (("currentUtcOffset",), _int), (("leap61",), _int), (("leap59",), _int), (("currentUtcOffsetValid",), _int),
+        (("ptpTimescale",), _int), (("timeTraceable",), _int), (("frequencyTraceable",), _int),
+        (("timeSource",), _int)]),
+    "PORT_DATA_SET_NP": (PortDataSetNP, [(("neighborPropDelayThresh",), _int), (("asCapable",), _int)]),
+    "PRIORITY1": (Priority, [(("priority1",), _int)]),
+    "PRIORITY2": (Priority, [(("priority2",), _int)]),
+    "DOMAIN": (Domain, [(("domainNumber",), _int)]),
+}
+
+
+# dataset -> (namedtuple, {pmc key: (field index, converter)})
+INDEX = {name: (cls, {key: (i, conv) for i, (aliases, conv) in enumerate(keys) for key in aliases})
+         for name, (cls, keys) in FIELDS.items()}
+
+
+def parse_responses(text):
+    """All response blocks in pmc output, in order, as pmc_client.Response tuples."""
+    out = []
+    head = None        # [port identity, name, action, error, namedtuple class, key index, values]
+    for line in text.splitlines():
+        if line.startswith("\t\t"):
+            if head is None: continue
+            kv = line.split(None, 1)
+            if len(kv) < 2: continue
+            if head[3] is not None:
+                # Error blocks carry one "ERROR: <text>" line
+                if kv[0] == "ERROR:": head[3] = kv[1].rstrip()
+                continue
+            spec = head[5].get(kv[0])
+            if spec is None: continue
+            try: head[6][spec[0]] = spec[1](kv[1].rstrip())
+            except ValueError: pass
+            continue
+        if head is not None and not line.startswith("\t"):
+            # "sending: GET ..." or anything else at column 0 ends the block
+            out.append(_close(head)); head = None
+            continue
+        parts = line.split()
+        # "<portIdentity> seq <n> <RESPONSE|ACKNOWLEDGE> <MANAGEMENT|MANAGEMENT_ERROR_STATUS> <ID>"
+        if len(parts) >= 6 and parts[1] == "seq" and parts[3] in ACTIONS:
+            if head is not None: out.append(_close(head))
+            cls, index = INDEX.get(parts[5], (None, {}))
+            head = [parts[0], parts[5], ACTIONS[parts[3]], None if parts[4] == "MANAGEMENT" else parts[4],
+                    cls, index, [None] * len(cls._fields) if cls else None]
+    if head is not None: out.append(_close(head))
+    return out
+
+
+def _close(head):
+    port_identity, name, action, error, cls, _, values = head
+    if error is not None or cls is None: return Response(port_identity, name, action, None, error or "UNKNOWN_ID")
+    return Response(port_identity, name, action, cls(*values), None)
+
+
+def parse_datasets(text):
+    """{name: dataset} like PmcClient.get(); port-scoped datasets map to one entry per port."""
+    result = {}
+    for resp in parse_responses(text):
+        if resp.error or resp.data is None: continue
+        if resp.name in PORT_SCOPED:
+            result.setdefault(resp.name, []).append(resp.data)
+        else:
+            result.setdefault(resp.name, resp.data)
+    return result
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/servo_stats.py"
+"""
+Incremental servo statistics from the sampled offset / frequency stream.
+
+Every ptp4l instance gets one ServoAnalyzer fed once per sampling cycle with
+the offsetFromMaster / rate offset already read from ptp4l. All statistics
+are running sums, so a new sample costs O(1) and no history is re-scanned:
+
+  - rolling RMS / mean / peak-to-peak over the last `window` samples
+    (running sums plus monotonic min / max deques),
+  - Allan deviation and TDEV for tau = 1, 2, 4 ... 1024 sampling intervals
+    (running sums of the phase second differences, one ring of phases),
+  - lock tracking: acquisition starts on the first SLAVE sample, after a
+    servo reset, a clock step or a grandmaster change, and time-to-lock is
+    the time until LOCK_SAMPLES consecutive offsets fall inside limit_ns,
+  - step events (offset jump > limit_ns while locked, or ptp4l's servo
+    entering s1) and holdover (the port leaving SLAVE after a lock).
+
+limit_ns defaults to the SMPTE ST 2059-2 slave accuracy of +/-1 us.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+TAU_FACTORS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+TRACKED_PORTS = ("SLAVE", "UNCALIBRATED")
+LOCK_SAMPLES = 5        # consecutive in-limit samples before the servo counts as locked
+GAP_FACTOR = 2.5        # a sample gap above GAP_FACTOR * tau0 restarts the deviation sums
+MAX_EVENTS = 20
+
+
+class RollingWindow:
+    """Mean / RMS / min / max of the last `size` values."""
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.seq = 0
+        self.lo = deque()   # (seq, value), values increasing
+        self.hi = deque()   # (seq, value), values decreasing
+
+    def add(self, v):
+        self.values.append(v)
+        self.total += v; self.total_sq += v * v
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            self.total -= old; self.total_sq -= old * old
+        self.seq += 1
+        # Re-sum once per window so add/subtract rounding never accumulates
+        if self.seq % self.size == 0:
+            self.total = math.fsum(self.values); self.total_sq = math.fsum(x * x for x in self.values)
+        while self.lo and self.lo[-1][1] >= v: self.lo.pop()
+        while self.hi and self.hi[-1][1] <= v: self.hi.pop()
+        self.lo.append((self.seq, v)); self.hi.append((self.seq, v))
+        first = self.seq - len(self.values)
+        if self.lo[0][0] <= first: self.lo.popleft()
+        if self.hi[0][0] <= first: self.hi.popleft()
+
+    def stats(self):
+        n = len(self.values)
+        if not n: return { "count": 0, "mean": None, "rms": None, "p2p": None, "min": None, "max": None }
+        lo, hi = self.lo[0][1], self.hi[0][1]
+        return { "count": n, "mean": round(self.total / n, 1), "rms": round(math.sqrt(max(self.total_sq, 0.0) / n), 1),
+                 "p2p": hi - lo, "min": lo, "max": hi }
+
+
+class StabilityAccumulator:
+    """
+    Overlapping Allan deviation and TDEV of a phase series (ns) sampled every tau0 s.
+    AVAR(tau) = sum(d^2) / (2 N tau^2) and TVAR(tau) = sum(S^2) / (6 m^2 N'), with
+    d = x[i] - 2 x[i-m] + x[i-2m] and S the sum of the last m second differences.
+    """
+    def __init__(self, tau0, factors=TAU_FACTORS):
+        self.tau0 = tau0
+        self.factors = factors
+        self.size = 2 * factors[-1] + 1
+        self.x = [0.0] * self.size
+        self.d = [[0.0] * m for m in factors]    # last m second differences per tau
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        k = len(self.factors)
+        self.avar_sum = [0.0] * k; self.avar_n = [0] * k
+        self.d_sum = [0.0] * k
+        self.tvar_sum = [0.0] * k; self.tvar_n = [0] * k
+        for ring in self.d: ring[:] = [0.0] * len(ring)
+
+    def add(self, x):
+        pos = self.n % self.size
+        self.x[pos] = x
+        self.n += 1
+        for k, m in enumerate(self.factors):
+            if self.n <= 2 * m: break
+            d = x - 2 * self.x[(pos - m) % self.size] + self.x[(pos - 2 * m) % self.size]
+            self.avar_sum[k] += d * d
+            slot = self.avar_n[k] % m
+            self.avar_n[k] += 1
+            ring = self.d[k]
+            self.d_sum[k] += d - ring[slot]; ring[slot] = d
+            if slot == m - 1: self.d_sum[k] = math.fsum(ring)   # amortized O(1) re-sum
+            if self.avar_n[k] >= m:
+                self.tvar_sum[k] += self.d_sum[k] ** 2; self.tvar_n[k] += 1
+
+    def results(self):
+        out = []
+        for k, m in enumerate(self.factors):
+            tau = m * self.tau0
+            n, tn = self.avar_n[k], self.tvar_n[k]
+            out.append({ "tau": tau, "n": n,
+                         "adev": float(f"{math.sqrt(self.avar_sum[k] / (2 * n)) * 1e-9 / tau:.4g}") if n else None,
+                         "tdev": round(math.sqrt(self.tvar_sum[k] / (6 * m * m * tn)), 2) if tn else None })
+        return out
+
+
+class ServoAnalyzer:
+    def __init__(self, tau0=1.0, window=60, limit_ns=1000):
+        self.tau0 = tau0
+        self.limit_ns = limit_ns
+        self.offsets = RollingWindow(window)
+        self.freqs = RollingWindow(window)
+        self.stability = StabilityAccumulator(tau0)
+        self.lock = threading.Lock()
+        self.state = "idle"         # idle -> acquiring -> locked -> holdover -> acquiring ...
+        self.port = None
+        self.gm = None
+        self.samples = 0
+        self.last_t = None
+        self.last_offset = None
+        self.in_limit = 0           # consecutive samples inside limit_ns
+        self.out_limit = 0
+        self.acquiring_since = None
+        self.locked_since = None
+        self.holdover_since = None
+        self.time_to_lock = None
+        self.servo_state = None     # last ptp4l servo state from the journal (0 unlocked, 1 jump, 2 locked)
+        self.counts = { "locks": 0, "steps": 0, "resets": 0, "gm_changes": 0, "holdovers": 0 }
+        self.events = deque(maxlen=MAX_EVENTS)
+
+    def _event(self, t, name, detail=None):
+        self.events.append({ "t": t, "event": name, "detail": detail })
+
+    def _acquire(self, t):
+        self.state = "acquiring"
+        self.acquiring_since = t
+        self.locked_since = None
+        self.in_limit = self.out_limit = 0
+        self.stability.reset()
+
+    def add(self, t, offset, freq, port, gm=None):
+        with self.lock:
+            self.port = port
+            if port not in TRACKED_PORTS:
+                if self.state == "locked":
+                    self.state = "holdover"; self.holdover_since = t
+                    self.counts["holdovers"] += 1; self._event(t, "holdover", port)
+                elif self.state == "acquiring":
+                    self.state = "idle"
+                self.last_t = None
+                return
+            if self.state == "holdover":
+                self._event(t, "holdover_end", round(t - self.holdover_since, 1)); self.holdover_since = None
+                self._acquire(t)
+            elif self.state == "idle":
+                self._acquire(t)
+            if gm and self.gm and gm != self.gm:
+                self.counts["gm_changes"] += 1; self._event(t, "gm_change", gm)
+                self._acquire(t)
+            if gm: self.gm = gm
+            if self.state == "locked" and abs(offset - self.last_offset) > self.limit_ns:
+                self.counts["steps"] += 1; self._event(t, "step", round(offset - self.last_offset, 1))
+                self._acquire(t)
+            elif self.last_t is not None and t - self.last_t > GAP_FACTOR * self.tau0:
+                self.stability.reset()
+            self.samples += 1
+            self.offsets.add(offset)
+            if freq is not None: self.freqs.add(freq)
+            if abs(offset) <= self.limit_ns: self.in_limit += 1; self.out_limit = 0
+            else: self.out_limit += 1; self.in_limit = 0
+            if self.state == "acquiring" and self.in_limit >= LOCK_SAMPLES:
+                self.state = "locked"; self.locked_since = t
+                self.time_to_lock = round(t - self.acquiring_since, 1)
+                self.counts["locks"] += 1; self._event(t, "lock", self.time_to_lock)
+            elif self.state == "locked" and self.out_limit >= LOCK_SAMPLES:
+                self._event(t, "unlock", offset)
+                self._acquire(t)
+            if self.state == "locked": self.stability.add(offset)
+            self.last_t = t; self.last_offset = offset
+
+    def servo_event(self, t, state):
+        """ptp4l servo state from its log lines: entering s0 is a servo reset, s1 a clock step."""
+        with self.lock:
+            prev, self.servo_state = self.servo_state, state
+            if prev is None or prev == state: return
+            if state == 0:
+                self.counts["resets"] += 1; self._event(t, "reset", prev)
+                if self.state in ("acquiring", "locked"): self._acquire(t)
+            elif state == 1 and self.state == "locked":
+                # A step the offset samples already caught has moved the state to acquiring
+                self.counts["steps"] += 1; self._event(t, "step", "s1")
+                self._acquire(t)
+
+    def snapshot(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            window = self.offsets.stats()
+            max_abs = max(abs(window["min"]), abs(window["max"])) if window["count"] else None
+            return { "state": self.state, "port": self.port, "gm": self.gm, "samples": self.samples,
+                     "window": { "seconds": round(self.offsets.size * self.tau0, 1), **window, "max_abs": max_abs },
+                     "freq": self.freqs.stats(),
+                     "stability": self.stability.results(),
+                     "time_to_lock": self.time_to_lock,
+                     "locked_for": round(now - self.locked_since, 1) if self.locked_since else None,
+                     "acquiring_for": round(now - self.acquiring_since, 1) if self.state == "acquiring" else None,
+                     "holdover_for": round(now - self.holdover_since, 1) if self.holdover_since else None,
+                     "servo_state": self.servo_state, **self.counts,
+                     "limit_ns": self.limit_ns,
+                     "within_limit": self.state == "locked" and max_abs is not None and max_abs <= self.limit_ns,
+                     "events": list(self.events) }
+
+
+class ServoStats:
+    """One ServoAnalyzer per ptp4l instance name."""
+    def __init__(self, tau0=1.0, window=60, limit_ns=1000):
+        self.tau0 = tau0; self.window = window; self.limit_ns = limit_ns
+        self.analyzers = {}
+        self.lock = threading.Lock()
+
+    def get(self, name, create=False):
+        a = self.analyzers.get(name)
+        if a is None and create:
+            with self.lock:
+                a = self.analyzers.setdefault(name, ServoAnalyzer(self.tau0, self.window, self.limit_ns))
+        return a
+
+    def add(self, name, t, offset, freq, port, gm=None):
+        self.get(name, create=True).add(t, offset, freq, port, gm)
+
+    def servo_event(self, name, t, state):
+        self.get(name, create=True).servo_event(t, state)
+
+    def retain(self, names):
+        with self.lock:
+            for name in [n for n in self.analyzers if n not in names]: del self.analyzers[name]
+
+    def snapshot(self, name):
+        a = self.get(name)
+        return a.snapshot() if a else None
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/sketch.py"
+"""
+Mergeable quantile sketches for per-client timing measurements.
+
+LogSketch is a DDSketch-style histogram over logarithmic buckets: a value v
+lands in bucket ceil(log(v) / log(gamma)), so every quantile it returns is
+within ALPHA relative error of the true one. Memory is bounded by
+MAX_BUCKETS (the lowest buckets are collapsed first, which only coarsens
+the low percentiles), and two sketches merge by adding bucket counts, so
+per-client sketches can be combined per master or per domain.
+
+WindowedSketch keeps the last completed `window` seconds next to the one
+being filled. Summaries are computed once per completed window, so the
+radar export does not re-sort thousands of sketches every sampling cycle.
+"""
+import math
+
+ALPHA = 0.02            # relative accuracy of the quantiles
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+LOG_GAMMA = math.log(GAMMA)
+MAX_BUCKETS = 1024       # covers 1 ns .. 1e9 s before any collapsing
+MIN_VALUE = 1e-9        # values at or below this (s) count as zero
+
+
+class LogSketch:
+    __slots__ = ("buckets", "count", "zeros", "min", "max", "sum")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.zeros = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+
+    def add(self, v):
+        self.count += 1
+        self.sum += v
+        if v < self.min: self.min = v
+        if v > self.max: self.max = v
+        if v <= MIN_VALUE: self.zeros += 1; return
+        i = math.ceil(math.log(v) / LOG_GAMMA)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        if len(self.buckets) > MAX_BUCKETS: self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self.buckets)
+        while len(keys) > MAX_BUCKETS:
+            low = keys.pop(0)
+            self.buckets[keys[0]] += self.buckets.pop(low)
+
+    def merge(self, other):
+        for i, n in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + n
+        self.count += other.count; self.zeros += other.zeros; self.sum += other.sum
+        self.min = min(self.min, other.min); self.max = max(self.max, other.max)
+        if len(self.buckets) > MAX_BUCKETS: self._collapse()
+        return self
+
+    def quantiles(self, qs):
+        """Values at the given quantiles (0..1, ascending), None when empty."""
+        if not self.count: return [None] * len(qs)
+        out = []
+        keys = sorted(self.buckets)
+        seen = self.zeros
+        k = 0
+        for q in qs:
+            rank = q * (self.count - 1)
+            if rank < self.zeros: out.append(0.0); continue
+            while k < len(keys) and seen + self.buckets[keys[k]] <= rank:
+                seen += self.buckets[keys[k]]; k += 1
+            if k >= len(keys): out.append(self.max); continue
+            # Bucket midpoint, clamped to the exact extremes
+            v = 2 * GAMMA ** keys[k] / (GAMMA + 1)
+            out.append(min(max(v, self.min), self.max))
+        return out
+
+    def summary(self, scale=1.0, digits=1):
+        p50, p90, p99 = self.quantiles((0.5, 0.9, 0.99))
+        if p50 is None: return { "count": 0 }
+        r = lambda v: round(v * scale, digits)
+        return { "count": self.count, "p50": r(p50), "p90": r(p90), "p99": r(p99), "max": r(self.max),
+                 "mean": r(self.sum / self.count) }
+
+
+class WindowedSketch:
+    """LogSketch of the last completed `window` seconds (plus the one being filled)."""
+    __slots__ = ("window", "scale", "start", "current", "last", "_summary")
+
+    def __init__(self, window=30.0, scale=1.0):
+        self.window = window
+        self.scale = scale      # unit of the summary, e.g. 1e6 for microseconds
+        self.start = None
+        self.current = LogSketch()
+        self.last = None
+        self._summary = None
+
+    def add(self, v, now):
+        if self.start is None: self.start = now
+        elif now - self.start >= self.window:
+            # A gap longer than a window leaves nothing recent to report
+            self.last = self.current if now - self.start < 2 * self.window else None
+            self.current = LogSketch(); self.start = now
+            self._summary = None
+        self.current.add(v)
+
+    def completed(self, now):
+        """The last completed window, None if there is none or it is stale."""
+        if self.last is None or now - self.start >= 2 * self.window: return None
+        return self.last
+
+    def summary(self, now):
+        sk = self.completed(now)
+        if sk is None: return None
+        if self._summary is None: self._summary = sk.summary(self.scale)
+        return self._summary
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/stream.py"
+"""
+Server-push fan-out for the dashboard (Server-Sent Events).
+
+One producer (the telemetry sampler and the journal follower) publishes deltas;
+each event is serialized once and handed to every subscriber queue, so the
+cost of an extra open screen is one queue put per event.
+"""
+import json
+import queue
+import threading
+
+HEARTBEAT_INTERVAL = 15.0
+
+
+def sse_format(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Broadcaster:
+    def __init__(self, max_subscribers=32, queue_size=256):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        # Returns None when full; callers answer 503 and the browser falls back to polling
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers: return None
+            q = queue.Queue(self.queue_size)
+            self._subscribers.add(q)
+            return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event, data):
+        msg = sse_format(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(msg)
+            except queue.Full:
+                # A stalled client gets disconnected; EventSource reconnects and resyncs from a snapshot
+                self.unsubscribe(q)
+                self._close(q)
+
+    @staticmethod
+    def _close(q):
+        # Make room for the end marker: the queue is full, and events() must see None to return
+        while True:
+            try:
+                q.put_nowait(None)
+                return
+            except queue.Full:
+                try: q.get_nowait()
+                except queue.Empty: pass
+
+    def events(self, q, initial=()):
+        """Generator for a streaming response: initial messages, then live events and heartbeats."""
+        try:
+            for msg in initial: yield msg
+            while True:
+                try:
+                    msg = q.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if msg is None: return
+                yield msg
+        finally:
+            self.unsubscribe(q)
+
+
+# --- Delta helpers ---
+def diff_fields(old, new):
+    """Top-level keys of `new` whose values differ from `old`."""
+    if not old: return dict(new or {})
+    return {k: v for k, v in (new or {}).items() if old.get(k) != v}
+
+
+def diff_clients(old, new):
+    """Client list delta keyed by ip: added/changed entries and expired ips."""
+    old_map = {c["ip"]: c for c in old or []}
+    new_map = {c["ip"]: c for c in new or []}
+    upsert = [c for ip, c in new_map.items() if old_map.get(ip) != c]
+    expire = [ip for ip in old_map if ip not in new_map]
+    return upsert, expire
+
+EOF
+
+cat << 'EOF' > "$INSTALL_DIR/telemetry.py"
+"""
+Background telemetry sampler.
+
+A single thread runs every collector at a fixed rate and publishes the
+results as one immutable Snapshot. HTTP handlers only read the latest
+snapshot, so their cost does not depend on how many browsers are polling.
+"""
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+# `data` maps collector name -> value. Published snapshots are never mutated.
+Snapshot = namedtuple("Snapshot", ["seq", "time", "duration", "data"])
+
+
+class TelemetrySampler:
+    def __init__(self, collectors, interval=1.0, derived=None):
+        self.collectors = collectors    # ordered {name: callable}
+        # {name: fn(data)} computed from the fresh cycle, so several keys can share one collection pass
+        self.derived = derived or {}
+        self.interval = interval
+        self._snapshot = None
+        self._seq = 0
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="telemetry-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def snapshot(self, timeout=2.0):
+        # Only the very first request after startup can block, until the first cycle is published
+        if self._snapshot is None: self._ready.wait(timeout)
+        return self._snapshot
+
+    def get(self, name, default=None, timeout=2.0):
+        snap = self.snapshot(timeout)
+        if snap is None: return default
+        return snap.data.get(name, default)
+
+    def add_listener(self, fn):
+        # fn(previous_snapshot, snapshot) runs on the sampler thread after every publish
+        self._listeners.append(fn)
+
+    def refresh(self):
+        # Request an immediate out-of-schedule cycle (e.g. right after a config apply)
+        self._wake.set()
+
+    def sample_once(self):
+        start = time.monotonic()
+        prev = self._snapshot.data if self._snapshot else {}
+        data = {}
+        for name, fn in self.collectors.items():
+            try:
+                data[name] = fn()
+            except Exception:
+                # Keep serving the last good value rather than a hole in the snapshot
+                traceback.print_exc()
+                data[name] = prev.get(name)
+        for name, fn in self.derived.items():
+            try:
+                data[name] = fn(data)
+            except Exception:
+                traceback.print_exc()
+                data[name] = prev.get(name)
+        self._seq += 1
+        prev_snap = self._snapshot
+        self._snapshot = Snapshot(self._seq, time.time(), time.monotonic() - start, data)
+        self._ready.set()
+        for fn in self._listeners:
+            try: fn(prev_snap, self._snapshot)
+            except Exception: traceback.print_exc()
+        return self._snapshot
+
+    def _run(self):
+        next_due = time.monotonic()
+        while True:
+            self.sample_once()
+            # Fixed-rate schedule; a slow cycle skips missed slots instead of bursting
+            next_due += self.interval
+            now = time.monotonic()
+            if next_due < now: next_due = now + self.interval
+            if self._wake.wait(next_due - now):
+                self._wake.clear()
+                next_due = time.monotonic()
+EOF
+
+# --- 7. 前端 UI (保持 Client Monitor 功能) ---
+echo "[5/8] 写入前端UI..."
+
+cat << 'EOF' > "$INSTALL_DIR/templates/index.html"
+<!DOCTYPE html>
+<html lang="zh">
+
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>PTP Controller</title>
+    <title>PTP Controller</title>
+    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+    <style>
+        .status-box {
+            padding: 15px;
+            border-radius: 8px;
+            color: white;
+            height: 100%;
+            display: flex;
+            flex-direction: column;
+            justify-content: center;
+            transition: background-color 0.3s;
+        }
+
+        .bg-running {
+            background-color: #198754;
+        }
+
+        .bg-stopped {
+            background-color: #dc3545;
+        }
+
+        .bg-slave {
+            background-color: #0d6efd;
+        }
+
+        .bg-master {
+            background-color: #6610f2;
+        }
+
+        .bg-syncing {
+            background-color: #fd7e14;
+        }
+
+        .bg-passive {
+            background-color: #6c757d;
+        }
+
+        #logWindow {
+            background-color: #212529;
+            color: #0f0;
+            height: 350px;
+            overflow-y: auto;
+            padding: 10px;
+            font-family: monospace;
+            font-size: 0.8rem;
+        }
+
+        .metric-label {
+            font-size: 0.75rem;
+            text-transform: uppercase;
+            color: #6c757d;
+            font-weight: bold;
+        }
+
+        .metric-value {
+            font-size: 1.5rem;
+            font-weight: bold;
+        }
+
+        .chart-container {
+            position: relative;
+            height: 250px;
+            width: 100%;
+        }
+
+        .ptp-time-display {
+            background: rgba(0, 0, 0, 0.2);
+            padding: 5px;
+            border-radius: 4px;
+            margin-top: 10px;
+            font-family: monospace;
+            font-size: 0.9rem;
+            text-align: center;
+        }
+    </style>
+</head>
+
+<body class="bg-light">
+    <div class="container-fluid p-4">
+        <div class="d-flex justify-content-between align-items-center mb-3">
+            <h3 class="mb-0">⏱️ PTP4L Controller by Vega Sun <small class="text-muted fs-6">v4.0 Stable</small></h3>
+            <div class="d-flex gap-1 align-items-center"><span id="instanceBar" class="d-flex gap-1"></span><span
+                    class="badge bg-secondary">{{ hostname }}</span></div>
+        </div>
+
+        <div class="row g-3 mb-3">
+            <div class="col-md-4">
+                <div id="ptpCard" class="status-box bg-stopped shadow-sm">
+                    <div class="d-flex justify-content-between">
+                        <small>PTP4L State</small>
+                        <span id="phcBadge" class="badge bg-dark border border-secondary" style="opacity: 0.3">SYNC
+                            OFF</span>
+                    </div>
+                    <div id="ptpState" class="h3 mb-0">STOPPED</div>
+                    <small id="serviceStateDetail" class="opacity-75">Service Inactive</small>
+                    <div class="ptp-time-display"><small class="d-block text-white-50" style="font-size:0.7rem">PTP
+                            HARDWARE TIME</small><span id="ptpTimeVal">--</span></div>
+                </div>
+            </div>
+            <div class="col-md-4">
+                <div class="card h-100 p-3 shadow-sm">
+                    <div class="d-flex h-100 align-items-center">
+                        <div class="w-50 text-center border-end">
+                            <div class="metric-label">Offset</div>
+                            <div id="offsetVal" class="metric-value text-primary">--</div><small
+                                class="text-muted">ns</small>
+                        </div>
+                        <div class="w-50 text-center">
+                            <div class="metric-label">Path Delay</div>
+                            <div id="pathDelayVal" class="metric-value text-info">--</div><small
+                                class="text-muted">ns</small>
+                        </div>
+                    </div>
+                </div>
+            </div>
+            <div class="col-md-4">
+                <div class="card h-100 p-3 shadow-sm justify-content-center">
+                    <div class="d-flex justify-content-between align-items-center mb-2"><small
+                            class="text-muted fw-bold">Grandmaster ID</small><span id="stepsBadge"
+                            class="badge bg-secondary">Hops: --</span></div>
+                    <div id="gmId" class="h6 mb-0 text-break font-monospace text-center bg-light p-2 rounded">
+                        Scanning...</div>
+                </div>
+            </div>
+        </div>
+
+        <div class="row g-3 mb-3">
+            <!-- BMCA Visualizer -->
+            <div class="col-12">
+                <div class="card shadow-sm">
+                    <div class="card-header bg-white d-flex justify-content-between align-items-center"
+                        style="cursor: pointer;" data-bs-toggle="collapse" data-bs-target="#bmcaBody">
+                        <span class="fw-bold small text-muted">🕸️ BMCA Decision Analyzer</span>
+                        <span class="badge bg-light text-dark border" id="bmcaSummary">Loading...</span>
+                    </div>
+                    <div id="bmcaBody" class="collapse show">
+                        <div class="card-body">
+                            <div class="row">
+                                <div class="col-md-8">
+                                    <div class="table-responsive">
+                                        <table class="table table-sm table-bordered text-center align-middle"
+                                            style="font-size: 0.85rem;">
+                                            <thead class="table-light">
+                                                <tr>
+                                                    <th style="width:20%">Check</th>
+                                                    <th style="width:30%" class="text-primary">Local (Me)</th>
+                                                    <th style="width:10%">Vs</th>
+                                                    <th style="width:30%" class="text-danger">Current GM</th>
+                                                    <th style="width:10%">Result</th>
+                                                </tr>
+                                            </thead>
+                                            <tbody id="bmcaTable"></tbody>
+                                        </table>
+                                    </div>
+                                </div>
+                                <div class="col-md-4">
+                                    <div class="p-2 border rounded bg-light h-100">
+                                        <h6 class="small fw-bold text-muted mb-2">ST 2059-2 Flags</h6>
+                                        <div id="ptpFlags" class="d-flex flex-wrap gap-2"></div>
+                                    </div>
+                                </div>
+                            </div>
+                            <div class="mt-2">
+                                <h6 class="small fw-bold text-muted mb-1">Foreign Masters (Announce) <span class="badge bg-light text-dark border" id="foreignSummary">--</span></h6>
+                                <div class="table-responsive" style="max-height: 220px; overflow-y: auto;">
+                                    <table class="table table-sm table-bordered text-center align-middle mb-0" style="font-size: 0.8rem;">
+                                        <thead class="table-light sticky-top">
+                                            <tr><th>#</th><th>Iface / Dom</th><th>GM Identity</th><th>P1</th><th>Class</th><th>Acc</th><th>Var</th><th>P2</th><th>Steps</th><th>Source</th><th>Rate</th></tr>
+                                        </thead>
+                                        <tbody id="foreignTable"></tbody>
+                                    </table>
+                                </div>
+                            </div>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </div>
+
+        <div class="row g-3 mb-3">
+            <!-- Servo Statistics -->
+            <div class="col-12">
+                <div class="card shadow-sm">
+                    <div class="card-header bg-white d-flex justify-content-between align-items-center"
+                        style="cursor: pointer;" data-bs-toggle="collapse" data-bs-target="#servoBody">
+                        <span class="fw-bold small text-muted">🎯 Servo Statistics <span id="servoInstance"></span></span>
+                        <span><span class="badge bg-secondary" id="servoState">--</span>
+                            <span class="badge bg-light text-dark border" id="servoVerdict">ST 2059: --</span></span>
+                    </div>
+                    <div id="servoBody" class="collapse show">
+                        <div class="card-body">
+                            <div class="row">
+                                <div class="col-md-5">
+                                    <table class="table table-sm table-bordered align-middle mb-2" style="font-size: 0.85rem;">
+                                        <tbody id="servoTable"></tbody>
+                                    </table>
+                                </div>
+                                <div class="col-md-7">
+                                    <div class="table-responsive">
+                                        <table class="table table-sm table-bordered text-center align-middle mb-2"
+                                            style="font-size: 0.85rem;">
+                                            <thead class="table-light">
+                                                <tr><th>τ (s)</th><th>Samples</th><th>ADEV</th><th>TDEV (ns)</th></tr>
+                                            </thead>
+                                            <tbody id="servoDevTable"></tbody>
+                                        </table>
+                                    </div>
+                                    <div id="servoEvents" class="small text-muted font-monospace"></div>
+                                </div>
+                            </div>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </div>
+
+        <div class="row g-3 mb-3">
+            <div class="col-lg-8">
+                <div class="card shadow-sm h-100">
+                    <div class="card-header d-flex justify-content-between py-1 bg-white align-items-center">
+                        <span class="fw-bold small text-muted">📈 Offset Stability</span>
+                        <span class="badge bg-light text-dark border">RMS: <span id="rmsVal">--</span></span>
+                    </div>
+                    <div class="card-body p-2">
+                        <div class="chart-container"><canvas id="offsetChart"></canvas></div>
+                    </div>
+                </div>
+            </div>
+            <div class="col-lg-4">
+                <div class="card shadow-sm h-100">
+                    <div class="card-header fw-bold small text-muted d-flex justify-content-between align-items-center">
+                        <span>📡 PTP Client Radar</span>
+                        <span class="badge bg-primary" id="clientCount">0</span>
+                    </div>
+                    <div class="card-body p-0">
+                        <div style="height: 250px; overflow-y: auto;">
+                            <table class="table table-sm table-striped mb-0" style="font-size: 0.8rem;">
+                                <thead class="table-light sticky-top">
+                                    <tr>
+                                        <th>IP Address</th>
+                                        <th>MAC</th>
+                                        <th>Iface</th>
+                                        <th>Rate</th>
+                                        <th>Last Seen</th>
+                                    </tr>
+                                </thead>
+                                <tbody id="clientTableBody">
+                                    <tr>
+                                        <td colspan="5" class="text-center text-muted">Waiting for data...</td>
+                                    </tr>
+                                </tbody>
+                            </table>
+                        </div>
+                    </div>
+                </div>
+            </div>
+        </div>
+
+        <div class="row g-3">
+            <div class="col-lg-4">
+                <div class="card shadow-sm">
+                    <div class="card-header fw-bold">⚙️ Configuration</div>
+                    <div class="card-body">
+                        <form id="configForm">
+                            <div class="mb-3">
+                                <label class="form-label fw-bold small text-uppercase text-secondary">Instance</label>
+                                <input class="form-control form-control-sm" id="instanceName" list="instanceList"
+                                    value="default" placeholder="default">
+                                <datalist id="instanceList"></datalist>
+                            </div>
+                            <div class="row g-2 mb-3">
+                                <div class="col-8">
+                                    <label class="form-label fw-bold small text-uppercase text-secondary">Clock
+                                        Mode</label>
+                                    <select class="form-select" id="clockMode" onchange="toggleMode()">
+                                        <option value="OC" selected>Ordinary Clock (OC)</option>
+                                        <option value="BC">Boundary Clock (BC)</option>
+                                    </select>
+                                </div>
+                                <div class="col-4">
+                                    <label
+                                        class="form-label fw-bold small text-uppercase text-secondary">Monitor</label>
+                                    <select class="form-select" id="monitorMode">
+                                        <option value="disabled">OFF</option>
+                                        <option value="periodic" selected>Scan</option>
+                                        <option value="realtime">Real-Time</option>
+                                    </select>
+                                </div>
+                            </div>
+
+                            <div id="ocPanel" class="mb-3">
+                                <label class="small text-muted">Network Interface</label>
+                                <select class="form-select" id="interface">
+                                    <option value="" disabled selected>-- Select --</option>{% for nic in nics %}<option
+                                        value="{{ nic }}">{{ nic }}</option>{% endfor %}
+                                </select>
+                            </div>
+                            <div id="bcPanel" class="mb-3 border p-2 rounded bg-white" style="display:none;">
+                                <label class="small fw-bold text-primary mb-2 d-block">Boundary Clock Topology</label>
+                                <div class="mb-2"><label class="small text-muted">⬇️ Upstream (Slave)</label><select
+                                        class="form-select form-select-sm" id="bcSlaveIf">
+                                        <option value="" disabled selected>-- Select --</option>{% for nic in nics %}
+                                        <option value="{{ nic }}">{{ nic }}</option>{% endfor %}
+                                    </select></div>
+                                <div class="mb-2"><label class="small text-muted">⬆️ Downstream (Master)</label><select
+                                        class="form-select form-select-sm" id="bcMasterIf">
+                                        <option value="" disabled selected>-- Select --</option>{% for nic in nics %}
+                                        <option value="{{ nic }}">{{ nic }}</option>{% endfor %}
+                                    </select></div>
+                            </div>
+
+                            <div class="row g-2 mb-3 bg-light p-2 rounded border mx-0">
+                                <div class="col-6">
+                                    <label class="small fw-bold text-muted">Clock Sync</label>
+                                    <select class="form-select form-select-sm" id="syncMode">
+                                        <option value="none">Disabled</option>
+                                        <option value="slave" selected>Slave (PHC➔SYS)</option>
+                                        <option value="master">Master (SYS➔PHC)</option>
+                                    </select>
+                                </div>
+                                <div class="col-6">
+                                    <label class="small fw-bold text-muted">Timestamping</label>
+                                    <select class="form-select form-select-sm" id="timeStamping">
+                                        <option value="hardware">Hardware</option>
+                                        <option value="software">Software</option>
+                                    </select>
+                                </div>
+                            </div>
+
+                            <hr>
+                            <div class="mb-2">
+                                <label class="small text-muted">Profile Manager</label>
+                                <div class="input-group input-group-sm">
+                                    <select class="form-select" id="profileSelect"
+                                        onchange="onUserSelectProfile()"></select>
+                                    <button type="button" class="btn btn-outline-success" onclick="saveProfile()"
+                                        title="Save">💾</button>
+                                    <button type="button" class="btn btn-outline-warning" id="btnRename"
+                                        onclick="renameProfile()" disabled title="Rename">✏️</button>
+                                    <button type="button" class="btn btn-outline-danger" id="btnDelete"
+                                        onclick="deleteProfile()" disabled title="Delete">🗑️</button>
+                                </div>
+                            </div>
+
+                            <div class="row g-2 mb-2">
+                                <div class="col-4"><label class="small text-muted">Domain</label><input type="number"
+                                        class="form-control form-control-sm" id="domain"></div>
+                                <div class="col-4"><label class="small text-muted">Prio 1</label><input type="number"
+                                        class="form-control form-control-sm" id="priority1"></div>
+                                <div class="col-4"><label class="small text-muted">Prio 2</label><input type="number"
+                                        class="form-control form-control-sm" id="priority2"></div>
+                            </div>
+                            <div class="row g-2 mb-2">
+                                <div class="col-6"><label class="small text-muted">Sync Int</label><input type="number"
+                                        class="form-control form-control-sm" id="logSyncInterval"></div>
+                                <div class="col-6"><label class="small text-muted">Announce Int</label><input
+                                        type="number" class="form-control form-control-sm" id="logAnnounceInterval">
+                                </div>
+                            </div>
+                            <div class="row g-2 mb-3">
+                                <div class="col-6"><label class="small text-muted">Delay Req</label><input type="number"
+                                        class="form-control form-control-sm" id="logMinDelayReqInterval"></div>
+                                <div class="col-6"><label class="small text-muted">Receipt T/O</label><input
+                                        type="number" class="form-control form-control-sm" id="announceReceiptTimeout">
+                                </div>
+                            </div>
+
+                            <div class="row g-2 mb-3">
+                                <div class="col-12">
+                                    <label class="small text-muted">Log Verbosity</label>
+                                    <select class="form-select form-select-sm" id="logLevel">
+                                        <option value="3">Error Only (3)</option>
+                                        <option value="4">Warning (4)</option>
+                                        <option value="5">Notice (5)</option>
+                                        <option value="6" selected>Info (6) - Default</option>
+                                        <option value="7">Debug (7) - High Load</option>
+                                    </select>
+                                </div>
+                            </div>
+
+                            <div class="d-grid gap-2"><button type="button" onclick="applyConfig()"
+                                    class="btn btn-primary btn-sm fw-bold">Apply & Restart</button><button type="button"
+                                    onclick="stopService()" class="btn btn-danger btn-sm">Stop</button></div>
+                            <div id="applyProgress" class="small mt-1 text-muted"></div>
+                        </form>
+                    </div>
+                </div>
+            </div>
+            <div class="col-lg-8">
+                <div class="card shadow-sm h-100">
+                    <div class="card-header d-flex justify-content-between py-2"><span class="fw-bold small">PTP4L
+                            Logs</span><span class="badge bg-secondary" id="logTime">--:--:--</span></div>
+                    <div class="card-body p-0">
+                        <div id="logWindow">Connecting...</div>
+                    </div>
+                </div>
+            </div>
+        </div>
     </div>
-</div>
-<script>
-    let profiles={}; 
-    const FIELDS=['timeStamping','domain','priority1','priority2','logSyncInterval','logAnnounceInterval','logMinDelayReqInterval','announceReceiptTimeout', 'syncMode', 'logLevel'];
-    const EXT_FIELDS=['profileSelect','clockMode','interface','bcSlaveIf','bcMasterIf', 'monitorMode']; 
-    let offsetChart = null;
-    let isUserInteractingLogs = false;
-
-    function init(){ initChart(); fetchProfiles(); setInterval(updateStatus, 1000); setInterval(updateLogs, 2500); setInterval(updateClients, 3000); setInterval(updateBmca, 2000); }
-
-    function updateBmca() {
-         fetch('/api/bmca').then(r=>r.json()).then(d => {
-             // 1. Update Decision Table
-             const tbody = document.getElementById('bmcaTable');
-             let html = "";
-             
-             if (d.decision.length === 0) {
-                 html = '<tr><td colspan="5" class="text-center text-muted">Waiting for PMC data...</td></tr>';
-                 document.getElementById('bmcaSummary').innerText = "Analyzing...";
-                 document.getElementById('bmcaSummary').className = "badge bg-secondary text-white";
-             } else {
-                 d.decision.forEach(step => {
+    <script>
+        let profiles = {};
+        const FIELDS = ['timeStamping', 'domain', 'priority1', 'priority2', 'logSyncInterval', 'logAnnounceInterval', 'logMinDelayReqInterval', 'announceReceiptTimeout', 'syncMode', 'logLevel'];
+        const EXT_FIELDS = ['instanceName', 'profileSelect', 'clockMode', 'interface', 'bcSlaveIf', 'bcMasterIf', 'monitorMode'];
+        let offsetChart = null;
+        let isUserInteractingLogs = false;
+        const LOG_MAX_LINES = 200;
+        let logLines = [], logCursor = null;
+        let liveStatus = {}, liveBmca = {}, liveClients = {}, liveInstances = {}, liveServo = {};
+        let pollers = [], stream = null;
+
+        function init() { initChart(); loadChartHistory(); fetchProfiles(); startStream(); document.getElementById('instanceName').addEventListener('input', showServo); }
+
+        // 页面打开时从服务器历史补齐最近 60 秒曲线 (Backfill the last 60 s of the chart from server-side history)
+        function loadChartHistory() {
+            const now = Date.now() / 1000;
+            fetch(`/api/history?metric=offset&from=${now - 60}&to=${now}&points=60`).then(r => r.json()).then(d => {
+                (d.series.offset || []).forEach(b => updateChartData(Math.round(b[3])));
+            }).catch(() => { });
+        }
+
+        // 轮询仅作为后备：浏览器不支持 SSE 或连接断开时使用 (Polling is only the fallback when the stream is unavailable)
+        function startPolling() {
+            if (pollers.length) return;
+            pollers = [setInterval(updateStatus, 1000), setInterval(updateLogs, 2500), setInterval(updateClients, 3000), setInterval(updateBmca, 2000), setInterval(updateInstances, 5000), setInterval(updateServo, 2000), setInterval(updateForeign, 3000)];
+        }
+        function stopPolling() { pollers.forEach(clearInterval); pollers = []; }
+
+        function startStream() {
+            if (!window.EventSource) { startPolling(); return; }
+            stream = new EventSource('/api/stream');
+            stream.addEventListener('snapshot', e => {
+                stopPolling();
+                const d = JSON.parse(e.data);
+                liveStatus = d.status || {}; renderStatus(liveStatus);
+                liveBmca = d.bmca || {}; if (liveBmca.decision) renderBmca(liveBmca);
+                liveClients = {}; (d.clients || []).forEach(c => liveClients[c.ip] = c); renderClients(Object.values(liveClients));
+                liveInstances = d.instances || {}; renderInstances(liveInstances);
+                liveServo = d.servo || {}; showServo();
+                if (d.foreign) renderForeign(d.foreign);
+                logCursor = d.log_cursor || null; renderLogs(d.logs || [], true);
+            });
+            stream.addEventListener('status', e => { Object.assign(liveStatus, JSON.parse(e.data)); renderStatus(liveStatus); });
+            stream.addEventListener('bmca', e => { Object.assign(liveBmca, JSON.parse(e.data)); if (liveBmca.decision) renderBmca(liveBmca); });
+            stream.addEventListener('clients', e => {
+                const d = JSON.parse(e.data);
+                d.upsert.forEach(c => liveClients[c.ip] = Object.assign(liveClients[c.ip] || {}, c)); d.expire.forEach(ip => delete liveClients[ip]);
+                renderClients(Object.values(liveClients));
+            });
+            // 速率/丢包/最后出现时间单独低频推送 (Rate, loss and last-seen arrive separately, at most every few seconds)
+            stream.addEventListener('client_counters', e => {
+                Object.entries(JSON.parse(e.data)).forEach(([ip, v]) => { if (liveClients[ip]) Object.assign(liveClients[ip], v); });
+                renderClients(Object.values(liveClients));
+            });
+            stream.addEventListener('instances', e => {
+                Object.entries(JSON.parse(e.data)).forEach(([k, v]) => { if (v) liveInstances[k] = v; else delete liveInstances[k]; });
+                renderInstances(liveInstances);
+            });
+            stream.addEventListener('servo', e => { liveServo = JSON.parse(e.data); showServo(); });
+            stream.addEventListener('foreign', e => renderForeign(JSON.parse(e.data)));
+            stream.addEventListener('logs', e => { const d = JSON.parse(e.data); logCursor = d.cursor; renderLogs(d.lines, false); });
+            stream.onerror = () => {
+                // EventSource reconnects by itself; keep the screen alive with polling meanwhile
+                startPolling();
+                if (stream.readyState === EventSource.CLOSED) setTimeout(startStream, 10000);
+            };
+        }
+
+        function updateInstances() {
+            fetch('/api/instances').then(r => r.json()).then(list => { liveInstances = {}; list.forEach(i => liveInstances[i.name] = i); renderInstances(liveInstances); }).catch(() => { });
+        }
+
+        // 每个 ptp4l 实例一个徽标 (One badge per ptp4l instance)
+        function renderInstances(map) {
+            const names = Object.keys(map);
+            document.getElementById('instanceList').innerHTML = names.map(n => `<option value="${n}">`).join('');
+            const bar = document.getElementById('instanceBar');
+            if (names.length < 2) { bar.innerHTML = ''; return; }
+            bar.innerHTML = names.map(n => {
+                const i = map[n];
+                const cls = i.ptp4l !== 'RUNNING' ? 'bg-secondary' : (i.port === 'SLAVE' || i.port === 'MASTER' ? 'bg-success' : 'bg-warning text-dark');
+                return `<span class="badge ${cls}" title="GM ${i.gm}">${n}: ${i.port} ${i.ptp4l === 'RUNNING' ? Math.round(i.offset) + 'ns' : ''}</span>`;
+            }).join('');
+        }
+
+        function updateBmca() { fetch('/api/bmca').then(r => r.json()).then(renderBmca).catch(() => { }); }
+
+        // 网络中所有发送 Announce 的端口，按 BMCA 排序 (Every announcing port on the network, in BMCA order; needs the client radar)
+        function updateForeign() { fetch('/api/foreign_masters').then(r => r.json()).then(renderForeign).catch(() => { }); }
+
+        function renderForeign(d) {
+            const sum = document.getElementById('foreignSummary');
+            const competing = d.groups.filter(g => g.competing);
+            sum.innerText = d.total ? `${d.total} ports` + (competing.length ? ` · ${competing.length} domain(s) with competing GMs` : '') : 'none seen (enable radar)';
+            sum.className = 'badge ' + (competing.length ? 'bg-warning text-dark' : 'bg-light text-dark border');
+            const rows = [];
+            d.groups.forEach(g => g.masters.forEach(m => {
+                const cls = m.stale ? 'text-muted' : (m.selected ? 'table-success' : (m.gm_identity !== g.best || !g.selected_gm ? '' : 'table-warning'));
+                rows.push(`<tr class="${cls}"><td>${m.rank}</td><td>${m.iface} / ${m.domain}</td><td class="font-monospace">${m.gm_identity}${m.is_self ? ' (Self)' : ''}</td><td>${m.priority1}</td><td>${m.clock_class}</td><td>0x${m.clock_accuracy.toString(16)}</td><td>0x${m.variance.toString(16)}</td><td>${m.priority2}</td><td>${m.steps_removed}</td><td class="small">${m.src_ip || m.src_mac}</td><td>${m.rate}/s${m.stale ? ' ⏸' : ''}</td></tr>`);
+            }));
+            document.getElementById('foreignTable').innerHTML = rows.length ? rows.join('') : '<tr><td colspan="11" class="text-muted">No Announce messages captured</td></tr>';
+        }
+
+        // 伺服统计由服务器增量计算，面板跟随配置中的实例 (Servo statistics are computed server-side; the panel follows the selected instance)
+        function updateServo() {
+            const name = document.getElementById('instanceName').value.trim() || 'default';
+            fetch(`/api/servo?instance=${encodeURIComponent(name)}`).then(r => r.ok ? r.json() : null).then(d => { liveServo[name] = d; showServo(); }).catch(() => { });
+        }
+
+        function showServo() {
+            const name = document.getElementById('instanceName').value.trim() || 'default';
+            renderServo(name, liveServo[name] || null);
+        }
+
+        function renderServo(name, d) {
+            document.getElementById('servoInstance').innerText = name === 'default' ? '' : `(${name})`;
+            const state = document.getElementById('servoState'), verdict = document.getElementById('servoVerdict');
+            if (!d) {
+                state.innerText = '--'; state.className = 'badge bg-secondary';
+                verdict.innerText = 'ST 2059: --'; verdict.className = 'badge bg-light text-dark border';
+                document.getElementById('servoTable').innerHTML = '<tr><td class="text-center text-muted">No samples yet</td></tr>';
+                document.getElementById('servoDevTable').innerHTML = ''; document.getElementById('servoEvents').innerText = '';
+                return;
+            }
+            const STATE_CLS = { locked: 'bg-success', acquiring: 'bg-warning text-dark', holdover: 'bg-danger', idle: 'bg-secondary' };
+            state.innerText = d.state.toUpperCase(); state.className = 'badge ' + (STATE_CLS[d.state] || 'bg-secondary');
+            if (d.state === 'locked') {
+                verdict.innerText = `ST 2059 ±${d.limit_ns} ns: ${d.within_limit ? 'PASS' : 'FAIL'}`;
+                verdict.className = 'badge ' + (d.within_limit ? 'bg-success' : 'bg-danger');
+            } else { verdict.innerText = 'ST 2059: --'; verdict.className = 'badge bg-light text-dark border'; }
+            const ns = v => (v === null || v === undefined) ? '--' : v + ' ns';
+            const sec = v => (v === null || v === undefined) ? '--' : v + ' s';
+            const w = d.window, f = d.freq;
+            const rows = [
+                [`RMS / Mean (${w.count} samples)`, `${ns(w.rms)} / ${ns(w.mean)}`],
+                ['Peak-to-Peak / Max |offset|', `${ns(w.p2p)} / ${ns(w.max_abs)}`],
+                ['Freq Mean / P2P', f.count ? `${f.mean} / ${Math.round(f.p2p * 10) / 10} ppb` : '--'],
+                ['Time to Lock', sec(d.time_to_lock)],
+                [d.state === 'holdover' ? 'Holdover For' : (d.state === 'acquiring' ? 'Acquiring For' : 'Locked For'), sec(d.holdover_for ?? d.acquiring_for ?? d.locked_for)],
+                ['Locks / Steps / Resets', `${d.locks} / ${d.steps} / ${d.resets}`],
+                ['GM Changes / Holdovers', `${d.gm_changes} / ${d.holdovers}`],
+            ];
+            document.getElementById('servoTable').innerHTML = rows.map(r => `<tr><td class="fw-bold small">${r[0]}</td><td class="font-monospace">${r[1]}</td></tr>`).join('');
+            const dev = d.stability.filter(s => s.n > 0);
+            document.getElementById('servoDevTable').innerHTML = dev.length ? dev.map(s => `<tr><td>${s.tau}</td><td>${s.n}</td><td class="font-monospace">${s.adev.toExponential(2)}</td><td class="font-monospace">${s.tdev ?? '--'}</td></tr>`).join('')
+                : '<tr><td colspan="4" class="text-center text-muted">Collecting locked samples...</td></tr>';
+            document.getElementById('servoEvents').innerText = d.events.slice(-5).reverse().map(e => `${new Date(e.t * 1000).toLocaleTimeString()} ${e.event}${e.detail !== null ? ' (' + e.detail + ')' : ''}`).join('  ·  ');
+        }
+
+        function renderBmca(d) {
+            // 1. Update Decision Table
+            const tbody = document.getElementById('bmcaTable');
+            let html = "";
+
+            if (d.decision.length === 0) {
+                html = '<tr><td colspan="5" class="text-center text-muted">Waiting for PMC data...</td></tr>';
+                document.getElementById('bmcaSummary').innerText = "Analyzing...";
+                document.getElementById('bmcaSummary').className = "badge bg-secondary text-white";
+            } else {
+                d.decision.forEach(step => {
                     let lVal = (step.l !== undefined && step.l !== null) ? step.l : "--";
                     let rVal = (step.r !== undefined && step.r !== null) ? step.r : "--";
                     let rowClass = "";
                     let resBadge = "";
-                    
+
                     if (step.result === "win") {
                         rowClass = "table-success";
                         resBadge = '<span class="badge bg-success">WIN</span>';
@@ -1029,194 +6122,207 @@ cat << 'EOF' > "$INSTALL_DIR/templates/index.html"
                     } else if (step.result === "tie") {
                         resBadge = '<span class="badge bg-light text-dark border">TIE</span>';
                     }
-                    
+
                     // Special case for Identity win by default
                     if (step.step === "Identity" && step.result === "win" && step.reason) {
-                         html += `<tr class="table-success"><td class="fw-bold">Identity</td><td colspan="3" class="small">${step.reason}</td><td><span class="badge bg-success">GM</span></td></tr>`;
+                        html += `<tr class="table-success"><td class="fw-bold">Identity</td><td colspan="3" class="small">${step.reason}</td><td><span class="badge bg-success">GM</span></td></tr>`;
                     } else {
-                         html += `<tr class="${rowClass}"><td class="fw-bold small">${step.step}</td><td>${lVal}</td><td class="text-muted small">vs</td><td>${rVal}</td><td>${resBadge}</td></tr>`;
+                        html += `<tr class="${rowClass}"><td class="fw-bold small">${step.step}</td><td>${lVal}</td><td class="text-muted small">vs</td><td>${rVal}</td><td>${resBadge}</td></tr>`;
                     }
-                 });
-                 
-                 // Summary Badge
-                 const sumBad = document.getElementById('bmcaSummary');
-                 if (d.winner === 'local') {
-                     sumBad.innerText = "Local is Master"; sumBad.className = "badge bg-success text-white";
-                 } else if (d.winner === 'remote') {
-                     sumBad.innerText = "Remote is Master"; sumBad.className = "badge bg-primary text-white";
-                 } else {
-                     sumBad.innerText = "Unknown";
-                 }
-             }
-             tbody.innerHTML = html;
-
-             // 2. Update Flags (ST 2059-2 Critical)
-             const flagsDiv = document.getElementById('ptpFlags');
-             const f = d.flags;
-             // Define flags to show: (key, label, expected_val)
-             const flagMap = [
-                 {k: 'ptpTimescale', l: 'PTP Scale', good: 1}, 
-                 {k: 'timeTraceable', l: 'Time Trc', good: 1},
-                 {k: 'frequencyTraceable', l: 'Freq Trc', good: 1},
-                 {k: 'currentUtcOffsetValid', l: 'UTC Valid', good: 1},
-                 {k: 'leap59', l: 'Leap59', good: 0},
-                 {k: 'leap61', l: 'Leap61', good: 0}
-             ];
-             
-             let fHtml = "";
-             flagMap.forEach(item => {
-                 const val = f[item.k];
-                 let color = "bg-secondary";
-                 if (val !== undefined && val !== null) {
-                     // ST2059: PTP=1, TT=1, FT=1, UTCV=1 are good. Leaps are usually 0.
-                     if (item.good === 1) color = (val == 1) ? "bg-success" : "bg-danger";
-                     else color = (val == 1) ? "bg-warning text-dark" : "bg-success"; 
-                     
-                     fHtml += `<span class="badge ${color}" title="${item.k}">${item.l}: ${val}</span>`;
-                 }
-             });
-             // Add UTC Offset manually
-             if(f.currentUtcOffset !== undefined) fHtml += `<span class="badge bg-info text-dark">Offset: ${f.currentUtcOffset}s</span>`;
-             
-             flagsDiv.innerHTML = fHtml;
-             
-         }).catch(()=>{});
-    }
+                });
 
-    function saveConfigCache() {
-        let cache = {};
-        FIELDS.forEach(f => { const el=document.getElementById(f); if(el) cache[f] = (el.type === 'checkbox') ? el.checked : el.value; });
-        EXT_FIELDS.forEach(f => { const el=document.getElementById(f); if(el) cache[f]=el.value; });
-        localStorage.setItem('ptp4l_last_config', JSON.stringify(cache));
-    }
+                // Summary Badge
+                const sumBad = document.getElementById('bmcaSummary');
+                if (d.winner === 'local') {
+                    sumBad.innerText = "Local is Master"; sumBad.className = "badge bg-success text-white";
+                } else if (d.winner === 'remote') {
+                    sumBad.innerText = "Remote is Master"; sumBad.className = "badge bg-primary text-white";
+                } else {
+                    sumBad.innerText = "Unknown";
+                }
+            }
+            tbody.innerHTML = html;
+
+            // 2. Update Flags (ST 2059-2 Critical)
+            const flagsDiv = document.getElementById('ptpFlags');
+            const f = d.flags;
+            // Define flags to show: (key, label, expected_val)
+            const flagMap = [
+                { k: 'ptpTimescale', l: 'PTP Scale', good: 1 },
+                { k: 'timeTraceable', l: 'Time Trc', good: 1 },
+                { k: 'frequencyTraceable', l: 'Freq Trc', good: 1 },
+                { k: 'currentUtcOffsetValid', l: 'UTC Valid', good: 1 },
+                { k: 'leap59', l: 'Leap59', good: 0 },
+                { k: 'leap61', l: 'Leap61', good: 0 }
+            ];
+
+            let fHtml = "";
+            flagMap.forEach(item => {
+                const val = f[item.k];
+                let color = "bg-secondary";
+                if (val !== undefined && val !== null) {
+                    // ST2059: PTP=1, TT=1, FT=1, UTCV=1 are good. Leaps are usually 0.
+                    if (item.good === 1) color = (val == 1) ? "bg-success" : "bg-danger";
+                    else color = (val == 1) ? "bg-warning text-dark" : "bg-success";
 
-    function loadConfigCache() {
-        const cacheStr = localStorage.getItem('ptp4l_last_config');
-        if(!cacheStr) return;
-        try {
-            const cache = JSON.parse(cacheStr);
-            [...FIELDS, ...EXT_FIELDS].forEach(f => {
-                const el = document.getElementById(f);
-                if(el && cache[f] !== undefined) {
-                    if(el.type === 'checkbox') el.checked = cache[f];
-                    else if(cache[f] !== "") el.value = cache[f];
+                    fHtml += `<span class="badge ${color}" title="${item.k}">${item.l}: ${val}</span>`;
                 }
             });
-            toggleMode(); 
-            onProfileChange(); 
-        } catch(e) {}
-    }
+            // Add UTC Offset manually
+            if (f.currentUtcOffset !== undefined) fHtml += `<span class="badge bg-info text-dark">Offset: ${f.currentUtcOffset}s</span>`;
 
-    function fetchProfiles(){ 
-        fetch('/api/profiles').then(r=>r.json()).then(d=>{ 
-            profiles=d; 
-            const s=document.getElementById('profileSelect'); 
-            s.innerHTML='<option value="" disabled selected>-- Select --</option>'; 
-            for(let i in d){ let o=document.createElement('option'); o.value=i; o.text=d[i].name+(d[i].is_builtin?"*":""); s.add(o); }
-            loadConfigCache();
-        });
-    }
+            flagsDiv.innerHTML = fHtml;
+        }
 
-    function onUserSelectProfile() { loadProfileData(); onProfileChange(); }
-    function onProfileChange() {
-        const pid = document.getElementById('profileSelect').value;
-        const isUser = pid && pid.startsWith('user_');
-        document.getElementById('btnRename').disabled = !isUser;
-        document.getElementById('btnDelete').disabled = !isUser;
-    }
+        function saveConfigCache() {
+            let cache = {};
+            FIELDS.forEach(f => { const el = document.getElementById(f); if (el) cache[f] = (el.type === 'checkbox') ? el.checked : el.value; });
+            EXT_FIELDS.forEach(f => { const el = document.getElementById(f); if (el) cache[f] = el.value; });
+            localStorage.setItem('ptp4l_last_config', JSON.stringify(cache));
+        }
 
-    function renameProfile() {
-        const pid = document.getElementById('profileSelect').value;
-        if(!pid || !profiles[pid]) return;
-        const newName = prompt("Rename Profile:", profiles[pid].name);
-        if(!newName) return;
-        let cleanConfig = {};
-        FIELDS.forEach(f => { const el = document.getElementById(f); if(el) cleanConfig[f] = (el.type === 'checkbox') ? el.checked : el.value; else cleanConfig[f] = profiles[pid][f]; });
-        fetch('/api/profiles', { method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({name: newName, config: cleanConfig}) })
-        .then(r=>r.json()).then(d => { if(d.status === 'success') { fetch('/api/profiles/' + pid, { method:'DELETE' }).then(() => { alert("Renamed!"); fetchProfiles(); }); } });
-    }
+        function loadConfigCache() {
+            const cacheStr = localStorage.getItem('ptp4l_last_config');
+            if (!cacheStr) return;
+            try {
+                const cache = JSON.parse(cacheStr);
+                [...FIELDS, ...EXT_FIELDS].forEach(f => {
+                    const el = document.getElementById(f);
+                    if (el && cache[f] !== undefined) {
+                        if (el.type === 'checkbox') el.checked = cache[f];
+                        else if (cache[f] !== "") el.value = cache[f];
+                    }
+                });
+                toggleMode();
+                onProfileChange();
+            } catch (e) { }
+        }
 
-    function deleteProfile() {
-        const pid = document.getElementById('profileSelect').value;
-        if(!confirm("Delete?")) return;
-        fetch('/api/profiles/' + pid, { method:'DELETE' }).then(r=>r.json()).then(d => { if(d.status==='success') { alert("Deleted!"); fetchProfiles(); } });
-    }
-    
-    function initChart(){
-        const ctx = document.getElementById('offsetChart');
-        if(!ctx) return;
-        offsetChart = new Chart(ctx.getContext('2d'), {
-            type: 'line',
-            data: { labels: [], datasets: [{ label: 'Offset (ns)', data: [], borderColor: '#0d6efd', backgroundColor: 'rgba(13, 110, 253, 0.1)', borderWidth: 2, pointRadius: 0, fill: true, tension: 0.3 }] },
-            options: { responsive: true, maintainAspectRatio: false, animation: false, plugins: { legend: { display: false } }, scales: { x: { display: false }, y: { beginAtZero: false, grid: { color: 'rgba(0,0,0,0.05)' } } } }
-        });
-    }
+        function fetchProfiles() {
+            fetch('/api/profiles').then(r => r.json()).then(d => {
+                profiles = d;
+                const s = document.getElementById('profileSelect');
+                s.innerHTML = '<option value="" disabled selected>-- Select --</option>';
+                for (let i in d) { let o = document.createElement('option'); o.value = i; o.text = d[i].name + (d[i].is_builtin ? "*" : ""); s.add(o); }
+                loadConfigCache();
+            });
+        }
 
-    function updateChartData(offset){
-        if(!offsetChart) return;
-        offsetChart.data.labels.push("");
-        offsetChart.data.datasets[0].data.push(offset);
-        if(offsetChart.data.labels.length > 60){ offsetChart.data.labels.shift(); offsetChart.data.datasets[0].data.shift(); }
-        offsetChart.update();
-        const data = offsetChart.data.datasets[0].data;
-        if(data.length > 0) {
-            const sumSq = data.reduce((a, b) => a + (b * b), 0);
-            document.getElementById('rmsVal').innerText = Math.round(Math.sqrt(sumSq / data.length)) + " ns";
+        function onUserSelectProfile() { loadProfileData(); onProfileChange(); }
+        function onProfileChange() {
+            const pid = document.getElementById('profileSelect').value;
+            const isUser = pid && pid.startsWith('user_');
+            document.getElementById('btnRename').disabled = !isUser;
+            document.getElementById('btnDelete').disabled = !isUser;
         }
-    }
 
-    function toggleMode(){ const m=document.getElementById('clockMode').value; document.getElementById('ocPanel').style.display=(m==='OC'?'block':'none'); document.getElementById('bcPanel').style.display=(m==='BC'?'block':'none'); }
-    
-    function loadProfileData(){ 
-        const p=document.getElementById('profileSelect').value; 
-        if(profiles[p]) FIELDS.forEach(f=>{ 
-            let el=document.getElementById(f);
-            if(el) {
-                if(el.type === 'checkbox') el.checked = profiles[p][f] === true;
-                else if (f === 'syncMode' && profiles[p][f] === undefined) { if (profiles[p]['syncSystem'] === true) el.value = 'slave'; else el.value = 'none'; }
-                else el.value = (profiles[p][f] !== undefined) ? profiles[p][f] : (f==='logLevel'?6:0);
+        function renameProfile() {
+            const pid = document.getElementById('profileSelect').value;
+            if (!pid || !profiles[pid]) return;
+            const newName = prompt("Rename Profile:", profiles[pid].name);
+            if (!newName) return;
+            let cleanConfig = {};
+            FIELDS.forEach(f => { const el = document.getElementById(f); if (el) cleanConfig[f] = (el.type === 'checkbox') ? el.checked : el.value; else cleanConfig[f] = profiles[pid][f]; });
+            fetch('/api/profiles', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ name: newName, config: cleanConfig }) })
+                .then(r => r.json()).then(d => { if (d.status === 'success') { fetch('/api/profiles/' + pid, { method: 'DELETE' }).then(() => { alert("Renamed!"); fetchProfiles(); }); } });
+        }
+
+        function deleteProfile() {
+            const pid = document.getElementById('profileSelect').value;
+            if (!confirm("Delete?")) return;
+            fetch('/api/profiles/' + pid, { method: 'DELETE' }).then(r => r.json()).then(d => { if (d.status === 'success') { alert("Deleted!"); fetchProfiles(); } });
+        }
+
+        function initChart() {
+            const ctx = document.getElementById('offsetChart');
+            if (!ctx) return;
+            offsetChart = new Chart(ctx.getContext('2d'), {
+                type: 'line',
+                data: { labels: [], datasets: [{ label: 'Offset (ns)', data: [], borderColor: '#0d6efd', backgroundColor: 'rgba(13, 110, 253, 0.1)', borderWidth: 2, pointRadius: 0, fill: true, tension: 0.3 }] },
+                options: { responsive: true, maintainAspectRatio: false, animation: false, plugins: { legend: { display: false } }, scales: { x: { display: false }, y: { beginAtZero: false, grid: { color: 'rgba(0,0,0,0.05)' } } } }
+            });
+        }
+
+        function updateChartData(offset) {
+            if (!offsetChart) return;
+            offsetChart.data.labels.push("");
+            offsetChart.data.datasets[0].data.push(offset);
+            if (offsetChart.data.labels.length > 60) { offsetChart.data.labels.shift(); offsetChart.data.datasets[0].data.shift(); }
+            offsetChart.update();
+            const data = offsetChart.data.datasets[0].data;
+            if (data.length > 0) {
+                const sumSq = data.reduce((a, b) => a + (b * b), 0);
+                document.getElementById('rmsVal').innerText = Math.round(Math.sqrt(sumSq / data.length)) + " ns";
             }
-        }); 
-    }
-    
-    function applyConfig(){
-        const m=document.getElementById('clockMode').value; const d={clockMode:m};
-        if(m==='BC'){ d.bcSlaveIf=document.getElementById('bcSlaveIf').value; d.bcMasterIf=document.getElementById('bcMasterIf').value; if(!d.bcSlaveIf||!d.bcMasterIf||d.bcSlaveIf===d.bcMasterIf){ alert("Invalid BC Config"); return; } }
-        else{ d.interface=document.getElementById('interface').value; if(!d.interface){ alert("Select Interface"); return; } }
-        if(!confirm("Apply & Restart?")) return;
-        FIELDS.forEach(f=>{ let el=document.getElementById(f); d[f] = (el.type === 'checkbox') ? el.checked : el.value; });
-        // Manually add monitorMode
-        d['monitorMode'] = document.getElementById('monitorMode').value;
-        saveConfigCache(); 
-        fetch('/api/apply',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(d)}).then(r=>r.json()).then(r=>{ if(r.status==='success') alert("✅ Success!"); else alert("❌ "+r.message); }).catch(e=>alert("Error:"+e));
-    }
+        }
+
+        function toggleMode() { const m = document.getElementById('clockMode').value; document.getElementById('ocPanel').style.display = (m === 'OC' ? 'block' : 'none'); document.getElementById('bcPanel').style.display = (m === 'BC' ? 'block' : 'none'); }
+
+        function loadProfileData() {
+            const p = document.getElementById('profileSelect').value;
+            if (profiles[p]) FIELDS.forEach(f => {
+                let el = document.getElementById(f);
+                if (el) {
+                    if (el.type === 'checkbox') el.checked = profiles[p][f] === true;
+                    else if (f === 'syncMode' && profiles[p][f] === undefined) { if (profiles[p]['syncSystem'] === true) el.value = 'slave'; else el.value = 'none'; }
+                    else el.value = (profiles[p][f] !== undefined) ? profiles[p][f] : (f === 'logLevel' ? 6 : 0);
+                }
+            });
+        }
 
-    function updateStatus(){ 
-        fetch('/api/status').then(r=>r.json()).then(d=>{
-            const c=document.getElementById('ptpCard'), t=document.getElementById('ptpState');
+        function applyConfig() {
+            const m = document.getElementById('clockMode').value; const d = { clockMode: m, instance: document.getElementById('instanceName').value.trim() || 'default' };
+            if (m === 'BC') { d.bcSlaveIf = document.getElementById('bcSlaveIf').value; d.bcMasterIf = document.getElementById('bcMasterIf').value; if (!d.bcSlaveIf || !d.bcMasterIf || d.bcSlaveIf === d.bcMasterIf) { alert("Invalid BC Config"); return; } }
+            else { d.interface = document.getElementById('interface').value; if (!d.interface) { alert("Select Interface"); return; } }
+            if (!confirm("Apply & Restart?")) return;
+            FIELDS.forEach(f => { let el = document.getElementById(f); d[f] = (el.type === 'checkbox') ? el.checked : el.value; });
+            // Manually add monitorMode
+            d['monitorMode'] = document.getElementById('monitorMode').value;
+            saveConfigCache();
+            fetch('/api/apply', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(d) }).then(r => r.json()).then(r => { if (r.status === 'success') trackJob(r.job); else alert("❌ " + r.message); }).catch(e => alert("Error:" + e));
+        }
+
+        // 跟踪应用任务直到 ptp4l 就绪 (Follow the apply / stop job until ptp4l is ready)
+        function trackJob(id) {
+            const el = document.getElementById('applyProgress');
+            const poll = () => fetch('/api/apply/' + id).then(r => r.json()).then(j => {
+                const last = j.steps.length ? j.steps[j.steps.length - 1] : null;
+                el.innerText = `${j.kind} ${j.state}` + (last ? ` · ${last.step} (${last.t}s)` : '') + (j.state === 'done' && j.result.restarted === false ? ' · ptp4l not restarted' : '') + (j.error ? ` · ${j.error}` : '');
+                el.className = 'small mt-1 ' + (j.state === 'failed' ? 'text-danger' : j.state === 'done' ? 'text-success' : 'text-muted');
+                if (j.state === 'queued' || j.state === 'running') setTimeout(poll, 500);
+            }).catch(() => { });
+            poll();
+        }
+
+        function updateStatus() { fetch('/api/status').then(r => r.json()).then(renderStatus).catch(() => { }); }
+
+        function renderStatus(d) {
+            const c = document.getElementById('ptpCard'), t = document.getElementById('ptpState');
             const ptpTimeEl = document.getElementById('ptpTimeVal');
-            if(d.ptp_time && d.ptp_time !== "--") {
+            if (d.ptp_time && d.ptp_time !== "--") {
                 ptpTimeEl.innerText = d.ptp_time;
                 const year = parseInt(d.ptp_time.split('-')[0]);
-                if(year < 2023) { ptpTimeEl.style.color = "#ff6b6b"; ptpTimeEl.innerHTML = "⚠️ " + d.ptp_time; } else { ptpTimeEl.style.color = "#51cf66"; }
+                if (year < 2023) { ptpTimeEl.style.color = "#ff6b6b"; ptpTimeEl.innerHTML = "⚠️ " + d.ptp_time; } else { ptpTimeEl.style.color = "#51cf66"; }
             } else { ptpTimeEl.innerText = "--"; ptpTimeEl.style.color = "white"; }
 
-            if(d.ptp4l==='RUNNING'){
-                t.innerText=d.port||"UNKNOWN"; 
-                document.getElementById('serviceStateDetail').innerText="Running";
-                c.className='status-box shadow-sm ';
-                
+            if (d.ptp4l === 'RUNNING') {
+                t.innerText = d.port || "UNKNOWN";
+                // 多端口 (BC) 逐端口显示状态 (Per-port states for multi-port / boundary clocks)
+                const ports = d.ports || [];
+                document.getElementById('serviceStateDetail').innerText = ports.length > 1 ? "Running · " + ports.map(p => `P${p.id.split('-').pop()} ${p.state}`).join(' / ') : "Running";
+                c.className = 'status-box shadow-sm ';
+
                 const p = d.port;
-                if(p==='MASTER'||p==='GRAND_MASTER') c.className += 'bg-master';
-                else if(p==='SLAVE') c.className += 'bg-slave';
-                else if(p==='UNCALIBRATED'||p==='LISTENING'||p==='INITIALIZING') c.className += 'bg-syncing';
-                else if(p==='FAULTY'||p==='DISABLED'||p==='UNKNOWN') c.className += 'bg-stopped';
-                else if(p==='PASSIVE') c.className += 'bg-passive';
+                if (p === 'MASTER' || p === 'GRAND_MASTER') c.className += 'bg-master';
+                else if (p === 'SLAVE') c.className += 'bg-slave';
+                else if (p === 'UNCALIBRATED' || p === 'LISTENING' || p === 'INITIALIZING') c.className += 'bg-syncing';
+                else if (p === 'FAULTY' || p === 'DISABLED' || p === 'UNKNOWN') c.className += 'bg-stopped';
+                else if (p === 'PASSIVE') c.className += 'bg-passive';
                 else c.className += 'bg-running';
-                
+
                 const phcEl = document.getElementById('phcBadge');
-                if(phcEl) {
-                    if(d.phc2sys === 'RUNNING') {
+                if (phcEl) {
+                    if (d.phc2sys === 'RUNNING') {
                         phcEl.className = "badge bg-success border border-light";
                         phcEl.style.opacity = "1.0";
                         phcEl.innerText = "SYNC ON";
@@ -1226,119 +6332,257 @@ cat << 'EOF' > "$INSTALL_DIR/templates/index.html"
                         phcEl.innerText = "SYNC OFF";
                     }
                 }
-                if(d.port !== 'UNKNOWN') updateChartData(Math.round(d.offset));
-            } else { 
-                c.className='status-box bg-stopped shadow-sm'; t.innerText="STOPPED"; 
-                document.getElementById('serviceStateDetail').innerText="Inactive"; 
+                if (d.port !== 'UNKNOWN') updateChartData(Math.round(d.offset));
+            } else if (d.ptp4l === 'UNKNOWN') {
+                // 进程检查失败，状态未知 (pgrep failed / timed out: state unknown, not stopped)
+                c.className = 'status-box bg-syncing shadow-sm'; t.innerText = "UNKNOWN";
+                document.getElementById('serviceStateDetail').innerText = "Process check failed";
+            } else {
+                c.className = 'status-box bg-stopped shadow-sm'; t.innerText = "STOPPED";
+                document.getElementById('serviceStateDetail').innerText = "Inactive";
             }
-            document.getElementById('offsetVal').innerText = Math.round(d.offset); 
+            document.getElementById('offsetVal').innerText = Math.round(d.offset);
             const delayEl = document.getElementById('pathDelayVal');
-            if(delayEl) delayEl.innerText = (d.port !== 'MASTER' && d.port !== 'GRAND_MASTER' && d.path_delay === 0) ? "--" : Math.round(d.path_delay);
+            if (delayEl) delayEl.innerText = (d.port !== 'MASTER' && d.port !== 'GRAND_MASTER' && d.path_delay === 0) ? "--" : Math.round(d.path_delay);
             document.getElementById('gmId').innerText = d.gm || "N/A";
             const stepsEl = document.getElementById('stepsBadge');
-            if(stepsEl) stepsEl.innerText = (d.steps_removed !== -1) ? "Hops: " + d.steps_removed : "Hops: --";
+            if (stepsEl) stepsEl.innerText = (d.steps_removed !== -1) ? "Hops: " + d.steps_removed : "Hops: --";
             document.getElementById('logTime').innerText = new Date().toLocaleTimeString();
-        }).catch(()=>{}); 
-    }
+        }
+
+        function updateClients() { fetch('/api/clients?sort=-rate').then(r => r.json()).then(d => renderClients(d.clients)).catch(() => { }); }
 
-    function updateClients(){
-        fetch('/api/clients').then(r=>r.json()).then(d=>{
+        function renderClients(d) {
             const tbody = document.getElementById('clientTableBody');
             document.getElementById('clientCount').innerText = d.length;
-                if(d.length === 0) {
-                    tbody.innerHTML = '<tr><td colspan="4" class="text-center text-muted">No clients detected</td></tr>';
-                } else {
-                    let html = '';
-                    const now = Date.now() / 1000;
-                    d.forEach(c => {
-                        const ago = Math.round(now - c.last_seen);
-                        let ipHtml = c.ip;
-                        let rowClass = "";
-                        if (c.is_self) {
-                             ipHtml += ' <span class="badge bg-info text-dark" style="font-size: 0.7em;">ME</span>';
-                             rowClass = "table-info";
+            if (d.length === 0) {
+                tbody.innerHTML = '<tr><td colspan="5" class="text-center text-muted">No clients detected</td></tr>';
+            } else {
+                let html = '';
+                const now = Date.now() / 1000;
+                d.forEach(c => {
+                    const ago = Math.round(now - c.last_seen);
+                    let ipHtml = c.ip;
+                    let rowClass = "";
+                    if (c.is_self) {
+                        ipHtml += ' <span class="badge bg-info text-dark" style="font-size: 0.7em;">ME</span>';
+                        rowClass = "table-info";
+                    }
+                    // 序列号缺口 = 丢包 (sequenceId gaps = lost messages)
+                const lossHtml = c.lost ? ` <span class="badge bg-warning text-dark" title="sequenceId gaps">-${c.lost}</span>` : '';
+                // 时序质量告警: 主时钟过载 / Delay_Req 洪泛 / 报文节奏偏离配置 (Timing flags: overloaded master, Delay_Req spam, cadence off profile)
+                const flagHtml = (c.flags || []).map(f => ` <span class="badge bg-danger" title="/api/clients/timing">${f.replace(/_/g, ' ')}</span>`).join('');
+                html += `<tr class="${rowClass}"><td>${ipHtml}</td><td class="text-muted small">${c.mac}</td><td><span class="badge bg-secondary">${c.iface}</span></td><td class="small">${c.rate}/s${lossHtml}${flagHtml}</td><td><span class="badge bg-success">${ago}s ago</span></td></tr>`;
+                });
+                tbody.innerHTML = html;
+            }
+        }
+
+        // 只拉取游标之后的新日志 (Only fetch entries after the last journal cursor)
+        function updateLogs() {
+            const url = logCursor ? `/api/logs?after=${encodeURIComponent(logCursor)}` : '/api/logs';
+            fetch(url).then(r => r.json()).then(d => {
+                const lines = d.entries.map(e => e.message);
+                if (lines.length || !logCursor || d.reset) renderLogs(lines, !logCursor || d.reset);
+                logCursor = d.cursor;
+            }).catch(() => { });
+        }
+
+        function renderLogs(lines, replace) {
+            // 推送的新行先进入缓冲区，即使本次跳过渲染也不会丢失 (Pushed lines are buffered even when rendering is skipped)
+            logLines = replace ? lines.slice() : logLines.concat(lines);
+            if (logLines.length > LOG_MAX_LINES) logLines = logLines.slice(-LOG_MAX_LINES);
+
+            const w = document.getElementById('logWindow');
+            if (!w) return;
+
+            // 1. 检测用户是否正在选中文本，如果是，则跳过本次更新（防打扰）
+            if (window.getSelection().toString().length > 0) return;
+
+            // 2. 检测用户是否已经手动滚动到了上方
+            // 允许 10px 的误差
+            const isAtBottom = (w.scrollHeight - w.scrollTop - w.clientHeight) < 20;
+
+            const text = logLines.join('\n');
+            // 只有内容变了才更新，减少DOM操作
+            if (w.innerText !== text) {
+                w.innerText = text;
+                // 3. 只有当用户原本就在底部时，才自动滚动到底部
+                if (isAtBottom) {
+                    w.scrollTop = w.scrollHeight;
+                }
+            }
+        }
+
+        function saveProfile() {
+            let n = prompt("Name:");
+            if (n) {
+                let c = {};
+                FIELDS.forEach(f => {
+                    let el = document.getElementById(f);
+                    c[f] = (el.type === 'checkbox') ? el.checked : el.value;
+                });
+                fetch('/api/profiles', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ name: n, config: c })
+                })
+                    .then(response => {
+                        if (!response.ok) {
+                            throw new Error('Network response was not ok');
                         }
-                        html += `<tr class="${rowClass}"><td>${ipHtml}</td><td class="text-muted small">${c.mac}</td><td><span class="badge bg-secondary">${c.iface}</span></td><td><span class="badge bg-success">${ago}s ago</span></td></tr>`;
+                        return response.json();
+                    })
+                    .then(() => fetchProfiles())
+                    .catch(error => {
+                        console.error('Error saving profile:', error);
+                        alert('Failed to save profile: ' + error.message);
                     });
-                    tbody.innerHTML = html;
-                }
-        }).catch(()=>{});
-    }
+            }
+        }
 
-   function updateLogs(){ 
-    const w = document.getElementById('logWindow');
-    if(!w) return;
+        function stopService() {
+            if (confirm("Stop?")) {
+                fetch('/api/stop', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ instance: document.getElementById('instanceName').value.trim() || 'default' })
+                })
+                    .then(response => {
+                        if (!response.ok) {
+                            throw new Error('Network response was not ok');
+                        }
+                        return response.json();
+                    })
+                    .then(r => trackJob(r.job))
+                    .catch(error => {
+                        console.error('Error stopping service:', error);
+                        alert('Failed to stop service: ' + error.message);
+                    });
+            }
+        }
 
-    // 1. 检测用户是否正在选中文本，如果是，则跳过本次更新（防打扰）
-    if (window.getSelection().toString().length > 0) return;
+        init();
+    </script>
+</body>
 
-    // 2. 检测用户是否已经手动滚动到了上方
-    // 允许 10px 的误差
-    const isAtBottom = (w.scrollHeight - w.scrollTop - w.clientHeight) < 20;
+</html>
+EOF
 
-    fetch('/api/logs').then(r=>r.json()).then(d=>{ 
-        // 只有内容变了才更新，减少DOM操作（可选，但简单起见直接赋值）
-        if (w.innerText !== d.logs) {
-            w.innerText = d.logs; 
-            // 3. 只有当用户原本就在底部时，才自动滚动到底部
-            if(isAtBottom) {
-                w.scrollTop = w.scrollHeight; 
-            }
+cat << 'EOF' > "$INSTALL_DIR/templates/fleet.html"
+<!DOCTYPE html>
+<html lang="zh">
+
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>PTP Fleet</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+    <style>
+        .topo ul {
+            list-style: none;
+            padding-left: 1.5rem;
+            border-left: 1px dashed #adb5bd;
+            margin-left: 0.4rem;
         }
-    }).catch(()=>{}); 
-}
 
-    function saveProfile() {
-        let n = prompt("Name:");
-        if (n) {
-            let c = {};
-            FIELDS.forEach(f => {
-                let el = document.getElementById(f);
-                c[f] = (el.type === 'checkbox') ? el.checked : el.value;
-            });
-            fetch('/api/profiles', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({name: n, config: c})
-            })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Network response was not ok');
-                }
-                return response.json();
-            })
-            .then(() => fetchProfiles())
-            .catch(error => {
-                console.error('Error saving profile:', error);
-                alert('Failed to save profile: ' + error.message);
-            });
+        .topo > ul {
+            border-left: none;
+            padding-left: 0;
+            margin-left: 0;
         }
-    }
 
-    function stopService() {
-        if (confirm("Stop?")) {
-            fetch('/api/stop', {
-                method: 'POST'
-            })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Network response was not ok');
-                }
-                return response.json();
-            })
-            .then(() => {
-                alert('Service stopped successfully');
-            })
-            .catch(error => {
-                console.error('Error stopping service:', error);
-                alert('Failed to stop service: ' + error.message);
-            });
+        .topo li {
+            margin: 2px 0;
+            font-size: 0.85rem;
         }
-    }
-    
-    init();
-</script>
+    </style>
+</head>
+
+<body class="bg-light">
+    <div class="container-fluid p-4">
+        <div class="d-flex justify-content-between align-items-center mb-3">
+            <h3 class="mb-0">🛰️ PTP Fleet <small class="text-muted fs-6" id="fleetSummary">--</small></h3>
+            <div><a href="/" class="btn btn-sm btn-outline-secondary">Local Node</a> <span
+                    class="badge bg-secondary">{{ hostname }}</span></div>
+        </div>
+        {% if not enabled %}
+        <div class="alert alert-warning">Fleet mode is disabled. Set <code>PTP_WEB_FLEET_PEERS</code> or create
+            <code>fleet_peers.json</code> and restart ptp-web.
+        </div>
+        {% endif %}
+        <div class="row g-3">
+            <div class="col-lg-4">
+                <div class="card shadow-sm h-100">
+                    <div class="card-header fw-bold small text-muted">🌳 Topology (GM ➔ BC ➔ Slave)</div>
+                    <div class="card-body topo" id="topology">Waiting for data...</div>
+                </div>
+            </div>
+            <div class="col-lg-8">
+                <div class="card shadow-sm">
+                    <div class="card-header fw-bold small text-muted">🖥️ Nodes</div>
+                    <div class="card-body p-0" style="max-height: 80vh; overflow-y: auto;">
+                        <table class="table table-sm table-striped mb-0" style="font-size: 0.8rem;">
+                            <thead class="table-light sticky-top">
+                                <tr>
+                                    <th>Node</th>
+                                    <th>Port</th>
+                                    <th>Offset (ns)</th>
+                                    <th>Path Delay (ns)</th>
+                                    <th>Hops</th>
+                                    <th>Grandmaster</th>
+                                    <th>Clients</th>
+                                    <th>Latency</th>
+                                </tr>
+                            </thead>
+                            <tbody id="nodeTable"></tbody>
+                        </table>
+                    </div>
+                </div>
+            </div>
+        </div>
+    </div>
+    <script>
+        const ROLE_BADGE = { gm: 'bg-danger', bc: 'bg-primary', slave: 'bg-success', external: 'bg-secondary' };
+
+        function refresh() {
+            fetch('/api/fleet').then(r => r.ok ? r.json() : null).then(d => { if (d) render(d); }).catch(() => { });
+        }
+
+        function render(d) {
+            const up = d.nodes.filter(n => n.ok).length;
+            document.getElementById('fleetSummary').innerText = `${up}/${d.nodes.length} nodes up · cycle ${d.duration !== null ? Math.round(d.duration * 1000) : '--'} ms`;
+            document.getElementById('nodeTable').innerHTML = d.nodes.map(n => {
+                const s = n.status || {};
+                if (!n.ok) return `<tr class="table-danger"><td>${n.name}</td><td colspan="6" class="text-muted">${n.error || 'down'} (retry #${n.failures})</td><td>--</td></tr>`;
+                return `<tr><td>${n.name}</td><td>${s.port}</td><td>${Math.round(s.offset)}</td><td>${Math.round(s.path_delay)}</td><td>${s.steps_removed}</td><td class="font-monospace">${s.gm_id || s.gm}</td><td>${n.clients_total}</td><td>${n.latency_ms} ms</td></tr>`;
+            }).join('');
+            renderTopology(d.topology);
+        }
+
+        // 以 GM 为根递归渲染树 (Render the tree from every root vertex)
+        function renderTopology(t) {
+            const byId = {}, children = {}, hasParent = {};
+            t.vertices.forEach(v => byId[v.id] = v);
+            t.edges.forEach(e => { (children[e.from] = children[e.from] || []).push(e.to); hasParent[e.to] = true; });
+            const seen = {};
+            const item = id => {
+                if (seen[id]) return '';
+                seen[id] = true;
+                const v = byId[id];
+                const kids = (children[id] || []).map(item).join('');
+                const label = v.node ? `${v.node} <span class="text-muted font-monospace">${v.id}</span>` : `<span class="font-monospace">${v.id}</span> <span class="text-muted">(outside fleet)</span>`;
+                return `<li><span class="badge ${ROLE_BADGE[v.role]}">${v.role.toUpperCase()}</span> ${label}${kids ? `<ul>${kids}</ul>` : ''}</li>`;
+            };
+            const roots = t.vertices.filter(v => !hasParent[v.id]).map(v => item(v.id)).join('');
+            document.getElementById('topology').innerHTML = roots ? `<ul>${roots}</ul>` : 'No topology data';
+        }
+
+        refresh();
+        setInterval(refresh, 1000);
+    </script>
 </body>
+
 </html>
 EOF
 
@@ -1389,6 +6633,20 @@ Restart=always
 WantedBy=multi-user.target
 EOF
 
+# 额外实例：/etc/linuxptp/ptp4l-<name>.conf 由 ptp4l@<name> 运行 (Extra instances, one per NIC/domain)
+cat << 'EOF' > /etc/systemd/system/ptp4l@.service
+[Unit]
+Description=Precision Time Protocol (PTP) service, instance %i
+After=network.target
+[Service]
+Type=simple
+ExecStart=/usr/sbin/ptp4l -f /etc/linuxptp/ptp4l-%i.conf
+Restart=always
+[Install]
+WantedBy=multi-user.target
+EOF
+
+# /api/stream (SSE) 每个打开的页面占用一个线程，因此线程数需覆盖 PTP_WEB_STREAM_CLIENTS
 cat << 'EOF' > /etc/systemd/system/ptp-web.service
 [Unit]
 Description=PTP Web Controller UI
@@ -1397,7 +6655,7 @@ After=network.target
 Type=simple
 User=root
 WorkingDirectory=/opt/ptp-web
-ExecStart=/opt/ptp-web/.venv/bin/gunicorn --workers 1 --threads 4 --bind 0.0.0.0:8080 app:app
+ExecStart=/opt/ptp-web/.venv/bin/gunicorn --workers 1 --threads 64 --bind 0.0.0.0:8080 app:app
 Restart=always
 [Install]
 WantedBy=multi-user.target
@@ -4,36 +4,116 @@ import re
 import json
 import socket
 import shutil
-import threading
 import time
 import atexit
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, g
+from pmc_client import PmcError, PmcUnavailable, PORT_STATES, GrandmasterSettingsNP
+from pmc_text import parse_datasets
+from telemetry import TelemetrySampler
+from stream import Broadcaster, sse_format, diff_fields, diff_clients
+from history import MetricHistory, downsample
+from metric_store import MetricStore
+from archive import PacketArchive, TYPE_CODES
+from capture import RawCapture
+from client_stats import ClientTable, query_clients
+from foreign_masters import ForeignMasterTable
+from monitor import MonitorSupervisor
+from journal import JournalFollower
+from fleet import FleetAggregator
+from metrics import Registry, CONTENT_TYPE
+from phc import PhcManager
+from hostinfo import HostInfo
+from apply import ApplyQueue, wait_until
+from executor import Executor
+from servo_stats import ServoStats
+from config_diff import RUNTIME_OPTIONS, diff_config, needs_restart, runtime_values
+from instances import InstanceRegistry, DEFAULT_INSTANCE, NAME_RE, config_path, default_uds_path, unit_name, parse_ptp4l_config
 
 app = Flask(__name__)
 
 # --- Configuration ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-CONFIG_FILE = "/etc/linuxptp/ptp4l.conf"
 PHC2SYS_SERVICE_FILE = "/etc/systemd/system/phc2sys-custom.service"
 SAFE_WRAPPER_SCRIPT = "/usr/local/bin/ptp-safe-wrapper.sh"
 INJECT_SCRIPT = "/usr/local/bin/ptp-inject"
 USER_PROFILES_FILE = os.path.join(BASE_DIR, "user_profiles.json")
-
-# Global Cache
-STATUS_CACHE = { "time": 0, "data": None }
+# linuxptp config directory (ptp4l.conf + ptp4l-<name>.conf); overridable for test rigs / benchmarks
+PTP_CONFIG_DIR = os.environ.get("PTP_WEB_CONFIG_DIR", "/etc/linuxptp")
+# Seconds between background telemetry cycles (status / BMCA / clients)
+SAMPLE_INTERVAL = float(os.environ.get("PTP_WEB_SAMPLE_INTERVAL", "1.0"))
+# Concurrent /api/stream connections (each holds one gunicorn thread)
+STREAM_MAX_CLIENTS = int(os.environ.get("PTP_WEB_STREAM_CLIENTS", "48"))
+# Upper bound of tracked radar endpoints (least recently seen are evicted first)
+MAX_CLIENTS = int(os.environ.get("PTP_WEB_MAX_CLIENTS", "4096"))
+# Delay_Req -> Delay_Resp turnaround p99 above which a master is flagged as overloaded
+TURNAROUND_LIMIT_MS = float(os.environ.get("PTP_WEB_TURNAROUND_LIMIT_MS", "10"))
+CLIENT_TTL = 120
+# In-memory metric history depth (hours at SAMPLE_INTERVAL resolution)
+HISTORY_HOURS = float(os.environ.get("PTP_WEB_HISTORY_HOURS", "24"))
+# On-disk metric store (one mmap file per day): directory, retention in days and total size cap
+DATA_DIR = os.environ.get("PTP_WEB_DATA_DIR", "/var/lib/ptp-web")
+STORE_DAYS = int(os.environ.get("PTP_WEB_STORE_DAYS", "30"))
+STORE_MAX_MB = int(os.environ.get("PTP_WEB_STORE_MAX_MB", "512"))
+# Rolling archive of captured PTP message headers (MB on disk, 0 = off)
+ARCHIVE_MB = int(os.environ.get("PTP_WEB_ARCHIVE_MB", "0"))
+# Fleet aggregator peers: comma-separated host[:port] list, or a JSON list in fleet_peers.json
+FLEET_PEERS = os.environ.get("PTP_WEB_FLEET_PEERS", "")
+FLEET_PEERS_FILE = os.path.join(BASE_DIR, "fleet_peers.json")
+LOG_UNITS = ["ptp4l", "ptp4l@*", "phc2sys-custom"]
+LOG_TAIL = 30
+SERVO_MAX_AGE = 5.0 # seconds a parsed "master offset" line stays current
+# Offset limit for lock detection and the servo verdict (ST 2059-2: +/-1 us) and the rolling stats window (samples)
+OFFSET_LIMIT_NS = int(os.environ.get("PTP_WEB_OFFSET_LIMIT_NS", "1000"))
+SERVO_WINDOW = int(os.environ.get("PTP_WEB_SERVO_WINDOW", "60"))
+# Helper processes (pgrep / pmc / systemctl) alive at once
+MAX_PROCS = int(os.environ.get("PTP_WEB_MAX_PROCS", "8"))
+SYSTEMCTL_TIMEOUT = 30.0
+
+# --- Self Metrics (served by /metrics together with the sampled values) ---
+METRICS = Registry()
+CMD_SECONDS = METRICS.histogram("ptpweb_subprocess_seconds", "Latency of helper process calls", ["cmd"])
+CMD_RESULTS = METRICS.counter("ptpweb_subprocess_total", "Helper process calls by result (ok, exit, timeout, error, coalesced)", ["cmd", "result"])
+PMC_SECONDS = METRICS.histogram("ptpweb_pmc_seconds", "Latency of batched management requests to ptp4l", ["instance"])
+HTTP_SECONDS = METRICS.histogram("ptpweb_http_request_seconds", "HTTP request latency per route", ["route"])
+SAMPLE_SECONDS = METRICS.histogram("ptpweb_sample_cycle_seconds", "Duration of one telemetry sampling cycle")
+OFFSET_ABS_NS = METRICS.histogram("ptp_offset_abs_ns", "Absolute offset from master per sample", ["instance"],
+                                  buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 100000, 1000000))
+JOURNAL_RECORDS = METRICS.counter("ptpweb_journal_records_total", "Journal records received by the follower", ["unit"])
+
+# NICs / addresses from rtnetlink and config directory changes from inotify, re-read only when the kernel reports a change
+HOST = HostInfo().start()
+atexit.register(HOST.close)
+# ptp4l instances (ptp4l.service + ptp4l@<name>.service), each with a persistent management connection
+INSTANCES = InstanceRegistry(PTP_CONFIG_DIR)
+atexit.register(INSTANCES.close)
+# Open /dev/ptpN per interface: PHC reads are a clock_gettime() instead of ethtool + phc_ctl
+PHC = PhcManager(ifindex=HOST.ifindex)
+atexit.register(PHC.close)
+
+def on_config_change(name):
+    # name is None when the watch itself ended: go back to checking mtimes every cycle
+    if name is None: INSTANCES.watched = False
+    INSTANCES.invalidate()
+
+def on_link_change(names):
+    # Driver reload / interface re-creation: reopen the PHC on next use
+    for name in names: PHC.invalidate(name)
+
+INSTANCES.watched = HOST.watch_dir(PTP_CONFIG_DIR, on_config_change)
+if HOST.watching_links: PHC.revalidate = None
+HOST.link_listeners.append(on_link_change)
+# Instances are sampled in parallel, so one cycle costs the slowest instance rather than the sum
+SAMPLE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ptp-sample")
 
 # --- Client Monitoring Globals ---
-MONITOR_CONFIG = { "mode": "disabled", "interfaces": [] }
-CLIENTS = {} # { ip: { mac: str, last_seen: float } }
-CLIENTS_LOCK = threading.Lock()
-
-# --- Cleanup on Exit ---
-def cleanup_subprocesses():
-    # 退出时强制清理 tcpdump，防止僵尸进程
-    os.system("pkill -f 'tcpdump -i .* dst port 319'")
-
-atexit.register(cleanup_subprocesses)
+CLIENTS = ClientTable(MAX_CLIENTS, TURNAROUND_LIMIT_MS / 1000) # ip (or mac for L2 PTP) -> ClientStats
+# Every announcing port seen by the radar, ranked per (iface, domain) as Announce messages arrive
+FOREIGN = ForeignMasterTable(MAX_CLIENTS, CLIENT_TTL)
+# Capture factory: RawCapture(iface) in production, capture.PcapCapture to replay recorded traffic
+open_capture = RawCapture
 
 # --- Built-in Profiles ---
 BUILTIN_PROFILES = {
@@ -42,244 +122,148 @@ BUILTIN_PROFILES = {
     "st2059": { "name": "SMPTE ST 2059-2 (Broadcast)", "timeStamping": "hardware", "domain": 127, "priority1": 128, "priority2": 128, "logAnnounceInterval": -2, "logSyncInterval": -3, "logMinDelayReqInterval": -2, "announceReceiptTimeout": 3, "syncMode": "slave", "logLevel": 6 }
 }
 
-def run_cmd_safe(cmd_list):
-    try:
-        env = os.environ.copy()
-        env['LANG'] = 'C'
-        # Reduced timeout to prevent long blocking
-        result = subprocess.check_output(cmd_list, stderr=subprocess.STDOUT, timeout=1.5, env=env)
-        return result.decode('utf-8', errors='ignore')
-    except:
-        return ""
-
-def validate_interface(iface):
-    if not iface: return False
-    try:
-        valid_nics = os.listdir('/sys/class/net/')
-        return iface in valid_nics
-    except:
-        return False
-
-# --- Monitor Logic (Multi-Interface) ---
-def get_ip_address(iface):
-    try:
-        out = subprocess.check_output(["ip", "-4", "addr", "show", iface], text=True)
-        m = re.search(r'inet\s+(\d+\.\d+\.\d+\.\d+)', out)
-        return m.group(1) if m else None
-    except: return None
-
-def monitor_worker(iface):
-    global CLIENTS
-    proc = None
-    my_ip = get_ip_address(iface)
-    
-    while True:
-        # Check global config (simple polling)
-        if MONITOR_CONFIG["mode"] == "disabled" or iface not in MONITOR_CONFIG["interfaces"]:
-            if proc:
-                try: proc.terminate(); proc.wait()
-                except: pass
-                proc = None
-            time.sleep(1)
-            # If interface was removed from config, exit this worker
-            if iface not in MONITOR_CONFIG["interfaces"]: return
-            continue
-
-        if not proc or proc.poll() is not None:
-            # Capture both Sync/FollowUp and DelayReq to see EVERYONE (GM + Clients)
-            cmd = ["tcpdump", "-i", iface, "-nn", "-l", "-e", "dst port 319"]
-            try:
-                proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
-            except:
-                time.sleep(5)
-                continue
-
-        try:
-            line = proc.stdout.readline()
-            if not line:
-                time.sleep(0.1)
-                continue
-            
-            # Simple interaction update
-            current_time = time.time()
-            # Regex: SourceMAC > ... SourceIP.319 >
-            # Note: tcpdump format varies slightly by version, but usually:
-            # HH:MM:SS.us MAC1 > MAC2, ethertype IPv4 (0x0800), length 76: 192.168.1.55.319 > 224.0.1.129.319: UDP, length 44
-            # We want source IP.
-            m = re.search(r'([0-9a-fA-F:]{17}) > .*? (\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\.319 >', line)
-            
-            # If standard regex failed, try alternative format (sometimes source port is not 319)
-            # e.g. 192.168.1.55.56789 > 224.0.1.129.319
-            if not m:
-                m = re.search(r'([0-9a-fA-F:]{17}) > .*? (\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\.(\d+) > .*?\.319', line)
-
-            if m:
-                mac = m.group(1)
-                ip = m.group(2)
-                # Filter out our own MAC/IP if possible? (Hard without netifaces)
-                # But seeing "Self" in radar is sometimes useful debugging.
-                is_self = (ip == my_ip)
-                with CLIENTS_LOCK:
-                    # Append interface name to info for UI
-                    CLIENTS[ip] = { "mac": mac, "last_seen": current_time, "iface": iface, "is_self": is_self }       
-        except:
-            time.sleep(1)
-
-def monitor_manager_thread():
-    # Spawns workers for interfaces in MONITOR_CONFIG
-    active_workers = {} # iface -> thread
-    while True:
-        target_ifaces = MONITOR_CONFIG.get("interfaces", [])
-        mode = MONITOR_CONFIG.get("mode", "disabled")
-        
-        if mode == "disabled":
-             target_ifaces = []
-
-        # Start new workers
-        for iface in target_ifaces:
-                if iface not in active_workers or not active_workers[iface].is_alive():
-                    # Refresh IP in case it changed
-                    t = threading.Thread(target=monitor_worker, args=(iface,), daemon=True)
-                    t.start()
-                    active_workers[iface] = t
-        
-        # Prune old workers (logic handled inside worker loop checking config)
-        time.sleep(2)
-
-# Start Manager
-threading.Thread(target=monitor_manager_thread, daemon=True).start()
+def observe_cmd(result, coalesced):
+    name = os.path.basename(result.argv[0])
+    if coalesced: CMD_RESULTS.labels(name, "coalesced").inc(); return
+    CMD_SECONDS.labels(name).observe(result.duration)
+    CMD_RESULTS.labels(name, result.status).inc()
 
-def cleanup_thread():
-    while True:
-        time.sleep(5)
-        now = time.time()
-        with CLIENTS_LOCK:
-            to_remove = [ip for ip, d in CLIENTS.items() if now - d['last_seen'] > 120]
-            for ip in to_remove:
-                del CLIENTS[ip]
+EXECUTOR = Executor(max_procs=MAX_PROCS, on_result=observe_cmd)
+atexit.register(EXECUTOR.close)
 
+def run_cmd_safe(cmd_list):
+    # Output of a successful call, "" otherwise (callers needing the reason use EXECUTOR.run)
+    result = EXECUTOR.run(cmd_list)
+    return result.output if result.ok else ""
 
-threading.Thread(target=cleanup_thread, daemon=True).start()
+def systemctl(*args):
+    return EXECUTOR.run(["systemctl", *args], timeout=SYSTEMCTL_TIMEOUT)
 
-def get_current_interface():
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                for line in f:
-                    m = re.match(r'^\[([^\]]+)\]', line.strip())
-                    if m and m.group(1) != 'global':
-                        return m.group(1)
-    except: pass
-    return None
+def validate_interface(iface):
+    return bool(iface) and HOST.has_link(iface)
+
+# Start Supervisor (one selector loop over every capture; config changes wake it immediately)
+# Local IPs come from the netlink-maintained table, so is_self follows DHCP changes
+MONITOR = MonitorSupervisor(CLIENTS, lambda iface: open_capture(iface), HOST.ipv4, CLIENT_TTL)
+MONITOR.observers.append(FOREIGN.observe)
+ARCHIVE = PacketArchive(os.path.join(DATA_DIR, "archive"), ARCHIVE_MB << 20) if ARCHIVE_MB > 0 else None
+if ARCHIVE:
+    MONITOR.observers.append(ARCHIVE.observe)
+    atexit.register(ARCHIVE.close)
+MONITOR.start()
 
 def get_ptp_time(interface):
     if not interface: return None
-    try:
-        ethtool_out = run_cmd_safe(["ethtool", "-T", interface])
-        m = re.search(r'(?:PTP Hardware Clock|Hardware timestamp provider index):\s+(\d+)', ethtool_out)
-        if not m: return None
-        ptp_dev = f"/dev/ptp{m.group(1)}"
-        out = run_cmd_safe(["phc_ctl", ptp_dev, "get"])
-        m_ts = re.search(r'clock time is (\d+)\.', out)
-        if m_ts:
-            ts = int(m_ts.group(1))
-            return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-    except: pass
-    return None
-
-def get_pmc_dict():
-    cmd = ["pmc", "-u", "-b", "0", 
-           "GET CURRENT_DATA_SET", 
-           "GET PORT_DATA_SET", 
-           "GET TIME_STATUS_NP", 
-           "GET PARENT_DATA_SET"]
-    output = run_cmd_safe(cmd)
-    data = { "port_state": "UNKNOWN", "offset": 0, "path_delay": 0, "steps_removed": -1, "gm_id": "Unknown", "gm_present": False, "clock_id": "", "phc2sys_state": "STOPPED" }
-
-    m_delay = re.search(r'meanPathDelay\s+([\d\.\-eE]+)', output)
-    if m_delay: 
-        try: data['path_delay'] = float(m_delay.group(1))
-        except: pass
-
-    m_steps = re.search(r'stepsRemoved\s+(\d+)', output)
-    if m_steps: 
-        try: data['steps_removed'] = int(m_steps.group(1))
-        except: pass
-
-    m_off = re.search(r'offsetFromMaster\s+([\d\.\-eE]+)', output)
-    if m_off: 
-        try: data['offset'] = float(m_off.group(1))
-        except: pass
-
-    m_gm = re.search(r'grandmasterIdentity\s+([0-9a-fA-F\.]+)', output)
-    if m_gm: data['gm_id'] = m_gm.group(1)
-        
-    m_clk = re.search(r'clockIdentity\s+([0-9a-fA-F\.]+)', output)
-    if not m_clk: m_clk = re.search(r'^([0-9a-fA-F\.]+).*RESPONSE', output, re.MULTILINE)
-    if m_clk: data['clock_id'] = m_clk.group(1)
-
-    states = re.findall(r'portState\s+(\w+)', output)
-    if states:
-        if 'SLAVE' in states: data['port_state'] = 'SLAVE'
-        elif all(s == 'MASTER' for s in states): data['port_state'] = 'MASTER'
-        elif 'UNCALIBRATED' in states: data['port_state'] = 'UNCALIBRATED'
-        else: data['port_state'] = states[0]
-
-    if run_cmd_safe(["pgrep", "-f", "phc2sys"]): data["phc2sys_state"] = "RUNNING"
+    ns = PHC.gettime_ns(interface)
+    if ns is None: return None
+    return datetime.fromtimestamp(ns // 1000000000).strftime('%Y-%m-%d %H:%M:%S')
+
+def pmc_query(inst, *names):
+    start = time.perf_counter()
+    try: return INSTANCES.client(inst).get(*names)
+    finally: PMC_SECONDS.labels(inst.name).observe(time.perf_counter() - start)
+
+def list_ptp_processes():
+    """argv lists of the running ptp4l / phc2sys processes, None when pgrep itself failed."""
+    # One fork per cycle for every instance; match on the process name so `journalctl -u ptp4l` never counts
+    result = EXECUTOR.run(["pgrep", "-a", "^(ptp4l|phc2sys)$"])
+    if result.failed or result.returncode not in (0, 1): return None     # 1 = nothing matched
+    procs = []
+    for line in result.output.splitlines():
+        parts = line.split()
+        if len(parts) >= 2: procs.append(parts[1:])
+    return procs
+
+def instance_running(inst, procs):
+    for argv in procs or ():
+        if os.path.basename(argv[0]) != "ptp4l": continue
+        if inst.config_file in argv: return True
+        if inst.name == DEFAULT_INSTANCE and "-f" not in argv: return True
+    return False
+
+def summarize_port_states(states):
+    if 'SLAVE' in states: return 'SLAVE'
+    if all(s == 'MASTER' for s in states): return 'MASTER'
+    if 'UNCALIBRATED' in states: return 'UNCALIBRATED'
+    return states[0]
+
+STATUS_DATASETS = ("DEFAULT_DATA_SET", "CURRENT_DATA_SET", "PORT_DATA_SET", "TIME_STATUS_NP", "PARENT_DATA_SET")
+BMCA_DATASETS = ("DEFAULT_DATA_SET", "PARENT_DATA_SET", "TIME_PROPERTIES_DATA_SET")
+
+def pmc_query_cli(inst, *names):
+    # Same {name: dataset} shape as the native client, parsed in one pass from the pmc binary's output
+    cmd = ["pmc", "-u", "-b", "0", "-s", inst.uds_path, "-d", str(inst.domain)] + [f"GET {n}" for n in names]
+    return parse_datasets(run_cmd_safe(cmd))
+
+def pmc_datasets(inst, *names):
+    try: return pmc_query(inst, *names)
+    except PmcUnavailable:
+        # Socket exists but is not usable in-process - fall back to the pmc binary
+        return pmc_query_cli(inst, *names) if os.path.exists(inst.uds_path) else {}
+
+def get_pmc_dict(inst):
+    data = { "port_state": "UNKNOWN", "ports": [], "offset": 0, "path_delay": 0, "freq": 0, "steps_removed": -1, "gm_id": "Unknown", "gm_present": False, "clock_id": "", "parent": "" }
+    try: ds = pmc_datasets(inst, *STATUS_DATASETS)
+    except PmcError: return data
+    cur = ds.get("CURRENT_DATA_SET")
+    if cur and cur.offset_from_master is not None:
+        data['path_delay'] = cur.mean_path_delay
+        data['steps_removed'] = cur.steps_removed
+        data['offset'] = cur.offset_from_master
+    if "PARENT_DATA_SET" in ds:
+        data['gm_id'] = ds["PARENT_DATA_SET"].gm_identity
+        data['parent'] = ds["PARENT_DATA_SET"].parent_port_identity
+    ts = ds.get("TIME_STATUS_NP")
+    if ts and ts.cumulative_scaled_rate_offset is not None:
+        data['gm_present'] = bool(ts.gm_present)
+        # cumulativeScaledRateOffset = (rateRatio - 1) * 2^41 -> ppb
+        data['freq'] = ts.cumulative_scaled_rate_offset / 2**41 * 1e9
+    if "DEFAULT_DATA_SET" in ds: data['clock_id'] = ds["DEFAULT_DATA_SET"].clock_identity
+    # One entry per port so boundary clocks show every port, the summary keeps the old single state
+    data['ports'] = [{ "id": p.port_identity, "state": p.port_state } for p in ds.get("PORT_DATA_SET", []) if p.port_state]
+    if data['ports']: data['port_state'] = summarize_port_states([p["state"] for p in data['ports']])
     return data
 
-def get_bmca_info():
-    # Helper to parse hex/int
-    def p_val(txt, key, type_func=lambda x: int(x, 0)):
-        # Match "key value"
-        m = re.search(f'{key}\\s+([\\w\\d\\.\\-]+)', txt)
-        if not m: return None
-        try: return type_func(m.group(1))
-        except: return None
-
-    # 1. Get ALL Data in one go (More efficient)
-    cmd = ["pmc", "-u", "-b", "0", "GET DEFAULT_DATA_SET", "GET PARENT_DATA_SET", "GET TIME_PROPERTIES_DATA_SET"]
-    out_all = run_cmd_safe(cmd)
-    
-    # Check if we got valid output
-    if "RESPONSE" not in out_all:
-        return { "local": {}, "gm": {}, "flags": {}, "decision": [], "winner": "unknown", "error": "No PTP response" }
-
+def bmca_sources(ds):
+    if not ds: return None
+    d = ds.get("DEFAULT_DATA_SET"); p = ds.get("PARENT_DATA_SET"); t = ds.get("TIME_PROPERTIES_DATA_SET")
     local = {
-        "priority1": p_val(out_all, "priority1"),
-        "class": p_val(out_all, "clockClass"),
-        "accuracy": p_val(out_all, "clockAccuracy"), 
-        "variance": p_val(out_all, "offsetScaledLogVariance"),
-        "priority2": p_val(out_all, "priority2"),
-        "id": "", 
+        "priority1": d.priority1 if d else None,
+        "class": d.clock_class if d else None,
+        "accuracy": d.clock_accuracy if d else None,
+        "variance": d.offset_scaled_log_variance if d else None,
+        "priority2": d.priority2 if d else None,
+        "id": (d.clock_identity or "") if d else "",
     }
-    # Local ID usually appears under generic clockIdentity or PTP port identity
-    # In bundled output, we need to be careful. GET DEFAULT_DATA_SET response usually has clockIdentity.
-    # We'll look for the first clockIdentity which is usually local.
-    m_id = re.search(r'clockIdentity\s+([0-9a-fA-F\.]+)', out_all)
-    if m_id: local["id"] = m_id.group(1)
-
     gm = {
-        "priority1": p_val(out_all, "grandmasterPriority1"),
-        "class": p_val(out_all, "grandmasterClockQuality.clockClass"),
-        "accuracy": p_val(out_all, "grandmasterClockQuality.clockAccuracy"),
-        "variance": p_val(out_all, "grandmasterClockQuality.offsetScaledLogVariance"),
-        "priority2": p_val(out_all, "grandmasterPriority2"),
-        "id": ""
+        "priority1": p.gm_priority1 if p else None,
+        "class": p.gm_clock_class if p else None,
+        "accuracy": p.gm_clock_accuracy if p else None,
+        "variance": p.gm_offset_scaled_log_variance if p else None,
+        "priority2": p.gm_priority2 if p else None,
+        "id": (p.gm_identity or "") if p else "",
     }
-    m_gmid = re.search(r'grandmasterIdentity\s+([0-9a-fA-F\.]+)', out_all)
-    if m_gmid: gm["id"] = m_gmid.group(1)
-
     flags = {
-        "currentUtcOffset": p_val(out_all, "currentUtcOffset"),
-        "leap61": p_val(out_all, "leap61"),
-        "leap59": p_val(out_all, "leap59"),
-        "currentUtcOffsetValid": p_val(out_all, "currentUtcOffsetValid"),
-        "ptpTimescale": p_val(out_all, "ptpTimescale"),
-        "timeTraceable": p_val(out_all, "timeTraceable"),
-        "frequencyTraceable": p_val(out_all, "frequencyTraceable"),
-        "timeSource": p_val(out_all, "timeSource")
+        "currentUtcOffset": t.current_utc_offset if t else None,
+        "leap61": t.leap61 if t else None,
+        "leap59": t.leap59 if t else None,
+        "currentUtcOffsetValid": t.current_utc_offset_valid if t else None,
+        "ptpTimescale": t.ptp_timescale if t else None,
+        "timeTraceable": t.time_traceable if t else None,
+        "frequencyTraceable": t.frequency_traceable if t else None,
+        "timeSource": t.time_source if t else None,
     }
+    return local, gm, flags
+
+def get_bmca_info(inst):
+    # 1. Get ALL Data in one go (single batched management request, or one pmc run)
+    try: sources = bmca_sources(pmc_datasets(inst, *BMCA_DATASETS))
+    except PmcError: sources = None
+
+    # Check if we got valid output
+    if not sources:
+        return { "local": {}, "gm": {}, "flags": {}, "decision": [], "winner": "unknown", "error": "No PTP response" }
+    local, gm, flags = sources
 
     # 4. Analyze Winner
     decision = []
@@ -356,6 +340,18 @@ def save_user_profiles(profiles):
     with open(tmp_file, 'w') as f: json.dump(profiles, f, indent=4)
     os.rename(tmp_file, USER_PROFILES_FILE)
 
+def write_if_changed(path, content, mode=None):
+    """Atomically replace `path` unless it already holds `content`. Returns True when written."""
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content: return False
+    except OSError: pass
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f: f.write(content)
+    if mode is not None: os.chmod(tmp, mode)
+    os.rename(tmp, path)
+    return True
+
 def create_safe_wrapper_script(sync_mode, log_level):
     script_dir = os.path.dirname(SAFE_WRAPPER_SCRIPT)
     if not os.path.exists(script_dir):
@@ -373,7 +369,9 @@ exec /usr/sbin/phc2sys -s CLOCK_REALTIME -c $INTERFACE -O 0 -l {log_level}
 """
     else:
         content += f"""
-PTP_DEV_ID=$(ethtool -T $INTERFACE 2>/dev/null | grep -E "(Clock|index):" | sed 's/.*: //')
+# sysfs link first (no process spawn); ethtool only for drivers without it
+PTP_DEV_ID=$(ls /sys/class/net/$INTERFACE/device/ptp 2>/dev/null | sed -n 's/^ptp//p' | head -n 1)
+if [ -z "$PTP_DEV_ID" ]; then PTP_DEV_ID=$(ethtool -T $INTERFACE 2>/dev/null | grep -E "(Clock|index):" | sed 's/.*: //'); fi
 if [ -z "$PTP_DEV_ID" ]; then exit 1; fi
 PTP_DEV="/dev/ptp$PTP_DEV_ID"
 PTP_SECONDS=$(phc_ctl $PTP_DEV get 2>/dev/null | sed -n 's/.*clock time is \\([0-9]\\+\\)\\..*/\\1/p')
@@ -384,17 +382,17 @@ fi
 echo "✅ PTP time valid. Syncing System..."
 exec /usr/sbin/phc2sys -s $INTERFACE -c CLOCK_REALTIME -w -O 0 -l {log_level}
 """
-    try:
-        with open(SAFE_WRAPPER_SCRIPT, 'w') as f: f.write(content)
-        os.chmod(SAFE_WRAPPER_SCRIPT, 0o755)
+    try: return write_if_changed(SAFE_WRAPPER_SCRIPT, content, 0o755)
     except Exception as e: print(f"Error writing wrapper script: {e}")
+    return False
 
-def create_phc2sys_service(interface, sync_mode, log_level):
-    create_safe_wrapper_script(sync_mode, log_level)
+def create_phc2sys_service(interface, sync_mode, log_level, unit="ptp4l"):
+    """Returns True when the wrapper or the unit file changed (phc2sys needs a restart)."""
+    changed = create_safe_wrapper_script(sync_mode, log_level)
     service_content = f"""[Unit]
 Description=Safe System Clock Sync (phc2sys)
-After=ptp4l.service
-Requires=ptp4l.service
+After={unit}.service
+Requires={unit}.service
 [Service]
 Type=simple
 ExecStart={SAFE_WRAPPER_SCRIPT} {interface}
@@ -405,45 +403,482 @@ StandardError=journal
 [Install]
 WantedBy=multi-user.target
 """
-    tmp_svc = PHC2SYS_SERVICE_FILE + ".tmp"
-    with open(tmp_svc, 'w') as f: f.write(service_content)
-    os.rename(tmp_svc, PHC2SYS_SERVICE_FILE)
-    subprocess.run(["systemctl", "daemon-reload"], check=False)
-
-def restart_services_async(enable_phc2sys, master_mode=False, domain=0):
-    def _restart():
-        time.sleep(0.5)
-        subprocess.run(["systemctl", "restart", "ptp4l"], check=False)
-        time.sleep(2) 
-        if enable_phc2sys:
-            subprocess.run(["systemctl", "enable", "--now", "phc2sys-custom"], check=False)
-            subprocess.run(["systemctl", "restart", "phc2sys-custom"], check=False)
-        else:
-            subprocess.run(["systemctl", "stop", "phc2sys-custom"], check=False)
-            subprocess.run(["systemctl", "disable", "phc2sys-custom"], check=False)
-        
-        if master_mode:
-            print(f"Fire-and-forget injection for Domain {domain}")
-            subprocess.Popen([INJECT_SCRIPT, str(domain)], 
-                             stdout=subprocess.DEVNULL, 
-                             stderr=subprocess.DEVNULL)
-            
-    threading.Thread(target=_restart).start()
+    if write_if_changed(PHC2SYS_SERVICE_FILE, service_content):
+        systemctl("daemon-reload")
+        changed = True
+    return changed
+
+def phc2sys_owner():
+    """ptp4l unit phc2sys-custom is bound to (its Requires=), None when the service is not installed."""
+    try:
+        with open(PHC2SYS_SERVICE_FILE) as f:
+            for line in f:
+                if line.startswith("Requires="): return os.path.splitext(line.split("=", 1)[1].strip())[0]
+    except OSError: pass
+    return None
+
+def owns_phc2sys(inst):
+    # A single phc2sys-custom drives the system clock: only the instance it is bound to may rewrite or stop it
+    owner = phc2sys_owner()
+    return owner is None or owner == inst.unit or not any(i.unit == owner for i in INSTANCES.all())
+
+# --- Apply jobs ---
+READY_TIMEOUT = 10.0    # ptp4l answering on its management socket after a restart
+STATE_TIMEOUT = 60.0    # port reaching MASTER / SLAVE (announceReceiptTimeout x announce interval + BMCA)
+LOCK_TIMEOUT = 60.0     # servo reaching s2 after the port became SLAVE
+# Grandmaster identity advertised in master mode (clockClass 13 + the traceable flags ST 2110 requires)
+GM_SETTINGS = GrandmasterSettingsNP(clock_class=13, clock_accuracy=0x27, offset_scaled_log_variance=0xFFFF,
+                                    current_utc_offset=37, leap61=0, leap59=0, current_utc_offset_valid=1,
+                                    ptp_timescale=1, time_traceable=1, frequency_traceable=1, time_source=0x50)
+# ptp4l's own defaults for the GRANDMASTER_SETTINGS_NP fields a config does not set
+GM_DEFAULTS = { "clockClass": "248", "clockAccuracy": "0xFE", "offsetScaledLogVariance": "0xFFFF", "utc_offset": "37", "timeSource": "0xA0" }
+
+def configured_gm_settings(options):
+    """GRANDMASTER_SETTINGS_NP as ptp4l builds it at start from its config (no traceability flags)."""
+    v = lambda key: int(options.get(key) or GM_DEFAULTS[key], 0)
+    return GrandmasterSettingsNP(clock_class=v("clockClass"), clock_accuracy=v("clockAccuracy"), offset_scaled_log_variance=v("offsetScaledLogVariance"),
+                                 current_utc_offset=v("utc_offset"), leap61=0, leap59=0, current_utc_offset_valid=0,
+                                 ptp_timescale=0 if options.get("utc_timescale") == "1" else 1, time_traceable=0, frequency_traceable=0,
+                                 time_source=v("timeSource"))
+
+APPLY = ApplyQueue().start()
+
+def port_states(inst):
+    try: return [p.port_state for p in INSTANCES.client(inst).get("PORT_DATA_SET", timeout=0.2).get("PORT_DATA_SET", [])]
+    except PmcError: return None
+
+def inject_gm_settings(job, inst):
+    try:
+        INSTANCES.client(inst).set("GRANDMASTER_SETTINGS_NP", GM_SETTINGS)
+        job.step("grandmaster settings set")
+    except PmcUnavailable:
+        # Socket not usable in-process: hand over to the pmc based injector
+        subprocess.Popen([INJECT_SCRIPT, str(inst.domain), inst.uds_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        job.step("grandmaster settings handed to ptp-inject")
+    except PmcError as e:
+        job.step("grandmaster settings failed", str(e))
+
+def wait_ready(job, inst, master_mode, restarted_at):
+    """Follow the restarted instance: management socket -> port state -> GM settings / servo lock."""
+    states = wait_until(lambda: port_states(inst), READY_TIMEOUT, cancel=APPLY.has_pending)
+    if states is None: raise RuntimeError(f"ptp4l did not answer on {inst.uds_path}")
+    job.step("management socket ready", states)
+    job.result["time_to_ready"] = job.elapsed()
+
+    target = ("MASTER", "GRAND_MASTER") if master_mode else ("SLAVE",)
+    def reached():
+        st = port_states(inst)
+        return st if st and any(x in target for x in st) else None
+    states = wait_until(reached, STATE_TIMEOUT, cancel=APPLY.has_pending)
+    if states is None:
+        job.step("port did not reach " + "/".join(target), port_states(inst)); return
+    job.step("port " + summarize_port_states(states), states)
+    job.result["time_to_state"] = job.elapsed()
+    if master_mode:
+        inject_gm_settings(job, inst); return
+
+    # Locked = ptp4l's servo reports s2 in a log line newer than the restart
+    key = inst.unit + ".service"
+    def locked():
+        servo = JOURNAL.servo.get(key)
+        return servo if servo and servo.ts >= restarted_at and servo.state == 2 else None
+    servo = wait_until(locked, LOCK_TIMEOUT, interval=0.1, cancel=APPLY.has_pending)
+    if servo is None: job.step("servo not locked yet"); return
+    job.step("servo locked", { "offset": servo.offset, "freq": servo.freq })
+    job.result["time_to_lock"] = job.elapsed()
+
+def set_runtime_options(job, inst, values, master_mode):
+    """Change priorities / GM settings in place with management SETs. False when ptp4l refused (restart instead)."""
+    pmc = INSTANCES.client(inst)
+    try:
+        for key in ("priority1", "priority2"):
+            if key in values:
+                pmc.set(RUNTIME_OPTIONS[key], int(values[key], 0))
+                job.step(f"{key} set", int(values[key], 0))
+        if "clockClass" in values or "timeSource" in values:
+            # Built from the config, not read back: flags injected earlier (master mode) must not survive
+            gm = GM_SETTINGS if master_mode else configured_gm_settings(parse_ptp4l_config(inst.config_file)[0])
+            pmc.set("GRANDMASTER_SETTINGS_NP", gm)
+            job.step("grandmaster settings set", { "clockClass": gm.clock_class, "timeSource": gm.time_source })
+    except (PmcError, ValueError) as e:
+        job.step("runtime change refused", str(e))
+        return False
+    return True
+
+def write_config(config_file, text):
+    tmp_conf = config_file + ".tmp"
+    with open(tmp_conf, 'w') as f: f.write(text)
+    os.rename(tmp_conf, config_file)
+
+def run_apply(job, instance, config_file, cfg, phc_args, master_mode):
+    try:
+        with open(config_file, 'r') as f: old_cfg = f.read()
+    except OSError: old_cfg = None
+    changes = diff_config(old_cfg, cfg)
+    job.result["changes"] = [c._asdict() for c in changes]
+    written = cfg != old_cfg
+    if written:
+        if old_cfg is not None: shutil.copy(config_file, config_file + ".bak")
+        write_config(config_file, cfg)
+        job.step("config written", config_file)
+    try: apply_changes(job, instance, config_file, changes, phc_args, master_mode)
+    except Exception:
+        # The file on disk must stay what ptp4l runs with, or an identical retry would report "no changes"
+        if written:
+            if old_cfg is None: os.unlink(config_file)
+            else: write_config(config_file, old_cfg)
+            INSTANCES.refresh()
+            job.step("config restored", config_file)
+        raise
+    finally:
+        # Screens see the outcome now rather than at the next scheduled sample
+        SAMPLER.refresh()
+
+def apply_changes(job, instance, config_file, changes, phc_args, master_mode):
+    INSTANCES.refresh()
+    inst = INSTANCES.get(instance)
+    if inst is None: raise RuntimeError(f"{config_file} is outside {PTP_CONFIG_DIR}")
+
+    # Only what really changed is applied: runtime options by SET, log options at the next restart
+    procs = list_ptp_processes()
+    if procs is None: job.step("process check failed, restarting to be safe")
+    restart = needs_restart(changes) or not instance_running(inst, procs)
+    if not restart and runtime_values(changes):
+        restart = not set_runtime_options(job, inst, runtime_values(changes), master_mode)
+    deferred = [c.key for c in changes if c.kind == "deferred"]
+    if deferred and not restart: job.step("applied on next restart", deferred)
+    phc_running = any(os.path.basename(argv[0]) == "phc2sys" for argv in procs or ())
+    if not owns_phc2sys(inst):
+        job.step("phc2sys left alone", f"phc2sys-custom belongs to {phc2sys_owner()}")
+        phc_args = phc_running = None
+    phc_changed = create_phc2sys_service(*phc_args) if phc_args else False
+    job.result["restarted"] = restart
+
+    if restart:
+        # Template instances (ptp4l@<name>) are enabled on first apply so they survive a reboot
+        if inst.unit != "ptp4l":
+            r = systemctl("enable", inst.unit)
+            if not r.ok: job.step("enable failed", r.describe())
+        restarted_at = time.time()
+        r = systemctl("restart", inst.unit)
+        if not r.ok: raise RuntimeError(f"restart of {inst.unit} failed: {r.describe()}")
+        job.step("ptp4l restarted", inst.unit)
+    # phc2sys -w waits for ptp4l itself, no need to hold it back
+    if phc_args and (restart or phc_changed or not phc_running):
+        enabled, r = EXECUTOR.run_all([["systemctl", "enable", "phc2sys-custom"], ["systemctl", "restart", "phc2sys-custom"]], SYSTEMCTL_TIMEOUT)
+        if not enabled.ok: job.step("enable failed", enabled.describe())
+        job.step("phc2sys restarted" if r.ok else "phc2sys restart failed", None if r.ok else r.describe())
+    elif not phc_args and phc_running:
+        r = systemctl("disable", "--now", "phc2sys-custom")
+        job.step("phc2sys stopped" if r.ok else "phc2sys stop failed", None if r.ok else r.describe())
+    if restart: wait_ready(job, inst, master_mode, restarted_at)
+    elif not job.steps: job.step("no changes")
+
+def run_stop(job, instance):
+    units = [unit_name(instance)]
+    if phc2sys_owner() == units[0]: units.append("phc2sys-custom")
+    # Independent units stop concurrently
+    for unit, r in zip(units, EXECUTOR.run_all([["systemctl", "stop", unit] for unit in units], SYSTEMCTL_TIMEOUT)):
+        if r.ok: job.step("stopped", unit)
+        else: job.step("stop failed", { "unit": unit, "error": r.describe() })
+    SAMPLER.refresh()
 
 def safe_int(val, default=0):
     try: return int(val)
     except: return default
 
+# --- Telemetry Sampler ---
+def collect_status(inst, procs):
+    data = { "instance": inst.name, "ptp4l": "STOPPED", "phc2sys": "STOPPED", "port": "Offline", "ports": [], "offset": 0, "path_delay": 0, "freq": 0, "servo_freq": None, "steps_removed": -1, "gm": "Scanning...", "gm_id": "", "clock_id": "", "parent": "", "ptp_time": "--", "phc_offset": None, "is_self": False }
+    iface = inst.interface
+    if iface:
+        t = get_ptp_time(iface)
+        if t: data["ptp_time"] = t
+        # PHC - CLOCK_REALTIME (best of 5 PTP_SYS_OFFSET readings); ~0 when phc2sys runs with -O 0
+        off = PHC.sys_offset(iface)
+        if off: data["phc_offset"] = off[0]
+    if procs is None:
+        # pgrep failed: say so instead of reporting a running ptp4l as stopped
+        data["ptp4l"] = data["phc2sys"] = "UNKNOWN"
+        return data
+    if any(os.path.basename(argv[0]) == "phc2sys" for argv in procs): data["phc2sys"] = "RUNNING"
+    if instance_running(inst, procs): data["ptp4l"] = "RUNNING"
+    if data["ptp4l"] == "RUNNING":
+        pmc = get_pmc_dict(inst)
+        if 'port_state' in pmc: data["port"] = pmc['port_state']
+        data["ports"] = pmc.get('ports', [])
+        if 'offset' in pmc: data["offset"] = pmc['offset']
+        if 'path_delay' in pmc: data["path_delay"] = pmc['path_delay']
+        if 'freq' in pmc: data["freq"] = pmc['freq']
+        if 'steps_removed' in pmc: data["steps_removed"] = pmc['steps_removed']
+        # Raw identities let a fleet aggregator rebuild the GM -> BC -> slave tree
+        for k in ("gm_id", "clock_id", "parent"): data[k] = pmc.get(k, "")
+        if 'gm_id' in pmc:
+            data["gm"] = pmc['gm_id']
+            if 'clock_id' in pmc and pmc['gm_id'] == pmc['clock_id']:
+                data["is_self"] = True
+                data["gm"] += " (Self)"
+        # Servo frequency adjustment comes from ptp4l's own log lines, pmc does not expose it
+        servo = JOURNAL.servo.get(inst.unit + ".service")
+        if servo and time.time() - servo.ts <= SERVO_MAX_AGE: data["servo_freq"] = servo.freq
+        if data["port"] in ["MASTER", "GRAND_MASTER"]:
+            data["offset"] = 0; data["path_delay"] = 0; data["steps_removed"] = 0; data["is_self"] = True
+    return data
+
+def sample_instance(inst, procs):
+    return { "status": collect_status(inst, procs), "bmca": get_bmca_info(inst) }
+
+# linuxptp defaults for intervals a config does not set
+DEFAULT_LOG_INTERVALS = { "logSyncInterval": 0, "logAnnounceInterval": 1, "logMinDelayReqInterval": 0 }
+_intervals_key = [None]
+
+def update_expected_intervals(insts):
+    """Configured Sync / Announce / Delay_Req intervals per domain, for the radar's cadence checks."""
+    key = tuple((i.name, i.mtime) for i in insts)
+    if key == _intervals_key[0]: return
+    _intervals_key[0] = key
+    expected = {}
+    for inst in insts:
+        if inst.mtime is None: continue
+        options = parse_ptp4l_config(inst.config_file)[0]
+        logs = {}
+        for name, default in DEFAULT_LOG_INTERVALS.items():
+            try: logs[name] = int(options.get(name, default))
+            except ValueError: logs[name] = default
+        expected.setdefault(inst.domain, { 0x0: 2.0 ** logs["logSyncInterval"], 0xB: 2.0 ** logs["logAnnounceInterval"],
+                                           0x1: 2.0 ** logs["logMinDelayReqInterval"] })
+    CLIENTS.expected = expected
+
+def collect_instances():
+    insts = INSTANCES.current()
+    update_expected_intervals(insts)
+    procs = list_ptp_processes()
+    futures = [(inst.name, SAMPLE_POOL.submit(sample_instance, inst, procs)) for inst in insts]
+    return {name: f.result() for name, f in futures}
+
+def instance_rows(data):
+    return {name: instance_row(name, sample) for name, sample in (data.get("instances") or {}).items()}
+
+def primary_instance(data):
+    return (data.get("instances") or {}).get(DEFAULT_INSTANCE) or {}
+
+def instance_row(name, sample):
+    # Compact per-instance summary pushed to dashboards
+    st = sample.get("status", {})
+    return { "ptp4l": st.get("ptp4l"), "port": st.get("port"), "offset": st.get("offset"), "gm": st.get("gm") }
+
+def collect_clients():
+    return CLIENTS.export(time.time())
+
+def radar_row(c):
+    # Compact projection pushed to dashboards (identity only, so it changes rarely); full stats stay behind /api/clients
+    return { "ip": c["ip"], "mac": c["mac"], "iface": c["iface"], "is_self": c["is_self"], "clock_id": c["clock_id"], "domain": c["domain"] }
+
+def radar_counters(c):
+    # The part of a radar row that moves every cycle
+    return { "last_seen": int(c["last_seen"]), "rate": round(c["rate"], 1), "lost": c["lost"], "flags": c["flags"] }
+
+def radar_full(c):
+    return { **radar_row(c), **radar_counters(c) }
+
+SAMPLER = TelemetrySampler({
+    "instances": collect_instances,
+    "clients": collect_clients,
+}, interval=SAMPLE_INTERVAL, derived={
+    # Top-level status / bmca keep describing the default instance
+    "status": lambda data: primary_instance(data).get("status", {}),
+    "bmca": lambda data: primary_instance(data).get("bmca", {}),
+})
+
+# --- Metric History ---
+HISTORY_METRICS = { "offset": "d", "path_delay": "d", "freq": "d", "servo_freq": "d", "phc_offset": "d", "port_state": "b" }
+HISTORY = MetricHistory(max(1, int(HISTORY_HOURS * 3600 / SAMPLE_INTERVAL)), HISTORY_METRICS)
+PORT_STATE_CODES = {name: code for code, name in PORT_STATES.items()}
+
+def record_history(prev, snap):
+    st = snap.data.get("status")
+    if not st: return
+    values = { "port_state": PORT_STATE_CODES.get(st.get("port"), 0), "phc_offset": st.get("phc_offset") }
+    if st.get("ptp4l") == "RUNNING" and st.get("port") in PORT_STATE_CODES:
+        values.update({ "offset": st["offset"], "path_delay": st["path_delay"], "freq": st["freq"], "servo_freq": st.get("servo_freq") })
+    values["gm_id"] = st.get("gm_id")
+    HISTORY.record(snap.time, values)
+    if STORE: STORE.append(snap.time, values, running=st.get("ptp4l") == "RUNNING")
+
+def open_store():
+    """(MetricStore, None) with the in-memory history refilled from it, (None, reason) when the data dir is unusable."""
+    try: store = MetricStore(os.path.join(DATA_DIR, "metrics"), SAMPLE_INTERVAL, STORE_DAYS, STORE_MAX_MB << 20)
+    except OSError as e:
+        traceback.print_exc()
+        return None, str(e)
+    now = time.time()
+    for t, off, delay, freq, sfreq, phc, _, port, flags, _ in store.records(now - HISTORY_HOURS * 3600, now):
+        values = { "offset": off, "path_delay": delay, "freq": freq, "servo_freq": sfreq, "phc_offset": phc, "port_state": port }
+        HISTORY.record(t, {k: v for k, v in values.items() if v == v})
+    return store, None
+
+STORE, STORE_ERROR = open_store()
+if STORE: atexit.register(STORE.close)
+
+# --- Live Stream (single producer, fan-out to every open dashboard) ---
+STREAM = Broadcaster(max_subscribers=STREAM_MAX_CLIENTS)
+
+CLIENT_COUNTERS_INTERVAL = 5.0     # seconds between radar counter updates on the stream
+_counters_sent = [0.0, {}]         # time and content of the last counter update
+
+def publish_snapshot_delta(prev, snap):
+    if not STREAM.subscriber_count: return
+    prev_data = prev.data if prev else {}
+    changed = diff_fields(prev_data.get("status"), snap.data.get("status"))
+    if changed: STREAM.publish("status", changed)
+    changed = diff_fields(prev_data.get("bmca"), snap.data.get("bmca"))
+    if changed: STREAM.publish("bmca", changed)
+    prev_rows, rows = instance_rows(prev_data), instance_rows(snap.data)
+    changed = diff_fields(prev_rows, rows)
+    changed.update({name: None for name in prev_rows if name not in rows})
+    if changed: STREAM.publish("instances", changed)
+    rows = snap.data.get("clients") or []
+    upsert, expire = diff_clients([radar_row(c) for c in prev_data.get("clients") or []], [radar_row(c) for c in rows])
+    counters = {c["ip"]: radar_counters(c) for c in rows}
+    # New or changed endpoints go out complete; counters of the others follow at most every CLIENT_COUNTERS_INTERVAL
+    for row in upsert: row.update(counters[row["ip"]])
+    if upsert or expire: STREAM.publish("clients", {"upsert": upsert, "expire": expire})
+    if snap.time - _counters_sent[0] >= CLIENT_COUNTERS_INTERVAL:
+        changed = diff_fields(_counters_sent[1], counters)
+        _counters_sent[:] = [snap.time, counters]
+        if changed: STREAM.publish("client_counters", changed)
+    # Servo statistics move every cycle: pushed once per cycle instead of polled by every tab
+    STREAM.publish("servo", servo_rows(snap.data))
+    STREAM.publish("foreign", foreign_masters(snap.data))
+
+# --- Journal (one long-lived journalctl -f, no per-request forks) ---
+JOURNAL = JournalFollower(LOG_UNITS, backlog=LOG_TAIL)
+
+def publish_log_records(records):
+    if STREAM.subscriber_count: STREAM.publish("logs", {"lines": [r.message for r in records], "cursor": records[-1].cursor})
+
+def log_entry(r):
+    return { "cursor": r.cursor, "ts": r.ts, "unit": r.unit, "priority": r.priority, "ident": r.ident, "message": r.message }
+
+def count_log_records(records):
+    for r in records: JOURNAL_RECORDS.labels(r.unit).inc()
+
+JOURNAL.listeners.append(publish_log_records)
+JOURNAL.listeners.append(count_log_records)
+JOURNAL.start()
+atexit.register(JOURNAL.stop)
+
+def record_metrics(prev, snap):
+    SAMPLE_SECONDS.observe(snap.duration)
+    for name, sample in (snap.data.get("instances") or {}).items():
+        st = sample.get("status") or {}
+        if st.get("ptp4l") == "RUNNING" and st.get("port") == "SLAVE": OFFSET_ABS_NS.labels(name).observe(abs(st.get("offset") or 0))
+
+def snapshot_metrics():
+    # Rendered from the latest snapshot at scrape time: a scrape never starts new sampling work
+    snap = SAMPLER.snapshot(timeout=0)
+    data = snap.data if snap else {}
+    per = [(name, s.get("status") or {}) for name, s in (data.get("instances") or {}).items()]
+    up = [(name, st) for name, st in per if st.get("ptp4l") == "RUNNING"]
+    yield ("ptp4l_up", "gauge", "ptp4l process running", ("instance",), [((n,), st.get("ptp4l") == "RUNNING") for n, st in per])
+    yield ("phc2sys_up", "gauge", "phc2sys process running", (), [((), (data.get("status") or {}).get("phc2sys") == "RUNNING")])
+    yield ("ptp_port_state", "gauge", "Port state code (IEEE 1588 portState)", ("instance",), [((n,), PORT_STATE_CODES.get(st.get("port"), 0)) for n, st in per])
+    yield ("ptp_offset_ns", "gauge", "Offset from master", ("instance",), [((n,), st.get("offset")) for n, st in up])
+    yield ("ptp_path_delay_ns", "gauge", "Mean path delay", ("instance",), [((n,), st.get("path_delay")) for n, st in up])
+    yield ("ptp_rate_offset_ppb", "gauge", "Cumulative scaled rate offset", ("instance",), [((n,), st.get("freq")) for n, st in up])
+    yield ("ptp_servo_freq_ppb", "gauge", "Servo frequency adjustment from ptp4l log", ("instance",), [((n,), st["servo_freq"]) for n, st in up if st.get("servo_freq") is not None])
+    yield ("ptp_steps_removed", "gauge", "Steps removed from the grandmaster", ("instance",), [((n,), st.get("steps_removed")) for n, st in up])
+    yield ("ptp_phc_sys_offset_ns", "gauge", "PHC minus system clock", ("instance",), [((n,), st["phc_offset"]) for n, st in per if st.get("phc_offset") is not None])
+    yield ("ptp_grandmaster_info", "gauge", "Current grandmaster identity", ("instance", "gm_identity", "clock_identity"), [((n, st.get("gm_id"), st.get("clock_id")), 1) for n, st in up])
+
+    by_iface = {}
+    for c in data.get("clients") or []:
+        agg = by_iface.setdefault(c["iface"], [0, 0.0, 0])
+        agg[0] += 1; agg[1] += c["rate"]; agg[2] += c["lost"]
+    yield ("ptp_clients", "gauge", "PTP endpoints seen by the client radar", ("iface",), [((i,), a[0]) for i, a in by_iface.items()])
+    yield ("ptp_client_messages_per_second", "gauge", "PTP message rate of all radar endpoints", ("iface",), [((i,), round(a[1], 3)) for i, a in by_iface.items()])
+    yield ("ptp_client_lost_messages", "gauge", "Sequence gaps of the currently tracked endpoints", ("iface",), [((i,), a[2]) for i, a in by_iface.items()])
+
+    caps = MONITOR.capture_stats()
+    yield ("ptpweb_capture_frames_total", "counter", "Frames read by the radar capture", ("iface",), [((i,), v[0]) for i, v in caps.items()])
+    yield ("ptpweb_capture_decoded_total", "counter", "Frames decoded as PTP by the radar capture", ("iface",), [((i,), v[1]) for i, v in caps.items()])
+    yield ("ptpweb_capture_kernel_packets_total", "counter", "Packets accepted by the capture socket filter", ("iface",), [((i,), v[2]) for i, v in caps.items()])
+    yield ("ptpweb_capture_kernel_drops_total", "counter", "Packets dropped by the kernel before the capture read them", ("iface",), [((i,), v[3]) for i, v in caps.items()])
+    yield ("ptpweb_clients_evicted_total", "counter", "Radar endpoints evicted by the table size cap", (), [((), CLIENTS.evicted)])
+    yield ("ptpweb_snapshot_age_seconds", "gauge", "Age of the served telemetry snapshot", (), [((), round(time.time() - snap.time, 3) if snap else None)])
+    yield ("ptpweb_metric_store_up", "gauge", "On-disk metric store open (0: history is memory-only)", (), [((), STORE is not None)])
+    yield ("ptpweb_stream_subscribers", "gauge", "Open /api/stream connections", (), [((), STREAM.subscriber_count)])
+
+# --- Servo Statistics (incremental, one analyzer per instance) ---
+SERVO = ServoStats(SAMPLE_INTERVAL, SERVO_WINDOW, OFFSET_LIMIT_NS)
+
+def record_servo(prev, snap):
+    instances = snap.data.get("instances") or {}
+    for name, sample in instances.items():
+        st = sample.get("status") or {}
+        port = st.get("port") if st.get("ptp4l") == "RUNNING" else "Offline"
+        gm = st.get("gm_id") if st.get("gm_id") not in ("", "Unknown") else None
+        SERVO.add(name, snap.time, st.get("offset") or 0, st.get("freq"), port, gm)
+    SERVO.retain(instances)
+
+def servo_rows(data):
+    return {name: SERVO.snapshot(name) for name in data.get("instances") or {}}
+
+def record_servo_state(unit, servo):
+    if servo.state is None: return      # summary line, not a state transition
+    # ptp4l.service -> default, ptp4l@<name>.service -> <name>
+    for inst in INSTANCES.all():
+        if inst.unit + ".service" == unit: return SERVO.servo_event(inst.name, servo.ts, servo.state)
+
+JOURNAL.servo_listeners.append(record_servo_state)
+
+METRICS.add_collector(snapshot_metrics)
+SAMPLER.add_listener(record_servo)
+SAMPLER.add_listener(record_history)
+SAMPLER.add_listener(record_metrics)
+SAMPLER.add_listener(publish_snapshot_delta)
+SAMPLER.start()
+
+# --- Fleet Aggregator (only runs when peers are configured) ---
+def load_fleet_peers():
+    if FLEET_PEERS: return [p for p in FLEET_PEERS.split(",") if p.strip()]
+    if os.path.exists(FLEET_PEERS_FILE):
+        try:
+            with open(FLEET_PEERS_FILE, 'r') as f: return json.load(f)
+        except: pass
+    return []
+
+FLEET = FleetAggregator(load_fleet_peers(), interval=SAMPLE_INTERVAL).start()
+
 # --- Routes ---
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    start = g.get('request_start')
+    # Label by route pattern, not raw path, so cardinality stays bounded
+    if start is not None: HTTP_SECONDS.labels(request.url_rule.rule if request.url_rule else "unmatched").observe(time.perf_counter() - start)
+    return response
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
+
 
 @app.route('/')
 def index():
-    nics = []
-    try:
-        nics = [n for n in os.listdir('/sys/class/net/') if not n.startswith('lo')]
-        nics.sort()
-    except: pass
-    return render_template('index.html', nics=nics, hostname=socket.gethostname())
+    return render_template('index.html', nics=HOST.nics(), hostname=socket.gethostname())
+
+@app.route('/fleet')
+def fleet_page():
+    return render_template('fleet.html', hostname=socket.gethostname(), enabled=bool(FLEET.nodes))
+
+@app.route('/api/fleet')
+def get_fleet():
+    if not FLEET.nodes: return jsonify({"status": "error", "message": "Fleet mode disabled (set PTP_WEB_FLEET_PEERS)"}), 404
+    return jsonify(FLEET.view)
 
 @app.route('/api/profiles', methods=['GET', 'POST'])
 def handle_profiles():
@@ -473,6 +908,11 @@ def delete_profile(pid):
 @app.route('/api/apply', methods=['POST'])
 def apply_config():
     req = request.json
+    instance = req.get('instance') or DEFAULT_INSTANCE
+    if not NAME_RE.match(instance): return jsonify({"status":"error", "message":"Invalid instance name"}), 400
+    config_file = config_path(instance, PTP_CONFIG_DIR)
+    unit = unit_name(instance)
+    uds_path = default_uds_path(instance)
     target_if = req.get('interface')
     mode = req.get('clockMode', 'OC')
     if mode == 'BC':
@@ -482,12 +922,11 @@ def apply_config():
         if not validate_interface(target_if): return jsonify({"status":"error", "message":"Invalid Interface"}), 400
 
     monitor_mode = req.get('monitorMode', 'disabled')
-    MONITOR_CONFIG["mode"] = monitor_mode
     # Populate interfaces list based on mode
     if mode == 'BC':
-        MONITOR_CONFIG["interfaces"] = [x for x in [req.get('bcSlaveIf'), req.get('bcMasterIf')] if x]
+        MONITOR.configure(monitor_mode, [req.get('bcSlaveIf'), req.get('bcMasterIf')])
     else:
-        MONITOR_CONFIG["interfaces"] = [target_if] if target_if else []
+        MONITOR.configure(monitor_mode, [target_if])
     
     ts_mode = req.get('timeStamping', 'hardware')
     sync_mode = req.get('syncMode')
@@ -496,14 +935,14 @@ def apply_config():
     log_level = safe_int(req.get('logLevel'), 6)
     if ts_mode not in ['hardware', 'software', 'legacy', 'onestep']: ts_mode = 'hardware'
     
-    if os.path.exists(CONFIG_FILE): shutil.copy(CONFIG_FILE, CONFIG_FILE + ".bak")
-    
     is_master_mode = (sync_mode == 'master')
     clock_class = 13 if is_master_mode else 248
     time_source = "0x40" if is_master_mode else "0xA0"
 
     try:
         cfg = f"[global]\nnetwork_transport UDPv4\ntime_stamping {ts_mode}\ndelay_mechanism E2E\ndomainNumber {safe_int(req.get('domain'))}\npriority1 {safe_int(req.get('priority1'), 128)}\npriority2 {safe_int(req.get('priority2'), 128)}\nclockClass {clock_class}\ntimeSource {time_source}\nlogAnnounceInterval {safe_int(req.get('logAnnounceInterval'), 1)}\nlogSyncInterval {safe_int(req.get('logSyncInterval'))}\nlogMinDelayReqInterval {safe_int(req.get('logMinDelayReqInterval'))}\nannounceReceiptTimeout {safe_int(req.get('announceReceiptTimeout'), 3)}\nlogging_level {log_level}\nuse_syslog 1\nverbose 1\n"
+        # Every extra instance needs its own management socket next to the default one
+        if instance != DEFAULT_INSTANCE: cfg += f"uds_address {uds_path}\n"
         final_target_if = ""
         if mode == 'BC':
             cfg += "boundary_clock_jbod 1\n\n"
@@ -513,69 +952,153 @@ def apply_config():
         else:
             cfg += "\n"; target_if = req.get('interface'); cfg += f"[{target_if}]\n"; final_target_if = target_if
 
-        tmp_conf = CONFIG_FILE + ".tmp"
-        with open(tmp_conf, 'w') as f: f.write(cfg)
-        os.rename(tmp_conf, CONFIG_FILE)
-
         should_enable_phc = (sync_mode != 'none' and final_target_if)
-        if should_enable_phc: create_phc2sys_service(final_target_if, sync_mode, log_level)
-
-        domain_val = safe_int(req.get('domain'), 0)
-        restart_services_async(should_enable_phc, is_master_mode, domain_val)
-        return jsonify({"status": "success"})
+        phc_args = (final_target_if, sync_mode, log_level, unit) if should_enable_phc else None
+        # Writing the config and restarting run in the apply queue, one job at a time
+        job = APPLY.submit("apply", instance, lambda job: run_apply(job, instance, config_file, cfg, phc_args, is_master_mode))
+        return jsonify({"status": "success", "job": job.id})
     except Exception as e: return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/apply/<job_id>')
+def get_apply_job(job_id):
+    job = APPLY.get(job_id)
+    if job is None: return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+def instance_sample(key):
+    # ?instance=<name> selects one ptp4l instance; without it the default instance is returned
+    name = request.args.get('instance')
+    if not name: return jsonify(SAMPLER.get(key, {}))
+    sample = (SAMPLER.get("instances") or {}).get(name)
+    if sample is None: return jsonify({"status": "error", "message": "Unknown instance"}), 404
+    return jsonify(sample.get(key, {}))
+
 @app.route('/api/status')
 def get_status():
-    global STATUS_CACHE
-    now = time.time()
-    if STATUS_CACHE['data'] and (now - STATUS_CACHE['time'] < 1.0): return jsonify(STATUS_CACHE['data'])
+    return instance_sample("status")
 
-    data = { "ptp4l": "STOPPED", "phc2sys": "STOPPED", "port": "Offline", "offset": 0, "path_delay": 0, "steps_removed": -1, "gm": "Scanning...", "ptp_time": "--", "is_self": False }
-    iface = get_current_interface()
-    if iface:
-        t = get_ptp_time(iface)
-        if t: data["ptp_time"] = t
-    if run_cmd_safe(["pgrep", "-x", "ptp4l"]): data["ptp4l"] = "RUNNING"
-    if data["ptp4l"] == "RUNNING":
-        pmc = get_pmc_dict()
-        if 'port_state' in pmc: data["port"] = pmc['port_state']
-        if 'offset' in pmc: data["offset"] = pmc['offset']
-        if 'path_delay' in pmc: data["path_delay"] = pmc['path_delay']
-        if 'steps_removed' in pmc: data["steps_removed"] = pmc['steps_removed']
-        if 'phc2sys_state' in pmc: data["phc2sys"] = pmc['phc2sys_state']
-        if 'gm_id' in pmc:
-            data["gm"] = pmc['gm_id']
-            if 'clock_id' in pmc and pmc['gm_id'] == pmc['clock_id']:
-                data["is_self"] = True
-                data["gm"] += " (Self)"
-        if data["port"] in ["MASTER", "GRAND_MASTER"]:
-            data["offset"] = 0; data["path_delay"] = 0; data["steps_removed"] = 0; data["is_self"] = True
-            
-    STATUS_CACHE = { "time": now, "data": data }
-    return jsonify(data)
+@app.route('/api/instances')
+def get_instances():
+    samples = SAMPLER.get("instances") or {}
+    return jsonify([{ **inst.to_dict(), **instance_row(inst.name, samples.get(inst.name, {})) } for inst in INSTANCES.all()])
 
 @app.route('/api/clients')
 def get_clients():
-    with CLIENTS_LOCK:
-        clients_list = []
-        for ip, info in CLIENTS.items():
-            clients_list.append({ "ip": ip, "mac": info["mac"], "last_seen": info["last_seen"], "iface": info.get("iface", "?"), "is_self": info.get("is_self", False) })
-        return jsonify(clients_list)
+    # Sorting / filtering / paging run on the sampled snapshot, never under the capture lock
+    total, page = query_clients(SAMPLER.get("clients", []),
+                                sort=request.args.get('sort', 'ip'),
+                                iface=request.args.get('iface'),
+                                domain=request.args.get('domain', type=int),
+                                msg_type=request.args.get('type'),
+                                search=request.args.get('q'),
+                                offset=request.args.get('offset', 0, type=int),
+                                limit=request.args.get('limit', type=int))
+    return jsonify({ "total": total, "offset": request.args.get('offset', 0, type=int), "clients": page })
 
 @app.route('/api/logs')
 def get_logs():
-    return jsonify({"logs": run_cmd_safe(["journalctl", "-u", "ptp4l", "-u", "phc2sys-custom", "-n", "30", "--no-pager", "--output", "cat"])})
+    # ?after=<cursor> returns only newer entries; without it the last LOG_TAIL lines (old behaviour)
+    after = request.args.get('after')
+    units = [u for u in request.args.get('unit', '').split(',') if u]
+    limit = min(max(request.args.get('limit', 500 if after else LOG_TAIL, type=int), 1), 2000)
+    records, cursor, reset, truncated = JOURNAL.since(after, units=units, max_priority=request.args.get('priority', type=int), limit=limit)
+    return jsonify({ "cursor": cursor, "reset": reset, "truncated": truncated, "entries": [log_entry(r) for r in records], "logs": "\n".join(r.message for r in records) })
+
+@app.route('/api/history')
+def get_history():
+    now = time.time()
+    t_to = request.args.get('to', type=float) or now
+    t_from = request.args.get('from', type=float) or (t_to - 3600)
+    points = min(max(request.args.get('points', 500, type=int), 1), 5000)
+    metrics = [m for m in request.args.get('metric', 'offset').split(',') if m]
+    unknown = [m for m in metrics if m not in HISTORY_METRICS]
+    if unknown: return jsonify({"status": "error", "message": f"Unknown metric: {', '.join(unknown)}"}), 400
+    if t_from >= t_to: return jsonify({"status": "error", "message": "Invalid time range"}), 400
+    # Ranges older than the in-memory window are read from the on-disk store
+    source = "store" if STORE and t_from < now - HISTORY_HOURS * 3600 else "memory"
+    if source == "store": series = {m: downsample(*STORE.series(m, t_from, t_to), t_from, t_to, points) for m in metrics}
+    else: series = {m: HISTORY.query(m, t_from, t_to, points) for m in metrics}
+    return jsonify({ "from": t_from, "to": t_to, "points": points, "source": source, "columns": ["t", "min", "max", "mean", "count"], "series": series,
+                     "store": { "enabled": STORE is not None, "error": STORE_ERROR } })
+
+@app.route('/api/history/export')
+def export_history():
+    if not STORE: return jsonify({"status": "error", "message": f"Metric store not available: {STORE_ERROR}"}), 503
+    t_to = request.args.get('to', type=float) or time.time()
+    t_from = request.args.get('from', type=float) or (t_to - 3600)
+    if t_from >= t_to: return jsonify({"status": "error", "message": "Invalid time range"}), 400
+    name = f"ptp-metrics-{datetime.fromtimestamp(t_from):%Y%m%d-%H%M%S}-{datetime.fromtimestamp(t_to):%Y%m%d-%H%M%S}.csv"
+    return Response(STORE.csv(t_from, t_to, PORT_STATES), mimetype='text/csv', headers={'Content-Disposition': f'attachment; filename={name}'})
+
+@app.route('/api/stream')
+def stream_events():
+    q = STREAM.subscribe()
+    if q is None: return jsonify({"status": "error", "message": "Too many stream clients"}), 503
+    snap = SAMPLER.snapshot()
+    data = snap.data if snap else {}
+    tail = JOURNAL.tail(LOG_TAIL)
+    initial = [sse_format("snapshot", { "status": data.get("status", {}), "bmca": data.get("bmca", {}), "clients": [radar_full(c) for c in data.get("clients", [])], "instances": instance_rows(data), "servo": servo_rows(data), "foreign": foreign_masters(data), "logs": [r.message for r in tail], "log_cursor": tail[-1].cursor if tail else None })]
+    return Response(STREAM.events(q, initial), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/stop', methods=['POST'])
 def stop_service():
-    subprocess.run(["systemctl", "stop", "ptp4l"], check=False)
-    subprocess.run(["systemctl", "stop", "phc2sys-custom"], check=False)
-    return jsonify({"status": "success"})
+    instance = (request.get_json(silent=True) or {}).get('instance') or DEFAULT_INSTANCE
+    if not NAME_RE.match(instance): return jsonify({"status":"error", "message":"Invalid instance name"}), 400
+    job = APPLY.submit("stop", instance, lambda job: run_stop(job, instance))
+    return jsonify({"status": "success", "job": job.id})
 
 @app.route('/api/bmca')
 def get_bmca_api():
-    return jsonify(get_bmca_info())
+    return instance_sample("bmca")
+
+def foreign_masters(data, iface=None, domain=None):
+    # The GM each running instance follows, so a better or competing announcer stands out
+    selected = {}
+    for sample in (data.get("instances") or {}).values():
+        st = sample.get("status") or {}
+        inst = INSTANCES.get(st.get("instance"))
+        if inst and st.get("ptp4l") == "RUNNING" and st.get("gm_id"): selected.setdefault(inst.domain, st["gm_id"])
+    groups = FOREIGN.query(time.time(), iface=iface, domain=domain)
+    for grp in groups:
+        grp["selected_gm"] = selected.get(grp["domain"])
+        for row in grp["masters"]: row["selected"] = row["gm_identity"] == grp["selected_gm"]
+    return { "total": len(FOREIGN), "groups": groups }
+
+@app.route('/api/foreign_masters')
+def get_foreign_masters():
+    snap = SAMPLER.snapshot()
+    return jsonify(foreign_masters(snap.data if snap else {}, request.args.get('iface'), request.args.get('domain', type=int)))
+
+@app.route('/api/clients/timing')
+def get_client_timing():
+    # Worst masters / flagged clients from the sampled rows, merged turnaround per domain from the live sketches
+    rows = SAMPLER.get("clients", [])
+    masters = sorted((c for c in rows if "served_us" in c["timing"]), key=lambda c: -c["timing"]["served_us"]["p99"])
+    return jsonify({ "turnaround_limit_ms": TURNAROUND_LIMIT_MS, "domains": CLIENTS.turnaround(time.time()),
+                     "masters": [{ "ip": c["ip"], "iface": c["iface"], "domain": c["domain"], "clock_id": c["clock_id"],
+                                   "served_us": c["timing"]["served_us"], "flags": c["flags"] } for c in masters],
+                     "flagged": [{ "ip": c["ip"], "iface": c["iface"], "domain": c["domain"], "flags": c["flags"], "timing": c["timing"] }
+                                 for c in rows if c["flags"]] })
+
+@app.route('/api/archive')
+def get_archive():
+    if not ARCHIVE: return jsonify({"status": "error", "message": "Packet archive disabled (PTP_WEB_ARCHIVE_MB)"}), 503
+    t_to = request.args.get('to', type=float) or time.time()
+    t_from = request.args.get('from', type=float) or (t_to - 600)
+    types = [t for t in request.args.get('type', '').split(',') if t]
+    unknown = [t for t in types if t not in TYPE_CODES]
+    if unknown: return jsonify({"status": "error", "message": f"Unknown message type: {', '.join(unknown)}"}), 400
+    if t_from >= t_to: return jsonify({"status": "error", "message": "Invalid time range"}), 400
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 10000)
+    result = ARCHIVE.query(t_from, t_to, clock_id=request.args.get('clock') or None, ip=request.args.get('ip') or None, types=types, limit=limit)
+    return jsonify({ "from": t_from, "to": t_to, **result, "archive": ARCHIVE.stats() })
+
+@app.route('/api/servo')
+def get_servo_stats():
+    name = request.args.get('instance') or DEFAULT_INSTANCE
+    stats = SERVO.snapshot(name)
+    if stats is None: return jsonify({"status": "error", "message": "Unknown instance"}), 404
+    return jsonify({ "instance": name, **stats })
 
 
 if __name__ == '__main__':
@@ -0,0 +1,106 @@
+"""
+Serialized config-apply jobs.
+
+One worker thread runs apply / stop jobs in submission order, so two
+requests never interleave on a config file or a service restart. Every job
+gets an id and a list of timestamped steps, and the last MAX_JOBS jobs stay
+queryable (/api/apply/<job>).
+
+Readiness is observed instead of slept for: wait_until() polls a probe (the
+management socket answering, the port reaching MASTER / SLAVE, the servo
+locking) at a short interval until it succeeds, times out, or a newer job is
+waiting in the queue.
+"""
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+
+MAX_JOBS = 50
+POLL_INTERVAL = 0.05
+
+
+def wait_until(probe, timeout, interval=POLL_INTERVAL, cancel=None):
+    """Call probe() until it returns something truthy (returned), or None on timeout / cancel()."""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = probe()
+        if result: return result
+        if time.monotonic() >= deadline or (cancel is not None and cancel()): return None
+        time.sleep(interval)
+
+
+class ApplyJob:
+    def __init__(self, kind, instance, fn):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.instance = instance
+        self.fn = fn            # fn(job)
+        self.state = "queued"   # queued -> running -> done | failed
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.steps = []
+        self.result = {}
+        self.error = None
+
+    def elapsed(self):
+        return round(time.time() - self.started, 3) if self.started else 0.0
+
+    def step(self, name, detail=None):
+        self.steps.append({ "t": self.elapsed(), "step": name, "detail": detail })
+
+    def to_dict(self):
+        return { "id": self.id, "kind": self.kind, "instance": self.instance, "state": self.state,
+                 "created": self.created, "started": self.started, "finished": self.finished,
+                 "duration": round(self.finished - self.started, 3) if self.finished and self.started else None,
+                 "steps": list(self.steps), "result": dict(self.result), "error": self.error }
+
+
+class ApplyQueue:
+    def __init__(self, max_jobs=MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()   # id -> ApplyJob, oldest first
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="apply-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, kind, instance, fn):
+        job = ApplyJob(kind, instance, fn)
+        with self.cond:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                old_id, old = next(iter(self.jobs.items()))
+                if old.state in ("queued", "running"): break
+                del self.jobs[old_id]
+            self.pending.append(job)
+            self.cond.notify()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def has_pending(self):
+        # Long readiness waits give way as soon as another apply is queued
+        return bool(self.pending)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending: self.cond.wait()
+                job = self.pending.popleft()
+            job.state = "running"; job.started = time.time()
+            try:
+                job.fn(job)
+                job.state = "done"
+            except Exception as e:
+                traceback.print_exc()
+                job.state = "failed"; job.error = str(e)
+            job.finished = time.time()
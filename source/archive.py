@@ -0,0 +1,223 @@
+"""
+Rolling on-disk archive of captured PTP message headers.
+
+Every batch the capture loop decodes is packed into fixed 64-byte records
+(capture time, sourcePortIdentity, sequenceId, message type, domain, flags,
+logMessageInterval, IPs, source MAC, interface) and appended to the current
+segment file with one write() per batch. A segment is closed at
+segment_bytes and the oldest segments are deleted once the archive exceeds
+max_bytes.
+
+Each segment is indexed in blocks of BLOCK_RECORDS records: file offset,
+time range, a bit mask of message types and the set of clock identities and
+IP addresses in the block. A query only reads (pread) the blocks whose time
+range, type mask and key set can match, so "Announce from clock X between T1
+and T2" costs a few blocks, not the whole archive. The index of a closed
+segment is stored next to it (.idx, JSON); a segment without one (the
+process stopped while writing it) is re-indexed by a single scan on start.
+"""
+import json
+import os
+import socket
+import struct
+import threading
+import traceback
+
+from capture import MESSAGE_TYPES
+
+RECORD = struct.Struct("<d8s4s4s6sHHHBBBb16s8x")   # 64 bytes
+BLOCK_RECORDS = 1024
+TYPE_CODES = {name: code for code, name in MESSAGE_TYPES.items()}
+
+
+def _ip_bytes(ip):
+    try: return socket.inet_aton(ip) if ip else bytes(4)
+    except OSError: return bytes(4)
+
+
+def _ip_text(raw):
+    return socket.inet_ntoa(raw) if any(raw) else None
+
+
+def _clock_text(raw):
+    h = raw.hex()
+    return f"{h[0:6]}.{h[6:10]}.{h[10:16]}"
+
+
+def pack_message(msg, iface, now):
+    return RECORD.pack(msg.ts or now, bytes.fromhex(msg.clock_id.replace(".", "")), _ip_bytes(msg.src_ip), _ip_bytes(msg.dst_ip),
+                       bytes.fromhex(msg.src_mac.replace(":", "")) if msg.src_mac else bytes(6),
+                       msg.port_number, msg.seq, msg.flags, msg.msg_type, msg.version, msg.domain, msg.log_interval,
+                       iface.encode()[:16])
+
+
+def unpack_record(rec):
+    ts, cid, src_ip, dst_ip, mac, port, seq, flags, mtype, version, domain, log_interval, iface = rec
+    return { "ts": ts, "iface": iface.rstrip(b"\0").decode(errors="replace"), "type": MESSAGE_TYPES.get(mtype, hex(mtype)),
+             "clock_id": _clock_text(cid), "port_number": port, "seq": seq, "domain": domain, "version": version,
+             "flags": flags, "log_interval": log_interval, "src_ip": _ip_text(src_ip), "dst_ip": _ip_text(dst_ip),
+             "src_mac": ":".join(f"{b:02x}" for b in mac) }
+
+
+class Block:
+    __slots__ = ("offset", "count", "t_min", "t_max", "types", "keys")
+
+    def __init__(self, offset, count=0, t_min=None, t_max=None, types=0, keys=()):
+        self.offset = offset; self.count = count
+        self.t_min = t_min; self.t_max = t_max
+        self.types = types; self.keys = set(keys)
+
+    def add(self, ts, msg_type, keys):
+        self.count += 1
+        if self.t_min is None or ts < self.t_min: self.t_min = ts
+        if self.t_max is None or ts > self.t_max: self.t_max = ts
+        self.types |= 1 << msg_type
+        self.keys.update(keys)
+
+    def matches(self, t_from, t_to, type_mask, key):
+        if not self.count or self.t_max < t_from or self.t_min > t_to: return False
+        if type_mask and not (self.types & type_mask): return False
+        return key is None or key in self.keys
+
+    def to_json(self):
+        return [self.offset, self.count, self.t_min, self.t_max, self.types, sorted(self.keys)]
+
+
+class Segment:
+    def __init__(self, path, blocks=None):
+        self.path = path
+        self.blocks = blocks if blocks is not None else []
+        self.size = self.blocks[-1].offset + self.blocks[-1].count * RECORD.size if self.blocks else 0
+
+    @property
+    def t_min(self):
+        return min((b.t_min for b in self.blocks if b.count), default=None)
+
+    @property
+    def t_max(self):
+        return max((b.t_max for b in self.blocks if b.count), default=None)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path + ".idx") as f: blocks = [Block(*b) for b in json.load(f)["blocks"]]
+            return cls(path, blocks)
+        except (OSError, ValueError, TypeError): pass
+        # No (valid) index: rebuild it from the records, dropping a torn tail
+        seg = cls(path)
+        with open(path, "rb") as f: data = f.read()
+        n = len(data) // RECORD.size
+        for rec in RECORD.iter_unpack(memoryview(data)[:n * RECORD.size]):
+            seg._index(rec[0], rec[8], (_clock_text(rec[1]), _ip_text(rec[2]), _ip_text(rec[3])))
+        if len(data) != n * RECORD.size: os.truncate(path, n * RECORD.size)
+        seg.save_index()
+        return seg
+
+    def _index(self, ts, msg_type, keys):
+        if not self.blocks or self.blocks[-1].count >= BLOCK_RECORDS:
+            self.blocks.append(Block(self.size))
+        self.blocks[-1].add(ts, msg_type, [k for k in keys if k])
+        self.size += RECORD.size
+
+    def save_index(self):
+        tmp = self.path + ".idx.tmp"
+        with open(tmp, "w") as f: json.dump({ "record_size": RECORD.size, "blocks": [b.to_json() for b in self.blocks] }, f)
+        os.replace(tmp, self.path + ".idx")
+
+    def read(self, block):
+        with open(self.path, "rb") as f:
+            return os.pread(f.fileno(), block.count * RECORD.size, block.offset)
+
+
+class PacketArchive:
+    def __init__(self, directory, max_bytes=256 << 20, segment_bytes=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes or max(1 << 20, max_bytes // 16)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".seg"): continue
+            seg = Segment.load(os.path.join(directory, name))
+            if seg.size: self.segments.append(seg)
+            else: self._unlink(seg)
+        self.fd = None
+        self._roll()
+
+    def _roll(self):
+        """Close the current segment (index written next to it) and start a new one."""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.segments[-1].save_index()
+        seq = int(os.path.basename(self.segments[-1].path)[:-4]) + 1 if self.segments else 1
+        path = os.path.join(self.directory, f"{seq:010d}.seg")
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self.segments.append(Segment(path))
+        # Room for the new segment to fill up keeps the whole archive under max_bytes
+        total = sum(s.size for s in self.segments) + self.segment_bytes
+        while total > self.max_bytes and len(self.segments) > 1:
+            old = self.segments.pop(0)
+            total -= old.size
+            self._unlink(old)
+
+    @staticmethod
+    def _unlink(seg):
+        for p in (seg.path, seg.path + ".idx"):
+            try: os.unlink(p)
+            except FileNotFoundError: pass
+
+    def observe(self, msgs, iface, my_ip, now):
+        """Same signature as ClientTable.observe: the whole batch is one write."""
+        try:
+            records = [pack_message(m, iface, now) for m in msgs]
+            with self.lock:
+                os.write(self.fd, b"".join(records))
+                seg = self.segments[-1]
+                for m in msgs: seg._index(m.ts or now, m.msg_type, (m.clock_id, m.src_ip, m.dst_ip))
+                self.written += len(records)
+                if seg.size >= self.segment_bytes: self._roll()
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+
+    def query(self, t_from, t_to, clock_id=None, ip=None, types=None, limit=1000):
+        """Archived messages in [t_from, t_to] (oldest first), optionally from one clock / IP and of some types."""
+        type_mask = 0
+        for name in types or ():
+            type_mask |= 1 << TYPE_CODES[name]
+        key = clock_id or ip
+        with self.lock:
+            # Block counts are taken under the lock: records appended later are not read half-written
+            candidates = [(seg, b, b.count) for seg in self.segments for b in seg.blocks if b.matches(t_from, t_to, type_mask, key)]
+        out, blocks = [], 0
+        for seg, block, count in candidates:
+            if len(out) > limit: break
+            try: data = seg.read(block)
+            except OSError: continue    # segment deleted by retention meanwhile
+            blocks += 1
+            for rec in RECORD.iter_unpack(data[:count * RECORD.size]):
+                if not (t_from <= rec[0] <= t_to): continue
+                if type_mask and not (type_mask >> rec[8]) & 1: continue
+                if clock_id and _clock_text(rec[1]) != clock_id: continue
+                if ip and ip not in (_ip_text(rec[2]), _ip_text(rec[3])): continue
+                out.append(rec)
+        # Blocks are in write order, so the first `limit` hits are the oldest ones up to capture jitter
+        out.sort(key=lambda r: r[0])
+        truncated = len(out) > limit
+        return { "count": min(len(out), limit), "truncated": truncated, "blocks_read": blocks,
+                 "messages": [unpack_record(r) for r in out[:limit]] }
+
+    def stats(self):
+        with self.lock:
+            return { "segments": len(self.segments), "bytes": sum(s.size for s in self.segments), "max_bytes": self.max_bytes,
+                     "written": self.written, "errors": self.errors,
+                     "oldest": self.segments[0].t_min if self.segments else None }
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd); self.fd = None
+                self.segments[-1].save_index()
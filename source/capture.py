@@ -0,0 +1,344 @@
+"""
+PTP packet capture without tcpdump.
+
+RawCapture opens an AF_PACKET socket with a classic BPF filter for PTP
+(UDP 319/320 over IPv4 and ethertype 0x88F7), reads frames in batches from
+a TPACKET_V3 mmap ring (falling back to a non-blocking recv drain) and
+decode_frame() turns each frame into a PtpMessage (decode_announce() adds the
+Announce body for the foreign master table, decode_delay_resp() the requesting
+port of a Delay_Resp). Frames carry kernel receive timestamps: the ring's
+tp_sec / tp_nsec, SO_TIMESTAMPNS on the recv path. PcapCapture offers the
+same read() interface over a pcap file so the pipeline can be replayed
+offline.
+"""
+import ctypes
+import mmap
+import os
+import select
+import socket
+import struct
+import time
+from collections import namedtuple
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_1588 = 0x88F7
+VLAN_TPIDS = (0x8100, 0x88A8)
+PTP_EVENT_PORT = 319
+PTP_GENERAL_PORT = 320
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+SO_ATTACH_FILTER = 26
+SO_TIMESTAMPNS = 35
+
+MESSAGE_TYPES = {
+    0x0: "Sync", 0x1: "Delay_Req", 0x2: "Pdelay_Req", 0x3: "Pdelay_Resp",
+    0x8: "Follow_Up", 0x9: "Delay_Resp", 0xA: "Pdelay_Resp_Follow_Up",
+    0xB: "Announce", 0xC: "Signaling", 0xD: "Management",
+}
+
+PTP_HEADER = struct.Struct(">BBHBBHqI8sHHBb")   # 34 bytes
+PTP_HEADER_LEN = PTP_HEADER.size
+
+# One decoded PTP message. `payload` is the PTP message itself (header + body).
+PtpMessage = namedtuple("PtpMessage", [
+    "ts", "iface", "src_mac", "dst_mac", "src_ip", "dst_ip", "transport",
+    "msg_type", "version", "domain", "flags", "seq", "clock_id", "port_number",
+    "log_interval", "payload"])
+
+# Classic BPF: "ether proto 0x88f7 or (ip and udp and not ip fragment and (port 319 or port 320))"
+BPF_ACCEPT = 0x40000
+_BPF = [
+    (0x28, 0, 0, 12),            # 0: ldh [12]               ethertype
+    (0x15, 12, 0, ETH_P_1588),   # 1: jeq 0x88f7 -> accept
+    (0x15, 0, 12, ETH_P_IP),     # 2: jeq 0x0800 else reject
+    (0x30, 0, 0, 23),            # 3: ldb [23]               ip proto
+    (0x15, 0, 10, 17),           # 4: jeq udp else reject
+    (0x28, 0, 0, 20),            # 5: ldh [20]               frag offset
+    (0x45, 8, 0, 0x1FFF),        # 6: jset 0x1fff -> reject
+    (0xB1, 0, 0, 14),            # 7: ldxb 4*([14]&0xf)
+    (0x48, 0, 0, 14),            # 8: ldh [x+14]             src port
+    (0x15, 4, 0, PTP_EVENT_PORT),    # 9
+    (0x15, 3, 0, PTP_GENERAL_PORT),  # 10
+    (0x48, 0, 0, 16),            # 11: ldh [x+16]            dst port
+    (0x15, 1, 0, PTP_EVENT_PORT),    # 12
+    (0x15, 0, 1, PTP_GENERAL_PORT),  # 13
+    (0x06, 0, 0, BPF_ACCEPT),    # 14: accept
+    (0x06, 0, 0, 0),             # 15: reject
+]
+
+
+# Announce body after the header: originTimestamp, currentUtcOffset, reserved, grandmasterPriority1,
+# grandmasterClockQuality (class, accuracy, offsetScaledLogVariance), grandmasterPriority2,
+# grandmasterIdentity, stepsRemoved, timeSource
+ANNOUNCE_BODY = struct.Struct(">10shxBBBHB8sHB")   # 30 bytes
+Announce = namedtuple("Announce", [
+    "utc_offset", "priority1", "clock_class", "clock_accuracy", "variance", "priority2",
+    "gm_identity", "steps_removed", "time_source"])
+# Delay_Resp body: receiveTimestamp, requestingPortIdentity (clockIdentity, portNumber)
+DELAY_RESP_BODY = struct.Struct(">10s8sH")   # 20 bytes
+
+
+def _format_mac(b):
+    return ":".join(f"{x:02x}" for x in b)
+
+
+def _format_clock_id(b):
+    h = b.hex()
+    return f"{h[0:6]}.{h[6:10]}.{h[10:16]}"
+
+
+def decode_ptp(ptp, ts=0.0, iface="", src_mac="", dst_mac="", src_ip=None, dst_ip=None, transport="L2"):
+    if len(ptp) < PTP_HEADER_LEN: return None
+    (b0, b1, _length, domain, _, flags, _corr, _, cid, port, seq, _ctl,
+     log_interval) = PTP_HEADER.unpack_from(ptp)
+    return PtpMessage(ts, iface, src_mac, dst_mac, src_ip, dst_ip, transport, b0 & 0x0F, b1 & 0x0F,
+                      domain, flags, seq, _format_clock_id(cid), port, log_interval, bytes(ptp))
+
+
+def decode_announce(msg):
+    """Announce dataset of a decoded Announce PtpMessage, or None when truncated."""
+    if msg.msg_type != 0xB or len(msg.payload) < PTP_HEADER_LEN + ANNOUNCE_BODY.size: return None
+    _, utc, p1, cls, acc, var, p2, gm, steps, src = ANNOUNCE_BODY.unpack_from(msg.payload, PTP_HEADER_LEN)
+    return Announce(utc, p1, cls, acc, var, p2, _format_clock_id(gm), steps, src)
+
+
+def decode_delay_resp(msg):
+    """(clock_id, port_number) of the port whose Delay_Req a Delay_Resp answers, or None."""
+    if msg.msg_type != 0x9 or len(msg.payload) < PTP_HEADER_LEN + DELAY_RESP_BODY.size: return None
+    _, cid, port = DELAY_RESP_BODY.unpack_from(msg.payload, PTP_HEADER_LEN)
+    return _format_clock_id(cid), port
+
+
+def decode_frame(frame, ts=0.0, iface=""):
+    """Decode one Ethernet frame into a PtpMessage, or None if it is not PTP."""
+    if len(frame) < 14: return None
+    off = 12
+    ethertype = (frame[off] << 8) | frame[off + 1]
+    while ethertype in VLAN_TPIDS and len(frame) >= off + 6:
+        off += 4
+        ethertype = (frame[off] << 8) | frame[off + 1]
+    off += 2
+    dst_mac = _format_mac(frame[0:6]); src_mac = _format_mac(frame[6:12])
+    if ethertype == ETH_P_1588:
+        return decode_ptp(memoryview(frame)[off:], ts, iface, src_mac, dst_mac)
+    if ethertype != ETH_P_IP or len(frame) < off + 28: return None
+    ihl = (frame[off] & 0x0F) * 4
+    if frame[off + 9] != 17 or (((frame[off + 6] << 8) | frame[off + 7]) & 0x1FFF): return None
+    udp = off + ihl
+    if len(frame) < udp + 8: return None
+    sport = (frame[udp] << 8) | frame[udp + 1]
+    dport = (frame[udp + 2] << 8) | frame[udp + 3]
+    if sport not in (PTP_EVENT_PORT, PTP_GENERAL_PORT) and dport not in (PTP_EVENT_PORT, PTP_GENERAL_PORT):
+        return None
+    src_ip = socket.inet_ntoa(frame[off + 12:off + 16])
+    dst_ip = socket.inet_ntoa(frame[off + 16:off + 20])
+    return decode_ptp(memoryview(frame)[udp + 8:], ts, iface, src_mac, dst_mac, src_ip, dst_ip, "UDPv4")
+
+
+class RawCapture:
+    """AF_PACKET capture of PTP frames on one interface (requires CAP_NET_RAW)."""
+    BLOCK_SIZE = 1 << 18
+    BLOCK_NR = 8
+    FRAME_SIZE = 1 << 11
+    BLOCK_TIMEOUT_MS = 50
+
+    def __init__(self, iface, use_ring=True):
+        self.iface = iface
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        self.packets = 0
+        self.drops = 0
+        self.frames = 0      # frames read from the socket / file
+        self.decoded = 0     # of which decoded as PTP
+        self.ring = None
+        try:
+            self._attach_filter()
+            # Kernel receive timestamps for the recv() fallback (the mmap ring always carries them)
+            try: self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            except OSError: pass
+            self.sock.bind((iface, ETH_P_ALL))
+            if use_ring:
+                try: self._setup_ring()
+                except OSError: self.ring = None
+            self.sock.setblocking(False)
+        except Exception:
+            self.close()
+            raise
+        self._block = 0
+
+    def _attach_filter(self):
+        # The kernel copies the program during setsockopt, so a temporary buffer is enough
+        buf = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *ins) for ins in _BPF))
+        fprog = struct.pack("HL", len(_BPF), ctypes.addressof(buf))
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    def _setup_ring(self):
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        frame_nr = self.BLOCK_SIZE * self.BLOCK_NR // self.FRAME_SIZE
+        req = struct.pack("7I", self.BLOCK_SIZE, self.BLOCK_NR, self.FRAME_SIZE, frame_nr,
+                          self.BLOCK_TIMEOUT_MS, 0, 0)
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        self.ring = mmap.mmap(self.sock.fileno(), self.BLOCK_SIZE * self.BLOCK_NR,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        if self.ring is not None:
+            try: self.ring.close()
+            except Exception: pass
+            self.ring = None
+        try: self.sock.close()
+        except Exception: pass
+
+    def stats(self):
+        # Kernel counters reset on every read, so accumulate them here
+        try:
+            raw = self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12)
+            packets, drops = struct.unpack_from("II", raw)
+            self.packets += packets
+            self.drops += drops
+        except OSError: pass
+        return self.packets, self.drops
+
+    def read_frames(self, timeout=None):
+        """Wait up to `timeout` seconds, then return every pending (ts, frame) in one batch."""
+        if timeout is not None and not self._ready():
+            r, _, _ = select.select([self.sock], [], [], timeout)
+            if not r: return []
+        return self._drain_ring() if self.ring is not None else self._drain_socket()
+
+    def read(self, timeout=None):
+        out = []
+        frames = self.read_frames(timeout)
+        for ts, frame in frames:
+            msg = decode_frame(frame, ts, self.iface)
+            if msg is not None: out.append(msg)
+        self.frames += len(frames)
+        self.decoded += len(out)
+        return out
+
+    def _ready(self):
+        if self.ring is None: return False
+        status = struct.unpack_from("I", self.ring, self._block * self.BLOCK_SIZE + 8)[0]
+        return bool(status & TP_STATUS_USER)
+
+    def _drain_ring(self):
+        frames = []
+        ring = self.ring
+        for _ in range(self.BLOCK_NR):
+            base = self._block * self.BLOCK_SIZE
+            status, num_pkts, first = struct.unpack_from("III", ring, base + 8)
+            if not status & TP_STATUS_USER: break
+            off = base + first
+            for _ in range(num_pkts):
+                next_off, sec, nsec, snaplen, _len, _st, mac = struct.unpack_from("IIIIIIH", ring, off)
+                frames.append((sec + nsec * 1e-9, ring[off + mac:off + mac + snaplen]))
+                off += next_off
+            # Hand the block back to the kernel
+            struct.pack_into("I", ring, base + 8, TP_STATUS_KERNEL)
+            self._block = (self._block + 1) % self.BLOCK_NR
+        return frames
+
+    def _drain_socket(self):
+        frames = []
+        now = time.time()
+        while True:
+            try:
+                data, anc, _, _ = self.sock.recvmsg(65535, socket.CMSG_SPACE(16))
+            except (BlockingIOError, InterruptedError):
+                return frames
+            ts = now
+            for level, kind, raw in anc:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(raw) >= 16:
+                    sec, nsec = struct.unpack_from("qq", raw)
+                    ts = sec + nsec * 1e-9
+            frames.append((ts, data))
+
+
+class PcapCapture:
+    """Replays a classic pcap file (Ethernet link type) through the same read() interface."""
+    LINKTYPE_ETHERNET = 1
+
+    def __init__(self, path, iface="pcap"):
+        self.iface = iface
+        self.f = open(path, "rb")
+        magic = self.f.read(4)
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"): self.endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"): self.endian = ">"
+        else: raise ValueError(f"{path}: not a pcap file")
+        self.nano = magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d")
+        self.linktype = struct.unpack(self.endian + "HHiIII", self.f.read(20))[5]
+        if self.linktype != self.LINKTYPE_ETHERNET: raise ValueError(f"{path}: unsupported link type {self.linktype}")
+        self.rec = struct.Struct(self.endian + "IIII")
+        self.packets = 0
+        self.drops = 0
+        self.frames = 0      # frames read from the socket / file
+        self.decoded = 0     # of which decoded as PTP
+        # Regular files cannot sit in epoll; expose a pipe that stays readable until EOF instead
+        self._ready_r, self._ready_w = os.pipe()
+        os.write(self._ready_w, b"\0")
+        self._eof = False
+
+    def records(self):
+        while True:
+            hdr = self.f.read(16)
+            if len(hdr) < 16: return self._set_eof()
+            sec, frac, incl, _orig = self.rec.unpack(hdr)
+            data = self.f.read(incl)
+            if len(data) < incl: return self._set_eof()
+            self.packets += 1
+            yield sec + frac * (1e-9 if self.nano else 1e-6), data
+
+    def _set_eof(self):
+        if not self._eof:
+            self._eof = True
+            os.read(self._ready_r, 1)
+
+    def read_frames(self, timeout=None, batch=4096):
+        out = []
+        for item in self.records():
+            out.append(item)
+            if len(out) >= batch: break
+        # At end of file behave like an idle link instead of spinning
+        if not out and timeout: time.sleep(timeout)
+        return out
+
+    def read(self, timeout=None, batch=4096):
+        out = []
+        frames = self.read_frames(timeout, batch)
+        for ts, frame in frames:
+            msg = decode_frame(frame, ts, self.iface)
+            if msg is not None: out.append(msg)
+        self.frames += len(frames)
+        self.decoded += len(out)
+        return out
+
+    def stats(self):
+        return self.packets, self.drops
+
+    def fileno(self):
+        return self._ready_r
+
+    def close(self):
+        self.f.close()
+        for fd in (self._ready_r, self._ready_w):
+            try: os.close(fd)
+            except OSError: pass
+
+
+def write_pcap(path, frames):
+    """Write [(ts, frame)] as a microsecond pcap file (fixtures / exporting captures)."""
+    with open(path, "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, PcapCapture.LINKTYPE_ETHERNET))
+        for ts, frame in frames:
+            sec = int(ts); usec = int(round((ts - sec) * 1e6))
+            f.write(struct.pack("<IIII", sec, usec, len(frame), len(frame)))
+            f.write(frame)
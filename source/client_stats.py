@@ -0,0 +1,291 @@
+"""
+Per-client PTP traffic statistics for the client radar.
+
+Every endpoint gets one ClientStats with fixed-size arrays indexed by PTP
+messageType (counters, decaying rate estimators, sequenceId gap tracking
+and inter-arrival jitter), so memory per client is constant and the whole
+table is capped at `max_clients` with least-recently-seen eviction.
+
+Timing quality comes from the capture timestamps (kernel receive time, or
+the pcap time when replaying), kept in mergeable quantile sketches:
+
+  - Delay_Req -> Delay_Resp turnaround, matched on requestingPortIdentity +
+    sequenceId, for the requesting client and for the master answering it,
+  - Sync / Announce cadence (multicast only) and Delay_Req cadence, compared
+    with the intervals of the applied profile for the domain (`expected`),
+    else with the interval the sender advertises.
+
+A master whose turnaround p99 exceeds `turnaround_limit` is flagged as
+overloaded, a client sending Delay_Req much faster than
+logMinDelayReqInterval allows as a spammer.
+"""
+import math
+import threading
+from array import array
+from collections import OrderedDict
+
+from capture import MESSAGE_TYPES, decode_delay_resp
+from sketch import LogSketch, WindowedSketch
+
+N_TYPES = 16
+RATE_TAU = 10.0          # seconds, time constant of the rate estimator
+JITTER_GAIN = 1 / 16.0   # RFC 3550 style smoothing
+MAX_SEQ_GAP = 1000       # larger jumps are treated as a sender restart, not loss
+# Message types whose sequenceId is a per-sender monotonic counter
+SEQUENCED_TYPES = (0x0, 0x1, 0x2, 0x8, 0xB)
+# Message types whose inter-arrival time is compared with the configured interval
+CADENCE_TYPES = { 0x0: "Sync", 0xB: "Announce", 0x1: "Delay_Req" }
+SKETCH_WINDOW = 30.0     # seconds per quantile sketch window
+PENDING_TIMEOUT = 2.0    # a Delay_Req without Delay_Resp after this long counts as unanswered
+MAX_PENDING = 16384
+CADENCE_TOLERANCE = 0.3  # IEEE 1588: mean message interval within +/-30 % of the configured one
+MIN_SAMPLES = 8
+
+
+def log_interval_seconds(log_interval):
+    # logMessageInterval 0x7F means "not specified"
+    return 2.0 ** log_interval if -8 <= log_interval <= 8 else None
+
+
+def is_multicast(ip):
+    return ip is None or 224 <= int(ip.split(".", 1)[0]) <= 239
+
+
+class ClientStats:
+    __slots__ = ("ip", "mac", "iface", "is_self", "clock_id", "domain", "transport", "first_seen",
+                 "last_seen", "counts", "lost", "rate", "last_ts", "last_seq", "interval", "jitter",
+                 "advertised", "sketches", "unanswered", "min_delay_req")
+
+    def __init__(self, ip, mac, iface, now):
+        self.ip = ip; self.mac = mac; self.iface = iface
+        self.is_self = False
+        self.clock_id = ""; self.domain = -1; self.transport = ""
+        self.first_seen = now; self.last_seen = now
+        self.counts = array("I", bytes(4 * N_TYPES))
+        self.lost = array("I", bytes(4 * N_TYPES))
+        self.rate = array("d", bytes(8 * N_TYPES))       # decaying rate estimate, msgs/s
+        self.last_ts = array("d", bytes(8 * N_TYPES))    # arrival time of the previous message
+        self.last_seq = array("i", [-1]) * N_TYPES
+        self.interval = array("d", bytes(8 * N_TYPES))   # smoothed inter-arrival time, s
+        self.jitter = array("d", bytes(8 * N_TYPES))     # smoothed |interval deviation|, s
+        self.advertised = array("b", [0x7F]) * N_TYPES    # logMessageInterval of the last message
+        self.sketches = {}          # name -> WindowedSketch, created on first use
+        self.unanswered = 0         # Delay_Req never answered
+        self.min_delay_req = None   # logMinDelayReqInterval the master announced in Delay_Resp, s
+
+    def sketch(self, name, scale):
+        sk = self.sketches.get(name)
+        if sk is None: sk = self.sketches[name] = WindowedSketch(SKETCH_WINDOW, scale)
+        return sk
+
+    def observe(self, msg, now):
+        t = msg.msg_type
+        ts = msg.ts or now
+        self.last_seen = now
+        self.clock_id = msg.clock_id; self.domain = msg.domain; self.transport = msg.transport
+        self.counts[t] += 1
+
+        prev = self.last_ts[t]
+        if prev:
+            dt = ts - prev
+            if dt > 0:
+                self.rate[t] = self.rate[t] * math.exp(-dt / RATE_TAU) + 1.0 / RATE_TAU
+                if self.interval[t]:
+                    self.jitter[t] += (abs(dt - self.interval[t]) - self.jitter[t]) * JITTER_GAIN
+                    self.interval[t] += (dt - self.interval[t]) * JITTER_GAIN
+                else:
+                    self.interval[t] = dt
+                # Unicast Sync / Announce to many slaves would look like one fast sender
+                if t in CADENCE_TYPES and (t == 0x1 or is_multicast(msg.dst_ip)):
+                    self.sketch(CADENCE_TYPES[t], 1e3).add(dt, ts)
+        else:
+            self.rate[t] = 1.0 / RATE_TAU
+        self.last_ts[t] = ts
+        self.advertised[t] = msg.log_interval
+
+        if t in SEQUENCED_TYPES:
+            last = self.last_seq[t]
+            if last >= 0:
+                gap = (msg.seq - last - 1) & 0xFFFF
+                # gap >= 0x8000 means duplicate / reordered, not loss
+                if 0 < gap < MAX_SEQ_GAP: self.lost[t] += gap
+                if gap < 0x8000: self.last_seq[t] = msg.seq
+            else:
+                self.last_seq[t] = msg.seq
+
+    def current_rate(self, t, now):
+        ts = self.last_ts[t]
+        if not ts: return 0.0
+        return self.rate[t] * math.exp(-max(0.0, now - ts) / RATE_TAU)
+
+    def timing(self, now, expected=None, turnaround_limit=None):
+        """({turnaround_us, served_us, unanswered, cadence}, [flags]) from the last completed sketch windows."""
+        timing = { "unanswered": self.unanswered }
+        flags = []
+        for name, field in (("turnaround", "turnaround_us"), ("served", "served_us")):
+            sk = self.sketches.get(name)
+            summary = sk.summary(now) if sk else None
+            if summary: timing[field] = summary
+        served = timing.get("served_us")
+        if served and turnaround_limit and served["p99"] > turnaround_limit * 1e6: flags.append("overloaded_master")
+        cadence = {}
+        for t, name in CADENCE_TYPES.items():
+            sk = self.sketches.get(name)
+            summary = sk.summary(now) if sk else None
+            if not summary: continue
+            if t == 0x1: want = self.min_delay_req or (expected or {}).get(t)
+            else: want = (expected or {}).get(t) or log_interval_seconds(self.advertised[t])
+            cadence[name] = dict(summary, expected_ms=round(want * 1e3, 1) if want else None)
+            if not want or summary["count"] < MIN_SAMPLES: continue
+            ratio = summary["p50"] / (want * 1e3)
+            if t == 0x1:
+                # Delay_Req intervals are randomized up to 2x the minimum, so only a far shorter median is spam
+                if ratio < 0.5: flags.append("delay_req_spam")
+            elif abs(ratio - 1) > CADENCE_TOLERANCE: flags.append(name.lower() + "_cadence")
+        if cadence: timing["cadence"] = cadence
+        return timing, flags
+
+    def to_dict(self, now, key, expected=None, turnaround_limit=None):
+        counts = {}; rates = {}; lost = {}; jitter = {}
+        for t in range(N_TYPES):
+            n = self.counts[t]
+            if not n: continue
+            name = MESSAGE_TYPES.get(t, str(t))
+            counts[name] = n
+            rates[name] = round(self.current_rate(t, now), 3)
+            if self.lost[t]: lost[name] = self.lost[t]
+            if self.interval[t]: jitter[name] = round(self.jitter[t] * 1e6, 1)
+        total = sum(counts.values())
+        timing, flags = self.timing(now, expected, turnaround_limit)
+        return {
+            "ip": key, "mac": self.mac, "iface": self.iface, "is_self": self.is_self,
+            "clock_id": self.clock_id, "domain": self.domain, "transport": self.transport,
+            "first_seen": self.first_seen, "last_seen": self.last_seen,
+            "total": total, "rate": round(sum(rates.values()), 3), "lost": sum(lost.values()),
+            "loss_pct": round(100.0 * sum(lost.values()) / (total + sum(lost.values())), 3) if total else 0.0,
+            "counts": counts, "rates": rates, "lost_by_type": lost, "jitter_us": jitter,
+            "timing": timing, "flags": flags,
+        }
+
+
+class ClientTable:
+    def __init__(self, max_clients=4096, turnaround_limit=0.01):
+        self.max_clients = max_clients
+        self.turnaround_limit = turnaround_limit   # s, served turnaround p99 above this = overloaded master
+        self.clients = OrderedDict()   # key -> ClientStats, least recently seen first
+        self.pending = OrderedDict()   # (domain, clock_id, port, seq) of a Delay_Req -> (ts, client key)
+        self.expected = {}             # domain -> {message type: configured interval, s} of the applied profile
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.clients)
+
+    def observe(self, msgs, iface, my_ip, now):
+        with self.lock:
+            for msg in msgs:
+                # L2 (ethertype 0x88F7) PTP has no IP, key those endpoints by MAC
+                key = msg.src_ip or msg.src_mac
+                c = self.clients.get(key)
+                if c is None:
+                    if len(self.clients) >= self.max_clients:
+                        self.clients.popitem(last=False)
+                        self.evicted += 1
+                    c = self.clients[key] = ClientStats(msg.src_ip, msg.src_mac, iface, now)
+                else:
+                    self.clients.move_to_end(key)
+                c.mac = msg.src_mac; c.iface = iface
+                # Seeing "Self" in radar is sometimes useful debugging.
+                c.is_self = (msg.src_ip is not None and msg.src_ip == my_ip)
+                c.observe(msg, now)
+                if msg.msg_type == 0x1: self._delay_req(msg, key, msg.ts or now)
+                elif msg.msg_type == 0x9: self._delay_resp(msg, c, msg.ts or now)
+
+    def _delay_req(self, msg, key, ts):
+        # Oldest requests sit at the front; anything older than PENDING_TIMEOUT was never answered
+        while self.pending:
+            (_, (req_ts, req_key)) = next(iter(self.pending.items()))
+            if ts - req_ts <= PENDING_TIMEOUT and len(self.pending) < MAX_PENDING: break
+            self.pending.popitem(last=False)
+            requester = self.clients.get(req_key)
+            if requester is not None: requester.unanswered += 1
+        self.pending[(msg.domain, msg.clock_id, msg.port_number, msg.seq)] = (ts, key)
+
+    def _delay_resp(self, msg, master, ts):
+        req = decode_delay_resp(msg)
+        if req is None: return
+        item = self.pending.pop((msg.domain, req[0], req[1], msg.seq), None)
+        if item is None: return
+        dt = ts - item[0]
+        if dt < 0: return
+        master.sketch("served", 1e6).add(dt, ts)
+        requester = self.clients.get(item[1])
+        if requester is not None:
+            requester.sketch("turnaround", 1e6).add(dt, ts)
+            requester.min_delay_req = log_interval_seconds(msg.log_interval)
+
+    def expire(self, max_age, now):
+        # Oldest entries sit at the front of the LRU order, so stop at the first live one
+        removed = []
+        with self.lock:
+            while self.clients:
+                key, c = next(iter(self.clients.items()))
+                if now - c.last_seen <= max_age: break
+                self.clients.popitem(last=False)
+                removed.append(key)
+        return removed
+
+    def next_expiry(self, max_age):
+        # The LRU order doubles as an expiry queue: the front entry always expires first
+        with self.lock:
+            if not self.clients: return None
+            return next(iter(self.clients.values())).last_seen + max_age
+
+    def export(self, now):
+        with self.lock:
+            items = list(self.clients.items())
+        return [c.to_dict(now, key, self.expected.get(c.domain), self.turnaround_limit) for key, c in items]
+
+    def turnaround(self, now):
+        """[{iface, domain, clients, turnaround_us}]: every requester's last window merged per (interface, domain)."""
+        groups = {}
+        with self.lock:
+            for c in self.clients.values():
+                sk = c.sketches.get("turnaround")
+                done = sk.completed(now) if sk else None
+                if done is not None: groups.setdefault((c.iface, c.domain), []).append(done)
+        out = []
+        for (iface, domain), sketches in sorted(groups.items()):
+            merged = LogSketch()
+            for sk in sketches: merged.merge(sk)
+            out.append({ "iface": iface, "domain": domain, "clients": len(sketches), "turnaround_us": merged.summary(1e6) })
+        return out
+
+
+# --- Query helpers for /api/clients ---
+SORT_FIELDS = ("ip", "mac", "iface", "clock_id", "domain", "first_seen", "last_seen", "total", "rate", "lost", "loss_pct")
+
+
+def _ip_sort_key(v):
+    parts = str(v).split(".")
+    if len(parts) == 4 and all(p.isdigit() for p in parts): return (0, tuple(int(p) for p in parts), "")
+    return (1, (), str(v))
+
+
+def query_clients(clients, sort="ip", iface=None, domain=None, msg_type=None, search=None, offset=0, limit=None):
+    """Filter, sort and page an exported client list. Returns (total_matching, page)."""
+    rows = clients
+    if iface: rows = [c for c in rows if c["iface"] == iface]
+    if domain is not None: rows = [c for c in rows if c["domain"] == domain]
+    if msg_type: rows = [c for c in rows if msg_type in c["counts"]]
+    if search:
+        s = search.lower()
+        rows = [c for c in rows if s in c["ip"].lower() or s in c["mac"].lower() or s in c["clock_id"].lower()]
+    desc = sort.startswith("-")
+    field = sort.lstrip("-")
+    if field not in SORT_FIELDS: field = "ip"
+    key = (lambda c: _ip_sort_key(c["ip"])) if field == "ip" else (lambda c: c[field])
+    rows = sorted(rows, key=key, reverse=desc)
+    total = len(rows)
+    offset = max(0, offset)
+    return total, rows[offset:offset + limit] if limit else rows[offset:]
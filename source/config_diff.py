@@ -0,0 +1,64 @@
+"""
+Classification of ptp4l config changes for /api/apply.
+
+The generated config is compared option by option with the one on disk, and
+every difference is one of:
+
+  - runtime:  ptp4l accepts a management SET for it (PRIORITY1, PRIORITY2,
+              GRANDMASTER_SETTINGS_NP for clockClass / timeSource), so it is
+              applied in place and lock is kept,
+  - deferred: only read at startup but harmless to leave until the next
+              restart (logging), so it is written to the file only,
+  - restart:  everything else (interfaces, transport, timestamping, domain,
+              message intervals ...), which needs ptp4l to be restarted.
+
+Comments, blank lines and option order are not changes.
+"""
+from collections import namedtuple
+
+from instances import parse_sections
+
+ConfigChange = namedtuple("ConfigChange", ["section", "key", "old", "new", "kind"])
+
+# [global] option -> management ID used to change it at runtime
+RUNTIME_OPTIONS = {
+    "priority1": "PRIORITY1",
+    "priority2": "PRIORITY2",
+    "clockClass": "GRANDMASTER_SETTINGS_NP",
+    "timeSource": "GRANDMASTER_SETTINGS_NP",
+}
+# ptp4l has no management ID for its log settings; they take effect on the next restart
+DEFERRED_OPTIONS = ("logging_level", "verbose", "use_syslog")
+
+
+def classify(section, key):
+    if section == "global" and key in RUNTIME_OPTIONS: return "runtime"
+    if key in DEFERRED_OPTIONS: return "deferred"
+    return "restart"
+
+
+def diff_config(old_text, new_text):
+    """[ConfigChange] between two config texts. A port section added / removed has key None."""
+    old, new = parse_sections(old_text or ""), parse_sections(new_text)
+    changes = []
+    for section in list(old) + [s for s in new if s not in old]:
+        a, b = old.get(section), new.get(section)
+        if a is None or b is None:
+            changes.append(ConfigChange(section, None, None if a is None else "present", None if b is None else "present", "restart"))
+            continue
+        for key in list(a) + [k for k in b if k not in a]:
+            if a.get(key) == b.get(key): continue
+            kind = classify(section, key)
+            # An option dropped from / added to the file falls back to ptp4l's default, which only a restart applies
+            if kind == "runtime" and None in (a.get(key), b.get(key)): kind = "restart"
+            changes.append(ConfigChange(section, key, a.get(key), b.get(key), kind))
+    return changes
+
+
+def needs_restart(changes):
+    return any(c.kind == "restart" for c in changes)
+
+
+def runtime_values(changes):
+    """{option: new value} of the runtime-changeable options."""
+    return {c.key: c.new for c in changes if c.kind == "runtime"}
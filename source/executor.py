@@ -0,0 +1,133 @@
+"""
+Helper process execution for the web app (pgrep, pmc, systemctl ...).
+
+Every command goes through one Executor:
+
+  - a semaphore bounds the number of child processes alive at once, so a
+    burst of requests queues instead of forking without limit,
+  - identical read-only commands already running with the same timeout are
+    coalesced (singleflight): the later callers wait for the running one and
+    share its result. Commands that change something (systemctl restart,
+    daemon-reload, pmc SET ...) always run,
+  - submit() / run_all() fan independent commands out on a small thread pool,
+  - the child environment (LANG=C) is built once, not copied per call.
+
+A command returns a CommandResult with exit code, output, duration and
+whether it timed out or could not be started, so a failed check is no
+longer indistinguishable from empty output.
+"""
+import os
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_TIMEOUT = 1.5
+# Helpers that only ever read state; anything not listed here (or below) is never coalesced
+READ_ONLY_COMMANDS = {"pgrep", "pidof", "ps"}
+# systemctl verbs that only read state
+SYSTEMCTL_QUERIES = {"is-active", "is-enabled", "is-failed", "is-system-running", "show", "status", "cat", "list-units", "list-unit-files"}
+PMC_ACTIONS = {"SET", "CMD", "COMMAND"}
+
+
+def is_query(argv):
+    """True when running argv twice at once is the same as running it once (safe to coalesce)."""
+    name = os.path.basename(argv[0])
+    if name == "systemctl":
+        verb = next((a for a in argv[1:] if not a.startswith("-")), None)
+        return verb in SYSTEMCTL_QUERIES
+    if name == "pmc": return not any(a.split(None, 1)[0].upper() in PMC_ACTIONS for a in argv[1:] if a.strip())
+    return name in READ_ONLY_COMMANDS
+
+
+class CommandResult(namedtuple("CommandResult", ["argv", "returncode", "output", "duration", "timed_out", "error"])):
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def failed(self):
+        """Timed out or could not be run at all (a non-zero exit is an answer, not a failure)."""
+        return self.timed_out or self.error is not None
+
+    @property
+    def status(self):
+        if self.timed_out: return "timeout"
+        if self.error is not None: return "error"
+        return "ok" if self.returncode == 0 else "exit"
+
+    def describe(self):
+        name = os.path.basename(self.argv[0])
+        if self.timed_out: return f"{name} timed out after {self.duration:.1f}s"
+        if self.error is not None: return f"{name}: {self.error}"
+        if self.returncode: return f"{name} exited with {self.returncode}: {self.output.strip()[-200:]}"
+        return f"{name} ok"
+
+
+class Executor:
+    def __init__(self, max_procs=8, max_workers=8, on_result=None):
+        self.slots = threading.BoundedSemaphore(max_procs)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ptp-exec")
+        self.on_result = on_result      # fn(result, coalesced) after every call, e.g. for metrics
+        self.env = dict(os.environ, LANG="C")
+        self.inflight = {}              # (tuple(argv), timeout) -> Future of the running query
+        self.lock = threading.Lock()
+        self.counts = { "runs": 0, "coalesced": 0, "timeouts": 0, "errors": 0 }
+
+    def _exec(self, argv, timeout):
+        start = time.perf_counter()
+        with self.slots:
+            try:
+                p = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout, env=self.env)
+                return CommandResult(argv, p.returncode, p.stdout.decode("utf-8", errors="ignore"), time.perf_counter() - start, False, None)
+            except subprocess.TimeoutExpired as e:
+                return CommandResult(argv, None, (e.output or b"").decode("utf-8", errors="ignore"), time.perf_counter() - start, True, None)
+            except OSError as e:
+                return CommandResult(argv, None, "", time.perf_counter() - start, False, e.strerror or str(e))
+
+    def run(self, argv, timeout=DEFAULT_TIMEOUT):
+        """Run argv (or join the identical query already running) and return its CommandResult."""
+        if not is_query(argv): return self._finish(self._exec(list(argv), timeout))
+        key = (tuple(argv), timeout)
+        with self.lock:
+            fut = self.inflight.get(key)
+            leader = fut is None
+            if leader: fut = self.inflight[key] = Future()
+        if not leader:
+            result = fut.result()
+            with self.lock: self.counts["coalesced"] += 1
+            if self.on_result: self.on_result(result, True)
+            return result
+        try: result = self._exec(list(argv), timeout)
+        except BaseException as e:
+            with self.lock: del self.inflight[key]
+            fut.set_exception(e)
+            raise
+        with self.lock: del self.inflight[key]
+        fut.set_result(result)
+        return self._finish(result)
+
+    def _finish(self, result):
+        with self.lock:
+            self.counts["runs"] += 1
+            if result.timed_out: self.counts["timeouts"] += 1
+            elif result.error is not None: self.counts["errors"] += 1
+        if self.on_result: self.on_result(result, False)
+        return result
+
+    def submit(self, argv, timeout=DEFAULT_TIMEOUT):
+        return self.pool.submit(self.run, argv, timeout)
+
+    def run_all(self, commands, timeout=DEFAULT_TIMEOUT):
+        """Run independent commands concurrently; results in the order given."""
+        futures = [self.submit(argv, timeout) for argv in commands]
+        return [f.result() for f in futures]
+
+    def stats(self):
+        with self.lock: return { **self.counts, "inflight": len(self.inflight) }
+
+    def close(self):
+        self.pool.shutdown(wait=False)
@@ -0,0 +1,265 @@
+"""
+Fleet aggregator: one dashboard over many ptp-web nodes.
+
+A single asyncio loop (own thread) keeps one HTTP/1.1 keep-alive connection
+per peer and polls /api/status, /api/bmca and /api/clients of every peer
+concurrently each cycle, with a per-node timeout and exponential backoff for
+unreachable nodes. The merged view (node table + GM -> BC -> slave topology)
+is rebuilt once per cycle, so /api/fleet only returns a cached object.
+
+`python3 fleet.py stub --count 200` starts local stub nodes for testing.
+"""
+import asyncio
+import json
+import threading
+import time
+import traceback
+
+MAX_BACKOFF = 30.0
+MAX_CONCURRENCY = 256     # open sockets at once; 200+ nodes still fit in one wave
+TOP_CLIENTS = 10
+
+
+def parse_peer(spec, default_port=8080):
+    """'host', 'host:port', 'http://host:port' or {"name", "host", "port"} -> (name, host, port)."""
+    if isinstance(spec, dict):
+        host = spec.get("host", "")
+        port = int(spec.get("port", default_port))
+        return spec.get("name") or f"{host}:{port}", host, port
+    spec = spec.strip().split("://", 1)[-1].rstrip("/")
+    host, sep, port = spec.rpartition(":")
+    if not sep: host, port = spec, ""
+    port = int(port) if port else default_port
+    return f"{host}:{port}", host, port
+
+
+class PeerConnection:
+    """Minimal HTTP/1.1 GET client over one persistent asyncio stream."""
+    def __init__(self, host, port):
+        self.host = host; self.port = port
+        self.reader = None; self.writer = None
+
+    async def get_json(self, path):
+        # A kept-alive socket may have been closed by the peer; retry once on a fresh one
+        for attempt in (0, 1):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self.writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nAccept: application/json\r\nConnection: keep-alive\r\n\r\n".encode())
+                await self.writer.drain()
+                status, body = await self._read_response()
+                break
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                self.close()
+                if attempt or not reused: raise
+        if status != 200: raise ConnectionError(f"HTTP {status} for {path}")
+        return json.loads(body)
+
+    async def _read_response(self):
+        line = await self.reader.readline()
+        if not line: raise ConnectionError("connection closed")
+        parts = line.split(None, 2)
+        version, status = parts[0], int(parts[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n"): break
+            if not line: raise ConnectionError("connection closed")
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            self.close()
+        if self.writer is not None and (headers.get("connection", "").lower() == "close" or version == b"HTTP/1.0"):
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            try: self.writer.close()
+            except Exception: pass
+        self.reader = None; self.writer = None
+
+
+class FleetNode:
+    def __init__(self, name, host, port):
+        self.name = name
+        self.conn = PeerConnection(host, port)
+        self.ok = False
+        self.error = "pending"
+        self.failures = 0
+        self.next_attempt = 0.0
+        self.last_ok = None
+        self.latency_ms = None
+        self.status = {}; self.bmca = {}
+        self.clients_total = 0; self.top_clients = []
+
+    def to_dict(self):
+        return { "name": self.name, "ok": self.ok, "error": self.error, "last_ok": self.last_ok, "latency_ms": self.latency_ms,
+                 "failures": self.failures, "status": self.status, "bmca": self.bmca,
+                 "clients_total": self.clients_total, "top_clients": self.top_clients }
+
+
+def _clock(identity):
+    # "aabbcc.fffe.000001-1" (port identity) -> clock identity
+    return (identity or "").split("-")[0]
+
+
+def build_topology(nodes):
+    """
+    GM -> BC -> slave graph from each node's clock_id, parent port identity,
+    grandmaster identity and stepsRemoved. Clocks outside the fleet (e.g. a
+    third-party GM) appear as vertices without a node.
+    """
+    vertices = {}
+    for n in nodes:
+        st = n.get("status") or {}
+        cid = st.get("clock_id")
+        if not cid: continue
+        vertices[cid] = { "id": cid, "node": n["name"], "ok": n["ok"], "port": st.get("port"), "steps_removed": st.get("steps_removed"), "gm": st.get("gm_id"), "role": "slave" }
+    edges = []
+    by_gm_steps = {}
+    for v in vertices.values(): by_gm_steps.setdefault((v["gm"], v["steps_removed"]), []).append(v["id"])
+    for n in nodes:
+        st = n.get("status") or {}
+        cid = st.get("clock_id")
+        if cid not in vertices: continue
+        if st.get("is_self") or st.get("gm_id") == cid:
+            vertices[cid]["role"] = "gm"; continue
+        parent = _clock(st.get("parent"))
+        if not parent or parent == cid:
+            # No parent identity (older peer): nearest clock one hop closer to the same GM
+            steps = st.get("steps_removed") or 0
+            cands = by_gm_steps.get((st.get("gm_id"), steps - 1)) or []
+            parent = cands[0] if len(cands) == 1 else st.get("gm_id")
+        if not parent: continue
+        if parent not in vertices:
+            vertices[parent] = { "id": parent, "node": None, "ok": None, "port": None, "steps_removed": None, "gm": st.get("gm_id"), "role": "gm" if parent == st.get("gm_id") else "external" }
+        edges.append({ "from": parent, "to": cid })
+    parents = {e["from"] for e in edges}
+    for v in vertices.values():
+        if v["role"] == "slave" and v["id"] in parents: v["role"] = "bc"
+    return { "vertices": list(vertices.values()), "edges": edges }
+
+
+class FleetAggregator:
+    def __init__(self, peers, interval=1.0, timeout=0.8):
+        self.nodes = [FleetNode(*parse_peer(p)) for p in peers]
+        self.interval = interval
+        self.timeout = timeout
+        self.view = { "time": None, "duration": None, "nodes": [n.to_dict() for n in self.nodes], "topology": { "vertices": [], "edges": [] } }
+        self._thread = None
+
+    def start(self):
+        if self.nodes and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._main()), name="fleet-aggregator", daemon=True)
+            self._thread.start()
+        return self
+
+    async def _poll(self, node, sem):
+        async with sem:
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(self._fetch(node), self.timeout)
+            except Exception as e:
+                # State of a timed-out keep-alive stream is unknown, start over next time
+                node.conn.close()
+                node.ok = False
+                node.error = str(e) or type(e).__name__
+                node.failures += 1
+                node.next_attempt = time.monotonic() + min(MAX_BACKOFF, self.interval * 2 ** (node.failures - 1))
+                return
+            node.ok = True; node.error = None; node.failures = 0
+            node.last_ok = time.time()
+            node.latency_ms = round((time.monotonic() - start) * 1000, 1)
+
+    async def _fetch(self, node):
+        status = await node.conn.get_json("/api/status")
+        bmca = await node.conn.get_json("/api/bmca")
+        clients = await node.conn.get_json(f"/api/clients?sort=-rate&limit={TOP_CLIENTS}")
+        node.status = status; node.bmca = bmca
+        node.clients_total = clients.get("total", 0)
+        node.top_clients = clients.get("clients", [])
+
+    async def _main(self):
+        sem = asyncio.Semaphore(MAX_CONCURRENCY)
+        next_due = time.monotonic()
+        while True:
+            try:
+                start = time.monotonic()
+                due = [n for n in self.nodes if n.next_attempt <= start]
+                if due: await asyncio.gather(*(self._poll(n, sem) for n in due))
+                nodes = [n.to_dict() for n in self.nodes]
+                self.view = { "time": time.time(), "duration": round(time.monotonic() - start, 4), "nodes": nodes, "topology": build_topology(nodes) }
+            except Exception:
+                traceback.print_exc()
+            next_due += self.interval
+            now = time.monotonic()
+            if next_due < now: next_due = now + self.interval
+            await asyncio.sleep(next_due - now)
+
+
+# --- Local stub nodes (python3 fleet.py stub --count N) ---
+def stub_payloads(i, fanout=4):
+    """Synthetic node i of a GM (0) -> BCs (1..fanout) -> slaves tree."""
+    cid = f"000000.fffe.{i:06x}"
+    gm = "000000.fffe.000000"
+    if i == 0: parent, steps, port = cid, 0, "MASTER"
+    elif i <= fanout: parent, steps, port = gm, 1, "SLAVE"
+    else: parent, steps, port = f"000000.fffe.{1 + (i % fanout):06x}", 2, "SLAVE"
+    status = { "ptp4l": "RUNNING", "phc2sys": "RUNNING", "port": port, "offset": (i % 7) - 3, "path_delay": 500 + i, "freq": 0,
+               "steps_removed": steps, "gm": gm + (" (Self)" if i == 0 else ""), "gm_id": gm, "clock_id": cid, "parent": f"{parent}-1",
+               "is_self": i == 0, "ptp_time": "--" }
+    bmca = { "local": {"id": cid}, "gm": {"id": gm}, "flags": {}, "decision": [], "winner": "local" if i == 0 else "remote" }
+    clients = { "total": 0, "offset": 0, "clients": [] }
+    return { "/api/status": json.dumps(status).encode(), "/api/bmca": json.dumps(bmca).encode(), "/api/clients": json.dumps(clients).encode() }
+
+
+async def _serve_stub(i, port):
+    payloads = stub_payloads(i)
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                path = line.split()[1].decode().split("?")[0]
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""): pass
+                body = payloads.get(path)
+                head = "200 OK" if body is not None else "404 Not Found"
+                body = body or b"{}"
+                writer.write(f"HTTP/1.1 {head}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+                await writer.drain()
+        except (ConnectionError, IndexError): pass
+        finally: writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", port)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Start local ptp-web stub nodes")
+    parser.add_argument("mode", choices=["stub"])
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--base-port", type=int, default=18000)
+    args = parser.parse_args()
+
+    async def main():
+        servers = [await _serve_stub(i, args.base_port + i) for i in range(args.count)]
+        print(",".join(f"127.0.0.1:{args.base_port + i}" for i in range(args.count)), flush=True)
+        await asyncio.gather(*(s.serve_forever() for s in servers))
+
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+"""
+Network-wide foreign master table built from captured Announce messages.
+
+Every announcing port (interface, domain, sender portIdentity) gets one
+entry with the grandmaster dataset of its latest Announce, its announce rate
+and first / last seen time. Per (interface, domain) the entries are kept in
+a list sorted by the IEEE 1588 dataset comparison (priority1, clockClass,
+clockAccuracy, offsetScaledLogVariance, priority2, grandmasterIdentity,
+stepsRemoved, sender portIdentity). An Announce only moves its entry when
+that key changed (bisect out + insort, most announces repeat the same
+dataset and cost one tuple compare), so a query walks an already ranked list
+instead of sorting hundreds of ports per request.
+
+An entry is stale after STALE_INTERVALS announce intervals without an
+Announce (the announceReceiptTimeout idea) and dropped after `ttl` seconds.
+"""
+import bisect
+import math
+import threading
+from collections import OrderedDict
+
+from capture import decode_announce
+
+RATE_TAU = 10.0         # seconds, time constant of the announce rate estimator
+STALE_INTERVALS = 4     # IEEE 1588 FOREIGN_MASTER_TIME_WINDOW
+
+
+class ForeignMaster:
+    __slots__ = ("key", "iface", "domain", "clock_id", "port_number", "src_ip", "src_mac", "is_self",
+                 "announce", "rank_key", "log_interval", "count", "rate", "first_seen", "last_seen")
+
+    def __init__(self, key, now):
+        self.key = key
+        self.iface, self.domain, self.clock_id, self.port_number = key
+        self.src_ip = self.src_mac = None; self.is_self = False
+        self.announce = None; self.rank_key = None; self.log_interval = 0
+        self.count = 0; self.rate = 0.0
+        self.first_seen = now; self.last_seen = now
+
+    def observe(self, msg, announce, now):
+        dt = now - self.last_seen
+        self.rate = self.rate * math.exp(-dt / RATE_TAU) + 1.0 / RATE_TAU if self.count else 1.0 / RATE_TAU
+        self.count += 1
+        self.last_seen = now
+        self.src_ip = msg.src_ip; self.src_mac = msg.src_mac
+        self.log_interval = msg.log_interval
+        self.announce = announce
+
+    def stale(self, now):
+        # logMessageInterval 0x7F means "not specified": fall back to the 1 s default
+        interval = 2.0 ** self.log_interval if -8 <= self.log_interval <= 8 else 1.0
+        return now - self.last_seen > STALE_INTERVALS * interval
+
+    def to_dict(self, now, rank):
+        a = self.announce
+        return { "rank": rank, "iface": self.iface, "domain": self.domain, "gm_identity": a.gm_identity,
+                 "priority1": a.priority1, "clock_class": a.clock_class, "clock_accuracy": a.clock_accuracy,
+                 "variance": a.variance, "priority2": a.priority2, "steps_removed": a.steps_removed,
+                 "time_source": a.time_source, "utc_offset": a.utc_offset,
+                 "port_identity": f"{self.clock_id}-{self.port_number}", "src_ip": self.src_ip, "src_mac": self.src_mac,
+                 "is_self": self.is_self, "log_interval": self.log_interval, "count": self.count,
+                 "rate": round(self.rate * math.exp(-(now - self.last_seen) / RATE_TAU), 2),
+                 "first_seen": self.first_seen, "last_seen": self.last_seen, "stale": self.stale(now) }
+
+
+def rank_key(entry):
+    a = entry.announce
+    return (a.priority1, a.clock_class, a.clock_accuracy, a.variance, a.priority2, a.gm_identity,
+            a.steps_removed, entry.clock_id, entry.port_number)
+
+
+class ForeignMasterTable:
+    def __init__(self, max_entries=1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()   # (iface, domain, clock_id, port) -> ForeignMaster, least recently seen first
+        self.ranking = {}              # (iface, domain) -> sorted [(rank_key, entry key)]
+        self.lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _unrank(self, entry):
+        group = self.ranking.get((entry.iface, entry.domain))
+        if group is None or entry.rank_key is None: return
+        i = bisect.bisect_left(group, (entry.rank_key, entry.key))
+        if i < len(group) and group[i][1] == entry.key: del group[i]
+        if not group: del self.ranking[(entry.iface, entry.domain)]
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self._unrank(entry)
+
+    def observe(self, msgs, iface, my_ip, now):
+        """Same signature as ClientTable.observe; everything but Announce is ignored."""
+        with self.lock:
+            for msg in msgs:
+                if msg.msg_type != 0xB: continue
+                announce = decode_announce(msg)
+                if announce is None: continue
+                key = (iface, msg.domain, msg.clock_id, msg.port_number)
+                entry = self.entries.get(key)
+                if entry is None:
+                    if len(self.entries) >= self.max_entries:
+                        self._remove(next(iter(self.entries)))
+                        self.evicted += 1
+                    entry = self.entries[key] = ForeignMaster(key, now)
+                else:
+                    self.entries.move_to_end(key)
+                entry.observe(msg, announce, now)
+                entry.is_self = (msg.src_ip is not None and msg.src_ip == my_ip)
+                new_key = rank_key(entry)
+                if new_key != entry.rank_key:
+                    self._unrank(entry)
+                    entry.rank_key = new_key
+                    bisect.insort(self.ranking.setdefault((iface, msg.domain), []), (new_key, key))
+            self._expire(now)
+
+    def _expire(self, now):
+        # Oldest entries sit at the front of the LRU order, so stop at the first live one
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if now - entry.last_seen <= self.ttl: break
+            self._remove(key)
+
+    def query(self, now, iface=None, domain=None):
+        """[{iface, domain, best, gm_count, competing, masters: [rows in BMCA order]}] per (interface, domain)."""
+        out = []
+        with self.lock:
+            self._expire(now)
+            for (g_iface, g_domain), group in sorted(self.ranking.items()):
+                if iface and g_iface != iface: continue
+                if domain is not None and g_domain != domain: continue
+                rows = [self.entries[key].to_dict(now, rank) for rank, (_, key) in enumerate(group, 1)]
+                live = [r for r in rows if not r["stale"]]
+                gms = {r["gm_identity"] for r in live}
+                out.append({ "iface": g_iface, "domain": g_domain, "best": live[0]["gm_identity"] if live else None,
+                             "gm_count": len(gms), "competing": len(gms) > 1, "masters": rows })
+        return out
@@ -0,0 +1,100 @@
+"""
+Fixed-memory time-series history for sampled PTP metrics.
+
+Each metric is a pair of preallocated `array` rings (timestamps + values),
+so 24 h at 1 Hz costs ~1.4 MB per float metric instead of a list of dicts.
+Queries return min/max/mean buckets (min-max decimation); bucket edges are
+located with bisect and aggregated with C-level min()/max()/sum() over
+array slices, so there is no per-sample Python loop.
+"""
+import bisect
+import threading
+from array import array
+
+
+class MetricRing:
+    def __init__(self, capacity, typecode="d"):
+        self.capacity = capacity
+        self.ts = array("d", bytes(8 * capacity))
+        self.values = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self.head = 0    # next physical write position
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, t, value):
+        with self.lock:
+            self.ts[self.head] = t
+            self.values[self.head] = value
+            self.head = (self.head + 1) % self.capacity
+            if self.count < self.capacity: self.count += 1
+
+    def _segments(self):
+        # Physical [start, end) slices of the live part of the ring, oldest first (one or two)
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity: return [(start, start + self.count)]
+        return [(start, self.capacity), (0, self.head)]
+
+    def range(self, t_from, t_to):
+        """(timestamps, values) arrays for samples with t_from <= t <= t_to, oldest first."""
+        ts = array("d"); vals = array(self.values.typecode)
+        with self.lock:
+            # Bisect each segment in place and copy only the matching samples
+            for start, end in self._segments():
+                lo = bisect.bisect_left(self.ts, t_from, start, end)
+                hi = bisect.bisect_right(self.ts, t_to, lo, end)
+                if hi > lo:
+                    ts += self.ts[lo:hi]; vals += self.values[lo:hi]
+        return ts, vals
+
+    def latest(self):
+        with self.lock:
+            if not self.count: return None
+            i = (self.head - 1) % self.capacity
+            return self.ts[i], self.values[i]
+
+    @property
+    def nbytes(self):
+        return self.capacity * (self.ts.itemsize + self.values.itemsize)
+
+
+def downsample(ts, vals, t_from, t_to, points):
+    """
+    Min-max decimation into `points` equal-time buckets.
+    Returns [[bucket_start, min, max, mean, count], ...], skipping empty buckets.
+    """
+    n = len(ts)
+    if not n or points <= 0: return []
+    if n <= points:
+        return [[t, v, v, v, 1] for t, v in zip(ts, vals)]
+    width = (t_to - t_from) / points
+    if width <= 0: return []
+    out = []
+    lo = 0
+    for i in range(points):
+        edge = t_from + (i + 1) * width
+        hi = n if i == points - 1 else bisect.bisect_right(ts, edge, lo)
+        if hi > lo:
+            chunk = vals[lo:hi]
+            out.append([t_from + i * width, min(chunk), max(chunk), sum(chunk) / (hi - lo), hi - lo])
+        lo = hi
+    return out
+
+
+class MetricHistory:
+    """Named set of MetricRing, one per metric."""
+    def __init__(self, capacity, metrics):
+        # metrics: {name: array typecode}
+        self.rings = {name: MetricRing(capacity, tc) for name, tc in metrics.items()}
+
+    def record(self, t, values):
+        for name, value in values.items():
+            ring = self.rings.get(name)
+            if ring is not None and value is not None: ring.append(t, value)
+
+    def query(self, name, t_from, t_to, points):
+        ts, vals = self.rings[name].range(t_from, t_to)
+        return downsample(ts, vals, t_from, t_to, points)
+
+    @property
+    def nbytes(self):
+        return sum(r.nbytes for r in self.rings.values())
@@ -0,0 +1,313 @@
+"""
+Cached host metadata: network interfaces and the ptp4l config directory.
+
+The interface table (name, ifindex, MAC, operstate, IPv4 / IPv6 addresses)
+is built from one rtnetlink dump (RTM_GETLINK + RTM_GETADDR) and kept as an
+immutable snapshot, so a read is a dict lookup. It is rebuilt only when the
+kernel reports a change on the RTMGRP_LINK / RTMGRP_IPV4_IFADDR /
+RTMGRP_IPV6_IFADDR multicast groups (link up/down, rename, driver reload,
+DHCP lease), and listeners get the names of the interfaces that changed.
+Config files are watched with inotify on their directory (editors and the
+apply path replace them by rename), so consumers re-parse on a real change
+instead of stat()ing on every request.
+
+Without netlink / inotify (non-Linux, restricted sandbox) the table falls
+back to a sysfs + SIOCGIFADDR scan at most every FALLBACK_INTERVAL seconds.
+"""
+import ctypes
+import errno
+import fcntl
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+SYSFS_NET = "/sys/class/net"
+FALLBACK_INTERVAL = 5.0
+
+# rtnetlink (linux/netlink.h, linux/rtnetlink.h, linux/if_link.h, linux/if_addr.h)
+NETLINK_ROUTE = 0
+RTMGRP_LINK, RTMGRP_IPV4_IFADDR, RTMGRP_IPV6_IFADDR = 0x1, 0x10, 0x100
+NLMSG_ERROR, NLMSG_DONE = 2, 3
+NLM_F_REQUEST, NLM_F_DUMP = 0x1, 0x300
+RTM_NEWLINK, RTM_GETLINK, RTM_NEWADDR, RTM_GETADDR = 16, 18, 20, 22
+IFLA_ADDRESS, IFLA_IFNAME, IFLA_OPERSTATE = 1, 3, 16
+IFA_ADDRESS, IFA_LOCAL = 1, 2
+IFF_UP = 0x1
+OPERSTATES = ["unknown", "notpresent", "down", "lowerlayerdown", "testing", "dormant", "up"]
+NLMSGHDR = struct.Struct("=IHHII")     # len, type, flags, seq, pid
+IFINFOMSG = struct.Struct("=BxHiII")   # family, type, index, flags, change
+IFADDRMSG = struct.Struct("=BBBBI")    # family, prefixlen, flags, scope, index
+RTATTR = struct.Struct("=HH")          # len, type
+
+# inotify (linux/inotify.h)
+IN_ATTRIB, IN_CLOSE_WRITE = 0x4, 0x8
+IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+IN_DELETE_SELF, IN_IGNORED = 0x400, 0x8000
+IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+CONFIG_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ATTRIB | IN_DELETE_SELF
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+SIOCGIFADDR = 0x8915
+
+Link = namedtuple("Link", ["name", "index", "mac", "up", "operstate", "ipv4", "ipv6"])
+
+
+def _attrs(buf, off, end):
+    while off + RTATTR.size <= end:
+        length, kind = RTATTR.unpack_from(buf, off)
+        if length < RTATTR.size: break
+        yield kind, buf[off + RTATTR.size:off + length]
+        off += (length + 3) & ~3
+
+
+def _messages(buf):
+    off = 0
+    while off + NLMSGHDR.size <= len(buf):
+        length, kind, _, _, _ = NLMSGHDR.unpack_from(buf, off)
+        if length < NLMSGHDR.size: break
+        yield kind, buf, off + NLMSGHDR.size, off + length
+        off += (length + 3) & ~3
+
+
+def parse_link(buf, off, end):
+    """RTM_NEWLINK body -> (index, name, mac, up, operstate)."""
+    _, _, index, flags, _ = IFINFOMSG.unpack_from(buf, off)
+    name = mac = None; oper = 0
+    for kind, value in _attrs(buf, off + IFINFOMSG.size, end):
+        if kind == IFLA_IFNAME: name = value.split(b"\0", 1)[0].decode(errors="replace")
+        elif kind == IFLA_ADDRESS: mac = ":".join(f"{b:02x}" for b in value)
+        elif kind == IFLA_OPERSTATE: oper = value[0]
+    return index, name, mac, bool(flags & IFF_UP), OPERSTATES[oper] if oper < len(OPERSTATES) else "unknown"
+
+
+def parse_addr(buf, off, end):
+    """RTM_NEWADDR body -> (index, family, address)."""
+    family, _, _, _, index = IFADDRMSG.unpack_from(buf, off)
+    addr = local = None
+    for kind, value in _attrs(buf, off + IFADDRMSG.size, end):
+        if kind == IFA_ADDRESS: addr = value
+        elif kind == IFA_LOCAL: local = value
+    # IFA_LOCAL is our address; IFA_ADDRESS is the peer on point-to-point links
+    raw = local or addr
+    return index, family, socket.inet_ntop(family, raw) if raw else None
+
+
+class NetlinkDumper:
+    """One unbound NETLINK_ROUTE socket for dump requests."""
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        self.seq = 0
+
+    def dump(self, kind):
+        self.seq += 1
+        # struct rtgenmsg { unsigned char rtgen_family; } padded to 4 bytes
+        self.sock.send(NLMSGHDR.pack(NLMSGHDR.size + 4, kind, NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0) + b"\0" * 4)
+        out = []
+        while True:
+            buf = self.sock.recv(65536)
+            for mtype, data, off, end in _messages(buf):
+                if mtype == NLMSG_DONE: return out
+                if mtype == NLMSG_ERROR:
+                    code = struct.unpack_from("=i", data, off)[0]
+                    if code: raise OSError(-code, os.strerror(-code))
+                    continue
+                out.append((mtype, data, off, end))
+
+    def links(self):
+        links = {}
+        for mtype, data, off, end in self.dump(RTM_GETLINK):
+            if mtype != RTM_NEWLINK: continue
+            index, name, mac, up, oper = parse_link(data, off, end)
+            if name: links[index] = [name, index, mac, up, oper, [], []]
+        for mtype, data, off, end in self.dump(RTM_GETADDR):
+            if mtype != RTM_NEWADDR: continue
+            index, family, addr = parse_addr(data, off, end)
+            if addr and index in links: links[index][5 if family == socket.AF_INET else 6].append(addr)
+        return {l[0]: Link(l[0], l[1], l[2], l[3], l[4], tuple(l[5]), tuple(l[6])) for l in links.values()}
+
+    def close(self):
+        self.sock.close()
+
+
+def _sysfs_read(iface, attr):
+    try:
+        with open(os.path.join(SYSFS_NET, iface, attr)) as f: return f.read().strip()
+    except OSError: return None
+
+
+def _ipv4_ioctl(iface):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try: return socket.inet_ntoa(fcntl.ioctl(s, SIOCGIFADDR, struct.pack("256s", iface.encode()[:15]))[20:24])
+        except OSError: return None
+
+
+def scan_sysfs():
+    """Fallback interface table from sysfs and SIOCGIFADDR (first IPv4 only)."""
+    links = {}
+    try: names = os.listdir(SYSFS_NET)
+    except OSError: return links
+    for name in names:
+        try: index = int(_sysfs_read(name, "ifindex") or 0)
+        except ValueError: index = 0
+        flags = _sysfs_read(name, "flags") or "0"
+        ip = _ipv4_ioctl(name)
+        links[name] = Link(name, index, _sysfs_read(name, "address"), bool(int(flags, 16) & IFF_UP),
+                           _sysfs_read(name, "operstate") or "unknown", (ip,) if ip else (), ())
+    return links
+
+
+class Inotify:
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno(); raise OSError(e, os.strerror(e))
+
+    def add_watch(self, path, mask):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno(); raise OSError(e, os.strerror(e))
+        return wd
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """[(wd, mask, name)] of the queued events."""
+        out = []
+        while True:
+            try: buf = os.read(self.fd, 65536)
+            except BlockingIOError: return out
+            off = 0
+            while off + INOTIFY_EVENT.size <= len(buf):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(buf, off)
+                name = buf[off + INOTIFY_EVENT.size:off + INOTIFY_EVENT.size + length].split(b"\0", 1)[0]
+                out.append((wd, mask, os.fsdecode(name)))
+                off += INOTIFY_EVENT.size + length
+
+    def close(self):
+        os.close(self.fd)
+
+
+class HostInfo:
+    def __init__(self):
+        self.links = {}               # name -> Link (replaced as a whole, never mutated)
+        self.link_listeners = []      # fn(set of changed interface names), on the watcher thread
+        self.watching_links = False
+        self._dirs = {}               # inotify wd -> (directory, fn(filename))
+        self._events = None
+        self._dumper = None
+        self._inotify = None
+        self._sel = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._scanned_at = 0.0
+        self._thread = None
+
+    def start(self):
+        try:
+            self._dumper = NetlinkDumper()
+            self._events = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            self._events.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            self._events.setblocking(False)
+            self._sel.register(self._events, selectors.EVENT_READ, "link")
+            self.watching_links = True
+        except OSError:
+            self._events = None
+        try:
+            self._inotify = Inotify()
+            self._sel.register(self._inotify, selectors.EVENT_READ, "inotify")
+        except (OSError, AttributeError):
+            self._inotify = None
+        self._reload()
+        if (self._events or self._inotify) and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name="host-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def watch_dir(self, path, fn):
+        """
+        Call fn(filename) for every create / write / rename / delete in `path`, and fn(None)
+        once if the directory itself goes away (the watch ends). False when not watchable.
+        """
+        if self._inotify is None: return False
+        try: wd = self._inotify.add_watch(path, CONFIG_MASK)
+        except OSError: return False
+        self._dirs[wd] = (path, fn)
+        return True
+
+    # --- reads (no syscalls unless running on the fallback scan) ---
+    def _table(self):
+        if not self.watching_links and time.monotonic() - self._scanned_at > FALLBACK_INTERVAL: self._reload()
+        return self.links
+
+    def nics(self):
+        return sorted(n for n in self._table() if not n.startswith("lo"))
+
+    def has_link(self, name):
+        return name in self._table()
+
+    def link(self, name):
+        return self._table().get(name)
+
+    def ifindex(self, name):
+        l = self._table().get(name)
+        return l.index if l else None
+
+    def ipv4(self, name):
+        l = self._table().get(name)
+        return l.ipv4[0] if l and l.ipv4 else None
+
+    # --- watcher ---
+    def _reload(self):
+        with self._lock:
+            old = self.links
+            try: links = self._dumper.links() if self._dumper else scan_sysfs()
+            except OSError: links = scan_sysfs()
+            self.links = links
+            self._scanned_at = time.monotonic()
+        return {n for n in set(old) | set(links) if old.get(n) != links.get(n)}
+
+    def _drain_links(self):
+        # Any number of queued events collapses into one re-dump; ENOBUFS (overrun) just means "re-dump"
+        while True:
+            try:
+                if not self._events.recv(65536): break
+            except BlockingIOError: break
+            except OSError as e:
+                if e.errno != errno.ENOBUFS: raise
+        return self._reload()
+
+    def _run(self):
+        while True:
+            try:
+                for key, _ in self._sel.select():
+                    if key.data == "link":
+                        changed = self._drain_links()
+                        if not changed: continue
+                        for fn in self.link_listeners:
+                            try: fn(changed)
+                            except Exception: traceback.print_exc()
+                    else:
+                        for wd, mask, name in self._inotify.read():
+                            path, fn = self._dirs.get(wd, (None, None))
+                            if fn is None: continue
+                            if mask & (IN_DELETE_SELF | IN_IGNORED):
+                                if self._dirs.pop(wd, None) is None: continue
+                                name = None
+                            try: fn(name)
+                            except Exception: traceback.print_exc()
+            except Exception:
+                traceback.print_exc()
+                time.sleep(1)
+
+    def close(self):
+        for closer in (self._events, self._dumper, self._inotify):
+            if closer is not None:
+                try: closer.close()
+                except Exception: pass
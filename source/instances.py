@@ -0,0 +1,155 @@
+"""
+Discovery of the ptp4l instances managed by this controller.
+
+The default instance is `/etc/linuxptp/ptp4l.conf` run by `ptp4l.service`.
+Every additional `/etc/linuxptp/ptp4l-<name>.conf` is one more instance run
+by the `ptp4l@<name>.service` template unit, with its own management socket
+(uds_address) and domain. Each instance keeps one persistent PmcClient.
+"""
+import os
+import re
+import threading
+
+from pmc_client import PmcClient, PTP4L_UDS
+
+CONFIG_DIR = "/etc/linuxptp"
+DEFAULT_INSTANCE = "default"
+NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+CONFIG_RE = re.compile(r"^ptp4l-([A-Za-z0-9_-]{1,32})\.conf$")
+
+
+def parse_sections(text):
+    """Single pass over ptp4l config text. Returns {section: {option: value}} in file order."""
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line[0] in "#;": continue
+        m = re.match(r'^\[([^\]]+)\]', line)
+        if m:
+            current = sections.setdefault(m.group(1), {})
+            continue
+        if current is not None:
+            parts = line.split(None, 1)
+            current[parts[0]] = parts[1].strip() if len(parts) > 1 else ""
+    return sections
+
+
+def parse_ptp4l_config(path):
+    """Returns ({global option: value}, [port section names])."""
+    try:
+        with open(path, 'r') as f: sections = parse_sections(f.read())
+    except OSError: return {}, []
+    return sections.get("global", {}), [s for s in sections if s != "global"]
+
+
+class PtpInstance:
+    __slots__ = ("name", "config_file", "unit", "uds_path", "domain", "interfaces", "mtime")
+
+    def __init__(self, name, config_file):
+        self.name = name
+        self.config_file = config_file
+        self.unit = unit_name(name)
+        self.load()
+
+    def load(self):
+        try: self.mtime = os.stat(self.config_file).st_mtime
+        except OSError: self.mtime = None
+        options, self.interfaces = parse_ptp4l_config(self.config_file)
+        self.uds_path = options.get("uds_address") or default_uds_path(self.name)
+        try: self.domain = int(options.get("domainNumber", 0))
+        except ValueError: self.domain = 0
+
+    @property
+    def interface(self):
+        return self.interfaces[0] if self.interfaces else None
+
+    def to_dict(self):
+        return { "name": self.name, "config_file": self.config_file, "unit": self.unit, "uds_path": self.uds_path,
+                 "domain": self.domain, "interfaces": list(self.interfaces), "configured": self.mtime is not None }
+
+
+def unit_name(name):
+    return "ptp4l" if name == DEFAULT_INSTANCE else f"ptp4l@{name}"
+
+
+def default_uds_path(name):
+    return PTP4L_UDS if name == DEFAULT_INSTANCE else f"{PTP4L_UDS}-{name}"
+
+
+def config_path(name, config_dir=CONFIG_DIR):
+    if name == DEFAULT_INSTANCE: return os.path.join(config_dir, "ptp4l.conf")
+    return os.path.join(config_dir, f"ptp4l-{name}.conf")
+
+
+class InstanceRegistry:
+    """
+    Cached instance list. refresh() costs one listdir plus one stat per config
+    and only re-parses files whose mtime changed. While the config directory is
+    watched (inotify), current() skips even that until invalidate() is called.
+    """
+    def __init__(self, config_dir=CONFIG_DIR):
+        self.config_dir = config_dir
+        self.instances = {}    # name -> PtpInstance, default first
+        self.clients = {}      # name -> PmcClient
+        self.lock = threading.Lock()
+        self.watched = False
+        self.stale = True
+        self.refresh()
+
+    def invalidate(self):
+        self.stale = True
+
+    def current(self):
+        return self.refresh() if self.stale or not self.watched else self.all()
+
+    def _discover(self):
+        names = [DEFAULT_INSTANCE]
+        try: names += sorted(m.group(1) for m in map(CONFIG_RE.match, os.listdir(self.config_dir)) if m)
+        except OSError: pass
+        return names
+
+    def refresh(self):
+        with self.lock:
+            # Cleared before the scan, so an event arriving during it is not lost
+            self.stale = False
+            current = {}
+            for name in self._discover():
+                inst = self.instances.get(name)
+                if inst is None: inst = PtpInstance(name, config_path(name, self.config_dir))
+                else:
+                    try: mtime = os.stat(inst.config_file).st_mtime
+                    except OSError: mtime = None
+                    if mtime != inst.mtime: inst.load()
+                current[name] = inst
+            for name in set(self.clients) - set(current):
+                self.clients.pop(name).close()
+            self.instances = current
+            return list(current.values())
+
+    def all(self):
+        with self.lock:
+            return list(self.instances.values())
+
+    def get(self, name):
+        with self.lock:
+            return self.instances.get(name or DEFAULT_INSTANCE)
+
+    @property
+    def primary(self):
+        return self.get(DEFAULT_INSTANCE)
+
+    def client(self, inst):
+        with self.lock:
+            pmc = self.clients.get(inst.name)
+            if pmc is not None and pmc.uds_path != inst.uds_path:
+                pmc.close(); pmc = None
+            if pmc is None: pmc = self.clients[inst.name] = PmcClient(inst.uds_path)
+        # ptp4l drops management messages for a foreign domain, so follow the configured one
+        pmc.domain = inst.domain
+        return pmc
+
+    def close(self):
+        with self.lock:
+            for pmc in self.clients.values(): pmc.close()
+            self.clients = {}
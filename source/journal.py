@@ -0,0 +1,147 @@
+"""
+Long-lived journald follower for the ptp4l / phc2sys units.
+
+One `journalctl -f -o json` process feeds a bounded in-memory ring of
+structured records. Readers fetch incrementally by journald cursor, and
+ptp4l servo lines ("master offset ... freq ... path delay ...") are parsed
+into metrics on the way in.
+"""
+import json
+import re
+import subprocess
+import threading
+import time
+import traceback
+from collections import deque, namedtuple
+
+LogRecord = namedtuple("LogRecord", ["seq", "cursor", "ts", "unit", "priority", "ident", "message"])
+ServoSample = namedtuple("ServoSample", ["ts", "offset", "state", "freq", "path_delay"])
+
+# ptp4l: "master offset        -12 s2 freq   +1234 path delay       567"
+SERVO_RE = re.compile(r"master offset\s+(-?\d+)\s+s(\d)\s+freq\s+([+-]?\d+)\s+path delay\s+(-?\d+)")
+# ptp4l with summary_interval: "rms   12 max   20 freq  +123 +/-   4 delay   567 +/-   1"
+SERVO_RMS_RE = re.compile(r"\brms\s+(\d+)\s+max\s+\d+\s+freq\s+([+-]?\d+)\s+\+/-\s+\d+(?:\s+delay\s+(\d+))?")
+
+RESTART_DELAY = 2.0
+
+
+def parse_servo(message, ts):
+    m = SERVO_RE.search(message)
+    if m: return ServoSample(ts, int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)))
+    # Summary lines are printed in any servo state and carry an unsigned rms: no offset, no state
+    m = SERVO_RMS_RE.search(message)
+    if m: return ServoSample(ts, None, None, int(m.group(2)), int(m.group(3)) if m.group(3) else None)
+    return None
+
+
+def _text(value):
+    # journald exports non-UTF-8 fields as a list of byte values
+    if isinstance(value, list): return bytes(value).decode("utf-8", errors="replace")
+    return value or ""
+
+
+class JournalFollower:
+    def __init__(self, units, maxlen=2000, backlog=200):
+        self.units = list(units)
+        self.backlog = backlog
+        self.records = deque(maxlen=maxlen)
+        self.servo = {}               # unit -> latest ServoSample (one per ptp4l instance)
+        self.listeners = []           # fn(list[LogRecord]) on the follower thread
+        self.servo_listeners = []     # fn(unit, ServoSample)
+        self._seq = 0
+        self._by_cursor = {}
+        self._lock = threading.Lock()
+        self._last_cursor = None
+        self._proc = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="journal-follower", daemon=True)
+            self._thread.start()
+        return self
+
+    def _command(self):
+        cmd = ["journalctl", "-f", "-o", "json", "--no-pager"]
+        for u in self.units: cmd += ["-u", u]
+        # Resume exactly where the previous follower process stopped
+        if self._last_cursor: cmd += ["--after-cursor", self._last_cursor]
+        else: cmd += ["-n", str(self.backlog)]
+        return cmd
+
+    def _run(self):
+        while True:
+            try:
+                self._proc = subprocess.Popen(self._command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                              env={"LANG": "C", "PATH": "/usr/bin:/bin:/usr/sbin:/sbin"})
+                for line in self._proc.stdout:
+                    rec = self._parse(line)
+                    if rec is not None: self._append(rec)
+                self._proc.wait()
+            except FileNotFoundError:
+                pass
+            except Exception:
+                traceback.print_exc()
+            time.sleep(RESTART_DELAY)
+
+    def _parse(self, line):
+        try: entry = json.loads(line)
+        except ValueError: return None
+        try: ts = int(entry.get("__REALTIME_TIMESTAMP", 0)) / 1e6 or time.time()
+        except (TypeError, ValueError): ts = time.time()
+        try: prio = int(entry.get("PRIORITY", 6))
+        except (TypeError, ValueError): prio = 6
+        return (entry.get("__CURSOR", ""), ts, _text(entry.get("_SYSTEMD_UNIT") or entry.get("UNIT")), prio,
+                _text(entry.get("SYSLOG_IDENTIFIER")), _text(entry.get("MESSAGE")))
+
+    def _append(self, fields):
+        with self._lock:
+            self._seq += 1
+            rec = LogRecord(self._seq, *fields)
+            if len(self.records) == self.records.maxlen:
+                self._by_cursor.pop(self.records[0].cursor, None)
+            self.records.append(rec)
+            self._by_cursor[rec.cursor] = rec.seq
+            self._last_cursor = rec.cursor
+        # phc2sys prints look-alike summaries, only ptp4l's servo lines are port metrics
+        servo = parse_servo(rec.message, rec.ts) if rec.unit.startswith("ptp4l") else None
+        if servo is not None:
+            self.servo[rec.unit] = servo
+            for fn in self.servo_listeners:
+                try: fn(rec.unit, servo)
+                except Exception: traceback.print_exc()
+        for fn in self.listeners:
+            try: fn([rec])
+            except Exception: traceback.print_exc()
+
+    def since(self, cursor=None, units=None, max_priority=None, limit=None):
+        """
+        Records after `cursor` (all buffered records when None/unknown), filtered by
+        unit name prefix and maximum syslog priority, at most the newest `limit` of them.
+        Returns (records, next_cursor, reset, truncated): next_cursor is the newest record
+        seen regardless of filters, truncated=True means older matches were left out, and
+        reset=True means the records do not continue from the given cursor (it had already
+        left the ring, or the limit cut a gap after it).
+        """
+        with self._lock:
+            start_seq = self._by_cursor.get(cursor) if cursor else None
+            reset = bool(cursor) and start_seq is None
+            if start_seq is None: items = list(self.records)
+            else:
+                # Records are seq-contiguous, so the cursor position is an index computation
+                items = list(self.records)[start_seq - self.records[0].seq + 1:]
+            next_cursor = self._last_cursor or cursor
+        if units: items = [r for r in items if any(r.unit.startswith(u) for u in units)]
+        if max_priority is not None: items = [r for r in items if r.priority <= max_priority]
+        truncated = bool(limit) and len(items) > limit
+        if truncated: items = items[-limit:]
+        return items, next_cursor, reset or (truncated and bool(cursor)), truncated
+
+    def tail(self, n):
+        with self._lock:
+            return list(self.records)[-n:]
+
+    def stop(self):
+        if self._proc and self._proc.poll() is None:
+            try: self._proc.terminate()
+            except Exception: pass
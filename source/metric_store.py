@@ -0,0 +1,319 @@
+"""
+Durable on-disk store of the sampled metrics (survives restarts and reboots).
+
+One file per UTC day (metrics-YYYYMMDD.dat), memory-mapped:
+
+    [0, 64)        header: magic, version, record size, day start
+    [64, 5824)     time index: uint32 per minute of the day, 1 + number of
+                   the first record in that minute (0 = no record yet)
+    [8192, ...)    fixed 64-byte records, append-only, in time order
+
+A record is t, offset, path delay, freq, servo freq, PHC - system offset
+(NaN = not available), the 8-byte grandmaster identity, port state, flags
+and a CRC32 of the other 60 bytes. Appending writes one record into the map
+and at most one index slot, so a write is O(1). Files are preallocated
+(sparse) and doubled when full. After a crash the record count is recovered
+by binary search over the zero-filled tail, and a torn last record fails
+its CRC and is dropped.
+
+Range queries find their first record through the minute index and return
+memoryview slices of the map (no copy). CSV export streams those records in
+chunks. The directory is bounded by retention_days and max_bytes (oldest
+days deleted first). Finished days are compacted by truncating their unused
+preallocated tail.
+"""
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import traceback
+import zlib
+from array import array
+from datetime import datetime, timezone
+
+MAGIC = b"PTPMET01"
+VERSION = 1
+HEADER = struct.Struct("<8sIId")       # magic, version, record size, day start (epoch s)
+RECORD = struct.Struct("<dddddd8sBB2xI")   # t, offset, path_delay, freq, servo_freq, phc_offset, gm, port_state, flags, crc
+RECORD_SIZE = RECORD.size              # 64
+INDEX_OFFSET = 64
+MINUTES = 1440
+DATA_OFFSET = 8192
+FLAG_RUNNING = 0x1
+NAN = float("nan")
+FIELDS = ("offset", "path_delay", "freq", "servo_freq", "phc_offset")
+FIELD_INDEX = {name: i + 1 for i, name in enumerate(FIELDS)}
+FIELD_INDEX["port_state"] = 7
+CSV_CHUNK = 1000
+
+
+def day_start(t):
+    return float(int(t // 86400) * 86400)
+
+
+def gm_bytes(gm_id):
+    try:
+        raw = bytes.fromhex((gm_id or "").replace(".", ""))
+        return raw if len(raw) == 8 else bytes(8)
+    except ValueError: return bytes(8)
+
+
+def gm_text(raw):
+    if not any(raw): return ""
+    h = raw.hex()
+    return f"{h[0:6]}.{h[6:10]}.{h[10:16]}"
+
+
+def pack_record(t, values, running):
+    def f(name):
+        v = values.get(name)
+        return NAN if v is None else float(v)
+    body = RECORD.pack(t, f("offset"), f("path_delay"), f("freq"), f("servo_freq"), f("phc_offset"),
+                       gm_bytes(values.get("gm_id")), values.get("port_state") or 0, FLAG_RUNNING if running else 0, 0)
+    return body[:-4] + struct.pack("<I", zlib.crc32(body[:-4]))
+
+
+def record_ok(buf, off):
+    return zlib.crc32(buf[off:off + RECORD_SIZE - 4]) == struct.unpack_from("<I", buf, off + RECORD_SIZE - 4)[0]
+
+
+class DayFile:
+    def __init__(self, path, start, writable=False, capacity=0):
+        self.path = path
+        self.start = start
+        self.writable = writable
+        if writable:
+            self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if os.fstat(self.fd).st_size < DATA_OFFSET:
+                os.ftruncate(self.fd, DATA_OFFSET + max(capacity, 1) * RECORD_SIZE)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, VERSION, RECORD_SIZE, start), 0)
+        else:
+            self.fd = os.open(path, os.O_RDONLY)
+        try:
+            self._map()
+            magic, version, size, _ = HEADER.unpack_from(self.mm, 0)
+            if magic != MAGIC or version != VERSION or size != RECORD_SIZE: raise ValueError(f"{path}: not a metric store file")
+        except (OSError, ValueError, struct.error):
+            if getattr(self, "mm", None) is not None: self.mm.close()
+            os.close(self.fd)
+            raise
+        self.index = memoryview(self.mm)[INDEX_OFFSET:INDEX_OFFSET + 4 * MINUTES].cast("I")
+        self.count = self._recover()
+        self.last_t = struct.unpack_from("<d", self.mm, self._off(self.count - 1))[0] if self.count else 0.0
+
+    def _map(self):
+        size = os.fstat(self.fd).st_size
+        # A grown file gets a new map; the old one stays valid for readers still holding views of it
+        self.mm = mmap.mmap(self.fd, size, access=mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ)
+        self.capacity = (size - DATA_OFFSET) // RECORD_SIZE
+
+    @staticmethod
+    def _off(i):
+        return DATA_OFFSET + i * RECORD_SIZE
+
+    def _t(self, i):
+        return struct.unpack_from("<d", self.mm, self._off(i))[0]
+
+    def _recover(self):
+        # Records are appended into a zero-filled file: the first t == 0 ends the data
+        lo, hi = 0, self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._t(mid) > 0: lo = mid + 1
+            else: hi = mid
+        count = lo
+        if count and not record_ok(self.mm, self._off(count - 1)):
+            count -= 1      # torn write of the last record
+            if self.writable: self.mm[self._off(count):self._off(count + 1)] = bytes(RECORD_SIZE)
+        if self.writable:
+            # The index slot is written after its record, so rebuild it from the data
+            self.index[:] = array("I", bytes(4 * MINUTES))
+            for i in range(count):
+                m = self._minute(self._t(i))
+                if not self.index[m]: self.index[m] = i + 1
+        return count
+
+    def _minute(self, t):
+        return min(max(int((t - self.start) // 60), 0), MINUTES - 1)
+
+    def append(self, record, t):
+        if self.count >= self.capacity:
+            os.ftruncate(self.fd, self._off(self.capacity * 2))
+            old = self.mm
+            self._map()
+            # The old index goes with the old map: dropped, not released, so a view still in use keeps both alive
+            self.index = memoryview(self.mm)[INDEX_OFFSET:INDEX_OFFSET + 4 * MINUTES].cast("I")
+            self._unmap(old)
+        off = self._off(self.count)
+        self.mm[off:off + RECORD_SIZE] = record
+        m = self._minute(t)
+        if not self.index[m]: self.index[m] = self.count + 1
+        self.count += 1
+        self.last_t = t
+
+    def find(self, t):
+        """Number of the first record with time >= t (minute index, then a short forward scan)."""
+        if t <= self.start: return 0
+        i = None
+        for m in range(self._minute(t), MINUTES):
+            if self.index[m]: i = self.index[m] - 1; break
+        if i is None: return self.count
+        # Minute slots can precede t within the minute; an index slot past count is a record still being written
+        i = min(i, self.count)
+        while i > 0 and self._t(i - 1) >= t: i -= 1
+        while i < self.count and self._t(i) < t: i += 1
+        return i
+
+    def view(self, t_from, t_to):
+        """memoryview over the raw records with t_from <= t <= t_to (no copy). Call with the writer held off."""
+        count = self.count
+        lo = self.find(t_from)
+        hi = self.find(math.nextafter(t_to, math.inf))
+        hi = min(hi, count)
+        return memoryview(self.mm)[self._off(lo):self._off(max(lo, hi))]
+
+    def flush(self):
+        if self.writable: self.mm.flush()
+
+    def compact(self):
+        """Drop the unused preallocated tail (the day is finished)."""
+        if self.writable:
+            self.mm.flush()
+            os.ftruncate(self.fd, self._off(self.count))
+
+    @staticmethod
+    def _unmap(mm):
+        # A reader still holding a view keeps the map alive; it is unmapped when that view goes away
+        try: mm.close()
+        except BufferError: pass
+
+    def close(self):
+        self.index = None
+        self._unmap(self.mm)
+        try: os.close(self.fd)
+        except OSError: pass
+
+
+class MetricStore:
+    def __init__(self, data_dir, sample_interval=1.0, retention_days=30, max_bytes=512 << 20, flush_interval=30.0):
+        self.data_dir = data_dir
+        self.capacity = int(86400 / max(sample_interval, 0.01) * 1.1) + 16
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.current = None
+        self.flushed_at = time.monotonic()
+        self.dropped = 0        # samples older than the last record (backward clock step)
+        self.lock = threading.Lock()
+        os.makedirs(data_dir, exist_ok=True)
+        self.enforce_retention()
+
+    def _path(self, start):
+        return os.path.join(self.data_dir, "metrics-" + datetime.fromtimestamp(start, timezone.utc).strftime("%Y%m%d") + ".dat")
+
+    def _files(self):
+        """[(day start, path)] of the stored days, oldest first."""
+        out = []
+        for name in os.listdir(self.data_dir):
+            if not (name.startswith("metrics-") and name.endswith(".dat")): continue
+            try: d = datetime.strptime(name[8:16], "%Y%m%d").replace(tzinfo=timezone.utc)
+            except ValueError: continue
+            out.append((d.timestamp(), os.path.join(self.data_dir, name)))
+        return sorted(out)
+
+    def _open_day(self, start):
+        path = self._path(start)
+        try: return DayFile(path, start, writable=True, capacity=self.capacity)
+        except ValueError:
+            # Not ours / corrupt header: keep it aside and start the day again
+            os.rename(path, path + ".bad")
+            return DayFile(path, start, writable=True, capacity=self.capacity)
+
+    def append(self, t, values, running=True):
+        with self.lock:
+            start = day_start(t)
+            if self.current is None or self.current.start != start:
+                if self.current is not None and start < self.current.start: self.dropped += 1; return
+                old, self.current = self.current, self._open_day(start)
+                if old is not None:
+                    old.compact(); old.close()
+                    self.enforce_retention()
+            if t <= self.current.last_t: self.dropped += 1; return
+            self.current.append(pack_record(t, values, running), t)
+            if time.monotonic() - self.flushed_at > self.flush_interval:
+                self.current.flush(); self.flushed_at = time.monotonic()
+
+    def enforce_retention(self):
+        files = self._files()
+        today = self.current.start if self.current else day_start(time.time())
+        keep = []
+        for start, path in files:
+            if start < today - (self.retention_days - 1) * 86400: self._unlink(path)
+            else: keep.append((start, path))
+        total = sum(os.path.getsize(p) for _, p in keep)
+        while total > self.max_bytes and len(keep) > 1 and keep[0][0] < today:
+            _, path = keep.pop(0)
+            total -= os.path.getsize(path)
+            self._unlink(path)
+
+    def _unlink(self, path):
+        try: os.unlink(path)
+        except OSError: traceback.print_exc()
+
+    def scan(self, t_from, t_to):
+        """memoryview chunks (one per day) of the raw records in [t_from, t_to], oldest first."""
+        for start, path in self._files():
+            if start + 86400 <= t_from or start > t_to: continue
+            with self.lock:
+                # The index lookup and the view are taken under the lock: append() may grow (remap) or close the day
+                chunk = self.current.view(t_from, t_to) if self.current is not None and self.current.start == start else None
+            if chunk is not None:
+                if len(chunk): yield chunk
+                continue
+            try: day = DayFile(path, start)
+            except (OSError, ValueError): continue
+            chunk = day.view(t_from, t_to)
+            try:
+                if len(chunk): yield chunk
+            finally:
+                # Past days are opened per query: unmap once the caller is done with the chunk
+                try: chunk.release()
+                except BufferError: pass
+                day.close()
+
+    def records(self, t_from, t_to):
+        for chunk in self.scan(t_from, t_to):
+            yield from RECORD.iter_unpack(chunk)
+
+    def series(self, name, t_from, t_to):
+        """(timestamps, values) arrays of one metric, skipping samples where it was not available."""
+        i = FIELD_INDEX[name]
+        ts = array("d"); vals = array("d")
+        for rec in self.records(t_from, t_to):
+            v = rec[i]
+            if v == v: ts.append(rec[0]); vals.append(v)
+        return ts, vals
+
+    def csv(self, t_from, t_to, port_names=None):
+        """Streaming CSV of every stored sample in the range, CSV_CHUNK lines per yielded string."""
+        port_names = port_names or {}
+        yield "time,timestamp,offset_ns,path_delay_ns,freq_ppb,servo_freq_ppb,phc_offset_ns,port_state,gm_identity,ptp4l_running\n"
+        lines = []
+        for t, off, delay, freq, sfreq, phc, gm, port, flags, _ in self.records(t_from, t_to):
+            iso = datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+            cols = ["" if v != v else f"{v:g}" for v in (off, delay, freq, sfreq, phc)]
+            lines.append(f"{iso},{t:.3f},{','.join(cols)},{port_names.get(port, port)},{gm_text(gm)},{flags & FLAG_RUNNING}\n")
+            if len(lines) >= CSV_CHUNK:
+                yield "".join(lines); lines = []
+        if lines: yield "".join(lines)
+
+    @property
+    def nbytes(self):
+        return sum(os.path.getsize(p) for _, p in self._files())
+
+    def close(self):
+        with self.lock:
+            if self.current is not None:
+                self.current.flush(); self.current.close()
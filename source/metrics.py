@@ -0,0 +1,168 @@
+"""
+Minimal Prometheus text-format metrics (no client library dependency).
+
+Hot-path cost is one dict lookup per labelled child plus a short lock:
+Counter.inc is an add, Histogram.observe is a bisect over the bucket bounds
+and an add. Values that already live in the telemetry snapshot are not
+copied into metrics at all; they are rendered by collector callbacks at
+scrape time, so a scrape never triggers new sampling work.
+"""
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names: return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def format_value(v):
+    if v is None: return "NaN"
+    if isinstance(v, bool): return "1" if v else "0"
+    if isinstance(v, float) and math.isinf(v): return "+Inf" if v > 0 else "-Inf"
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(format_labels(self.labelnames, values), values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock: self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _new_child = staticmethod(_Value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, labels, values, child):
+        return [f"{self.name}{labels} {format_value(child.value)}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # per bucket, last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, labels, values, child):
+        with child.lock:
+            counts = list(child.counts); total = child.sum
+        names = self.labelnames + ("le",)
+        lines = []
+        acc = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            acc += n
+            lines.append(f"{self.name}_bucket{format_labels(names, values + (format_value(float(bound)),))} {acc}")
+        lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {acc}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        """
+        fn() -> iterable of (name, kind, help, labelnames, [(label_values, value), ...]),
+        evaluated at scrape time (used to expose snapshot values without copying them).
+        """
+        self.collectors.append(fn)
+
+    def render(self):
+        lines = []
+        for fn in self.collectors:
+            for name, kind, help, labelnames, samples in fn():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for values, value in samples:
+                    lines.append(f"{name}{format_labels(labelnames, values)} {format_value(value)}")
+        for metric in self.metrics: lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,134 @@
+"""
+Event-driven supervisor for the client radar captures.
+
+One thread multiplexes every capture socket plus a wake-up socketpair in a
+selector (epoll on Linux). Config changes wake it immediately, captures are
+opened/closed on the spot, and client expiry is scheduled from the oldest
+entry of the LRU-ordered ClientTable, so an idle monitor sleeps in the
+kernel instead of polling.
+"""
+import selectors
+import socket
+import threading
+import time
+import traceback
+
+RETRY_DELAY = 5.0
+
+
+class MonitorSupervisor:
+    def __init__(self, clients, open_capture, resolve_ip, ttl):
+        self.clients = clients
+        self.open_capture = open_capture    # iface -> capture object (fileno/read/close)
+        self.resolve_ip = resolve_ip        # iface -> local IPv4 (for is_self), looked up per batch
+        self.ttl = ttl
+        self.observers = []     # extra fn(msgs, iface, local ip, now) fed with every batch (foreign master table)
+        self.mode = "disabled"
+        self.interfaces = []
+        self.captures = {}      # iface -> capture
+        self.retry_at = {}      # iface -> monotonic time of next open attempt
+        self._lock = threading.Lock()
+        self._sel = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = None
+
+    @property
+    def config(self):
+        return { "mode": self.mode, "interfaces": list(self.interfaces) }
+
+    def configure(self, mode, interfaces):
+        with self._lock:
+            self.mode = mode
+            self.interfaces = [i for i in interfaces if i]
+        self._wake()
+
+    def _wake(self):
+        try: self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError): pass
+
+    def capture_stats(self):
+        """{iface: (frames, decoded, kernel packets, kernel drops)} of the open captures."""
+        out = {}
+        for iface, cap in list(self.captures.items()):
+            packets, drops = cap.stats()
+            out[iface] = (cap.frames, cap.decoded, packets, drops)
+        return out
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="monitor-supervisor", daemon=True)
+            self._thread.start()
+        return self
+
+    # --- capture lifecycle ---
+    def _targets(self):
+        with self._lock:
+            return set() if self.mode == "disabled" else set(self.interfaces)
+
+    def _reconcile(self):
+        targets = self._targets()
+        for iface in list(self.captures):
+            if iface not in targets: self._close(iface)
+        for iface in list(self.retry_at):
+            if iface not in targets: del self.retry_at[iface]
+        now = time.monotonic()
+        for iface in targets:
+            if iface in self.captures or self.retry_at.get(iface, 0) > now: continue
+            try:
+                cap = self.open_capture(iface)
+                self._sel.register(cap, selectors.EVENT_READ, iface)
+            except Exception:
+                self.retry_at[iface] = now + RETRY_DELAY
+                continue
+            self.retry_at.pop(iface, None)
+            self.captures[iface] = cap
+
+    def _close(self, iface):
+        cap = self.captures.pop(iface, None)
+        if cap is None: return
+        try: self._sel.unregister(cap)
+        except Exception: pass
+        try: cap.close()
+        except Exception: pass
+
+    def _fail(self, iface):
+        self._close(iface)
+        self.retry_at[iface] = time.monotonic() + RETRY_DELAY
+
+    # --- main loop ---
+    def _timeout(self):
+        deadlines = []
+        nxt = self.clients.next_expiry(self.ttl)
+        if nxt is not None: deadlines.append(nxt - time.time())
+        if self.retry_at: deadlines.append(min(self.retry_at.values()) - time.monotonic())
+        if not deadlines: return None      # nothing scheduled: block until traffic or a config change
+        return max(0.0, min(deadlines))
+
+    def _run(self):
+        while True:
+            try:
+                self._reconcile()
+                for key, _ in self._sel.select(self._timeout()):
+                    if key.data is None:
+                        try:
+                            while self._wake_r.recv(4096): pass
+                        except (BlockingIOError, InterruptedError): pass
+                        continue
+                    iface = key.data
+                    cap = self.captures.get(iface)
+                    if cap is None: continue
+                    try:
+                        msgs = cap.read()
+                    except Exception:
+                        self._fail(iface)
+                        continue
+                    if msgs:
+                        now = time.time(); my_ip = self.resolve_ip(iface)
+                        self.clients.observe(msgs, iface, my_ip, now)
+                        for fn in self.observers: fn(msgs, iface, my_ip, now)
+                self.clients.expire(self.ttl, time.time())
+            except Exception:
+                traceback.print_exc()
+                time.sleep(1)
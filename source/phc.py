@@ -0,0 +1,174 @@
+"""
+Direct PTP hardware clock (PHC) access.
+
+Interface -> /dev/ptpN is resolved once through sysfs
+(/sys/class/net/<if>/device/ptp/ptpN) or, for drivers without that link, the
+ETHTOOL_GET_TS_INFO ioctl, and cached until the interface's ifindex changes
+(link events, or a periodic check without them) or a read fails. Time is read with clock_gettime() on the dynamic posix clock
+of the open /dev/ptpN fd, and PHC - system offset with the PTP_SYS_OFFSET
+ioctls (best of several samples), so a read is a syscall instead of
+`ethtool -T` + `phc_ctl get`.
+
+The clock backend is injectable (PhcManager(open_clock=...)) so callers can be
+exercised without PTP hardware.
+"""
+import ctypes
+import fcntl
+import os
+import socket
+import struct
+import threading
+import time
+
+SYSFS_NET = "/sys/class/net"
+SIOCETHTOOL = 0x8946
+ETHTOOL_GET_TS_INFO = 0x41
+PTP_MAX_SAMPLES = 25
+CLOCKFD = 3
+REVALIDATE_INTERVAL = 30.0   # seconds between ifindex checks of a cached mapping
+
+
+def _IOW(nr, size):
+    return (1 << 30) | (size << 16) | (ord('=') << 8) | nr
+
+
+def _IOWR(nr, size):
+    return (3 << 30) | (size << 16) | (ord('=') << 8) | nr
+
+
+# struct ptp_sys_offset: n_samples, rsv[3], ptp_clock_time ts[2 * PTP_MAX_SAMPLES + 1]
+PTP_SYS_OFFSET = _IOW(5, 16 + 16 * (2 * PTP_MAX_SAMPLES + 1))
+# struct ptp_sys_offset_extended: n_samples, rsv[3], ptp_clock_time ts[PTP_MAX_SAMPLES][3]
+PTP_SYS_OFFSET_EXTENDED = _IOWR(9, 16 + 16 * 3 * PTP_MAX_SAMPLES)
+
+
+def fd_to_clockid(fd):
+    # FD_TO_CLOCKID() from the kernel's posix-clock ABI
+    return ((~fd) << 3) | CLOCKFD
+
+
+def read_ifindex(iface):
+    try:
+        with open(os.path.join(SYSFS_NET, iface, "ifindex")) as f: return int(f.read())
+    except (OSError, ValueError): return None
+
+
+def phc_index_sysfs(iface):
+    try: entries = os.listdir(os.path.join(SYSFS_NET, iface, "device", "ptp"))
+    except OSError: return None
+    for e in sorted(entries):
+        if e.startswith("ptp") and e[3:].isdigit(): return int(e[3:])
+    return None
+
+
+def phc_index_ethtool(iface):
+    # struct ethtool_ts_info: cmd, so_timestamping, phc_index, tx_types, tx_reserved[3], rx_filters, rx_reserved[3]
+    info = ctypes.create_string_buffer(struct.pack("IIi8I", ETHTOOL_GET_TS_INFO, 0, -1, *([0] * 8)))
+    ifreq = struct.pack("16sP", iface.encode()[:15], ctypes.addressof(info))
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try: fcntl.ioctl(s, SIOCETHTOOL, ifreq)
+        except OSError: return None
+    index = struct.unpack_from("i", info.raw, 8)[0]
+    return index if index >= 0 else None
+
+
+def resolve_phc_index(iface):
+    index = phc_index_sysfs(iface)
+    return index if index is not None else phc_index_ethtool(iface)
+
+
+class PosixPhc:
+    """One open /dev/ptpN."""
+    def __init__(self, index):
+        self.index = index
+        self.path = f"/dev/ptp{index}"
+        try: self.fd = os.open(self.path, os.O_RDWR)
+        except PermissionError: self.fd = os.open(self.path, os.O_RDONLY)
+        self.clockid = fd_to_clockid(self.fd)
+
+    def gettime_ns(self):
+        return time.clock_gettime_ns(self.clockid)
+
+    def sys_offset(self, samples=5):
+        """(PHC - CLOCK_REALTIME in ns, read delay in ns) of the tightest of `samples` readings."""
+        samples = max(1, min(samples, PTP_MAX_SAMPLES))
+        try:
+            buf = bytearray(struct.pack("I", samples) + bytes(12 + 16 * 3 * PTP_MAX_SAMPLES))
+            fcntl.ioctl(self.fd, PTP_SYS_OFFSET_EXTENDED, buf)
+            triples = [[self._ts(buf, 16 + 48 * i + 16 * k) for k in range(3)] for i in range(samples)]
+        except OSError:
+            # Older kernels / drivers: sys, phc, sys, phc, ..., sys
+            buf = bytearray(struct.pack("I", samples) + bytes(12 + 16 * (2 * PTP_MAX_SAMPLES + 1)))
+            fcntl.ioctl(self.fd, PTP_SYS_OFFSET, buf)
+            ts = [self._ts(buf, 16 + 16 * j) for j in range(2 * samples + 1)]
+            triples = [(ts[2 * i], ts[2 * i + 1], ts[2 * i + 2]) for i in range(samples)]
+        before, phc, after = min(triples, key=lambda t: t[2] - t[0])
+        return phc - (before + after) // 2, after - before
+
+    @staticmethod
+    def _ts(buf, off):
+        sec, nsec = struct.unpack_from("qI", buf, off)
+        return sec * 1000000000 + nsec
+
+    def close(self):
+        try: os.close(self.fd)
+        except OSError: pass
+
+
+class PhcManager:
+    """Cached iface -> open PHC, revalidated against the interface ifindex."""
+    def __init__(self, open_clock=PosixPhc, resolve=resolve_phc_index, ifindex=read_ifindex):
+        self.open_clock = open_clock
+        self.resolve = resolve
+        self.ifindex = ifindex
+        self.clocks = {}    # iface -> [clock, ifindex, checked_at]
+        self.revalidate = REVALIDATE_INTERVAL   # None when link events call invalidate() instead
+        self.lock = threading.Lock()
+
+    def _clock(self, iface):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.clocks.get(iface)
+            if entry is not None and self.revalidate and now - entry[2] > self.revalidate:
+                # Driver reload / interface re-creation changes the ifindex
+                if self.ifindex(iface) != entry[1]: self._drop(iface)
+                else: entry[2] = now
+                entry = self.clocks.get(iface)
+            if entry is None:
+                index = self.resolve(iface)
+                if index is None: return None
+                entry = self.clocks[iface] = [self.open_clock(index), self.ifindex(iface), now]
+            return entry[0]
+
+    def _drop(self, iface):
+        entry = self.clocks.pop(iface, None)
+        if entry is not None: entry[0].close()
+
+    def invalidate(self, iface=None):
+        with self.lock:
+            for name in ([iface] if iface else list(self.clocks)): self._drop(name)
+
+    def phc_index(self, iface):
+        try: clock = self._clock(iface)
+        except OSError: return None
+        return clock.index if clock is not None else None
+
+    def gettime_ns(self, iface):
+        return self._call(iface, lambda c: c.gettime_ns())
+
+    def sys_offset(self, iface, samples=5):
+        return self._call(iface, lambda c: c.sys_offset(samples))
+
+    def _call(self, iface, fn):
+        # A failing read means the device went away: drop the mapping and retry once
+        for attempt in (0, 1):
+            try:
+                clock = self._clock(iface)
+                if clock is None: return None
+                return fn(clock)
+            except OSError:
+                self.invalidate(iface)
+        return None
+
+    def close(self):
+        self.invalidate()
@@ -0,0 +1,418 @@
+"""
+Native PTP management client for ptp4l's UNIX domain socket.
+
+Speaks the same IEEE 1588 management protocol as `pmc -u`, but in-process:
+one persistent datagram socket, all GET requests of a batch are sent
+back-to-back and the responses are decoded into namedtuples. SET is
+supported for the datasets in ENCODERS.
+"""
+import os
+import socket
+import struct
+import threading
+import time
+import itertools
+from collections import namedtuple
+
+PTP4L_UDS = "/var/run/ptp4l"
+
+# --- Protocol constants ---
+MSG_MANAGEMENT = 0x0D
+CTL_MANAGEMENT = 0x04
+TLV_MANAGEMENT = 0x0001
+TLV_MANAGEMENT_ERROR_STATUS = 0x0002
+
+ACTION_GET, ACTION_SET, ACTION_RESPONSE, ACTION_COMMAND, ACTION_ACKNOWLEDGE = range(5)
+
+HEADER = struct.Struct(">BBHBBHqI8sHHBB")   # 34 bytes, common PTP header
+MGMT = struct.Struct(">8sHBBBB")            # 14 bytes, targetPortIdentity .. actionField
+TLV = struct.Struct(">HHH")                 # tlvType, lengthField, managementId
+MGMT_OFFSET = HEADER.size
+TLV_OFFSET = HEADER.size + MGMT.size
+
+WILDCARD_CLOCK = b"\xff" * 8
+WILDCARD_PORT = 0xFFFF
+
+# managementId values (IEEE 1588-2008 table 40 + linuxptp _NP extensions)
+MANAGEMENT_IDS = {
+    "DEFAULT_DATA_SET": 0x2000,
+    "CURRENT_DATA_SET": 0x2001,
+    "PARENT_DATA_SET": 0x2002,
+    "TIME_PROPERTIES_DATA_SET": 0x2003,
+    "PORT_DATA_SET": 0x2004,
+    "PRIORITY1": 0x2005,
+    "PRIORITY2": 0x2006,
+    "DOMAIN": 0x2007,
+    "TIME_STATUS_NP": 0xC000,
+    "GRANDMASTER_SETTINGS_NP": 0xC001,
+    "PORT_DATA_SET_NP": 0xC002,
+}
+MANAGEMENT_NAMES = {v: k for k, v in MANAGEMENT_IDS.items()}
+
+# Datasets answered once per port (the rest are answered once per clock)
+PORT_SCOPED = {"PORT_DATA_SET", "PORT_DATA_SET_NP"}
+
+PORT_STATES = {
+    1: "INITIALIZING", 2: "FAULTY", 3: "DISABLED", 4: "LISTENING", 5: "PRE_MASTER",
+    6: "MASTER", 7: "PASSIVE", 8: "UNCALIBRATED", 9: "SLAVE", 10: "GRAND_MASTER",
+}
+
+MANAGEMENT_ERRORS = {
+    0x0001: "RESPONSE_TOO_BIG", 0x0002: "NO_SUCH_ID", 0x0003: "WRONG_LENGTH",
+    0x0004: "WRONG_VALUE", 0x0005: "NOT_SETABLE", 0x0006: "NOT_SUPPORTED",
+    0xFFFE: "GENERAL_ERROR",
+}
+
+# --- Typed datasets ---
+DefaultDataSet = namedtuple("DefaultDataSet", [
+    "two_step", "slave_only", "number_ports", "priority1", "clock_class", "clock_accuracy",
+    "offset_scaled_log_variance", "priority2", "clock_identity", "domain_number"])
+CurrentDataSet = namedtuple("CurrentDataSet", ["steps_removed", "offset_from_master", "mean_path_delay"])
+ParentDataSet = namedtuple("ParentDataSet", [
+    "parent_port_identity", "parent_stats", "observed_parent_offset_scaled_log_variance",
+    "observed_parent_clock_phase_change_rate", "gm_priority1", "gm_clock_class", "gm_clock_accuracy",
+    "gm_offset_scaled_log_variance", "gm_priority2", "gm_identity"])
+TimePropertiesDataSet = namedtuple("TimePropertiesDataSet", [
+    "current_utc_offset", "leap61", "leap59", "current_utc_offset_valid", "ptp_timescale",
+    "time_traceable", "frequency_traceable", "time_source"])
+PortDataSet = namedtuple("PortDataSet", [
+    "port_identity", "port_state", "log_min_delay_req_interval", "peer_mean_path_delay",
+    "log_announce_interval", "announce_receipt_timeout", "log_sync_interval", "delay_mechanism",
+    "log_min_pdelay_req_interval", "version_number"])
+TimeStatusNP = namedtuple("TimeStatusNP", [
+    "master_offset", "ingress_time", "cumulative_scaled_rate_offset", "scaled_last_gm_phase_change",
+    "gm_time_base_indicator", "last_gm_phase_change", "gm_present", "gm_identity"])
+GrandmasterSettingsNP = namedtuple("GrandmasterSettingsNP", [
+    "clock_class", "clock_accuracy", "offset_scaled_log_variance", "current_utc_offset", "leap61",
+    "leap59", "current_utc_offset_valid", "ptp_timescale", "time_traceable", "frequency_traceable",
+    "time_source"])
+PortDataSetNP = namedtuple("PortDataSetNP", ["neighbor_prop_delay_thresh", "as_capable"])
+Priority = namedtuple("Priority", ["value"])
+Domain = namedtuple("Domain", ["value"])
+
+# One decoded reply. `data` is a dataset namedtuple, or None when `error` is set.
+Response = namedtuple("Response", ["port_identity", "name", "action", "data", "error"])
+
+
+class PmcError(Exception):
+    pass
+
+
+class PmcUnavailable(PmcError):
+    """The ptp4l socket could not be reached at all (not running / wrong path)."""
+
+
+class PmcTimeout(PmcError):
+    pass
+
+
+# --- Field helpers ---
+def format_clock_identity(raw):
+    h = raw.hex()
+    return f"{h[0:6]}.{h[6:10]}.{h[10:16]}"
+
+
+def format_port_identity(raw_clock, port):
+    return f"{format_clock_identity(raw_clock)}-{port}"
+
+
+def scaled_ns(value):
+    # TimeInterval is nanoseconds multiplied by 2^16
+    return value / 65536.0
+
+
+TIME_FLAG_BITS = (("leap61", 0x01), ("leap59", 0x02), ("current_utc_offset_valid", 0x04),
+                  ("ptp_timescale", 0x08), ("time_traceable", 0x10), ("frequency_traceable", 0x20))
+
+
+def _time_flags(flags):
+    return [1 if flags & bit else 0 for _, bit in TIME_FLAG_BITS]
+
+
+# --- Decoders (data field -> namedtuple) ---
+def _dec_default(buf):
+    flags, _, nports, p1, cclass, cacc, var, p2, cid, domain, _ = struct.unpack_from(">BBHBBBHB8sBB", buf)
+    return DefaultDataSet(flags & 1, (flags >> 1) & 1, nports, p1, cclass, cacc, var, p2,
+                          format_clock_identity(cid), domain)
+
+
+def _dec_current(buf):
+    steps, offset, delay = struct.unpack_from(">Hqq", buf)
+    return CurrentDataSet(steps, scaled_ns(offset), scaled_ns(delay))
+
+
+def _dec_parent(buf):
+    (pcid, pport, stats, _, ovar, rate, gp1, gclass, gacc, gvar, gp2,
+     gmid) = struct.unpack_from(">8sHBBHiBBBHB8s", buf)
+    return ParentDataSet(format_port_identity(pcid, pport), stats, ovar, rate, gp1, gclass, gacc, gvar,
+                         gp2, format_clock_identity(gmid))
+
+
+def _dec_time_properties(buf):
+    utc, flags, source = struct.unpack_from(">hBB", buf)
+    return TimePropertiesDataSet(utc, *_time_flags(flags), source)
+
+
+def _dec_port(buf):
+    (cid, port, state, min_dreq, peer_delay, ann, ann_to, sync, mech, min_pdreq,
+     ver) = struct.unpack_from(">8sHBbqbBbBbB", buf)
+    return PortDataSet(format_port_identity(cid, port), PORT_STATES.get(state, str(state)), min_dreq,
+                       scaled_ns(peer_delay), ann, ann_to, sync, mech, min_pdreq, ver & 0x0f)
+
+
+def _dec_time_status(buf):
+    (offset, ingress, csro, slgpc, gtbi, nsmsb, nslsb, fracns, present,
+     gmid) = struct.unpack_from(">qqiiHHQHi8s", buf)
+    last_change = ((nsmsb << 64) | nslsb) + fracns / 65536.0
+    return TimeStatusNP(offset, ingress, csro, slgpc, gtbi, last_change, present, format_clock_identity(gmid))
+
+
+def _dec_gm_settings(buf):
+    cclass, cacc, var, utc, flags, source = struct.unpack_from(">BBHhBB", buf)
+    return GrandmasterSettingsNP(cclass, cacc, var, utc, *_time_flags(flags), source)
+
+
+def _dec_port_np(buf):
+    return PortDataSetNP(*struct.unpack_from(">Ii", buf))
+
+
+DECODERS = {
+    "DEFAULT_DATA_SET": _dec_default,
+    "CURRENT_DATA_SET": _dec_current,
+    "PARENT_DATA_SET": _dec_parent,
+    "TIME_PROPERTIES_DATA_SET": _dec_time_properties,
+    "PORT_DATA_SET": _dec_port,
+    "PRIORITY1": lambda b: Priority(b[0]),
+    "PRIORITY2": lambda b: Priority(b[0]),
+    "DOMAIN": lambda b: Domain(b[0]),
+    "TIME_STATUS_NP": _dec_time_status,
+    "GRANDMASTER_SETTINGS_NP": _dec_gm_settings,
+    "PORT_DATA_SET_NP": _dec_port_np,
+}
+
+
+# --- Encoders (namedtuple / value -> data field, for SET) ---
+def _time_flag_byte(ds):
+    return sum(bit for field, bit in TIME_FLAG_BITS if getattr(ds, field))
+
+
+def _enc_gm_settings(ds):
+    return struct.pack(">BBHhBB", ds.clock_class, ds.clock_accuracy, ds.offset_scaled_log_variance,
+                       ds.current_utc_offset, _time_flag_byte(ds), ds.time_source)
+
+
+ENCODERS = {
+    "GRANDMASTER_SETTINGS_NP": _enc_gm_settings,
+    "PRIORITY1": lambda v: bytes([getattr(v, "value", v) & 0xFF, 0]),
+    "PRIORITY2": lambda v: bytes([getattr(v, "value", v) & 0xFF, 0]),
+    "DOMAIN": lambda v: bytes([getattr(v, "value", v) & 0xFF, 0]),
+}
+
+
+# --- Message framing ---
+def pack_management(seq, mid, action=ACTION_GET, data=b"", domain=0, boundary_hops=0,
+                    source_port=0, target_clock=WILDCARD_CLOCK, target_port=WILDCARD_PORT):
+    if len(data) % 2: data += b"\x00"
+    length = TLV_OFFSET + TLV.size + len(data)
+    return b"".join((
+        HEADER.pack(MSG_MANAGEMENT, 2, length, domain, 0, 0, 0, 0, b"\x00" * 8, source_port & 0xFFFF,
+                    seq, CTL_MANAGEMENT, 0x7F),
+        MGMT.pack(target_clock, target_port, boundary_hops, boundary_hops, action & 0x0F, 0),
+        TLV.pack(TLV_MANAGEMENT, 2 + len(data), mid),
+        data,
+    ))
+
+
+def unpack_management(buf):
+    """Decode one management message. Returns (sequenceId, Response) or None if not a management reply."""
+    if len(buf) < TLV_OFFSET + TLV.size or (buf[0] & 0x0F) != MSG_MANAGEMENT:
+        return None
+    hdr = HEADER.unpack_from(buf)
+    src_clock, src_port, seq = hdr[8], hdr[9], hdr[10]
+    action = buf[MGMT_OFFSET + 12] & 0x0F
+    tlv_type, tlv_len, mid = TLV.unpack_from(buf, TLV_OFFSET)
+    port_identity = format_port_identity(src_clock, src_port)
+    data_start = TLV_OFFSET + TLV.size
+    if tlv_type == TLV_MANAGEMENT_ERROR_STATUS:
+        # managementErrorId comes first, the managementId follows it
+        err_id = mid
+        mid = struct.unpack_from(">H", buf, data_start)[0] if len(buf) >= data_start + 2 else 0
+        name = MANAGEMENT_NAMES.get(mid, hex(mid))
+        return seq, Response(port_identity, name, action, None, MANAGEMENT_ERRORS.get(err_id, hex(err_id)))
+    if tlv_type != TLV_MANAGEMENT:
+        return None
+    name = MANAGEMENT_NAMES.get(mid, hex(mid))
+    payload = buf[data_start:data_start + tlv_len - 2]
+    decoder = DECODERS.get(name)
+    if decoder is None:
+        return seq, Response(port_identity, name, action, bytes(payload), None)
+    try:
+        return seq, Response(port_identity, name, action, decoder(payload), None)
+    except struct.error:
+        return seq, Response(port_identity, name, action, None, "WRONG_LENGTH")
+
+
+class PmcClient:
+    """
+    Persistent management client for one ptp4l instance.
+
+    `uds_path` is ptp4l's `uds_address`; the client binds its own socket next
+    to it (like pmc's /var/run/pmc.<pid>) so replies can be addressed back.
+    Safe to share between threads: requests are serialized on a lock.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, uds_path=PTP4L_UDS, domain=0, boundary_hops=0, timeout=0.5, client_path=None):
+        self.uds_path = uds_path
+        self.domain = domain
+        self.boundary_hops = boundary_hops
+        self.timeout = timeout
+        self.client_path = client_path or os.path.join(
+            os.path.dirname(uds_path) or ".", f"ptp-web.{os.getpid()}.{next(self._ids)}")
+        self.number_ports = None
+        self._sock = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    # --- socket lifecycle ---
+    def _open(self):
+        if self._sock is not None: return self._sock
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            try: os.unlink(self.client_path)
+            except FileNotFoundError: pass
+            sock.bind(self.client_path)
+            sock.connect(self.uds_path)
+        except OSError as e:
+            sock.close()
+            self._unlink()
+            raise PmcUnavailable(f"{self.uds_path}: {e}") from e
+        self._sock = sock
+        return sock
+
+    def _unlink(self):
+        try: os.unlink(self.client_path)
+        except OSError: pass
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+            self._unlink()
+
+    def _next_seq(self):
+        self._seq = (self._seq + 1) & 0xFFFF
+        return self._seq
+
+    def _drain(self, sock):
+        # Drop late replies left over from an earlier timed-out batch
+        sock.setblocking(False)
+        try:
+            while True: sock.recv(4096)
+        except (BlockingIOError, InterruptedError): pass
+        except OSError: pass
+
+    # --- requests ---
+    def request(self, requests, timeout=None):
+        """
+        Send a batch of (name, action, data) management requests back-to-back and
+        collect every reply. Returns a list of Response in arrival order.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            pending = {}   # seq -> [name, expected replies, received]
+            frames = []
+            for name, action, data in requests:
+                seq = self._next_seq()
+                pending[seq] = [name, None if name in PORT_SCOPED else 1, 0]
+                frames.append(pack_management(seq, MANAGEMENT_IDS[name], action, data, self.domain,
+                                              self.boundary_hops, source_port=os.getpid()))
+            sock = self._send_all(frames)
+
+            replies = []
+            deadline = time.monotonic() + timeout
+            while not self._complete(pending):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Port count may have changed (ptp4l restarted with another config)
+                    self.number_ports = None
+                    if replies: break
+                    raise PmcTimeout(f"no response from {self.uds_path} within {timeout}s")
+                sock.settimeout(remaining)
+                try:
+                    buf = sock.recv(4096)
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    self._reset()
+                    raise PmcUnavailable(f"{self.uds_path}: {e}") from e
+                decoded = unpack_management(buf)
+                if decoded is None: continue
+                seq, resp = decoded
+                entry = pending.get(seq)
+                if entry is None or resp.action not in (ACTION_RESPONSE, ACTION_ACKNOWLEDGE): continue
+                entry[2] += 1
+                if resp.name == "DEFAULT_DATA_SET" and resp.data is not None:
+                    self.number_ports = resp.data.number_ports
+                replies.append(resp)
+            return replies
+
+    def _send_all(self, frames):
+        # A persistent socket goes stale when ptp4l restarts; reconnect once before giving up
+        for attempt in (0, 1):
+            reused = self._sock is not None
+            sock = self._open()
+            self._drain(sock)
+            try:
+                for frame in frames: sock.send(frame)
+                return sock
+            except OSError as e:
+                self._reset()
+                if attempt or not reused:
+                    raise PmcUnavailable(f"{self.uds_path}: {e}") from e
+
+    def _complete(self, pending):
+        for name, expected, received in pending.values():
+            if expected is None:
+                # Port-scoped: one reply per port, once we know how many ports there are
+                expected = self.number_ports
+                if expected is None: return False
+            if received < expected: return False
+        return True
+
+    def _reset(self):
+        self.number_ports = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._unlink()
+
+    def query(self, *names, timeout=None):
+        """Batched GET. Port-scoped datasets implicitly fetch DEFAULT_DATA_SET first to learn the port count."""
+        names = list(names)
+        if self.number_ports is None and any(n in PORT_SCOPED for n in names) and "DEFAULT_DATA_SET" not in names:
+            names.insert(0, "DEFAULT_DATA_SET")
+        return self.request([(n, ACTION_GET, b"") for n in names], timeout)
+
+    def set(self, name, value, timeout=None):
+        """SET one dataset (see ENCODERS). Returns the value ptp4l reports back, raises PmcError if refused."""
+        replies = self.request([(name, ACTION_SET, ENCODERS[name](value))], timeout)
+        for resp in replies:
+            if resp.error: raise PmcError(f"SET {name}: {resp.error}")
+            return resp.data
+        raise PmcTimeout(f"no response to SET {name}")
+
+    def get(self, *names, timeout=None):
+        """
+        Batched GET returning {name: dataset}. Port-scoped datasets map to a list
+        (one entry per port); datasets that errored or did not answer are absent.
+        """
+        result = {}
+        for resp in self.query(*names, timeout=timeout):
+            if resp.error or resp.data is None: continue
+            if resp.name in PORT_SCOPED:
+                result.setdefault(resp.name, []).append(resp.data)
+            else:
+                result.setdefault(resp.name, resp.data)
+        return result
@@ -0,0 +1,144 @@
+"""
+Parser for the text output of the `pmc` binary (`pmc -u -b 0 'GET ...'`).
+
+Used when ptp4l's socket cannot be used in-process. The output is walked
+once, line by line: every "<portIdentity> seq N RESPONSE MANAGEMENT <ID>"
+line opens a block, and each indented "key value" line below it is converted
+straight into its slot of that block's record through a precomputed key
+index. Blocks become the same namedtuples as the native client decodes, so
+callers do not care which path produced a dataset, and a key never matches
+outside its own block (clockIdentity of DEFAULT_DATA_SET vs
+grandmasterIdentity, priority1 vs grandmasterPriority1).
+"""
+from pmc_client import (
+    ACTION_ACKNOWLEDGE, ACTION_RESPONSE, PORT_SCOPED, Response,
+    DefaultDataSet, CurrentDataSet, ParentDataSet, TimePropertiesDataSet, PortDataSet, TimeStatusNP,
+    GrandmasterSettingsNP, PortDataSetNP, Priority, Domain,
+)
+
+ACTIONS = {"RESPONSE": ACTION_RESPONSE, "ACKNOWLEDGE": ACTION_ACKNOWLEDGE}
+
+
+def _int(v):
+    return int(v, 0)
+
+
+def _float(v):
+    return float(v)
+
+
+def _bool(v):
+    return 1 if v in ("true", "1") else 0
+
+
+def _rate(v):
+    # pmc prints cumulativeScaledRateOffset as a ratio; the native decoder keeps the raw 2^41-scaled value
+    return int(round(float(v) * 2**41))
+
+
+def _str(v):
+    return v
+
+
+def _phase(v):
+    # "0x0000'0000000000000000.0000": nanoseconds msb'lsb.fractional, all hex
+    ns, _, frac = v.partition(".")
+    return int(ns.replace("'", ""), 16) + int(frac or "0", 16) / 65536.0
+
+
+# dataset -> (namedtuple, [(pmc keys, converter)] in namedtuple field order)
+FIELDS = {
+    "DEFAULT_DATA_SET": (DefaultDataSet, [
+        (("twoStepFlag",), _int), (("slaveOnly",), _int), (("numberPorts",), _int), (("priority1",), _int),
+        (("clockClass",), _int), (("clockAccuracy",), _int), (("offsetScaledLogVariance",), _int),
+        (("priority2",), _int), (("clockIdentity",), _str), (("domainNumber",), _int)]),
+    "CURRENT_DATA_SET": (CurrentDataSet, [
+        (("stepsRemoved",), _int), (("offsetFromMaster",), _float), (("meanPathDelay",), _float)]),
+    # linuxptp prints "gm.ClockClass", some older builds "grandmasterClockQuality.clockClass"
+    "PARENT_DATA_SET": (ParentDataSet, [
+        (("parentPortIdentity",), _str), (("parentStats",), _int),
+        (("observedParentOffsetScaledLogVariance",), _int), (("observedParentClockPhaseChangeRate",), _int),
+        (("grandmasterPriority1",), _int),
+        (("gm.ClockClass", "grandmasterClockQuality.clockClass"), _int),
+        (("gm.ClockAccuracy", "grandmasterClockQuality.clockAccuracy"), _int),
+        (("gm.OffsetScaledLogVariance", "grandmasterClockQuality.offsetScaledLogVariance"), _int),
+        (("grandmasterPriority2",), _int), (("grandmasterIdentity",), _str)]),
+    "TIME_PROPERTIES_DATA_SET": (TimePropertiesDataSet, [
+        (("currentUtcOffset",), _int), (("leap61",), _int), (("leap59",), _int),
+        (("currentUtcOffsetValid",), _int), (("ptpTimescale",), _int), (("timeTraceable",), _int),
+        (("frequencyTraceable",), _int), (("timeSource",), _int)]),
+    "PORT_DATA_SET": (PortDataSet, [
+        (("portIdentity",), _str), (("portState",), _str), (("logMinDelayReqInterval",), _int),
+        (("peerMeanPathDelay",), _float), (("logAnnounceInterval",), _int), (("announceReceiptTimeout",), _int),
+        (("logSyncInterval",), _int), (("delayMechanism",), _int), (("logMinPdelayReqInterval",), _int),
+        (("versionNumber",), _int)]),
+    "TIME_STATUS_NP": (TimeStatusNP, [
+        (("master_offset",), _int), (("ingress_time",), _int), (("cumulativeScaledRateOffset",), _rate),
+        (("scaledLastGmPhaseChange",), _int), (("gmTimeBaseIndicator",), _int), (("lastGmPhaseChange",), _phase),
+        (("gmPresent",), _bool), (("gmIdentity",), _str)]),
+    "GRANDMASTER_SETTINGS_NP": (GrandmasterSettingsNP, [
+        (("clockClass",), _int), (("clockAccuracy",), _int), (("offsetScaledLogVariance",), _int),
+        (("currentUtcOffset",), _int), (("leap61",), _int), (("leap59",), _int), (("currentUtcOffsetValid",), _int),
+        (("ptpTimescale",), _int), (("timeTraceable",), _int), (("frequencyTraceable",), _int),
+        (("timeSource",), _int)]),
+    "PORT_DATA_SET_NP": (PortDataSetNP, [(("neighborPropDelayThresh",), _int), (("asCapable",), _int)]),
+    "PRIORITY1": (Priority, [(("priority1",), _int)]),
+    "PRIORITY2": (Priority, [(("priority2",), _int)]),
+    "DOMAIN": (Domain, [(("domainNumber",), _int)]),
+}
+
+
+# dataset -> (namedtuple, {pmc key: (field index, converter)})
+INDEX = {name: (cls, {key: (i, conv) for i, (aliases, conv) in enumerate(keys) for key in aliases})
+         for name, (cls, keys) in FIELDS.items()}
+
+
+def parse_responses(text):
+    """All response blocks in pmc output, in order, as pmc_client.Response tuples."""
+    out = []
+    head = None        # [port identity, name, action, error, namedtuple class, key index, values]
+    for line in text.splitlines():
+        if line.startswith("\t\t"):
+            if head is None: continue
+            kv = line.split(None, 1)
+            if len(kv) < 2: continue
+            if head[3] is not None:
+                # Error blocks carry one "ERROR: <text>" line
+                if kv[0] == "ERROR:": head[3] = kv[1].rstrip()
+                continue
+            spec = head[5].get(kv[0])
+            if spec is None: continue
+            try: head[6][spec[0]] = spec[1](kv[1].rstrip())
+            except ValueError: pass
+            continue
+        if head is not None and not line.startswith("\t"):
+            # "sending: GET ..." or anything else at column 0 ends the block
+            out.append(_close(head)); head = None
+            continue
+        parts = line.split()
+        # "<portIdentity> seq <n> <RESPONSE|ACKNOWLEDGE> <MANAGEMENT|MANAGEMENT_ERROR_STATUS> <ID>"
+        if len(parts) >= 6 and parts[1] == "seq" and parts[3] in ACTIONS:
+            if head is not None: out.append(_close(head))
+            cls, index = INDEX.get(parts[5], (None, {}))
+            head = [parts[0], parts[5], ACTIONS[parts[3]], None if parts[4] == "MANAGEMENT" else parts[4],
+                    cls, index, [None] * len(cls._fields) if cls else None]
+    if head is not None: out.append(_close(head))
+    return out
+
+
+def _close(head):
+    port_identity, name, action, error, cls, _, values = head
+    if error is not None or cls is None: return Response(port_identity, name, action, None, error or "UNKNOWN_ID")
+    return Response(port_identity, name, action, cls(*values), None)
+
+
+def parse_datasets(text):
+    """{name: dataset} like PmcClient.get(); port-scoped datasets map to one entry per port."""
+    result = {}
+    for resp in parse_responses(text):
+        if resp.error or resp.data is None: continue
+        if resp.name in PORT_SCOPED:
+            result.setdefault(resp.name, []).append(resp.data)
+        else:
+            result.setdefault(resp.name, resp.data)
+    return result
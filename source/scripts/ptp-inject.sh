@@ -1,8 +1,9 @@
 #!/bin/bash
 # PTP4L 状态强制注入工具 (v6.2 Robust)
-# Usage: ptp-inject <domain_number>
+# Usage: ptp-inject <domain_number> [uds_address]
 
 DOMAIN=${1:-0}
+UDS=${2:-/var/run/ptp4l}
 LOG_TAG="ptp-inject"
 
 # 构造指令：包含 clockClass 13 (Master) 以及 ST 2110 必需的 Traceable 标志
@@ -16,7 +17,7 @@ SUCCESS_COUNT=0
 
 for i in {1..20}; do
     # 运行 PMC 命令
-    OUT=$(pmc -u -b 0 -d "$DOMAIN" "$CMD" 2>&1)
+    OUT=$(pmc -u -b 0 -s "$UDS" -d "$DOMAIN" "$CMD" 2>&1)
     
     # 检查结果：必须包含 RESPONSE 且不能包含 ERROR
     if echo "$OUT" | grep -q "RESPONSE" && ! echo "$OUT" | grep -q "ERROR"; then
@@ -0,0 +1,249 @@
+"""
+Incremental servo statistics from the sampled offset / frequency stream.
+
+Every ptp4l instance gets one ServoAnalyzer fed once per sampling cycle with
+the offsetFromMaster / rate offset already read from ptp4l. All statistics
+are running sums, so a new sample costs O(1) and no history is re-scanned:
+
+  - rolling RMS / mean / peak-to-peak over the last `window` samples
+    (running sums plus monotonic min / max deques),
+  - Allan deviation and TDEV for tau = 1, 2, 4 ... 1024 sampling intervals
+    (running sums of the phase second differences, one ring of phases),
+  - lock tracking: acquisition starts on the first SLAVE sample, after a
+    servo reset, a clock step or a grandmaster change, and time-to-lock is
+    the time until LOCK_SAMPLES consecutive offsets fall inside limit_ns,
+  - step events (offset jump > limit_ns while locked, or ptp4l's servo
+    entering s1) and holdover (the port leaving SLAVE after a lock).
+
+limit_ns defaults to the SMPTE ST 2059-2 slave accuracy of +/-1 us.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+TAU_FACTORS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+TRACKED_PORTS = ("SLAVE", "UNCALIBRATED")
+LOCK_SAMPLES = 5        # consecutive in-limit samples before the servo counts as locked
+GAP_FACTOR = 2.5        # a sample gap above GAP_FACTOR * tau0 restarts the deviation sums
+MAX_EVENTS = 20
+
+
+class RollingWindow:
+    """Mean / RMS / min / max of the last `size` values."""
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.seq = 0
+        self.lo = deque()   # (seq, value), values increasing
+        self.hi = deque()   # (seq, value), values decreasing
+
+    def add(self, v):
+        self.values.append(v)
+        self.total += v; self.total_sq += v * v
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            self.total -= old; self.total_sq -= old * old
+        self.seq += 1
+        # Re-sum once per window so add/subtract rounding never accumulates
+        if self.seq % self.size == 0:
+            self.total = math.fsum(self.values); self.total_sq = math.fsum(x * x for x in self.values)
+        while self.lo and self.lo[-1][1] >= v: self.lo.pop()
+        while self.hi and self.hi[-1][1] <= v: self.hi.pop()
+        self.lo.append((self.seq, v)); self.hi.append((self.seq, v))
+        first = self.seq - len(self.values)
+        if self.lo[0][0] <= first: self.lo.popleft()
+        if self.hi[0][0] <= first: self.hi.popleft()
+
+    def stats(self):
+        n = len(self.values)
+        if not n: return { "count": 0, "mean": None, "rms": None, "p2p": None, "min": None, "max": None }
+        lo, hi = self.lo[0][1], self.hi[0][1]
+        return { "count": n, "mean": round(self.total / n, 1), "rms": round(math.sqrt(max(self.total_sq, 0.0) / n), 1),
+                 "p2p": hi - lo, "min": lo, "max": hi }
+
+
+class StabilityAccumulator:
+    """
+    Overlapping Allan deviation and TDEV of a phase series (ns) sampled every tau0 s.
+    AVAR(tau) = sum(d^2) / (2 N tau^2) and TVAR(tau) = sum(S^2) / (6 m^2 N'), with
+    d = x[i] - 2 x[i-m] + x[i-2m] and S the sum of the last m second differences.
+    """
+    def __init__(self, tau0, factors=TAU_FACTORS):
+        self.tau0 = tau0
+        self.factors = factors
+        self.size = 2 * factors[-1] + 1
+        self.x = [0.0] * self.size
+        self.d = [[0.0] * m for m in factors]    # last m second differences per tau
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        k = len(self.factors)
+        self.avar_sum = [0.0] * k; self.avar_n = [0] * k
+        self.d_sum = [0.0] * k
+        self.tvar_sum = [0.0] * k; self.tvar_n = [0] * k
+        for ring in self.d: ring[:] = [0.0] * len(ring)
+
+    def add(self, x):
+        pos = self.n % self.size
+        self.x[pos] = x
+        self.n += 1
+        for k, m in enumerate(self.factors):
+            if self.n <= 2 * m: break
+            d = x - 2 * self.x[(pos - m) % self.size] + self.x[(pos - 2 * m) % self.size]
+            self.avar_sum[k] += d * d
+            slot = self.avar_n[k] % m
+            self.avar_n[k] += 1
+            ring = self.d[k]
+            self.d_sum[k] += d - ring[slot]; ring[slot] = d
+            if slot == m - 1: self.d_sum[k] = math.fsum(ring)   # amortized O(1) re-sum
+            if self.avar_n[k] >= m:
+                self.tvar_sum[k] += self.d_sum[k] ** 2; self.tvar_n[k] += 1
+
+    def results(self):
+        out = []
+        for k, m in enumerate(self.factors):
+            tau = m * self.tau0
+            n, tn = self.avar_n[k], self.tvar_n[k]
+            out.append({ "tau": tau, "n": n,
+                         "adev": float(f"{math.sqrt(self.avar_sum[k] / (2 * n)) * 1e-9 / tau:.4g}") if n else None,
+                         "tdev": round(math.sqrt(self.tvar_sum[k] / (6 * m * m * tn)), 2) if tn else None })
+        return out
+
+
+class ServoAnalyzer:
+    def __init__(self, tau0=1.0, window=60, limit_ns=1000):
+        self.tau0 = tau0
+        self.limit_ns = limit_ns
+        self.offsets = RollingWindow(window)
+        self.freqs = RollingWindow(window)
+        self.stability = StabilityAccumulator(tau0)
+        self.lock = threading.Lock()
+        self.state = "idle"         # idle -> acquiring -> locked -> holdover -> acquiring ...
+        self.port = None
+        self.gm = None
+        self.samples = 0
+        self.last_t = None
+        self.last_offset = None
+        self.in_limit = 0           # consecutive samples inside limit_ns
+        self.out_limit = 0
+        self.acquiring_since = None
+        self.locked_since = None
+        self.holdover_since = None
+        self.time_to_lock = None
+        self.servo_state = None     # last ptp4l servo state from the journal (0 unlocked, 1 jump, 2 locked)
+        self.counts = { "locks": 0, "steps": 0, "resets": 0, "gm_changes": 0, "holdovers": 0 }
+        self.events = deque(maxlen=MAX_EVENTS)
+
+    def _event(self, t, name, detail=None):
+        self.events.append({ "t": t, "event": name, "detail": detail })
+
+    def _acquire(self, t):
+        self.state = "acquiring"
+        self.acquiring_since = t
+        self.locked_since = None
+        self.in_limit = self.out_limit = 0
+        self.stability.reset()
+
+    def add(self, t, offset, freq, port, gm=None):
+        with self.lock:
+            self.port = port
+            if port not in TRACKED_PORTS:
+                if self.state == "locked":
+                    self.state = "holdover"; self.holdover_since = t
+                    self.counts["holdovers"] += 1; self._event(t, "holdover", port)
+                elif self.state == "acquiring":
+                    self.state = "idle"
+                self.last_t = None
+                return
+            if self.state == "holdover":
+                self._event(t, "holdover_end", round(t - self.holdover_since, 1)); self.holdover_since = None
+                self._acquire(t)
+            elif self.state == "idle":
+                self._acquire(t)
+            if gm and self.gm and gm != self.gm:
+                self.counts["gm_changes"] += 1; self._event(t, "gm_change", gm)
+                self._acquire(t)
+            if gm: self.gm = gm
+            if self.state == "locked" and abs(offset - self.last_offset) > self.limit_ns:
+                self.counts["steps"] += 1; self._event(t, "step", round(offset - self.last_offset, 1))
+                self._acquire(t)
+            elif self.last_t is not None and t - self.last_t > GAP_FACTOR * self.tau0:
+                self.stability.reset()
+            self.samples += 1
+            self.offsets.add(offset)
+            if freq is not None: self.freqs.add(freq)
+            if abs(offset) <= self.limit_ns: self.in_limit += 1; self.out_limit = 0
+            else: self.out_limit += 1; self.in_limit = 0
+            if self.state == "acquiring" and self.in_limit >= LOCK_SAMPLES:
+                self.state = "locked"; self.locked_since = t
+                self.time_to_lock = round(t - self.acquiring_since, 1)
+                self.counts["locks"] += 1; self._event(t, "lock", self.time_to_lock)
+            elif self.state == "locked" and self.out_limit >= LOCK_SAMPLES:
+                self._event(t, "unlock", offset)
+                self._acquire(t)
+            if self.state == "locked": self.stability.add(offset)
+            self.last_t = t; self.last_offset = offset
+
+    def servo_event(self, t, state):
+        """ptp4l servo state from its log lines: entering s0 is a servo reset, s1 a clock step."""
+        with self.lock:
+            prev, self.servo_state = self.servo_state, state
+            if prev is None or prev == state: return
+            if state == 0:
+                self.counts["resets"] += 1; self._event(t, "reset", prev)
+                if self.state in ("acquiring", "locked"): self._acquire(t)
+            elif state == 1 and self.state == "locked":
+                # A step the offset samples already caught has moved the state to acquiring
+                self.counts["steps"] += 1; self._event(t, "step", "s1")
+                self._acquire(t)
+
+    def snapshot(self, now=None):
+        now = now or time.time()
+        with self.lock:
+            window = self.offsets.stats()
+            max_abs = max(abs(window["min"]), abs(window["max"])) if window["count"] else None
+            return { "state": self.state, "port": self.port, "gm": self.gm, "samples": self.samples,
+                     "window": { "seconds": round(self.offsets.size * self.tau0, 1), **window, "max_abs": max_abs },
+                     "freq": self.freqs.stats(),
+                     "stability": self.stability.results(),
+                     "time_to_lock": self.time_to_lock,
+                     "locked_for": round(now - self.locked_since, 1) if self.locked_since else None,
+                     "acquiring_for": round(now - self.acquiring_since, 1) if self.state == "acquiring" else None,
+                     "holdover_for": round(now - self.holdover_since, 1) if self.holdover_since else None,
+                     "servo_state": self.servo_state, **self.counts,
+                     "limit_ns": self.limit_ns,
+                     "within_limit": self.state == "locked" and max_abs is not None and max_abs <= self.limit_ns,
+                     "events": list(self.events) }
+
+
+class ServoStats:
+    """One ServoAnalyzer per ptp4l instance name."""
+    def __init__(self, tau0=1.0, window=60, limit_ns=1000):
+        self.tau0 = tau0; self.window = window; self.limit_ns = limit_ns
+        self.analyzers = {}
+        self.lock = threading.Lock()
+
+    def get(self, name, create=False):
+        a = self.analyzers.get(name)
+        if a is None and create:
+            with self.lock:
+                a = self.analyzers.setdefault(name, ServoAnalyzer(self.tau0, self.window, self.limit_ns))
+        return a
+
+    def add(self, name, t, offset, freq, port, gm=None):
+        self.get(name, create=True).add(t, offset, freq, port, gm)
+
+    def servo_event(self, name, t, state):
+        self.get(name, create=True).servo_event(t, state)
+
+    def retain(self, names):
+        with self.lock:
+            for name in [n for n in self.analyzers if n not in names]: del self.analyzers[name]
+
+    def snapshot(self, name):
+        a = self.get(name)
+        return a.snapshot() if a else None
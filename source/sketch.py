@@ -0,0 +1,115 @@
+"""
+Mergeable quantile sketches for per-client timing measurements.
+
+LogSketch is a DDSketch-style histogram over logarithmic buckets: a value v
+lands in bucket ceil(log(v) / log(gamma)), so every quantile it returns is
+within ALPHA relative error of the true one. Memory is bounded by
+MAX_BUCKETS (the lowest buckets are collapsed first, which only coarsens
+the low percentiles), and two sketches merge by adding bucket counts, so
+per-client sketches can be combined per master or per domain.
+
+WindowedSketch keeps the last completed `window` seconds next to the one
+being filled. Summaries are computed once per completed window, so the
+radar export does not re-sort thousands of sketches every sampling cycle.
+"""
+import math
+
+ALPHA = 0.02            # relative accuracy of the quantiles
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+LOG_GAMMA = math.log(GAMMA)
+MAX_BUCKETS = 1024       # covers 1 ns .. 1e9 s before any collapsing
+MIN_VALUE = 1e-9        # values at or below this (s) count as zero
+
+
+class LogSketch:
+    __slots__ = ("buckets", "count", "zeros", "min", "max", "sum")
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.zeros = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+
+    def add(self, v):
+        self.count += 1
+        self.sum += v
+        if v < self.min: self.min = v
+        if v > self.max: self.max = v
+        if v <= MIN_VALUE: self.zeros += 1; return
+        i = math.ceil(math.log(v) / LOG_GAMMA)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        if len(self.buckets) > MAX_BUCKETS: self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self.buckets)
+        while len(keys) > MAX_BUCKETS:
+            low = keys.pop(0)
+            self.buckets[keys[0]] += self.buckets.pop(low)
+
+    def merge(self, other):
+        for i, n in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + n
+        self.count += other.count; self.zeros += other.zeros; self.sum += other.sum
+        self.min = min(self.min, other.min); self.max = max(self.max, other.max)
+        if len(self.buckets) > MAX_BUCKETS: self._collapse()
+        return self
+
+    def quantiles(self, qs):
+        """Values at the given quantiles (0..1, ascending), None when empty."""
+        if not self.count: return [None] * len(qs)
+        out = []
+        keys = sorted(self.buckets)
+        seen = self.zeros
+        k = 0
+        for q in qs:
+            rank = q * (self.count - 1)
+            if rank < self.zeros: out.append(0.0); continue
+            while k < len(keys) and seen + self.buckets[keys[k]] <= rank:
+                seen += self.buckets[keys[k]]; k += 1
+            if k >= len(keys): out.append(self.max); continue
+            # Bucket midpoint, clamped to the exact extremes
+            v = 2 * GAMMA ** keys[k] / (GAMMA + 1)
+            out.append(min(max(v, self.min), self.max))
+        return out
+
+    def summary(self, scale=1.0, digits=1):
+        p50, p90, p99 = self.quantiles((0.5, 0.9, 0.99))
+        if p50 is None: return { "count": 0 }
+        r = lambda v: round(v * scale, digits)
+        return { "count": self.count, "p50": r(p50), "p90": r(p90), "p99": r(p99), "max": r(self.max),
+                 "mean": r(self.sum / self.count) }
+
+
+class WindowedSketch:
+    """LogSketch of the last completed `window` seconds (plus the one being filled)."""
+    __slots__ = ("window", "scale", "start", "current", "last", "_summary")
+
+    def __init__(self, window=30.0, scale=1.0):
+        self.window = window
+        self.scale = scale      # unit of the summary, e.g. 1e6 for microseconds
+        self.start = None
+        self.current = LogSketch()
+        self.last = None
+        self._summary = None
+
+    def add(self, v, now):
+        if self.start is None: self.start = now
+        elif now - self.start >= self.window:
+            # A gap longer than a window leaves nothing recent to report
+            self.last = self.current if now - self.start < 2 * self.window else None
+            self.current = LogSketch(); self.start = now
+            self._summary = None
+        self.current.add(v)
+
+    def completed(self, now):
+        """The last completed window, None if there is none or it is stale."""
+        if self.last is None or now - self.start >= 2 * self.window: return None
+        return self.last
+
+    def summary(self, now):
+        sk = self.completed(now)
+        if sk is None: return None
+        if self._summary is None: self._summary = sk.summary(self.scale)
+        return self._summary
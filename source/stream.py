@@ -0,0 +1,95 @@
+"""
+Server-push fan-out for the dashboard (Server-Sent Events).
+
+One producer (the telemetry sampler and the journal follower) publishes deltas;
+each event is serialized once and handed to every subscriber queue, so the
+cost of an extra open screen is one queue put per event.
+"""
+import json
+import queue
+import threading
+
+HEARTBEAT_INTERVAL = 15.0
+
+
+def sse_format(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Broadcaster:
+    def __init__(self, max_subscribers=32, queue_size=256):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        # Returns None when full; callers answer 503 and the browser falls back to polling
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers: return None
+            q = queue.Queue(self.queue_size)
+            self._subscribers.add(q)
+            return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event, data):
+        msg = sse_format(event, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(msg)
+            except queue.Full:
+                # A stalled client gets disconnected; EventSource reconnects and resyncs from a snapshot
+                self.unsubscribe(q)
+                self._close(q)
+
+    @staticmethod
+    def _close(q):
+        # Make room for the end marker: the queue is full, and events() must see None to return
+        while True:
+            try:
+                q.put_nowait(None)
+                return
+            except queue.Full:
+                try: q.get_nowait()
+                except queue.Empty: pass
+
+    def events(self, q, initial=()):
+        """Generator for a streaming response: initial messages, then live events and heartbeats."""
+        try:
+            for msg in initial: yield msg
+            while True:
+                try:
+                    msg = q.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if msg is None: return
+                yield msg
+        finally:
+            self.unsubscribe(q)
+
+
+# --- Delta helpers ---
+def diff_fields(old, new):
+    """Top-level keys of `new` whose values differ from `old`."""
+    if not old: return dict(new or {})
+    return {k: v for k, v in (new or {}).items() if old.get(k) != v}
+
+
+def diff_clients(old, new):
+    """Client list delta keyed by ip: added/changed entries and expired ips."""
+    old_map = {c["ip"]: c for c in old or []}
+    new_map = {c["ip"]: c for c in new or []}
+    upsert = [c for ip, c in new_map.items() if old_map.get(ip) != c]
+    expire = [ip for ip in old_map if ip not in new_map]
+    return upsert, expire
+
@@ -0,0 +1,90 @@
+"""
+Background telemetry sampler.
+
+A single thread runs every collector at a fixed rate and publishes the
+results as one immutable Snapshot. HTTP handlers only read the latest
+snapshot, so their cost does not depend on how many browsers are polling.
+"""
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+# `data` maps collector name -> value. Published snapshots are never mutated.
+Snapshot = namedtuple("Snapshot", ["seq", "time", "duration", "data"])
+
+
+class TelemetrySampler:
+    def __init__(self, collectors, interval=1.0, derived=None):
+        self.collectors = collectors    # ordered {name: callable}
+        # {name: fn(data)} computed from the fresh cycle, so several keys can share one collection pass
+        self.derived = derived or {}
+        self.interval = interval
+        self._snapshot = None
+        self._seq = 0
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="telemetry-sampler", daemon=True)
+            self._thread.start()
+        return self
+
+    def snapshot(self, timeout=2.0):
+        # Only the very first request after startup can block, until the first cycle is published
+        if self._snapshot is None: self._ready.wait(timeout)
+        return self._snapshot
+
+    def get(self, name, default=None, timeout=2.0):
+        snap = self.snapshot(timeout)
+        if snap is None: return default
+        return snap.data.get(name, default)
+
+    def add_listener(self, fn):
+        # fn(previous_snapshot, snapshot) runs on the sampler thread after every publish
+        self._listeners.append(fn)
+
+    def refresh(self):
+        # Request an immediate out-of-schedule cycle (e.g. right after a config apply)
+        self._wake.set()
+
+    def sample_once(self):
+        start = time.monotonic()
+        prev = self._snapshot.data if self._snapshot else {}
+        data = {}
+        for name, fn in self.collectors.items():
+            try:
+                data[name] = fn()
+            except Exception:
+                # Keep serving the last good value rather than a hole in the snapshot
+                traceback.print_exc()
+                data[name] = prev.get(name)
+        for name, fn in self.derived.items():
+            try:
+                data[name] = fn(data)
+            except Exception:
+                traceback.print_exc()
+                data[name] = prev.get(name)
+        self._seq += 1
+        prev_snap = self._snapshot
+        self._snapshot = Snapshot(self._seq, time.time(), time.monotonic() - start, data)
+        self._ready.set()
+        for fn in self._listeners:
+            try: fn(prev_snap, self._snapshot)
+            except Exception: traceback.print_exc()
+        return self._snapshot
+
+    def _run(self):
+        next_due = time.monotonic()
+        while True:
+            self.sample_once()
+            # Fixed-rate schedule; a slow cycle skips missed slots instead of bursting
+            next_due += self.interval
+            now = time.monotonic()
+            if next_due < now: next_due = now + self.interval
+            if self._wake.wait(next_due - now):
+                self._wake.clear()
+                next_due = time.monotonic()
@@ -0,0 +1,21 @@
+"""
+Shared fixtures: the app modules are imported from source/ and the fakes
+(fake ptp4l management socket, synthetic PTP frames) from benchmarks/common.py.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "source"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import common  # noqa: E402
+
+
+@pytest.fixture
+def fake_ptp4l(tmp_path):
+    fake = common.FakePtp4l(str(tmp_path / "ptp4l"))
+    yield fake
+    fake.stop()
@@ -0,0 +1,54 @@
+import common
+import capture
+import pytest
+
+MAC = bytes.fromhex("020000000001")
+
+
+def test_decode_frame_udp_announce():
+    frame = common.ptp_udp_frame("10.0.0.1", MAC, 0xB, 42, domain=3, announce=(100, 6, 110, 1))
+    msg = capture.decode_frame(frame, 12.5, "eth0")
+    assert msg.msg_type == 0xB and msg.seq == 42 and msg.domain == 3 and msg.version == 2
+    assert (msg.src_ip, msg.dst_ip, msg.transport, msg.iface, msg.ts) == ("10.0.0.1", "224.0.1.129", "UDPv4", "eth0", 12.5)
+    assert msg.src_mac == "02:00:00:00:00:01"
+    assert msg.clock_id == "020000.fffe.000001"
+    ann = capture.decode_announce(msg)
+    assert (ann.priority1, ann.clock_class, ann.priority2, ann.steps_removed) == (100, 6, 110, 1)
+    assert ann.gm_identity == "020000.fffe.000001"
+
+
+def test_decode_frame_rejects_non_ptp():
+    frame = common.ptp_udp_frame("10.0.0.1", MAC, 0x1, 1)
+    assert capture.decode_frame(frame[:12] + b"\x86\xdd" + frame[14:]) is None    # IPv6 ethertype
+    assert capture.decode_frame(frame[:20]) is None
+
+
+def test_pcap_replay(tmp_path):
+    traffic = common.synthetic_traffic(clients=5, per_client=16, start=1700000000.0)
+    path = str(tmp_path / "radar.pcap")
+    capture.write_pcap(path, traffic)
+    cap = capture.PcapCapture(path, iface="pcap0")
+    try:
+        msgs = []
+        while True:
+            batch = cap.read(batch=32)
+            if not batch: break
+            msgs.extend(batch)
+        assert len(msgs) == len(traffic)
+        assert cap.stats() == (len(traffic), 0)
+        assert (cap.frames, cap.decoded) == (len(traffic), len(traffic))
+        assert msgs[0].ts == pytest.approx(traffic[0][0], abs=1e-6)
+        assert {m.iface for m in msgs} == {"pcap0"}
+        assert {m.src_ip for m in msgs} == {f"10.0.0.{c}" for c in range(1, 6)}
+        # Every 8th message of an endpoint is an Announce, the rest Delay_Req
+        assert sum(m.msg_type == 0xB for m in msgs) == 5 * 2
+        assert all(m.msg_type in (0x1, 0xB) for m in msgs)
+    finally:
+        cap.close()
+
+
+def test_pcap_rejects_other_files(tmp_path):
+    path = tmp_path / "not.pcap"
+    path.write_bytes(b"hello world, not a capture")
+    with pytest.raises(ValueError):
+        capture.PcapCapture(str(path))
@@ -0,0 +1,70 @@
+import asyncio
+import socket
+import threading
+import time
+
+import fleet
+import pytest
+
+
+@pytest.fixture
+def stub_nodes():
+    """Stub nodes 0 (GM) and 1 (slave of it) on an event loop of their own; yields their ports."""
+    loop = asyncio.new_event_loop()
+    servers = [loop.run_until_complete(fleet._serve_stub(i, 0)) for i in (0, 1)]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield [s.sockets[0].getsockname()[1] for s in servers]
+
+    async def shutdown():
+        # Kept-alive connections stay open on the handler side: cancel them before the loop goes
+        for s in servers: s.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(2)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(2)
+    loop.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond(): return True
+        time.sleep(0.02)
+    return False
+
+
+def test_parse_peer():
+    assert fleet.parse_peer("10.0.0.1") == ("10.0.0.1:8080", "10.0.0.1", 8080)
+    assert fleet.parse_peer("http://node-a:9000/") == ("node-a:9000", "node-a", 9000)
+    assert fleet.parse_peer({"name": "gm", "host": "10.0.0.2"}) == ("gm", "10.0.0.2", 8080)
+
+
+def test_aggregates_two_stub_nodes(stub_nodes):
+    agg = fleet.FleetAggregator([f"127.0.0.1:{p}" for p in stub_nodes], interval=0.05, timeout=1.0).start()
+    assert wait_for(lambda: all(n["ok"] for n in agg.view["nodes"]))
+    gm, slave = agg.view["nodes"]
+    assert gm["status"]["port"] == "MASTER" and slave["status"]["port"] == "SLAVE"
+    assert slave["bmca"]["winner"] == "remote"
+    assert slave["latency_ms"] is not None and slave["error"] is None
+    topo = agg.view["topology"]
+    roles = {v["id"]: v["role"] for v in topo["vertices"]}
+    assert roles == {"000000.fffe.000000": "gm", "000000.fffe.000001": "slave"}
+    assert topo["edges"] == [{"from": "000000.fffe.000000", "to": "000000.fffe.000001"}]
+
+
+def test_unreachable_peer_backs_off(stub_nodes):
+    agg = fleet.FleetAggregator([f"127.0.0.1:{stub_nodes[0]}", f"127.0.0.1:{free_port()}"], interval=0.05, timeout=0.5).start()
+    assert wait_for(lambda: agg.view["nodes"][0]["ok"] and agg.view["nodes"][1]["failures"] >= 2)
+    up, down = agg.view["nodes"]
+    assert not down["ok"] and down["error"]
+    # The reachable node is not held back by the dead one
+    assert up["ok"] and up["failures"] == 0
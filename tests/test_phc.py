@@ -0,0 +1,95 @@
+import phc
+import pytest
+
+
+class FakeClock:
+    """Stands in for PosixPhc: a PHC `offset_ns` ahead of the system clock."""
+    opened = []
+
+    def __init__(self, index, offset_ns=37_000_000_000):
+        self.index = index
+        self.offset_ns = offset_ns
+        self.closed = False
+        self.fail = False
+        FakeClock.opened.append(self)
+
+    def gettime_ns(self):
+        if self.fail: raise OSError(19, "No such device")
+        return 1_700_000_000_000_000_000 + self.offset_ns
+
+    def sys_offset(self, samples=5):
+        if self.fail: raise OSError(19, "No such device")
+        return self.offset_ns, 120
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def links():
+    FakeClock.opened = []
+    return { "eth0": [0, 2], "eth1": [1, 3] }     # iface -> [phc index, ifindex]
+
+
+@pytest.fixture
+def manager(links):
+    resolve = lambda iface: links[iface][0] if iface in links else None
+    ifindex = lambda iface: links[iface][1] if iface in links else None
+    return phc.PhcManager(open_clock=FakeClock, resolve=resolve, ifindex=ifindex)
+
+
+def test_reads_through_cached_clock(manager):
+    assert manager.phc_index("eth0") == 0
+    assert manager.gettime_ns("eth0") == 1_700_000_037_000_000_000
+    assert manager.sys_offset("eth0") == (37_000_000_000, 120)
+    # One open per interface, reused by every read
+    assert [c.index for c in FakeClock.opened] == [0]
+    assert manager.phc_index("eth1") == 1
+    assert len(FakeClock.opened) == 2
+
+
+def test_interface_without_phc(manager):
+    assert manager.phc_index("lo") is None
+    assert manager.gettime_ns("lo") is None
+    assert FakeClock.opened == []
+
+
+def test_failed_read_reopens_once(manager):
+    manager.gettime_ns("eth0")
+    first = FakeClock.opened[0]
+    first.fail = True
+    # The stale clock is closed and the read retried on a fresh one
+    assert manager.gettime_ns("eth0") == 1_700_000_037_000_000_000
+    assert first.closed and len(FakeClock.opened) == 2
+
+
+def test_read_gives_up_when_device_stays_broken(manager):
+    class Broken(FakeClock):
+        def __init__(self, index):
+            super().__init__(index); self.fail = True
+    manager.open_clock = Broken
+    assert manager.sys_offset("eth0") is None
+    assert len(FakeClock.opened) == 2 and all(c.closed for c in FakeClock.opened)
+
+
+def test_ifindex_change_remaps(manager, links):
+    manager.revalidate = 0.000001
+    assert manager.phc_index("eth0") == 0
+    # Driver reload: new ifindex and a different /dev/ptpN
+    links["eth0"] = [4, 9]
+    assert manager.phc_index("eth0") == 4
+    assert FakeClock.opened[0].closed
+
+
+def test_invalidate_closes_everything(manager):
+    manager.phc_index("eth0"); manager.phc_index("eth1")
+    manager.invalidate("eth0")
+    assert [c.closed for c in FakeClock.opened] == [True, False]
+    manager.close()
+    assert all(c.closed for c in FakeClock.opened)
+    assert manager.clocks == {}
+
+
+def test_clockid_from_fd():
+    # FD_TO_CLOCKID(3) as computed by the kernel's posix-clock ABI
+    assert phc.fd_to_clockid(3) == -29
@@ -0,0 +1,70 @@
+import common
+import pmc_client as pc
+import pytest
+
+
+@pytest.fixture
+def client(fake_ptp4l):
+    c = pc.PmcClient(fake_ptp4l.path, timeout=0.5)
+    yield c
+    c.close()
+
+
+def test_get_decodes_datasets(client):
+    ds = client.get("DEFAULT_DATA_SET", "CURRENT_DATA_SET", "PARENT_DATA_SET", "TIME_PROPERTIES_DATA_SET")
+    assert ds["DEFAULT_DATA_SET"].clock_identity == "001122.fffe.334455"
+    assert ds["DEFAULT_DATA_SET"].number_ports == 2
+    assert ds["CURRENT_DATA_SET"].offset_from_master == -12.0
+    assert ds["CURRENT_DATA_SET"].mean_path_delay == 812.0
+    assert ds["PARENT_DATA_SET"].gm_identity == "aabbcc.fffe.000001"
+    assert ds["PARENT_DATA_SET"].gm_clock_class == 6
+
+
+def test_port_scoped_get_returns_one_entry_per_port(client):
+    ports = client.get("PORT_DATA_SET")["PORT_DATA_SET"]
+    assert [p.port_identity for p in ports] == ["001122.fffe.334455-1", "001122.fffe.334455-2"]
+    assert [p.port_state for p in ports] == ["SLAVE", "MASTER"]
+    # The port count learnt from DEFAULT_DATA_SET is kept for the next batch
+    assert client.number_ports == 2
+
+
+def test_port_state_follows_ptp4l(client, fake_ptp4l):
+    fake_ptp4l.port_state = 6   # MASTER
+    assert {p.port_state for p in client.get("PORT_DATA_SET")["PORT_DATA_SET"]} == {"MASTER"}
+
+
+def test_set_round_trip(client):
+    assert client.get("PRIORITY1")["PRIORITY1"].value == 128
+    assert client.set("PRIORITY1", 10).value == 10
+    assert client.get("PRIORITY1")["PRIORITY1"].value == 10
+
+
+def test_set_grandmaster_settings_round_trip(client):
+    gm = pc.GrandmasterSettingsNP(clock_class=13, clock_accuracy=0x27, offset_scaled_log_variance=0xFFFF,
+                                  current_utc_offset=37, leap61=0, leap59=0, current_utc_offset_valid=1,
+                                  ptp_timescale=1, time_traceable=1, frequency_traceable=1, time_source=0x50)
+    assert client.set("GRANDMASTER_SETTINGS_NP", gm) == gm
+    assert client.get("GRANDMASTER_SETTINGS_NP")["GRANDMASTER_SETTINGS_NP"] == gm
+
+
+def test_error_status_is_left_out(client):
+    # The fake answers MANAGEMENT_ERROR_STATUS for datasets it does not know
+    assert client.get("DOMAIN") == {}
+    replies = client.query("DOMAIN")
+    assert len(replies) == 1 and replies[0].error
+
+
+def test_missing_socket_raises_unavailable(tmp_path):
+    c = pc.PmcClient(str(tmp_path / "nope"), timeout=0.2)
+    with pytest.raises(pc.PmcUnavailable):
+        c.get("DEFAULT_DATA_SET")
+
+
+def test_reconnects_after_ptp4l_restart(client, fake_ptp4l):
+    assert client.get("DEFAULT_DATA_SET")
+    fake_ptp4l.stop()
+    with pytest.raises(pc.PmcUnavailable):
+        client.get("DEFAULT_DATA_SET")
+    restarted = common.FakePtp4l(fake_ptp4l.path)
+    try: assert client.get("DEFAULT_DATA_SET")["DEFAULT_DATA_SET"].priority1 == 128
+    finally: restarted.stop()